@@ -97,6 +97,7 @@ from general.templatetags.util import license_with_version
 from messages.models import Message
 from sounds.forms import LicenseForm, PackForm
 from sounds.models import BulkUploadProgress, Download, Pack, PackDownload, Sound, SoundLicenseHistory
+from sounds.sound_loader import get_sound_loader
 from sounds.views import edit_and_describe_sounds_helper
 from tickets.models import Ticket, TicketComment, UserAnnotation
 from utils.cache import invalidate_user_template_caches
@@ -1402,6 +1403,7 @@ def charts(request):
 def account(request, username):
     user = get_parameter_user_or_404(request)
     latest_sounds = list(Sound.objects.bulk_sounds_for_user(user.id, settings.SOUNDS_PER_PAGE_PROFILE_PACK_PAGE))
+    get_sound_loader(request).add(latest_sounds)
     following = follow_utils.get_users_following_qs(user)
     followers = follow_utils.get_users_followers_qs(user)
     following_tags = follow_utils.get_tags_following_qs(user)
@@ -0,0 +1,172 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+"""Accounting of the number of API requests per client and day.
+
+Requests are counted in memory in each process and flushed periodically (every settings.API_USAGE_FLUSH_INTERVAL
+seconds) by a background thread, so counting a request does not access the cache. Counts are flushed to a hash per day
+in the api_monitoring cache (with the client IDs as fields), incrementing all of them with a single transactional
+pipelined call.
+The consolidate_api_usage_data management command then stores the daily counts in the DB.
+"""
+
+import atexit
+import collections
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.utils import timezone
+from prometheus_client import Counter
+
+errors_logger = logging.getLogger("api_errors")
+
+API_USAGE_KEY = "api_usage_{}"
+API_USAGE_EXPIRE_SECONDS = 60 * 60 * 24 * 3  # Keep counts in the cache for 3 days
+
+api_requests_total = Counter(
+    "freesound_api_requests_total",
+    "Number of API requests made by each API client.",
+    ["client_id"],
+)
+
+pending_counts_lock = threading.Lock()
+pending_counts = collections.Counter()
+flusher_thread = None
+
+
+def reset_after_fork():
+    # Forked processes (e.g. gunicorn workers) start with no pending counts (these are flushed by the parent process)
+    # and need to start their own flusher thread
+    global pending_counts_lock, pending_counts, flusher_thread
+    pending_counts_lock = threading.Lock()
+    pending_counts = collections.Counter()
+    flusher_thread = None
+
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+
+def get_api_usage_key(date):
+    return API_USAGE_KEY.format(date.isoformat())
+
+
+def count_api_request(client_id):
+    """Counts a request made by the given API client. Counts are kept in memory and flushed to the cache by a
+    background thread, or immediately if settings.API_USAGE_FLUSH_INTERVAL is not set.
+
+    Args:
+        client_id (str): ID of the API client
+    """
+    api_requests_total.labels(client_id=client_id).inc()
+    with pending_counts_lock:
+        pending_counts[timezone.now().date(), client_id] += 1
+    if settings.API_USAGE_FLUSH_INTERVAL:
+        start_flusher_thread()
+    else:
+        flush_api_usage()
+
+
+def start_flusher_thread():
+    global flusher_thread
+    if flusher_thread is None:
+        with pending_counts_lock:
+            if flusher_thread is None:
+                flusher_thread = threading.Thread(target=flush_api_usage_periodically, daemon=True)
+                flusher_thread.start()
+
+
+def flush_api_usage_periodically():
+    while True:
+        time.sleep(settings.API_USAGE_FLUSH_INTERVAL)
+        flush_api_usage()
+
+
+def flush_api_usage():
+    """Adds the pending counts to the daily counts stored in the cache. If that fails, counts are kept as pending so
+    that they are added the next time.
+    """
+    global pending_counts
+    with pending_counts_lock:
+        counts = pending_counts
+        pending_counts = collections.Counter()
+    if not counts:
+        return
+    try:
+        increment_api_usage_counts(counts)
+    except Exception as e:
+        errors_logger.info(f"Could not flush API usage counts: {e}")
+        with pending_counts_lock:
+            pending_counts.update(counts)
+
+
+atexit.register(flush_api_usage)
+
+
+def increment_api_usage_counts(counts):
+    """Increments the daily counts stored in the cache. With a Redis cache, all the increments are sent in a MULTI/EXEC
+    transaction so that they are applied all or none, and the counts can be re-added for the next flush if it fails
+    without counting any of them twice.
+
+    Args:
+        counts (dict): counts to add, with (date, client_id) tuples as keys
+    """
+    cache_api_monitoring = caches["api_monitoring"]
+    if isinstance(cache_api_monitoring, RedisCache):
+        client = cache_api_monitoring._cache.get_client(write=True)
+        keys = set()
+        with client.pipeline(transaction=True) as pipeline:
+            for (date, client_id), count in counts.items():
+                key = cache_api_monitoring.make_and_validate_key(get_api_usage_key(date))
+                pipeline.hincrby(key, client_id, count)
+                keys.add(key)
+            for key in keys:
+                pipeline.expire(key, API_USAGE_EXPIRE_SECONDS)
+            pipeline.execute()
+    else:
+        # Other cache backends (used in development and tests) store the hash as a dictionary, which is not atomic
+        counts_per_date = collections.defaultdict(collections.Counter)
+        for (date, client_id), count in counts.items():
+            counts_per_date[date][client_id] += count
+        for date, date_counts in counts_per_date.items():
+            key = get_api_usage_key(date)
+            date_counts.update(cache_api_monitoring.get(key, {}))
+            cache_api_monitoring.set(key, dict(date_counts), API_USAGE_EXPIRE_SECONDS)
+
+
+def get_api_usage_counts(date):
+    """Returns the number of requests made by each API client in the given date (only including flushed counts).
+
+    Args:
+        date (datetime.date): date of the counts
+
+    Returns:
+        dict: number of requests with API client IDs as keys
+    """
+    cache_api_monitoring = caches["api_monitoring"]
+    if isinstance(cache_api_monitoring, RedisCache):
+        client = cache_api_monitoring._cache.get_client()
+        counts = client.hgetall(cache_api_monitoring.make_and_validate_key(get_api_usage_key(date)))
+        return {client_id.decode(): int(count) for client_id, count in counts.items()}
+    return dict(cache_api_monitoring.get(get_api_usage_key(date), {}))
@@ -25,9 +25,8 @@ from urllib.parse import unquote
 
 from django.conf import settings
 from django.contrib.sites.models import Site
-from django.core.cache import cache, caches
+from django.core.cache import cache
 from django.http import HttpResponseRedirect, JsonResponse
-from django.utils import timezone
 from django.utils.encoding import smart_str
 from oauth2_provider.generators import BaseHashGenerator
 from oauthlib.common import UNICODE_ASCII_CHARACTER_SET
@@ -44,6 +43,7 @@ from rest_framework.generics import (
 from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.utils import formatting
 
+from apiv2.api_usage import count_api_request
 from apiv2.authentication import OAuth2Authentication, SessionAuthentication, TokenAuthentication
 from apiv2.exceptions import (
     BadRequestException,
@@ -60,7 +60,6 @@ from utils.search.search_sounds import parse_weights_parameter
 from .examples import examples
 
 search_logger = logging.getLogger("search")
-cache_api_monitoring = caches["api_monitoring"]
 
 
 ##########################################
@@ -118,22 +117,19 @@ class FreesoundAPIViewMixin:
         return log_message_helper(message, resource=self)
 
     def store_monitor_usage(self):
-        """This function increases the counter of requests per API client that is stored in the cache.
-        This function is expected to be called everytime an API request is received, it generates a key for the
-        current daily count (composed of the current date and the API client id) and increases the count stored in
-        the cache by one.
+        """This function increases the counter of requests per API client for the current day.
+        This function is expected to be called everytime an API request is received. Counts are buffered in memory
+        and periodically added to daily counts stored in the cache (see apiv2.api_usage), so no cache access is made
+        while serving the request.
 
         A Django management command is expected to run periodically to take the information from the cache
         and store it in the DB. The management command should run at least once a day, and it will consolidate
-        API usage counts for the last 2 days (see consolidate_api_usage_data.py for more info). The cache entries
-        set by this function expire in 72 hours so the management command has time to consolidate the results of the
+        API usage counts for the last 2 days (see consolidate_api_usage_data.py for more info). The daily counts
+        expire from the cache in 72 hours so the management command has time to consolidate the results of the
         previous days.
         """
         if self.client_id is not None:
-            now = timezone.now().date()
-            monitoring_key = f"{now.year}-{now.month}-{now.day}_{self.client_id}"
-            current_value = cache_api_monitoring.get(monitoring_key, 0)
-            cache_api_monitoring.set(monitoring_key, current_value + 1, 60 * 60 * 24 * 3)  # Expire in 3 days
+            count_api_request(self.client_id)
 
     def get_request_information(self, request):
         # Get request information and store it as class variable
@@ -0,0 +1,118 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.urls import reverse
+from rest_framework import serializers
+
+from apiv2.apiv2_utils import prepend_base
+from apiv2.serializers import SoundListSerializer
+from apiv2.views import get_include_remix_subqueries, get_needed_audio_descriptors, get_needed_similarity_vectors
+from sounds.models import Sound
+
+console_logger = logging.getLogger("console")
+
+# Fields with URLs of views which take the sound ID, which serializers build without reversing the view for each sound
+OBJECT_URL_FIELDS = {
+    "download": "apiv2-sound-download",
+    "bookmark": "apiv2-user-create-bookmark",
+    "rate": "apiv2-user-create-rating",
+    "comments": "apiv2-sound-comments",
+    "comment": "apiv2-user-create-comment",
+    "similar_sounds": "apiv2-similarity-sound",
+}
+
+
+class Command(BaseCommand):
+    help = """Compares the time it takes to serialize a page of sounds as done in the search API endpoints creating a
+    SoundListSerializer for every sound and using the default to_representation of serializers (as done before), and
+    using a single SoundListSerializer for the whole page with its precompiled field plan. Sounds are retrieved from the
+    DB before timing the serialization."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--page-size",
+            action="store",
+            dest="page_size",
+            type=int,
+            default=settings.APIV2["MAX_PAGE_SIZE"],
+            help="Number of sounds in the page (default: settings.APIV2['MAX_PAGE_SIZE']).",
+        )
+        parser.add_argument(
+            "--fields", action="store", dest="fields", default="*", help="Requested fields (default: '*')."
+        )
+        parser.add_argument(
+            "--repetitions", action="store", dest="repetitions", type=int, default=10, help="Number of repetitions."
+        )
+
+    def handle(self, *args, **options):
+        fields = options["fields"]
+        sound_ids = list(Sound.public.order_by("-id").values_list("id", flat=True)[: options["page_size"]])
+        sounds_dict = Sound.objects.dict_ids(
+            sound_ids=sound_ids,
+            include_audio_descriptors=get_needed_audio_descriptors(fields),
+            include_similarity_vectors=get_needed_similarity_vectors(fields),
+            include_remix_subqueries=get_include_remix_subqueries(fields),
+        )
+        sounds = [sounds_dict[sound_id] for sound_id in sound_ids if sound_id in sounds_dict]
+        context = {"request": RequestFactory().get("/apiv2/search/", {"fields": fields}, secure=True)}
+        score_map = {sound.id: 1.0 for sound in sounds}
+        Site.objects.get_current()  # Make sure the current site is cached
+
+        def serialize_per_sound():
+            results = []
+            for sound in sounds:
+                serializer = SoundListSerializer(sound, context=context, score_map=score_map)
+                results.append(serializers.ModelSerializer.to_representation(serializer, sound))
+            return results
+
+        def serialize_with_field_plan():
+            serializer = SoundListSerializer(context=context, score_map=score_map)
+            return [serializer.to_representation(sound) for sound in sounds]
+
+        # Serialize once before timing so that cached data in sound objects (e.g. locations) is already computed
+        results = serialize_with_field_plan()
+        if [dict(result) for result in serialize_per_sound()] != results:
+            console_logger.info("Serialized sounds differ between both methods")
+        # Both methods build URLs in the same way, so URLs are also compared with the views reversed for each sound
+        for sound, result in zip(sounds, results):
+            for field_name, view_name in OBJECT_URL_FIELDS.items():
+                if result.get(field_name) is not None and result[field_name] != prepend_base(
+                    reverse(view_name, args=[sound.id]), request_is_secure=True
+                ):
+                    console_logger.info(f"Wrong URL in field {field_name} of sound {sound.id}: {result[field_name]}")
+
+        timings = {}
+        for name, serialize in [
+            ("per sound serializer", serialize_per_sound),
+            ("field plan", serialize_with_field_plan),
+        ]:
+            starttime = time.monotonic()
+            for _ in range(options["repetitions"]):
+                serialize()
+            timings[name] = (time.monotonic() - starttime) / options["repetitions"]
+            console_logger.info(f"{name}: {timings[name] * 1000:.1f}ms per page of {len(sounds)} sounds")
+        console_logger.info(f"speedup: {timings['per sound serializer'] / timings['field plan']:.1f}x")
@@ -22,8 +22,10 @@ import datetime
 import logging
 
 from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
 from django.utils import timezone
 
+from apiv2.api_usage import get_api_usage_counts
 from apiv2.models import APIClientDailyUsageHistory, ApiV2Client
 from utils.cache import get_all_keys_matching_pattern
 from utils.management_commands import LoggingBaseCommand
@@ -34,10 +36,10 @@ cache_api_monitoring = caches["api_monitoring"]
 
 class Command(LoggingBaseCommand):
     help = (
-        "Consolidate API usage data stored in cache backend to the database. This command will look for entries in"
-        ' the cache which correspond to stored "requests per client" counts for the last 2 days. It will update '
-        "corresponding APIClientDailyUsageHistory objects in the database so the information is saved permanently"
-        "before the cache items expire."
+        "Consolidate API usage data stored in cache backend to the database. This command will look for the stored "
+        '"requests per client" counts for the last 2 days in the cache. It will update corresponding '
+        "APIClientDailyUsageHistory objects in the database so the information is saved permanently before the cache "
+        "items expire."
     )
 
     def handle(self, *args, **options):
@@ -47,14 +49,21 @@ class Command(LoggingBaseCommand):
         now = timezone.now().date()
         for i in range(n_days_back):
             date_filter = now - datetime.timedelta(days=i)
+            counts = get_api_usage_counts(date_filter)
 
-            # Get cache keys that match a pattern. Note that using Django's default redis client, this requires some special trickery
-            monitoring_key_pattern = f"*{date_filter.year}-{date_filter.month}-{date_filter.day}_*"
-            cache_keys = get_all_keys_matching_pattern(monitoring_key_pattern, cache_api_monitoring)
+            # Counts were stored in one key per client and day before they were stored in a hash per day, add these
+            # as well so that counts of the days when that changed are complete. Note that using Django's default
+            # redis client, getting the keys requires some special trickery.
+            if isinstance(cache_api_monitoring, RedisCache):
+                monitoring_key_pattern = f"*{date_filter.year}-{date_filter.month}-{date_filter.day}_*"
+                cache_keys = get_all_keys_matching_pattern(monitoring_key_pattern, cache_api_monitoring)
+                for key, count in cache_api_monitoring.get_many(cache_keys).items():
+                    client_id = key.split("_")[1]
+                    counts[client_id] = counts.get(client_id, 0) + count
 
-            for key, count in cache_api_monitoring.get_many(cache_keys).items():
+            for client_id, count in counts.items():
                 try:
-                    apiv2_client = ApiV2Client.objects.get(oauth_client__client_id=key.split("_")[1])
+                    apiv2_client = ApiV2Client.objects.get(oauth_client__client_id=client_id)
                     usage_history, _ = APIClientDailyUsageHistory.objects.get_or_create(
                         date=date_filter, apiv2_client=apiv2_client
                     )
@@ -19,10 +19,15 @@
 #
 
 
+from functools import partial
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils.functional import cached_property
 from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
 
 from bookmarks.models import Bookmark, BookmarkCategory
 from comments.models import Comment
@@ -69,6 +74,20 @@ for sim_space_name in settings.SIMILARITY_SPACES_NAMES:
     similarity_vectors_accessors[field_name] = get_similarity_vector_accessor
 
 
+# ID used to reverse the URLs of views which take an object ID, see AbstractSoundSerializer.object_url
+OBJECT_ID_PLACEHOLDER = 999999999
+
+
+def serialize_model_field(field, obj):
+    # Same as done for each field in Serializer.to_representation (SkipField is handled in
+    # AbstractSoundSerializer.to_representation)
+    attribute = field.get_attribute(obj)
+    check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+    if check_for_none is None:
+        return None
+    return field.to_representation(attribute)
+
+
 class AbstractSoundSerializer(serializers.HyperlinkedModelSerializer):
     """
     In this abstract class we define ALL possible fields that a sound object should serialize/deserialize.
@@ -79,7 +98,12 @@ class AbstractSoundSerializer(serializers.HyperlinkedModelSerializer):
     default_fields = None
 
     def __init__(self, *args, **kwargs):
+        """Serializers are expected to be created once per request and used to serialize all sounds of the response
+        (either with many=True or calling to_representation for each sound), as computing the requested fields and the
+        accessors to get them (see field_plan) is done once per serializer.
+        """
         self.score_map = kwargs.pop("score_map", {})
+        self.object_url_parts = {}
         super().__init__(*args, **kwargs)
         requested_fields = self.context["request"].GET.get("fields", self.default_fields)
 
@@ -129,6 +153,52 @@ class AbstractSoundSerializer(serializers.HyperlinkedModelSerializer):
                 if field_name in self.fields:
                     self.fields.pop(field_name)
 
+    @cached_property
+    def field_plan(self):
+        """List of (field name, accessor) tuples for the requested fields, where each accessor is a function that
+        returns the serialized value of the field for a given sound. This is equivalent to the default
+        to_representation of serializers, but avoids going through the fields machinery for every sound.
+        """
+        plan = []
+        for field_name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                plan.append((field_name, getattr(self, field.method_name)))
+            else:
+                plan.append((field_name, partial(serialize_model_field, field)))
+        return plan
+
+    def to_representation(self, instance):
+        ret = {}
+        for field_name, accessor in self.field_plan:
+            try:
+                ret[field_name] = accessor(instance)
+            except SkipField:
+                # As in Serializer.to_representation, fields which raise SkipField are not included
+                continue
+        return ret
+
+    @cached_property
+    def base_url(self):
+        return prepend_base("", request_is_secure=self.context["request"].is_secure())
+
+    def absolute_url(self, rel):
+        """Same as prepend_base, but only checking if the request is secure and getting the site domain once"""
+        if rel.startswith("http"):
+            return rel
+        return self.base_url + rel
+
+    def object_url(self, view_name, object_id):
+        """Returns the absolute URL of a view which only takes an object ID as argument. The view is reversed only
+        once per serializer (using a placeholder ID) and the URLs of other objects are built from the result.
+        """
+        if view_name not in self.object_url_parts:
+            url = self.absolute_url(reverse(view_name, args=[OBJECT_ID_PLACEHOLDER]))
+            self.object_url_parts[view_name] = url.split(str(OBJECT_ID_PLACEHOLDER), 1)
+        prefix, suffix = self.object_url_parts[view_name]
+        return f"{prefix}{object_id}{suffix}"
+
     class Meta:
         model = Sound
         fields = (
@@ -179,9 +249,7 @@ class AbstractSoundSerializer(serializers.HyperlinkedModelSerializer):
 
     def get_url(self, obj):
         username = self.get_username(obj)
-        return prepend_base(
-            reverse("sound", args=[username, obj.id]), request_is_secure=self.context["request"].is_secure()
-        )
+        return self.absolute_url(reverse("sound", args=[username, obj.id]))
 
     username = serializers.SerializerMethodField()
 
@@ -253,10 +321,7 @@ class AbstractSoundSerializer(serializers.HyperlinkedModelSerializer):
 
     def get_pack(self, obj):
         if obj.pack:
-            return prepend_base(
-                reverse("apiv2-pack-instance", args=[obj.pack_id]),
-                request_is_secure=self.context["request"].is_secure(),
-            )
+            return self.object_url("apiv2-pack-instance", obj.pack_id)
         else:
             return None
 
@@ -272,47 +337,31 @@ class AbstractSoundSerializer(serializers.HyperlinkedModelSerializer):
 
     def get_previews(self, obj):
         return {
-            "preview-hq-mp3": prepend_base(
-                obj.locations("preview.HQ.mp3.url"), request_is_secure=self.context["request"].is_secure()
-            ),
-            "preview-hq-ogg": prepend_base(
-                obj.locations("preview.HQ.ogg.url"), request_is_secure=self.context["request"].is_secure()
-            ),
-            "preview-lq-mp3": prepend_base(
-                obj.locations("preview.LQ.mp3.url"), request_is_secure=self.context["request"].is_secure()
-            ),
-            "preview-lq-ogg": prepend_base(
-                obj.locations("preview.LQ.ogg.url"), request_is_secure=self.context["request"].is_secure()
-            ),
+            "preview-hq-mp3": self.absolute_url(obj.locations("preview.HQ.mp3.url")),
+            "preview-hq-ogg": self.absolute_url(obj.locations("preview.HQ.ogg.url")),
+            "preview-lq-mp3": self.absolute_url(obj.locations("preview.LQ.mp3.url")),
+            "preview-lq-ogg": self.absolute_url(obj.locations("preview.LQ.ogg.url")),
         }
 
     images = serializers.SerializerMethodField()
 
     def get_images(self, obj):
         return {
-            "waveform_m": prepend_base(
-                obj.locations("display.wave.M.url"), request_is_secure=self.context["request"].is_secure()
-            ),
-            "waveform_l": prepend_base(
-                obj.locations("display.wave.L.url"), request_is_secure=self.context["request"].is_secure()
-            ),
-            "spectral_m": prepend_base(
-                obj.locations("display.spectral.M.url"), request_is_secure=self.context["request"].is_secure()
+            "waveform_m": self.absolute_url(obj.locations("display.wave.M.url")),
+            "waveform_l": self.absolute_url(obj.locations("display.wave.L.url")),
+            "spectral_m": self.absolute_url(obj.locations("display.spectral.M.url")),
+            "spectral_l": self.absolute_url(obj.locations("display.spectral.L.url")),
+            "waveform_bw_m": self.absolute_url(  # We keep this field for backward compatibility, but it actually contains the same image as waveform_m
+                obj.locations("display.wave.M.url")
             ),
-            "spectral_l": prepend_base(
-                obj.locations("display.spectral.L.url"), request_is_secure=self.context["request"].is_secure()
+            "waveform_bw_l": self.absolute_url(  # We keep this field for backward compatibility, but it actually contains the same image as waveform_l
+                obj.locations("display.wave.L.url")
             ),
-            "waveform_bw_m": prepend_base(  # We keep this field for backward compatibility, but it actually contains the same image as waveform_m
-                obj.locations("display.wave.M.url"), request_is_secure=self.context["request"].is_secure()
+            "spectral_bw_m": self.absolute_url(  # We keep this field for backward compatibility, but it actually contains the same image as spectral_m
+                obj.locations("display.spectral.M.url")
             ),
-            "waveform_bw_l": prepend_base(  # We keep this field for backward compatibility, but it actually contains the same image as waveform_l
-                obj.locations("display.wave.L.url"), request_is_secure=self.context["request"].is_secure()
-            ),
-            "spectral_bw_m": prepend_base(  # We keep this field for backward compatibility, but it actually contains the same image as spectral_m
-                obj.locations("display.spectral.M.url"), request_is_secure=self.context["request"].is_secure()
-            ),
-            "spectral_bw_l": prepend_base(  # We keep this field for backward compatibility, but it actually contains the same image as spectral_l
-                obj.locations("display.spectral.L.url"), request_is_secure=self.context["request"].is_secure()
+            "spectral_bw_l": self.absolute_url(  # We keep this field for backward compatibility, but it actually contains the same image as spectral_l
+                obj.locations("display.spectral.L.url")
             ),
         }
 
@@ -321,44 +370,32 @@ class AbstractSoundSerializer(serializers.HyperlinkedModelSerializer):
     def get_similar_sounds(self, obj):
         if obj.similarity_state != "OK":
             return None
-        return prepend_base(
-            reverse("apiv2-similarity-sound", args=[obj.id]), request_is_secure=self.context["request"].is_secure()
-        )
+        return self.object_url("apiv2-similarity-sound", obj.id)
 
     download = serializers.SerializerMethodField()
 
     def get_download(self, obj):
-        return prepend_base(
-            reverse("apiv2-sound-download", args=[obj.id]), request_is_secure=self.context["request"].is_secure()
-        )
+        return self.object_url("apiv2-sound-download", obj.id)
 
     rate = serializers.SerializerMethodField()
 
     def get_rate(self, obj):
-        return prepend_base(
-            reverse("apiv2-user-create-rating", args=[obj.id]), request_is_secure=self.context["request"].is_secure()
-        )
+        return self.object_url("apiv2-user-create-rating", obj.id)
 
     bookmark = serializers.SerializerMethodField()
 
     def get_bookmark(self, obj):
-        return prepend_base(
-            reverse("apiv2-user-create-bookmark", args=[obj.id]), request_is_secure=self.context["request"].is_secure()
-        )
+        return self.object_url("apiv2-user-create-bookmark", obj.id)
 
     comment = serializers.SerializerMethodField()
 
     def get_comment(self, obj):
-        return prepend_base(
-            reverse("apiv2-user-create-comment", args=[obj.id]), request_is_secure=self.context["request"].is_secure()
-        )
+        return self.object_url("apiv2-user-create-comment", obj.id)
 
     ratings = serializers.SerializerMethodField()
 
     def get_ratings(self, obj):
-        return prepend_base(
-            reverse("apiv2-sound-ratings", args=[obj.id]), request_is_secure=self.context["request"].is_secure()
-        )
+        return self.object_url("apiv2-sound-ratings", obj.id)
 
     avg_rating = serializers.SerializerMethodField()
 
@@ -368,9 +405,7 @@ class AbstractSoundSerializer(serializers.HyperlinkedModelSerializer):
     comments = serializers.SerializerMethodField()
 
     def get_comments(self, obj):
-        return prepend_base(
-            reverse("apiv2-sound-comments", args=[obj.id]), request_is_secure=self.context["request"].is_secure()
-        )
+        return self.object_url("apiv2-sound-comments", obj.id)
 
     geotag = serializers.SerializerMethodField()
 
@@ -24,12 +24,18 @@ from django.conf import settings
 from django.contrib.auth.models import AnonymousUser, User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
+from django.core.cache import caches
+from django.core.management import call_command
 from django.http import Http404
-from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from apiv2.models import ApiV2Client
+from apiv2.api_usage import api_requests_total, flush_api_usage, get_api_usage_counts
+from apiv2.apiv2_utils import prepend_base
+from apiv2.models import APIClientDailyUsageHistory, ApiV2Client
 from apiv2.serializers import DEFAULT_FIELDS_IN_SOUND_LIST, SoundListSerializer, SoundSerializer
 from bookmarks.models import Bookmark, BookmarkCategory
 from sounds.models import Sound
@@ -157,6 +163,37 @@ class TestAPI(TestCase):
         )
         self.assertEqual(resp.status_code, 200)
 
+    def test_api_usage_accounting(self):
+        user, packs, sounds = create_user_and_sounds(num_sounds=1)
+        sound = sounds[0]
+        sound.change_processing_state("OK")
+        sound.change_moderation_state("OK")
+        c = ApiV2Client.objects.create(
+            user=user, status="OK", redirect_uri="https://freesound.com", url="https://freesound.com", name="test"
+        )
+        client_id = c.oauth_client.client_id
+        caches["api_monitoring"].clear()
+        headers = {"HTTP_AUTHORIZATION": f"Token {c.key}"}
+        url = reverse("apiv2-sound-instance", kwargs={"pk": sound.id})
+        today = timezone.now().date()
+        requests_before = counter_samples(api_requests_total, "client_id").get((client_id,), 0)
+
+        # Counts are flushed after every request when API_USAGE_FLUSH_INTERVAL is 0 (as in tests)
+        for _ in range(2):
+            self.assertEqual(self.client.get(url, secure=True, **headers).status_code, 200)
+        self.assertDictEqual(get_api_usage_counts(today), {client_id: 2})
+
+        # Otherwise counts are kept in memory until they are flushed
+        with override_settings(API_USAGE_FLUSH_INTERVAL=60), mock.patch("apiv2.api_usage.start_flusher_thread"):
+            self.assertEqual(self.client.get(url, secure=True, **headers).status_code, 200)
+            self.assertDictEqual(get_api_usage_counts(today), {client_id: 2})
+            flush_api_usage()
+            self.assertDictEqual(get_api_usage_counts(today), {client_id: 3})
+        self.assertEqual(counter_samples(api_requests_total, "client_id")[(client_id,)], requests_before + 3)
+
+        call_command("consolidate_api_usage_data")
+        self.assertEqual(APIClientDailyUsageHistory.objects.get(apiv2_client=c, date=today).number_of_requests, 3)
+
 
 class TestSoundCombinedSearchFormAPI(SimpleTestCase):
     # Query
@@ -304,6 +341,70 @@ class TestSoundListSerializer(TestCase):
                     # Call serializer .data to actually get the data and potentially trigger unwanted extra queries
                     _ = SoundListSerializer(sound, context={"request": dummy_request}).data
 
+    def get_expected_urls(self, sound):
+        # URLs built as done before serializers reversed views only once (see AbstractSoundSerializer.object_url)
+        def absolute_url(rel):
+            return prepend_base(rel, request_is_secure=True)
+
+        return {
+            "url": absolute_url(reverse("sound", args=[sound.username, sound.id])),
+            "pack": absolute_url(reverse("apiv2-pack-instance", args=[sound.pack_id])) if sound.pack_id else None,
+            "download": absolute_url(reverse("apiv2-sound-download", args=[sound.id])),
+            "bookmark": absolute_url(reverse("apiv2-user-create-bookmark", args=[sound.id])),
+            "rate": absolute_url(reverse("apiv2-user-create-rating", args=[sound.id])),
+            "comments": absolute_url(reverse("apiv2-sound-comments", args=[sound.id])),
+            "comment": absolute_url(reverse("apiv2-user-create-comment", args=[sound.id])),
+            "similar_sounds": absolute_url(reverse("apiv2-similarity-sound", args=[sound.id]))
+            if sound.similarity_state == "OK"
+            else None,
+            "previews": {
+                "preview-hq-mp3": absolute_url(sound.locations("preview.HQ.mp3.url")),
+                "preview-hq-ogg": absolute_url(sound.locations("preview.HQ.ogg.url")),
+                "preview-lq-mp3": absolute_url(sound.locations("preview.LQ.mp3.url")),
+                "preview-lq-ogg": absolute_url(sound.locations("preview.LQ.ogg.url")),
+            },
+        }
+
+    def test_field_plan(self):
+        # Test that serializing sounds with the field plan of a single serializer returns the same as serializing each
+        # sound with the default to_representation of serializers
+        domain = Site.objects.get_current().domain
+        sounds_dict = Sound.objects.dict_ids(
+            sound_ids=self.sids,
+            include_audio_descriptors=True,
+            include_similarity_vectors=True,
+            include_remix_subqueries=True,
+        )
+        for field_set in ["", "*", "id,pack,previews,download,similar_sounds"]:
+            dummy_request = self.factory.get(reverse("apiv2-sound-search"), {"fields": field_set}, secure=True)
+            serializer = SoundListSerializer(context={"request": dummy_request})
+            for sound in sounds_dict.values():
+                self.assertDictEqual(
+                    serializer.to_representation(sound),
+                    dict(
+                        serializers.ModelSerializer.to_representation(
+                            SoundListSerializer(sound, context={"request": dummy_request}), sound
+                        )
+                    ),
+                )
+
+        # As both ways of serializing sounds build URLs in the same way, URLs are checked separately
+        dummy_request = self.factory.get(reverse("apiv2-sound-search"), {"fields": "*"}, secure=True)
+        serializer = SoundListSerializer(context={"request": dummy_request})
+        for sound in sounds_dict.values():
+            serialized_sound = serializer.to_representation(sound)
+            for field_name, expected_url in self.get_expected_urls(sound).items():
+                self.assertEqual(serialized_sound[field_name], expected_url)
+            self.assertEqual(serialized_sound["download"], f"https://{domain}/apiv2/sounds/{sound.id}/download/")
+
+    def test_field_plan_skip_field(self):
+        # Fields which raise SkipField are not included, as in the default to_representation of serializers
+        dummy_request = self.factory.get(reverse("apiv2-sound-search"), {"fields": "id,name"})
+        serializer = SoundListSerializer(context={"request": dummy_request})
+        sound = Sound.objects.get(id=self.sids[0])
+        with mock.patch.object(serializer.fields["name"], "get_attribute", side_effect=serializers.SkipField):
+            self.assertDictEqual(serializer.to_representation(sound), {"id": sound.id})
+
 
 class TestSoundSerializer(TestCase):
     fixtures = ["licenses", "sounds"]
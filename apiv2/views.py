@@ -230,14 +230,12 @@ class TextSearch(GenericAPIView):
             include_similarity_vectors=needs_similarity_vectors,
             include_remix_subqueries=include_remix_subqueries,
         )
+        # Use the same serializer for all sounds so that requested fields are only processed once
+        serializer = SoundListSerializer(context=self.get_serializer_context(), score_map=id_score_map)
         sounds = []
         for i, sid in enumerate(sound_ids):
             try:
-                sound = SoundListSerializer(
-                    sounds_dict[sid],
-                    context=self.get_serializer_context(),
-                    score_map=id_score_map,
-                ).data
+                sound = serializer.to_representation(sounds_dict[sid])
                 if more_from_pack_data:
                     if more_from_pack_data[sid][0]:
                         pack_id = more_from_pack_data[sid][1][: more_from_pack_data[sid][1].find("_")]
@@ -411,12 +409,12 @@ class SimilarSounds(GenericAPIView):
             include_remix_subqueries=include_remix_subqueries,
         )
 
+        # Use the same serializer for all sounds so that requested fields are only processed once
+        serializer = SoundListSerializer(score_map=id_score_map, context=self.get_serializer_context())
         sounds = []
         for i, sid in enumerate(ids):
             try:
-                sound = SoundListSerializer(
-                    sounds_dict[sid], score_map=id_score_map, context=self.get_serializer_context()
-                ).data
+                sound = serializer.to_representation(sounds_dict[sid])
                 sounds.append(sound)
             except:
                 # This will happen if there are synchronization errors between gaia and the database.
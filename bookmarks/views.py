@@ -30,6 +30,7 @@ from django.urls import reverse
 from bookmarks.forms import BookmarkCategoryForm, BookmarkForm
 from bookmarks.models import Bookmark, BookmarkCategory
 from sounds.models import Sound
+from sounds.sound_loader import get_sound_loader
 from utils.download_limit import (
     DownloadType,
     count_download_and_set_sentinel,
@@ -64,6 +65,7 @@ def bookmarks(request, category_id=None):
 
     paginator = paginate(request, bookmarked_sounds, settings.BOOKMARKS_PER_PAGE)
     page_sounds = Sound.objects.ordered_ids([bookmark.sound_id for bookmark in paginator["page"].object_list])
+    get_sound_loader(request).add(page_sounds)
     tvars.update(paginator)
     tvars["page_bookmarks_and_sound_objects"] = zip(paginator["page"].object_list, page_sounds)
     tvars["download_limit_reached"] = user_download_limit_reached(request)
@@ -33,7 +33,9 @@ from django.conf import settings
 from networkx.algorithms.community import k_clique_communities
 from networkx.readwrite import json_graph
 from past.utils import old_div
+from scipy import sparse
 from sklearn import metrics
+from sklearn.cluster import MiniBatchKMeans
 from sklearn.feature_selection import mutual_info_classif
 from sklearn.neighbors import kneighbors_graph
 
@@ -384,3 +386,255 @@ class ClusteringEngine(object):
         graph_json = json_graph.node_link_data(graph)
 
         return {"clusters": communities, "graph": graph_json}
+
+
+def _nearest_neighbors(features, squared_norms, queries, candidates, k):
+    """Finds the k nearest neighbors of the points with indexes queries among the points with indexes candidates
+    (a point is not considered to be its own neighbor). Returns the indexes of the queries repeated k times, the
+    indexes of their neighbors and the squared distances to them as flat arrays."""
+    k = min(k, len(candidates) - 1)
+    squared_distances = (
+        squared_norms[queries, None] - 2 * features[queries] @ features[candidates].T + squared_norms[candidates]
+    )
+    squared_distances[queries[:, None] == candidates[None, :]] = np.inf
+    neighbors = np.argpartition(squared_distances, k - 1, axis=1)[:, :k]
+    return (
+        np.repeat(queries, k),
+        candidates[neighbors.ravel()],
+        np.take_along_axis(squared_distances, neighbors, axis=1).ravel(),
+    )
+
+
+def knn_adjacency_matrix(features, k, max_distance=None, num_cells=None, num_probes=8, block_size=1024, seed=0):
+    """Builds the symmetric adjacency matrix of the k nearest neighbors graph of the given feature vectors.
+
+    Distances are computed in blocks with matrix products and the k nearest neighbors are selected with a partial
+    sort, so no pairwise distance matrix is kept in memory. If num_cells is given, neighbors are searched
+    approximately using an inverted file index: points are assigned to num_cells cells with k-means, and the
+    neighbors of the points in a cell are only searched among the points in the num_probes cells with the closest
+    centroids. Otherwise, the exact nearest neighbors are computed. Two points are connected if one of them is
+    among the k nearest neighbors of the other (and their distance is below max_distance, if given).
+
+    Args:
+        features (np.ndarray): N x D array with the feature vectors.
+        k (int): number of neighbors of each point.
+        max_distance (float): maximum euclidean distance between connected points.
+        num_cells (int): number of cells of the inverted file index (None for exact search).
+        num_probes (int): number of cells where the neighbors of each point are searched.
+        block_size (int): number of points for which distances are computed at once in exact search.
+        seed (int): random seed for the k-means of the inverted file index.
+
+    Returns:
+        scipy.sparse.csr_matrix: N x N binary adjacency matrix.
+    """
+    num_points = features.shape[0]
+    if min(k, num_points - 1) < 1:
+        return sparse.csr_matrix((num_points, num_points), dtype=np.float32)
+    squared_norms = np.einsum("ij,ij->i", features, features)
+    all_points = np.arange(num_points)
+    if num_cells is None or num_cells <= num_probes:
+        search_batches = [
+            (all_points[start : start + block_size], all_points) for start in range(0, num_points, block_size)
+        ]
+    else:
+        kmeans = MiniBatchKMeans(n_clusters=num_cells, n_init=1, random_state=seed).fit(features)
+        cell_points = [np.flatnonzero(kmeans.labels_ == cell) for cell in range(num_cells)]
+        centroids = kmeans.cluster_centers_
+        centroid_distances = ((centroids[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+        probed_cells = np.argsort(centroid_distances, axis=1)[:, :num_probes]
+        search_batches = []
+        for cell in range(num_cells):
+            if len(cell_points[cell]) > 0:
+                candidates = np.concatenate([cell_points[probed_cell] for probed_cell in probed_cells[cell]])
+                if len(candidates) <= k:
+                    candidates = all_points  # Not enough candidates in the probed cells
+                search_batches.append((cell_points[cell], np.sort(candidates)))
+
+    rows, columns = [], []
+    for queries, candidates in search_batches:
+        batch_rows, batch_columns, batch_squared_distances = _nearest_neighbors(
+            features, squared_norms, queries, candidates, k
+        )
+        if max_distance is not None:
+            close_enough = batch_squared_distances < max_distance**2
+            batch_rows, batch_columns = batch_rows[close_enough], batch_columns[close_enough]
+        rows.append(batch_rows)
+        columns.append(batch_columns)
+    rows, columns = np.concatenate(rows), np.concatenate(columns)
+    adjacency = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=(num_points, num_points)
+    )
+    return adjacency.maximum(adjacency.T).tocsr()
+
+
+def louvain_partition(adjacency):
+    """Detects communities in a graph given as a sparse adjacency matrix with the Louvain method, using the same
+    python-louvain implementation as ClusteringEngine.cluster_graph.
+
+    Args:
+        adjacency (scipy.sparse.csr_matrix): symmetric adjacency matrix of the graph.
+
+    Returns:
+        np.ndarray: community index of each node (consecutive integers starting at 0).
+    """
+    partition = com.best_partition(nx.from_scipy_sparse_array(adjacency))
+    return np.array([partition[node] for node in range(adjacency.shape[0])])
+
+
+def modularity(adjacency, partition):
+    """Modularity of the given partition (community index of each node) of a graph with the given adjacency
+    matrix."""
+    total_weight = adjacency.sum()
+    if total_weight == 0:
+        return 0.0
+    coo = adjacency.tocoo()
+    intra_weights = np.bincount(
+        partition[coo.row], weights=coo.data * (partition[coo.row] == partition[coo.col]), minlength=partition.max() + 1
+    )
+    community_degrees = np.bincount(
+        partition, weights=np.asarray(adjacency.sum(axis=1)).ravel(), minlength=partition.max() + 1
+    )
+    return float(np.sum(intra_weights / total_weight - (community_degrees / total_weight) ** 2))
+
+
+class SparseClusteringEngine(ClusteringEngine):
+    """Clustering Engine working on sparse matrices.
+
+    Performs the same steps as ClusteringEngine (K-Nearest Neighbors graph, Louvain community detection, removal of
+    low quality clusters and community centralities) but using a scipy CSR adjacency matrix and NumPy operations
+    instead of a NetworkX graph. Only the Louvain community detection works on a NetworkX graph (built from the
+    adjacency matrix) so that it uses the same python-louvain implementation as ClusteringEngine. The NetworkX-style
+    node-link JSON is only built for the final graph.
+    """
+
+    def create_knn_adjacency_matrix(self, similarity_vectors_map):
+        """Creates the adjacency matrix of a K-Nearest Neighbors Graph of the given sounds.
+
+        Args:
+            similarity_vectors_map (Dict{int:List[float]}): dictionary with the similarity feature vectors for each sound.
+
+        Returns:
+            Tuple(List[str], scipy.sparse.csr_matrix): sound ids and adjacency matrix of the graph (with isolated
+                nodes removed).
+        """
+        sound_ids = [str(sound_id) for sound_id in similarity_vectors_map.keys()]
+        if len(sound_ids) < 2:
+            return [], sparse.csr_matrix((0, 0), dtype=np.float32)
+        sound_features = np.array(list(similarity_vectors_map.values())).astype("float32")
+        # As in ClusteringEngine.create_knn_graph, k is set to log2(N)
+        k = int(np.ceil(np.log2(len(sound_ids))))
+        # For large numbers of sounds, approximate nearest neighbors are used (with ~sqrt(N) cells in the index)
+        num_cells = None
+        if len(sound_ids) >= settings.CLUSTERING_APPROXIMATE_KNN_MIN_POINTS:
+            num_cells = int(np.sqrt(len(sound_ids)))
+        # Neighbors are not filtered by distance: ClusteringEngine.create_knn_graph compares
+        # CLUSTERING_MAX_NEIGHBORS_DISTANCE with the values of a connectivity graph, which are all 1, so it keeps all
+        # the edges as well
+        adjacency = knn_adjacency_matrix(
+            sound_features,
+            k,
+            num_cells=num_cells,
+            num_probes=settings.CLUSTERING_APPROXIMATE_KNN_NUM_PROBES,
+        )
+
+        # Remove isolated nodes
+        connected = np.flatnonzero(adjacency.getnnz(axis=1))
+        return [sound_ids[idx] for idx in connected], adjacency[connected][:, connected].tocsr()
+
+    def _ratio_intra_community_edges_sparse(self, adjacency, partition, num_communities):
+        """Same as ClusteringEngine._ratio_intra_community_edges for a graph given as an adjacency matrix."""
+        coo = sparse.triu(adjacency, k=1).tocoo()
+        same_community = partition[coo.row] == partition[coo.col]
+        intra_community_edges = np.bincount(partition[coo.row][same_community], minlength=num_communities)
+        degrees = adjacency.getnnz(axis=1)
+        total_community_edges = (
+            np.bincount(partition, weights=degrees, minlength=num_communities) - intra_community_edges
+        )
+        return [round(a / float(b), 2) for a, b in zip(intra_community_edges, total_community_edges)]
+
+    def _point_centralities_sparse(self, adjacency, partition, num_communities):
+        """Same as ClusteringEngine._point_centralities for a graph given as an adjacency matrix: the degree of each
+        node counting only edges inside its community, normalised by the maximum in the community."""
+        coo = adjacency.tocoo()
+        same_community = partition[coo.row] == partition[coo.col]
+        intra_community_degrees = np.bincount(coo.row[same_community], minlength=adjacency.shape[0])
+        max_degrees = np.zeros(num_communities)
+        np.maximum.at(max_degrees, partition, intra_community_degrees)
+        max_degrees = max_degrees[partition]
+        return np.divide(intra_community_degrees, max_degrees, out=np.ones(len(partition)), where=max_degrees > 0)
+
+    def cluster_points(self, query_params, sound_ids, similarity_vectors_map):
+        """Applies clustering on the requested sounds using the given features name.
+
+        Args:
+            query_params (str): string representing the query parameters submitted by the user to the search engine.
+            sound_ids (List[int]): list containing the ids of the sound to cluster.
+            similarity_vectors_map (Dict{int:List[float]}): dictionary with the similarity feature vectors for each sound.
+
+        Returns:
+            Dict: contains the resulting clustering classes and the graph in node-link format suitable for JSON serialization.
+        """
+        start_time = time()
+        sound_ids = [str(s) for s in sound_ids]
+        logger.info(
+            'Request clustering of {} points: {} ... from the query "{}"'.format(
+                len(sound_ids), ", ".join(sound_ids[:20]), json.dumps(query_params)
+            )
+        )
+
+        node_ids, adjacency = self.create_knn_adjacency_matrix(similarity_vectors_map)
+        if len(node_ids) == 0:  # the graph does not contain any node
+            return {"clusters": None, "graph": None}
+
+        partition = louvain_partition(adjacency)
+        num_communities = partition.max() + 1
+        graph_modularity = modularity(adjacency, partition)
+        ratio_intra_community_edges = self._ratio_intra_community_edges_sparse(adjacency, partition, num_communities)
+
+        # Discard low quality clusters if there are more than NUM_MAX_CLUSTERS clusters (but keep at least 2)
+        num_clusters_to_keep = max(settings.CLUSTERING_NUM_MAX_CLUSTERS, 2)
+        if num_communities > num_clusters_to_keep:
+            communities_to_keep = np.sort(
+                np.argsort(ratio_intra_community_edges, kind="stable")[::-1][:num_clusters_to_keep]
+            )
+            ratio_intra_community_edges = [ratio_intra_community_edges[idx] for idx in communities_to_keep]
+            new_community_index = np.full(num_communities, -1)
+            new_community_index[communities_to_keep] = np.arange(len(communities_to_keep))
+            partition = new_community_index[partition]
+            kept_nodes = np.flatnonzero(partition >= 0)
+            node_ids = [node_ids[idx] for idx in kept_nodes]
+            adjacency = adjacency[kept_nodes][:, kept_nodes].tocsr()
+            partition = partition[kept_nodes]
+            num_communities = len(communities_to_keep)
+
+        node_community_centralities = self._point_centralities_sparse(adjacency, partition, num_communities)
+        communities = [[] for _ in range(num_communities)]
+        for node_id, community in zip(node_ids, partition.tolist()):
+            communities[community].append(node_id)
+
+        end_time = time()
+        logger.info(
+            "Clustering done! It took {} seconds. Modularity: {}, Average ratio_intra_community_edges: {}".format(
+                end_time - start_time, graph_modularity, np.mean(ratio_intra_community_edges)
+            )
+        )
+
+        # Export graph as json (same format as networkx.readwrite.json_graph.node_link_data)
+        links = sparse.triu(adjacency, k=1).tocoo()
+        graph_json = {
+            "directed": False,
+            "multigraph": False,
+            "graph": {},
+            "nodes": [
+                {"group": community, "group_centrality": centrality, "id": node_id}
+                for node_id, community, centrality in zip(
+                    node_ids, partition.tolist(), node_community_centralities.tolist()
+                )
+            ],
+            "links": [
+                {"source": node_ids[source], "target": node_ids[target]}
+                for source, target in zip(links.row.tolist(), links.col.tolist())
+            ],
+        }
+
+        return {"clusters": communities, "graph": graph_json}
@@ -24,8 +24,7 @@ import time
 
 from celery import Task, shared_task
 from django.conf import settings
-
-from .clustering import ClusteringEngine
+from django.utils.module_loading import import_string
 
 workers_logger = logging.getLogger("workers")
 
@@ -34,7 +33,7 @@ class ClusteringTask(Task):
     """Task Class used  for defining the clustering engine only required in celery workers"""
 
     def __init__(self):
-        self.engine = ClusteringEngine()
+        self.engine = import_string(settings.CLUSTERING_ENGINE_CLASS)()
 
 
 @shared_task(name="cluster_sounds", base=ClusteringTask, queue=settings.CELERY_CLUSTERING_TASK_QUEUE_NAME)
@@ -0,0 +1,144 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+import community as com
+import networkx as nx
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+from scipy import sparse
+
+from clustering.clustering import (
+    ClusteringEngine,
+    SparseClusteringEngine,
+    knn_adjacency_matrix,
+    louvain_partition,
+    modularity,
+)
+
+
+def create_similarity_vectors_map(num_blobs, num_sounds_per_blob, num_dimensions=32, seed=0):
+    """Returns similarity vectors of sounds forming well separated blobs, and the blob of each sound"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(num_blobs, num_dimensions))
+    similarity_vectors_map = {}
+    blobs = {}
+    for blob in range(num_blobs):
+        for i in range(num_sounds_per_blob):
+            sound_id = str(1000 * (blob + 1) + i)
+            vector = centers[blob] + 0.05 * rng.normal(size=num_dimensions)
+            similarity_vectors_map[sound_id] = (vector / np.linalg.norm(vector)).tolist()
+            blobs[sound_id] = blob
+    return similarity_vectors_map, blobs
+
+
+class SparseClusteringEngineTest(SimpleTestCase):
+    def test_louvain_partition(self):
+        # Two cliques of 5 nodes joined by a single edge
+        graph = nx.disjoint_union(nx.complete_graph(5), nx.complete_graph(5))
+        graph.add_edge(0, 5)
+        adjacency = sparse.csr_matrix(nx.to_scipy_sparse_array(graph, nodelist=range(10)))
+        partition = louvain_partition(adjacency)
+        self.assertEqual(len(set(partition[:5])), 1)
+        self.assertEqual(len(set(partition[5:])), 1)
+        self.assertNotEqual(partition[0], partition[5])
+        self.assertAlmostEqual(
+            modularity(adjacency, partition), com.modularity(dict(enumerate(partition.tolist())), graph)
+        )
+
+    def test_knn_adjacency_matrix(self):
+        similarity_vectors_map, _ = create_similarity_vectors_map(4, 50)
+        features = np.array(list(similarity_vectors_map.values()), dtype=np.float32)
+        exact = knn_adjacency_matrix(features, 8)
+        self.assertEqual((exact != exact.T).nnz, 0)
+        self.assertEqual(exact.diagonal().sum(), 0)
+        self.assertTrue(np.all(exact.getnnz(axis=1) >= 8))
+
+        # Same graph as the one built by sklearn (kNN graph made symmetric)
+        reference = ClusteringEngine().create_knn_graph(list(similarity_vectors_map.keys()), similarity_vectors_map)
+        self.assertEqual(exact.nnz // 2, reference.number_of_edges())
+
+        # Approximate nearest neighbors find almost all of the exact neighbors
+        approximate = knn_adjacency_matrix(features, 8, num_cells=8, num_probes=3)
+        self.assertGreater(exact.multiply(approximate).nnz / exact.nnz, 0.95)
+
+        # Neighbors further than max_distance are not connected
+        self.assertEqual(knn_adjacency_matrix(features, 8, max_distance=0.0).nnz, 0)
+
+    def test_knn_adjacency_matrix_keeps_far_neighbors(self):
+        # As in ClusteringEngine, neighbors are connected regardless of CLUSTERING_MAX_NEIGHBORS_DISTANCE
+        similarity_vectors_map, _ = create_similarity_vectors_map(2, 20)
+        similarity_vectors_map = {
+            sound_id: (1000 * np.array(vector)).tolist() for sound_id, vector in similarity_vectors_map.items()
+        }
+        sound_ids = list(similarity_vectors_map.keys())
+        node_ids, adjacency = SparseClusteringEngine().create_knn_adjacency_matrix(similarity_vectors_map)
+        reference = ClusteringEngine().create_knn_graph(sound_ids, similarity_vectors_map)
+        self.assertCountEqual(node_ids, reference.nodes)
+        self.assertEqual(adjacency.nnz // 2, reference.number_of_edges())
+
+    @override_settings(CLUSTERING_APPROXIMATE_KNN_MIN_POINTS=100)
+    def test_cluster_points(self):
+        similarity_vectors_map, blobs = create_similarity_vectors_map(3, 60)
+        sound_ids = list(similarity_vectors_map.keys())
+        results = SparseClusteringEngine().cluster_points("query", sound_ids, similarity_vectors_map)
+
+        # Each cluster corresponds to one blob
+        self.assertEqual(len(results["clusters"]), 3)
+        self.assertCountEqual(
+            [len({blobs[sound_id] for sound_id in cluster}) for cluster in results["clusters"]], [1] * 3
+        )
+        self.assertCountEqual([sound_id for cluster in results["clusters"] for sound_id in cluster], sound_ids)
+
+        # Graph is in the same node-link format as produced by ClusteringEngine
+        graph = results["graph"]
+        reference_graph = ClusteringEngine().cluster_points("query", sound_ids, similarity_vectors_map)["graph"]
+        self.assertCountEqual(graph.keys(), reference_graph.keys())
+        self.assertCountEqual(graph["nodes"][0].keys(), reference_graph["nodes"][0].keys())
+        self.assertCountEqual(graph["links"][0].keys(), reference_graph["links"][0].keys())
+        for node in graph["nodes"]:
+            self.assertIn(node["id"], results["clusters"][node["group"]])
+            self.assertTrue(0 < node["group_centrality"] <= 1)
+        for cluster_index in range(3):
+            self.assertEqual(
+                max(node["group_centrality"] for node in graph["nodes"] if node["group"] == cluster_index), 1
+            )
+        for link in graph["links"]:
+            self.assertEqual(blobs[link["source"]], blobs[link["target"]])
+
+    @override_settings(CLUSTERING_NUM_MAX_CLUSTERS=2)
+    def test_cluster_points_max_clusters(self):
+        similarity_vectors_map, _ = create_similarity_vectors_map(4, 30)
+        results = SparseClusteringEngine().cluster_points(
+            "query", list(similarity_vectors_map.keys()), similarity_vectors_map
+        )
+        self.assertEqual(len(results["clusters"]), 2)
+        node_ids = {node["id"] for node in results["graph"]["nodes"]}
+        self.assertSetEqual(node_ids, {sound_id for cluster in results["clusters"] for sound_id in cluster})
+        self.assertSetEqual({node["group"] for node in results["graph"]["nodes"]}, {0, 1})
+        for link in results["graph"]["links"]:
+            self.assertIn(link["source"], node_ids)
+            self.assertIn(link["target"], node_ids)
+
+    def test_cluster_points_not_enough_sounds(self):
+        similarity_vectors_map, _ = create_similarity_vectors_map(1, 1)
+        results = SparseClusteringEngine().cluster_points(
+            "query", list(similarity_vectors_map.keys()), similarity_vectors_map
+        )
+        self.assertDictEqual(results, {"clusters": None, "graph": None})
@@ -18,6 +18,7 @@
 #     See AUTHORS file.
 #
 
+import datetime
 import time
 import urllib.error
 import urllib.parse
@@ -70,125 +71,203 @@ def is_user_following_tag(user, slash_tag):
     return FollowingQueryItem.objects.filter(user=user, query=slash_tag.replace("/", " ")).exists()
 
 
-def get_stream_sounds(
-    user, time_lapse, num_results_per_group=3, search_engine_backend=None, sleep_between_queries=None
-):
-    if search_engine_backend is None:
-        search_engine = get_search_engine()
-    else:
-        search_engine = search_engine_backend
-
-    #
-    # USERS FOLLOWING
-    #
-
-    users_following = get_users_following(user)
+class StreamDigest:
+    """Computes the new sounds of followed users and tags to be shown in the streams of several users (e.g. in all
+    the stream emails sent in a run of the send_stream_emails command), so that the search engine is queried only once
+    per distinct followed user or tag set, and sound objects are retrieved only once.
+
+    If date_from and date_to are given, the new sounds of each followed user or tag set are searched once in that time
+    window, and the streams of each user are computed from these results (see get_stream_sounds). Otherwise, results
+    are only shared between streams with the same time lapse.
+
+    If prefetch_uploaders is called, followed users who did not upload any sound since the given date are skipped
+    without querying the search engine.
+    """
+
+    def __init__(
+        self,
+        num_results_per_group=3,
+        search_engine_backend=None,
+        sleep_between_queries=None,
+        date_from=None,
+        date_to=None,
+    ):
+        if search_engine_backend is None:
+            search_engine_backend = get_search_engine()
+        self.search_engine = search_engine_backend
+        self.num_results_per_group = num_results_per_group
+        self.sleep_between_queries = sleep_between_queries
+        self.time_lapse = build_time_lapse(date_from, date_to) if date_from is not None else None
+        self.results = {}
+        self.window_results = {}
+        self.sounds = {}
+        self.uploader_ids = None
+        self.num_search_engine_queries = 0
+        self.num_reused_results = 0
+
+    def prefetch_uploaders(self, date_from):
+        """Retrieves in one DB query the users who uploaded public sounds since the given date. Streams computed
+        afterwards should not start before that date.
+        """
+        # Time lapses start at the beginning of the day of date_from in UTC, so we add some margin
+        self.uploader_ids = set(
+            sounds.models.Sound.public.filter(created__gte=date_from - datetime.timedelta(days=1))
+            .values_list("user_id", flat=True)
+            .distinct()
+        )
 
-    users_sounds = []
-    for user_following in users_following:
-        filter_str = 'username:"' + user_following.username + '" created:' + time_lapse
-        result = search_engine.search_sounds(
+    def _search(self, filter_str, num_sounds):
+        result = self.search_engine.search_sounds(
             textual_query="",
             query_filter=filter_str,
             sort=settings.SEARCH_SOUNDS_SORT_OPTION_DATE_NEW_FIRST,
             offset=0,
-            num_sounds=num_results_per_group,
+            num_sounds=num_sounds,
             group_by_pack=False,
         )
+        self.num_search_engine_queries += 1
 
+        # To avoid overwhelming the search engine
+        if self.sleep_between_queries is not None:
+            time.sleep(self.sleep_between_queries)
+
+        return result
+
+    def _new_sounds(self, sound_ids, new_count, filter_str):
+        """Returns the new sounds tuple (see search_new_sounds) for the given IDs of the newest sounds and total number
+        of new sounds"""
+        # the sorting only works if done like this!
+        more_url_params = [
+            urllib.parse.quote(filter_str),
+            urllib.parse.quote(settings.SEARCH_SOUNDS_SORT_OPTION_DATE_NEW_FIRST),
+        ]
+        return sound_ids, more_url_params, new_count - len(sound_ids), new_count
+
+    def search_new_sounds(self, filter_str):
+        """Returns the IDs of the newest sounds matching the filter, the parameters of the URL to see more sounds, the
+        number of sounds not included and the total number of new sounds (or None if there are no new sounds).
+        Results are computed once per filter.
+        """
+        if filter_str in self.results:
+            self.num_reused_results += 1
+            return self.results[filter_str]
+
+        result = self._search(filter_str, self.num_results_per_group)
+        new_sounds = None
         if result.num_rows != 0:
-            more_count = max(0, result.num_found - num_results_per_group)
-
-            # the sorting only works if done like this!
-            more_url_params = [
-                urllib.parse.quote(filter_str),
-                urllib.parse.quote(settings.SEARCH_SOUNDS_SORT_OPTION_DATE_NEW_FIRST),
-            ]
-
-            # this is the same link but for the email has to be "quoted"
-            more_url = "?f=" + filter_str + "&s=" + settings.SEARCH_SOUNDS_SORT_OPTION_DATE_NEW_FIRST
-            # more_url_quoted = urllib.quote(more_url)
-
             sound_ids = [element["id"] for element in result.docs]
-            # sound_objs = sounds.models.Sound.objects.ordered_ids(sound_ids)
-            # NOTE: for now we add sound_ids in users_sounds instead of the actual sound object. We retrieve sound objs later in a single query.
-            new_count = more_count + len(sound_ids)
-            users_sounds.append((user_following, sound_ids, more_url_params, more_count, new_count))
-
-        # To avoid overwhelming the search engine
-        if sleep_between_queries is not None:
-            time.sleep(sleep_between_queries)
-
-    #
-    # TAGS FOLLOWING
-    #
-
-    tags_following = get_tags_following(user)
-
-    tags_sounds = []
-    for tag_following in tags_following:
-        tags = tag_following.split(" ")
-        tag_filter_query = ""
-        for tag in tags:
-            tag_filter_query += "tag:" + tag + " "
-
-        tag_filter_str = tag_filter_query + " created:" + time_lapse
-
-        result = search_engine.search_sounds(
-            textual_query="",
-            query_filter=tag_filter_str,
-            sort=settings.SEARCH_SOUNDS_SORT_OPTION_DATE_NEW_FIRST,
-            offset=0,
-            num_sounds=num_results_per_group,
-            group_by_pack=False,
+            new_sounds = self._new_sounds(sound_ids, max(result.num_found, len(sound_ids)), filter_str)
+        self.results[filter_str] = new_sounds
+        return new_sounds
+
+    def search_new_sounds_in_window(self, filter_str):
+        """Returns the IDs and creation dates of the sounds matching the filter in the time window of the digest
+        (newest first), and whether these are all the sounds in the window or only the newest
+        settings.STREAM_EMAIL_MAX_SOUNDS_PER_SEARCH_ENGINE_QUERY. Results are computed once per filter.
+        """
+        if filter_str in self.window_results:
+            self.num_reused_results += 1
+            return self.window_results[filter_str]
+
+        result = self._search(
+            f"{filter_str} created:{self.time_lapse}", settings.STREAM_EMAIL_MAX_SOUNDS_PER_SEARCH_ENGINE_QUERY
+        )
+        sound_ids = [element["id"] for element in result.docs]
+        created = dict(sounds.models.Sound.objects.filter(id__in=sound_ids).values_list("id", "created"))
+        sounds_created = [(sound_id, created[sound_id]) for sound_id in sound_ids if sound_id in created]
+        self.window_results[filter_str] = (sounds_created, result.num_found <= len(sound_ids))
+        return self.window_results[filter_str]
+
+    def search_new_sounds_since(self, filter_str, time_lapse, date_from):
+        """Same as search_new_sounds for the filter in the given time lapse, which starts at the beginning of the day
+        of date_from, but taking the sounds from the results in the time window of the digest."""
+        sounds_created, all_sounds_in_window = self.search_new_sounds_in_window(filter_str)
+        time_lapse_start = datetime.datetime.combine(date_from.date(), datetime.time.min, tzinfo=datetime.timezone.utc)
+        sound_ids = [sound_id for sound_id, created in sounds_created if created >= time_lapse_start]
+        if not all_sounds_in_window and len(sound_ids) == len(sounds_created):
+            # Sounds in the time lapse which were not retrieved could also be new, search them separately
+            return self.search_new_sounds(f"{filter_str} created:{time_lapse}")
+        if not sound_ids:
+            return None
+        return self._new_sounds(
+            sound_ids[: self.num_results_per_group], len(sound_ids), f"{filter_str} created:{time_lapse}"
         )
 
-        if result.num_rows != 0:
-            more_count = max(0, result.num_found - num_results_per_group)
-
-            # the sorting only works if done like this!
-            more_url_params = [
-                urllib.parse.quote(tag_filter_str),
-                urllib.parse.quote(settings.SEARCH_SOUNDS_SORT_OPTION_DATE_NEW_FIRST),
-            ]
-
-            # this is the same link but for the email has to be "quoted"
-            more_url = "?f=" + tag_filter_str + "&s=" + settings.SEARCH_SOUNDS_SORT_OPTION_DATE_NEW_FIRST
-            # more_url_quoted = urllib.quote(more_url)
+    def get_sounds(self, sound_ids):
+        """Returns the sound objects with the given IDs, retrieving in a single query the ones not retrieved before"""
+        sound_ids_to_retrieve = [sid for sid in set(sound_ids) if sid not in self.sounds]
+        if sound_ids_to_retrieve:
+            sound_objs_dict = sounds.models.Sound.objects.dict_ids(sound_ids_to_retrieve)
+            for sid in sound_ids_to_retrieve:
+                self.sounds[sid] = sound_objs_dict.get(sid, None)
+        return [self.sounds[sid] for sid in sound_ids if self.sounds[sid] is not None]
+
+    def get_stream_sounds(self, user, time_lapse, date_from=None):
+        """Returns the new sounds of the users and tags followed by the user in the given time lapse. If the digest
+        has a time window, date_from (the start of the time lapse, which must be in the time window) can be given so
+        that the new sounds are taken from the results in the time window."""
+
+        def search_new_sounds(filter_str):
+            if date_from is not None and self.time_lapse is not None:
+                return self.search_new_sounds_since(filter_str, time_lapse, date_from)
+            return self.search_new_sounds(f"{filter_str} created:{time_lapse}")
+
+        users_sounds = []
+        for user_following in get_users_following(user):
+            if self.uploader_ids is not None and user_following.id not in self.uploader_ids:
+                continue
+            new_sounds = search_new_sounds('username:"' + user_following.username + '"')
+            if new_sounds is not None:
+                users_sounds.append((user_following, *new_sounds))
+
+        tags_sounds = []
+        for tag_following in get_tags_following(user):
+            tags = tag_following.split(" ")
+            tag_filter_query = ""
+            for tag in tags:
+                tag_filter_query += "tag:" + tag + " "
+            new_sounds = search_new_sounds(tag_filter_query)
+            if new_sounds is not None:
+                tags_sounds.append((tags, *new_sounds))
+
+        # Now retrieve all sound objects that will be needed (the ones not already retrieved for other streams)
+        all_sound_ids_to_retrieve = []
+        for _, sound_ids, _, _, _ in users_sounds + tags_sounds:
+            all_sound_ids_to_retrieve += sound_ids
+        self.get_sounds(all_sound_ids_to_retrieve)
+
+        # Replace lists of sound_ids by actual sound objects
+        users_sounds_with_objects = [
+            (user_following, self.get_sounds(sound_ids), more_url_params, more_count, new_count)
+            for user_following, sound_ids, more_url_params, more_count, new_count in users_sounds
+        ]
+        tags_sounds_with_objects = [
+            (tags, self.get_sounds(sound_ids), more_url_params, more_count, new_count)
+            for tags, sound_ids, more_url_params, more_count, new_count in tags_sounds
+        ]
+        return users_sounds_with_objects, tags_sounds_with_objects
 
-            sound_ids = [element["id"] for element in result.docs]
-            # NOTE: for now we add sound_ids in users_sounds instead of the actual sound objetcs. We retrieve sound
-            # objs later in a single query.
-            new_count = more_count + len(sound_ids)
-            tags_sounds.append((tags, sound_ids, more_url_params, more_count, new_count))
 
-        # To avoid overwhelming the search engine
-        if sleep_between_queries is not None:
-            time.sleep(sleep_between_queries)
-
-    # Now retrieve all sound objects that will be needed
-    all_sound_ids_to_retrieve = []
-    for _, sound_ids, _, _, _ in users_sounds:
-        all_sound_ids_to_retrieve += sound_ids
-    for _, sound_ids, _, _, _ in tags_sounds:
-        all_sound_ids_to_retrieve += sound_ids
-    all_sound_ids_to_retrieve = list(set(all_sound_ids_to_retrieve))
-    sound_objs_dict = sounds.models.Sound.objects.dict_ids(all_sound_ids_to_retrieve)
-
-    # Replace lists of sound_ids by actual sound objects
-    users_sounds_with_objects = []
-    for user, sound_ids, more_url_params, more_count, new_count in users_sounds:
-        sound_objs = [sound_objs_dict.get(sid, None) for sid in sound_ids]
-        sound_objs = [sound_obj for sound_obj in sound_objs if sound_obj is not None]
-        users_sounds_with_objects.append((user, sound_objs, more_url_params, more_count, new_count))
-
-    tags_sounds_with_objects = []
-    for tags, sound_ids, more_url_params, more_count, new_count in tags_sounds:
-        sound_objs = [sound_objs_dict.get(sid, None) for sid in sound_ids]
-        sound_objs = [sound_obj for sound_obj in sound_objs if sound_obj is not None]
-        tags_sounds_with_objects.append((tags, sound_objs, more_url_params, more_count, new_count))
-
-    return users_sounds_with_objects, tags_sounds_with_objects
+def get_stream_sounds(
+    user,
+    time_lapse,
+    num_results_per_group=3,
+    search_engine_backend=None,
+    sleep_between_queries=None,
+    digest=None,
+    date_from=None,
+):
+    """Returns the new sounds of the users and tags followed by the user in the given time lapse. If a StreamDigest is
+    passed, it is used to share search engine results and sound objects with the streams of other users (see
+    StreamDigest.get_stream_sounds for the date_from parameter).
+    """
+    if digest is None:
+        digest = StreamDigest(
+            num_results_per_group=num_results_per_group,
+            search_engine_backend=search_engine_backend,
+            sleep_between_queries=sleep_between_queries,
+        )
+    return digest.get_stream_sounds(user, time_lapse, date_from=date_from)
 
 
 def build_time_lapse(date_from, date_to):
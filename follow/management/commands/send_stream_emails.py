@@ -61,6 +61,22 @@ class Command(LoggingBaseCommand):
             .exclude(last_stream_email_sent__gt=date_today_minus_notification_timedelta)
             .order_by("-last_attempt_of_sending_stream_email")[: settings.MAX_EMAILS_PER_COMMAND_RUN]
         )
+        users_enabled_notifications = list(users_enabled_notifications)
+
+        # New sounds of each followed user and tag are searched once for the time window of all the emails, and the
+        # sounds of each email are taken from these results
+        first_days = [
+            profile.last_stream_email_sent
+            for profile in users_enabled_notifications
+            if profile.last_stream_email_sent is not None
+        ]
+        digest = follow_utils.StreamDigest(
+            sleep_between_queries=settings.STREAM_EMAIL_SEARCH_ENGINE_SLEEP_BETWEEN_QUERIES,
+            date_from=min(first_days) if first_days else None,
+            date_to=timezone.now(),
+        )
+        if first_days:
+            digest.prefetch_uploaders(min(first_days))
 
         n_emails_sent = 0
         for profile in users_enabled_notifications:
@@ -84,7 +100,7 @@ class Command(LoggingBaseCommand):
             user = User.objects.get(username=username)
             try:
                 users_sounds, tags_sounds = follow_utils.get_stream_sounds(
-                    user, time_lapse, sleep_between_queries=settings.STREAM_EMAIL_SEARCH_ENGINE_SLEEP_BETWEEN_QUERIES
+                    user, time_lapse, digest=digest, date_from=week_first_day
                 )
             except Exception:
                 # If error occur do not send the email
@@ -125,4 +141,12 @@ class Command(LoggingBaseCommand):
             profile.last_stream_email_sent = timezone.now()
             profile.save()
 
-        self.log_end({"n_users_notified": n_emails_sent})
+        queries_per_email = round(digest.num_search_engine_queries / n_emails_sent, 2) if n_emails_sent else None
+        self.log_end(
+            {
+                "n_users_notified": n_emails_sent,
+                "n_search_engine_queries": digest.num_search_engine_queries,
+                "n_reused_search_engine_results": digest.num_reused_results,
+                "search_engine_queries_per_email": queries_per_email,
+            }
+        )
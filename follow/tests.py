@@ -18,13 +18,21 @@
 #     See AUTHORS file.
 #
 
+import datetime
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
+from accounts.models import EmailPreferenceType, Profile, UserEmailSetting
 from follow.models import FollowingQueryItem, FollowingUserItem
+from sounds.models import Sound
+from utils.search import SearchResults
+from utils.test_helpers import create_user_and_sounds
 
 
 class FollowTestCase(TestCase):
@@ -236,3 +244,58 @@ class StreamViewTestCase(TestCase):
         self.mock_get_stream_sounds.assert_called_once_with(self.user, expected_time_lapse, num_results_per_group=4)
         self.assertEqual(response.context["date_from"], expected_date_from)
         self.assertEqual(response.context["date_to"], "2024-01-05")
+
+
+@override_settings(STREAM_EMAIL_SEARCH_ENGINE_SLEEP_BETWEEN_QUERIES=None)
+class StreamEmailsTestCase(TestCase):
+    fixtures = ["licenses", "email_preference_type"]
+
+    def setUp(self):
+        uploader, _, self.sounds = create_user_and_sounds(num_sounds=2, processing_state="OK", moderation_state="OK")
+        uploader_without_new_sounds = User.objects.create_user("uploader-without-new-sounds")
+        email_type = EmailPreferenceType.objects.get(name="stream_emails")
+        for username in ["stream-user-1", "stream-user-2"]:
+            user = User.objects.create_user(username, email=f"{username}@freesound.org")
+            FollowingUserItem.objects.create(user_from=user, user_to=uploader)
+            FollowingUserItem.objects.create(user_from=user, user_to=uploader_without_new_sounds)
+            FollowingQueryItem.objects.create(user=user, query="field-recording")
+            UserEmailSetting.objects.create(user=user, email_type=email_type)
+        Profile.objects.update(last_stream_email_sent=timezone.now() - datetime.timedelta(days=8))
+
+    @patch("follow.follow_utils.get_search_engine")
+    def test_send_stream_emails_shares_search_engine_queries(self, get_search_engine):
+        search_sounds = get_search_engine.return_value.search_sounds
+        search_sounds.return_value = SearchResults(
+            docs=[{"id": sound.id} for sound in self.sounds], num_found=2, num_rows=2
+        )
+        call_command("send_stream_emails")
+
+        # Both users get the email, but the search engine is only queried once for the followed user with new sounds
+        # and once for the followed tag
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(search_sounds.call_count, 2)
+        for email in mail.outbox:
+            self.assertIn(self.sounds[0].original_filename, email.body)
+
+    @patch("follow.follow_utils.get_search_engine")
+    def test_send_stream_emails_different_time_lapses(self, get_search_engine):
+        # The second sound was uploaded 15 days ago, so it is only new for the user whose last email was sent 20 days
+        # ago, but the search engine is still queried only once for the followed user and once for the followed tag
+        Sound.objects.filter(id=self.sounds[1].id).update(created=timezone.now() - datetime.timedelta(days=15))
+        Profile.objects.filter(user__username="stream-user-2").update(
+            last_stream_email_sent=timezone.now() - datetime.timedelta(days=20)
+        )
+        search_sounds = get_search_engine.return_value.search_sounds
+        search_sounds.return_value = SearchResults(
+            docs=[{"id": sound.id} for sound in self.sounds], num_found=2, num_rows=2
+        )
+        call_command("send_stream_emails")
+
+        self.assertEqual(search_sounds.call_count, 2)
+        emails = {email.to[0]: email.body for email in mail.outbox}
+        self.assertIn(self.sounds[0].original_filename, emails["stream-user-1@freesound.org"])
+        self.assertNotIn(self.sounds[1].original_filename, emails["stream-user-1@freesound.org"])
+        self.assertIn("has uploaded 1 new sound:", emails["stream-user-1@freesound.org"])
+        self.assertIn(self.sounds[0].original_filename, emails["stream-user-2@freesound.org"])
+        self.assertIn(self.sounds[1].original_filename, emails["stream-user-2@freesound.org"])
+        self.assertIn("has uploaded 2 new sounds:", emails["stream-user-2@freesound.org"])
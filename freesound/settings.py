@@ -121,6 +121,7 @@ CLUSTERING_CACHE_REDIS_STORE_ID = 1
 AUDIO_FEATURES_REDIS_STORE_ID = 2
 CELERY_BROKER_REDIS_STORE_ID = 3
 ABUSE_REDIS_STORE_ID = 4
+DOWNLOAD_COUNTERS_REDIS_STORE_ID = 5
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
@@ -143,6 +144,10 @@ CACHES = {
         "BACKEND": "django.core.cache.backends.redis.RedisCache",
         "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/{ABUSE_REDIS_STORE_ID}",
     },
+    "download_counters": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/{DOWNLOAD_COUNTERS_REDIS_STORE_ID}",
+    },
 }
 
 CACHE_MIDDLEWARE_SECONDS = 300
@@ -327,6 +332,9 @@ NUM_SIMILAR_SOUNDS_PAGES = 1  # In the modal we only show one page, full results
 # Sleep time in milliseconds between stream email queries to the search engine
 # This is to avoid overwhelming the search engine if many emails are being sent at the same time
 STREAM_EMAIL_SEARCH_ENGINE_SLEEP_BETWEEN_QUERIES = 0.2  # in seconds
+# Max number of new sounds retrieved per followed user or tag when the new sounds of all stream emails are searched at
+# once. Streams which could have more sounds than the ones retrieved are searched separately
+STREAM_EMAIL_MAX_SOUNDS_PER_SEARCH_ENGINE_QUERY = 1000
 
 # Weights using to compute charts
 BW_CHARTS_ACTIVE_USERS_WEIGHTS = {"upload": 1, "post": 0.8, "comment": 0.05}
@@ -335,6 +343,9 @@ CHARTS_DATA_CACHE_KEY = "bw-charts-data"
 # User profile page cache key templates
 USER_STATS_CACHE_KEY = "user_stats_{}"
 
+# Generation of the template caches of an object, formatted with the object type and ID (see utils.cache)
+TEMPLATE_CACHE_GENERATION_KEY = "template_cache_generation_{}_{}"
+
 # User flagging notification thresholds
 USERFLAG_THRESHOLD_FOR_NOTIFICATION = 3
 USERFLAG_THRESHOLD_FOR_AUTOMATIC_BLOCKING = 6
@@ -343,6 +354,15 @@ USERFLAG_THRESHOLD_FOR_AUTOMATIC_BLOCKING = 6
 MAX_DOWNLOADS_PER_DAY = 200
 DOWNLOAD_LIMIT_MESSAGE = "You have reached the download limit. Come back tomorrow to download more sounds."
 
+# If True, download counts of sounds, packs and profiles are stored in the download_counters cache and applied to the
+# DB by the flush_download_counters command (see sounds.download_counters), which then needs a cronjob running it
+# periodically. If False, they are updated in the DB directly.
+DOWNLOAD_COUNTERS_WRITE_BEHIND = False
+
+# Sounds are marked to be reindexed in the search engine when their number of downloads changes by more than this
+# factor (approximately), instead of after every download
+NUM_DOWNLOADS_REINDEX_RATIO = 1.1
+
 # Supported audio formats
 # When adding support for a new audio format you have to change the variables below and check:
 # - mime types in accounts.forms.validate_file_extension
@@ -390,6 +410,17 @@ RANDOM_SOUND_OF_THE_DAY_CACHE_KEY = "random_sound"
 # Geotags  stuff
 # Cache key for storing "all geotags" bytearray
 ALL_GEOTAGS_BYTEARRAY_CACHE_KEY = "geotags_bytearray"
+# Number of rows fetched at once when building geotag bytearrays from the DB
+GEOTAGS_FETCH_CHUNK_SIZE = 10000
+# Cache key for storing the (delta-compressed) array of all geotags used to build map tiles
+ALL_GEOTAGS_POINTS_CACHE_KEY = "geotags_points"
+# Cache key for storing the number of points and the generation of the array above, read for every tile request
+ALL_GEOTAGS_POINTS_GENERATION_CACHE_KEY = "geotags_points_generation"
+GEOTAGS_TILES_CACHE_KEY_PREFIX = "geotags_tile"
+GEOTAGS_TILES_CACHE_TIME = 60 * 60 * 24  # Tiles are also invalidated when the geotags points array is regenerated
+GEOTAGS_TILES_MAX_ZOOM = 12
+GEOTAGS_TILES_CLUSTER_MAX_ZOOM = 10  # Tiles with higher zoom contain individual sounds instead of clusters
+GEOTAGS_TILES_CLUSTER_GRID_SIZE = 8  # Points in a tile are clustered in a grid of this number of rows and columns
 
 # Avatar background colors (only BW)
 from utils.audioprocessing.color_schemes import BEASTWHOOSH_COLOR_SCHEME, COLOR_SCHEMES
@@ -525,6 +556,9 @@ ORCHESTRATE_ANALYSIS_MAX_NUM_ANALYSIS_ATTEMPTS = 3
 ORCHESTRATE_ANALYSIS_MAX_TIME_IN_QUEUED_STATUS = 24 * 2  # in hours
 ORCHESTRATE_ANALYSIS_MAX_TIME_CONVERTED_FILES_IN_DISK = 24 * 7  # in hours
 
+# Number of consecutive sound IDs in each shard of the analysis store (see utils.analysis_store)
+ANALYSIS_STORE_SHARD_SIZE = 100000
+
 AUDIOCOMMONS_ANALYZER_NAME = "ac-extractor_v3"
 FREESOUND_ESSENTIA_EXTRACTOR_NAME = "fs-essentia-extractor_v1"
 BIRDNET_ANALYZER_NAME = "birdnet_v1"
@@ -641,6 +675,23 @@ SEARCH_SOLR_TIME_ALLOWED_MS = 1000
 # Similarity searches can take a bit longer
 SEARCH_SOLR_SIMILARITY_TIMEOUT_SECONDS = 4.0
 SEARCH_SOLR_SIMILARITY_TIME_ALLOWED_MS = 3000
+# Number of documents requested per page when exporting all document IDs from the search engine (cursor paging)
+SEARCH_ENGINE_EXPORT_PAGE_SIZE = 2000
+# Similarity searches (search_sounds with similar_to) can be answered by a separate similarity backend instead of the
+# vector search of the search engine. Set to None to use the search engine for similarity searches. Vectors for
+# utils.search.backends.numpy_similarity.NumpySimilarityBackend are indexed with the build_similarity_index command
+SEARCH_ENGINE_SIMILARITY_BACKEND_CLASS = None
+# Maximum number of similar sounds returned by the similarity backend for a single query. Note that the IDs of the
+# returned sounds are sent to the search engine as a filter when results need to be sorted by other criteria
+SIMILARITY_BACKEND_MAX_RESULTS = 1000
+# Similarity searches with filters matching more than this number of sounds are done with the vector search of the
+# search engine, as the IDs of all the matching sounds need to be retrieved from the search engine to pass them to the
+# similarity backend
+SIMILARITY_BACKEND_MAX_FILTERED_SOUNDS = 10000
+# Similarity indexes of utils.search.backends.numpy_similarity.NumpySimilarityBackend are rebuilt by
+# post_dirty_sounds_to_search_engine when the number of updates made since they were built is larger than this
+# fraction of the number of indexed vectors
+SIMILARITY_INDEX_MAX_UPDATES_RATIO = 0.1
 
 SIMILARITY_SPACE_LAION_CLAP = "laion_clap"
 SIMILARITY_FREESOUND_CLASSIC = "freesound_classic"
@@ -664,16 +715,22 @@ SIMILARITY_SPACES_NAMES = list(SIMILARITY_SPACES.keys())
 SIMILARITY_SPACES_ANALYZER_NAMES = list(set([ss["analyzer"] for ss in SIMILARITY_SPACES.values()]))
 SIMILARITY_SPACE_DEFAULT: str = SIMILARITY_SPACE_LAION_CLAP
 SIMILARITY_MIN_THRESHOLD = 0.7
+# Similarity vectors are also written to the legacy "vector" column of SoundSimilarityVector so that the previous
+# release can still read them. Set to False once vector_data has been backfilled for all vectors and the previous
+# release is no longer deployed, before removing the column.
+SIMILARITY_VECTORS_WRITE_LEGACY_COLUMN = True
 
 MAX_SEARCH_RESULTS_IN_MAP_DISPLAY = (
     10000  # This is the maximum number of sounds that will be shown when using "display results in map" mode
 )
 
-SEARCH_CACHE_EMPTY_QUERIES = True
-SEARCH_EMPTY_QUERY_CACHE_KEY = "search_empty_query_results_paginator"
-SEARCH_EMPTY_QUERY_CACHE_TIME = (
-    60 * 10
-)  # 10 minutes, although we manually invalidate this cache when the search index is updated so this time could theoretically be longer
+# Results of search page queries are cached (keyed by the query parameters sent to the search engine). Cached results
+# are invalidated by bumping the "search index generation" number (part of all cache keys) when the index is updated
+SEARCH_RESULTS_CACHE_ENABLED = True
+SEARCH_RESULTS_CACHE_KEY_PREFIX = "search_results"
+SEARCH_RESULTS_CACHE_GENERATION_KEY = "search_index_generation"
+SEARCH_RESULTS_CACHE_TIME = 60 * 10  # 10 minutes
+SEARCH_RESULTS_CACHE_MAX_DOCS = 500  # Results with more docs than this (e.g. map mode queries) are not cached
 
 SEARCH_LOG_SLOW_QUERIES_MS_THRESHOLD = 1000  # Log search queries that take longer than this threshold in milliseconds. Set it to -1 to disable logging of slow queries.
 SEARCH_LOG_SLOW_QUERIES_QUERY_BASE_URL = "http://localhost:8983/solr/freesound/select/"
@@ -775,18 +832,46 @@ MP3_HQ_PREVIEW_QUALITY = 192
 OGG_LQ_PREVIEW_QUALITY = 1
 OGG_HQ_PREVIEW_QUALITY = 6
 
+# Max number of preview encoders (lame/oggenc processes) run concurrently when processing a sound
+PROCESSING_PREVIEW_ENCODING_WORKERS = 4
+
+# Sizes (width, height) of the display images generated when processing sounds. Keys are the size names used in sound
+# locations (e.g. "display.wave.M.path"). All sizes are drawn from a single analysis of the audio file computed for the
+# largest width, smaller widths should divide the largest one so that images are the same as if computed directly.
+PROCESSING_DISPLAY_SIZES = {
+    "M": (195, 101),
+    "L": (780, 301),
+}
+PROCESSING_DISPLAY_FFT_SIZE = 2048
+
 # -------------------------------------------------------------------------------
 # Search results clustering
 # NOTE: celery configuration is set after the local settings import
 
-MAX_RESULTS_FOR_CLUSTERING = 1000
+# Clustering 5000 sounds (512-dimensional vectors) takes ~2.5 seconds in a single core with either of the engines
+# below, well within CLUSTERING_TASK_TIMEOUT
+MAX_RESULTS_FOR_CLUSTERING = 5000
+
+# Class used to cluster the sounds. clustering.clustering.ClusteringEngine works on a NetworkX graph, while
+# clustering.clustering.SparseClusteringEngine builds the same k nearest neighbors graph (approximate above
+# CLUSTERING_APPROXIMATE_KNN_MIN_POINTS) working on sparse matrices, and only builds a NetworkX graph for the Louvain
+# community detection
+CLUSTERING_ENGINE_CLASS = "clustering.clustering.ClusteringEngine"
+
+# When clustering at least this number of sounds with SparseClusteringEngine, the k nearest neighbors graph is built
+# with approximate nearest neighbors search. Neighbors of each sound are searched among the sounds in the
+# CLUSTERING_APPROXIMATE_KNN_NUM_PROBES closest cells (out of ~sqrt(N) cells) of an inverted file index. For smaller
+# numbers of sounds the exact search is faster
+CLUSTERING_APPROXIMATE_KNN_MIN_POINTS = 5000
+CLUSTERING_APPROXIMATE_KNN_NUM_PROBES = 10
 
 # One day timeout for keeping clustering results. The cache timer is reset when the clustering is
 # requested so that popular queries that are performed once a day minimum will always stay in cache
 # and won't be recomputed.
 CLUSTERING_CACHE_TIME = 24 * 60 * 60 * 1
 
-# Limit of distance when creating Nearest Neighbors graph
+# Limit of distance when creating Nearest Neighbors graph with ClusteringEngine. Note that it has no effect, as it is
+# compared to the values of a connectivity graph (which are all 1), and it is not used by SparseClusteringEngine
 CLUSTERING_MAX_NEIGHBORS_DISTANCE = 20
 
 # Number of sound examples extracted per cluster for cluster facet sound preview
@@ -850,6 +935,10 @@ REST_FRAMEWORK = {
 
 API_DOWNLOAD_TOKEN_LIFETIME = 60 * 60  # 1 hour
 
+# Number of seconds between flushes of the API usage counts of each process to the cache (see apiv2.api_usage).
+# If set to 0, counts are flushed after every request.
+API_USAGE_FLUSH_INTERVAL = 10
+
 OAUTH2_PROVIDER = {
     "ACCESS_TOKEN_EXPIRE_SECONDS": 60 * 60 * 24,
     "CLIENT_SECRET_GENERATOR_LENGTH": 40,
@@ -985,6 +1074,7 @@ PACKS_PATH = os.path.join(DATA_PATH, "packs/")
 UPLOADS_PATH = os.path.join(DATA_PATH, "uploads/")
 CSV_PATH = os.path.join(DATA_PATH, "csv/")
 ANALYSIS_PATH = os.path.join(DATA_PATH, "analysis/")
+SIMILARITY_INDEX_PATH = os.path.join(DATA_PATH, "similarity_index/")
 FILE_UPLOAD_TEMP_DIR = os.path.join(DATA_PATH, "tmp_uploads/")
 PROCESSING_TEMP_DIR: str = os.path.join(DATA_PATH, "tmp_processing/")
 PROCESSING_BEFORE_DESCRIPTION_DIR = os.path.join(DATA_PATH, "processing_before_description/")
@@ -38,6 +38,120 @@ function getSoundsLocations(url, callback) {
   oReq.send();
 }
 
+function isTiledGeotagsUrl(url) {
+  // Geotags URLs with {z}, {x} and {y} placeholders are loaded per tile (see geotags/tiles.py)
+  return url.indexOf('{z}') !== -1;
+}
+
+function locationsToGeojsonFeatures(data) {
+  /*
+    Converts a list of locations as returned by getSoundsLocations to GeoJSON features. Locations with negative ids
+    are clusters of sounds computed in the server (see geotags/tiles.py). These are given the same properties as the
+    clusters computed by mapbox so they are displayed with the same layers.
+     */
+  return data.map(item => {
+    var properties = { id: item[0] };
+    if (item[0] < 0) {
+      var pointCount = -item[0];
+      properties = {
+        point_count: pointCount,
+        point_count_abbreviated:
+          pointCount >= 1000
+            ? `${Math.round(pointCount / 1000)}k`
+            : pointCount.toString(),
+      };
+    }
+    return {
+      type: 'Feature',
+      properties: properties,
+      geometry: {
+        type: 'Point',
+        coordinates: [item[2], item[1]],
+      },
+    };
+  });
+}
+
+function loadVisibleGeotagTiles(map, tiles_url, callback) {
+  /*
+    Loads the geotag tiles which cover the visible area of the map at the current zoom level and shows them in the
+    'sounds' source. Loaded tiles are kept in map.geotagTiles so that each tile is only requested once. The callback
+    (if any) is called with the number of sounds in the visible tiles once these are loaded. The maximum zoom of the
+    tiles (settings.GEOTAGS_TILES_MAX_ZOOM) is taken from the data-geotags-tiles-max-zoom attribute of the map
+    container.
+     */
+  var maxZoom = parseInt(map.getContainer().dataset.geotagsTilesMaxZoom, 10);
+  var z = Math.max(0, Math.min(maxZoom, Math.floor(map.getZoom())));
+  var nTiles = Math.pow(2, z);
+  var bounds = map.getBounds();
+  var tileX = lng => Math.floor(((lng + 180) / 360) * nTiles);
+  var tileY = lat => {
+    var latRadians =
+      (Math.max(-85.0511, Math.min(85.0511, lat)) * Math.PI) / 180;
+    var y = (1 - Math.asinh(Math.tan(latRadians)) / Math.PI) / 2;
+    return Math.max(0, Math.min(nTiles - 1, Math.floor(y * nTiles)));
+  };
+  var tileKeys = new Set();
+  var maxX = Math.min(
+    tileX(bounds.getEast()),
+    tileX(bounds.getWest()) + nTiles - 1
+  );
+  var minY = tileY(bounds.getNorth());
+  var maxY = tileY(bounds.getSouth());
+  for (var x = tileX(bounds.getWest()); x <= maxX; x++) {
+    for (var y = minY; y <= maxY; y++) {
+      tileKeys.add(`${z}/${((x % nTiles) + nTiles) % nTiles}/${y}`);
+    }
+  }
+  map.geotagTiles = map.geotagTiles || {};
+  map.visibleGeotagTiles = Array.from(tileKeys);
+  var pendingTiles = map.visibleGeotagTiles.filter(
+    key => map.geotagTiles[key] === undefined
+  );
+  var showVisibleTiles = () => {
+    var features = [];
+    map.visibleGeotagTiles.forEach(key => {
+      if (map.geotagTiles[key]) {
+        features = features.concat(map.geotagTiles[key]);
+      }
+    });
+    if (map.getSource('sounds') !== undefined) {
+      map.getSource('sounds').setData({
+        type: 'FeatureCollection',
+        features: features,
+      });
+    }
+    if (callback !== undefined) {
+      callback(
+        features.reduce(
+          (total, feature) => total + (feature.properties.point_count || 1),
+          0
+        )
+      );
+    }
+  };
+  if (pendingTiles.length === 0) {
+    showVisibleTiles();
+    return;
+  }
+  var nPendingTiles = pendingTiles.length;
+  pendingTiles.forEach(key => {
+    map.geotagTiles[key] = null; // Tile being loaded, don't request it again
+    var [keyZ, keyX, keyY] = key.split('/');
+    var url = tiles_url
+      .replace('{z}', keyZ)
+      .replace('{x}', keyX)
+      .replace('{y}', keyY);
+    getSoundsLocations(url, data => {
+      map.geotagTiles[key] = locationsToGeojsonFeatures(data);
+      nPendingTiles -= 1;
+      if (nPendingTiles === 0) {
+        showVisibleTiles();
+      }
+    });
+  });
+}
+
 function call_on_bounds_chage_callback(map, map_element_id, callback) {
   /* Util function used in "make_sounds_map" and "make_geotag_edit_map" to get parameters to cll callback */
   callback(
@@ -198,9 +312,18 @@ function makeSoundsMap(
     happen in Freesound) the "zoom in" method in inforwindows won't work properly.
      */
 
-  getSoundsLocations(geotags_url, function (data) {
+  /*
+    If geotags_url has {z}, {x} and {y} placeholders, geotags are loaded per tile as the visible area of the map
+    changes (see loadVisibleGeotagTiles) instead of all at once. In that case, clustering is done in the server.
+     */
+  var tiled = isTiledGeotagsUrl(geotags_url);
+  var loadSoundsLocations = tiled
+    ? callback => callback([])
+    : callback => getSoundsLocations(geotags_url, callback);
+
+  loadSoundsLocations(function (data) {
     var nSounds = data.length;
-    if (nSounds > 0 || show_if_empty) {
+    if (nSounds > 0 || show_if_empty || tiled) {
       // Define initial map center and zoom
       var init_zoom = 2;
       var init_lat = 22;
@@ -239,25 +362,10 @@ function makeSoundsMap(
       window.map = map; // Used to have a global reference to the map
 
       // Get coordinates for each sound
-      var geojson_features = [];
+      var geojson_features = locationsToGeojsonFeatures(data);
       var bounds = new mapboxgl.LngLatBounds();
-
-      data.forEach(item => {
-        var id = item[0];
-        var lat = item[1];
-        var lon = item[2];
-
-        geojson_features.push({
-          type: 'Feature',
-          properties: {
-            id: id,
-          },
-          geometry: {
-            type: 'Point',
-            coordinates: [lon, lat],
-          },
-        });
-        bounds.extend([lon, lat]);
+      geojson_features.forEach(feature => {
+        bounds.extend(feature.geometry.coordinates);
       });
 
       map.on('load', function () {
@@ -379,7 +487,7 @@ function makeSoundsMap(
         });
 
         // Adjust map boundaries
-        if (center_lat === undefined) {
+        if (center_lat === undefined && !tiled) {
           // If initital center and zoom were not given, adjust map boundaries now based on the sounds
           if (nSounds > 1) {
             // The padding and offset "manual" adjustments of bounds below are to make the boudns more similar to
@@ -398,7 +506,13 @@ function makeSoundsMap(
         }
 
         // Run callback function (if passed) after map is built
-        if (on_built_callback !== undefined) {
+        if (tiled) {
+          // Load the tiles of the visible area, and load them again when the visible area changes
+          loadVisibleGeotagTiles(map, geotags_url, on_built_callback);
+          map.on('moveend', function (e) {
+            loadVisibleGeotagTiles(map, geotags_url);
+          });
+        } else if (on_built_callback !== undefined) {
           on_built_callback(nSounds);
         }
 
@@ -437,10 +551,14 @@ function makeSoundsMap(
               type: 'FeatureCollection',
               features: geojson_features,
             },
-            cluster: cluster,
+            cluster: cluster && !tiled, // Tiles are already clustered in the server
             clusterMaxZoom: 10, // Max zoom to cluster points on
             clusterRadius: 30, // Radius of each cluster when clustering points (defaults to 50)
           });
+          if (tiled && map.visibleGeotagTiles !== undefined) {
+            // If the style has been changed, show again the tiles that had been loaded
+            loadVisibleGeotagTiles(map, geotags_url);
+          }
 
           map.addLayer({
             id: 'sounds-clusters',
@@ -31,12 +31,25 @@ CACHES = {
         "BACKEND": "django.core.cache.backends.redis.RedisCache",
         "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/15",
     },
+    "download_counters": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
 }
 
+# Flush API usage counts after every request in tests instead of using a background thread
+API_USAGE_FLUSH_INTERVAL = 0
+
+# Update download counts in the same transaction as downloads in tests instead of using flush_download_counters
+DOWNLOAD_COUNTERS_WRITE_BEHIND = False
+
 # django_ratelimit off in tests.
 # enable with @override_settings(RATELIMIT_ENABLE=True) if needed
 RATELIMIT_ENABLE = False
 
+# Search results cache off in tests so that results don't leak between tests that mock search engine responses.
+# enable with @override_settings(SEARCH_RESULTS_CACHE_ENABLED=True) if needed
+SEARCH_RESULTS_CACHE_ENABLED = False
+
 from .logger import LOGGING
 
 LOGGING["handlers"]["stdout"]["class"] = "logging.NullHandler"
@@ -1,3 +1,5 @@
+from unittest import mock
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.messages import get_messages
@@ -7,6 +9,7 @@ from django.utils.text import slugify
 
 from fscollections.models import Collection, CollectionSound
 from sounds.models import Sound
+from utils.cache import get_template_cache_generations
 from utils.test_helpers import create_user_and_sounds
 
 
@@ -524,6 +527,19 @@ class CollectionTest(TestCase):
         self.assertIn("collections/collection.html", [template.name for template in resp.templates])
         self.assertContains(resp, 'id="sounds-grid"')
 
+    def test_collection_page_gets_sound_template_cache_generations_at_once(self):
+        self.client.force_login(self.user)
+        self.add_sounds_to_collection(self.sound, self.sound1, self.sound2)
+
+        with mock.patch(
+            "sounds.sound_loader.get_template_cache_generations", wraps=get_template_cache_generations
+        ) as get_generations:
+            resp = self.client.get(reverse("collection", args=[self.collection.id, slugify(self.collection.name)]))
+
+        self.assertEqual(200, resp.status_code)
+        get_generations.assert_called_once()
+        self.assertSetEqual({self.sound.id, self.sound1.id, self.sound2.id}, set(get_generations.call_args.args[1]))
+
     def add_sounds_to_collection(self, *sounds):
         for sound in sounds:
             CollectionSound.objects.create(user=self.user, sound=sound, collection=self.collection, status="OK")
@@ -49,6 +49,7 @@ from sounds.sound_grid_editor import (
     resolve_sort,
     sorted_paginated_edit_sounds,
 )
+from sounds.sound_loader import get_sound_loader
 from utils.download_limit import (
     DownloadType,
     count_download_and_set_sentinel,
@@ -116,6 +117,7 @@ def collection(request, collection):
 
     pagination = paginate(request, sounds, settings.BOOKMARKS_PER_PAGE)
     page_sounds = list(pagination["page"])
+    get_sound_loader(request).add(page_sounds)
 
     is_following = user.is_authenticated and follow_utils.is_user_following_user(user, collection.user)
 
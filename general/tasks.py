@@ -30,6 +30,7 @@ from django.utils import timezone
 
 from tickets import TICKET_STATUS_CLOSED
 from tickets.models import Ticket, UserAnnotation
+from utils import analysis_store
 from utils.audioprocessing.freesound_audio_processing import (
     FreesoundAudioProcessor,
     FreesoundAudioProcessorBeforeDescription,
@@ -38,7 +39,11 @@ from utils.audioprocessing.freesound_audio_processing import (
     check_if_free_space,
     set_timeout_alarm,
 )
-from utils.cache import invalidate_all_moderators_header_cache, invalidate_user_template_caches
+from utils.cache import (
+    invalidate_all_moderators_header_cache,
+    invalidate_user_template_caches,
+    invalidate_users_template_caches,
+)
 
 workers_logger = logging.getLogger("workers")
 
@@ -156,6 +161,7 @@ def post_moderation_assigned_tickets(ticket_ids=[], notification=None, users_to_
         users_to_update = set()
         packs_to_update = set()
 
+    sender_ids = set()
     for ticket in tickets:
         if collect_users_and_packs:
             # Collect list of users and packs to update
@@ -164,15 +170,17 @@ def post_moderation_assigned_tickets(ticket_ids=[], notification=None, users_to_
             users_to_update.add(ticket.sound.user_id)
             if ticket.sound.pack:
                 packs_to_update.add(ticket.sound.pack_id)
-
-        # Invalidate caches of related objects
-        invalidate_user_template_caches(ticket.sender.id)
-        invalidate_all_moderators_header_cache()
+        if ticket.sender_id is not None:
+            sender_ids.add(ticket.sender_id)
 
         # Send notification email to users
         if notification is not None:
             ticket.send_notification_email_user(notification)
 
+    # Invalidate caches of related objects
+    invalidate_users_template_caches(list(sender_ids))
+    invalidate_all_moderators_header_cache()
+
     # Update number of sounds for each user
     Profile = apps.get_model("accounts.Profile")
     for profile in Profile.objects.filter(user_id__in=list(users_to_update)):
@@ -428,6 +436,30 @@ def process_analysis_results(sound_id, analyzer, status, analysis_time, exceptio
                 )
             )
         else:
+            if status == "OK" and analysis_store.analyzer_has_store(analyzer):
+                # If the analysis data of this analyzer has been migrated to the analysis store, add the new data to
+                # it so that it replaces the data that the store might have for the sound
+                analysis_data = SoundAnalysis.get_analysis_data_from_output_file(sound_id, analyzer)
+                if analysis_data:
+                    try:
+                        analysis_store.add_analysis_data(analyzer, [(sound_id, analysis_data)])
+                    except Exception as e:
+                        # The store only caches the analysis output files, so if the data can't be added to it (e.g.
+                        # because it has values that can't be encoded as JSON), the data that the store might have
+                        # for the sound is deleted so that it is read from the file, and processing continues
+                        workers_logger.info(
+                            "Error adding analysis results to store (%s)"
+                            % json.dumps(
+                                {
+                                    "task_name": PROCESS_ANALYSIS_RESULTS_TASK_NAME,
+                                    "sound_id": sound_id,
+                                    "analyzer": analyzer,
+                                    "error": str(e),
+                                }
+                            )
+                        )
+                        analysis_store.delete_analysis_data(sound_id, analyzer)
+
             # Load analysis output to database field (following configuration in settings.ANALYZERS_CONFIGURATION)
             # NOTE: this features is no longer used as we only load data for the "meta" SoundAnalysis objects with consolidated
             # audio descriptors from several analyers. Still we, we leave the feature for possible future use.
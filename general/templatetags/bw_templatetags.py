@@ -28,6 +28,7 @@ from django.urls import reverse
 from follow.follow_utils import is_user_following_tag
 from general.templatetags.plausible import plausible_scripts
 from ratings.models import SoundRating
+from sounds.sound_loader import get_sound_loader
 from utils.pagination import build_paginator_template_context
 
 register = template.Library()
@@ -223,6 +224,8 @@ def bw_intcomma(value):
 
 @register.inclusion_tag("molecules/carousel.html", takes_context=True)
 def sound_carousel(context, sounds, show_timesince=False):
+    # Sounds are usually given as IDs, so add them to the request's sound loader to retrieve them all at once
+    get_sound_loader(context["request"]).add(sounds)
     # Update context and pass it to templatetag so nested template tags also have it
     context.update({"elements": sounds, "type": "sound", "show_timesince": show_timesince})
     return context
@@ -28,6 +28,8 @@ from django.template import Library
 from django.template.defaultfilters import stringfilter
 from django.utils.safestring import mark_safe
 
+from utils.cache import get_request_template_cache_generations, get_template_cache_generation
+
 register = Library()
 
 
@@ -142,3 +144,19 @@ def format_json(value):
     value = json.dumps(value, indent=4)
     value = "<pre>" + value + "</pre>"
     return mark_safe(value)
+
+
+@register.simple_tag(takes_context=True)
+def template_cache_generation(context, object_type, object_id):
+    """Generation of the template caches of an object, to be used as a variable of {% cache %} tags (see utils.cache).
+    Generations are memoized in the request so that fragments of the same object don't get them from the cache again.
+
+    Usage: {% template_cache_generation "sound" sound.id as template_cache_generation %}
+    """
+    request = context.get("request")
+    if request is None:
+        return get_template_cache_generation(object_type, object_id)
+    template_cache_generations = get_request_template_cache_generations(request)
+    if (object_type, object_id) not in template_cache_generations:
+        template_cache_generations[object_type, object_id] = get_template_cache_generation(object_type, object_id)
+    return template_cache_generations[object_type, object_id]
@@ -19,11 +19,13 @@
 #
 
 import logging
+import time
 
 from django.conf import settings
 from django.core.cache import caches
 
-from geotags.views import generate_geotag_bytearray_queryset_fast
+from geotags.tiles import encode_points
+from geotags.views import generate_geotag_bytearray_points, geotag_points_from_queryset
 from sounds.models import Sound
 from utils.management_commands import LoggingBaseCommand
 
@@ -40,9 +42,21 @@ class Command(LoggingBaseCommand):
 
         # Generate the bytearray for all geotagged sounds in Freesound and store it in cache
         # Don't set expiration time because the bytearray will be overwritten everytime this command runs
-        sounds = Sound.objects.select_related("geotag").exclude(geotag=None)
-        computed_bytearray, num_geotags = generate_geotag_bytearray_queryset_fast(sounds)
+        # The ids and coordinates of all geotags are fetched once as NumPy arrays and used for both the bytearray and
+        # the array of points for the map tiles
+        ids, lats, lons = geotag_points_from_queryset(Sound.objects.exclude(geotag=None))
+        computed_bytearray, num_geotags = generate_geotag_bytearray_points(ids, lats, lons)
         cache_persistent.set(settings.ALL_GEOTAGS_BYTEARRAY_CACHE_KEY, [computed_bytearray, num_geotags], timeout=None)
         console_logger.info(f"Generated all geotags bytearray with {num_geotags} sounds")
 
+        # Also store the array of points used to build the map tiles. The generation number is part of the cache keys
+        # of the tiles, so tiles built from previous versions of the array are not used anymore. It is also stored
+        # (after the array) in its own small entry so that tile requests don't need to load the whole array
+        generation = time.time_ns()
+        cache_persistent.set(
+            settings.ALL_GEOTAGS_POINTS_CACHE_KEY, [encode_points(ids, lats, lons), len(ids), generation], timeout=None
+        )
+        cache_persistent.set(settings.ALL_GEOTAGS_POINTS_GENERATION_CACHE_KEY, [len(ids), generation], timeout=None)
+        console_logger.info(f"Generated all geotags points array for map tiles with {len(ids)} sounds")
+
         self.log_end({"all_geotags_bytearray_n_sounds": num_geotags})
@@ -18,11 +18,20 @@
 #     See AUTHORS file.
 #
 
+import struct
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from geotags.models import GeoTag
+from geotags.tiles import TilePoints, build_tile, decode_points, encode_points
+from geotags.views import generate_geotag_bytearray_dict, generate_geotag_bytearray_queryset_fast
 from sounds.models import Sound
 
 
@@ -106,6 +115,39 @@ class GeoTagsTests(TestCase):
         n_sounds = len(resp.content) // 12
         self.assertEqual(n_sounds, 2)
 
+    def test_generate_geotag_bytearray_dict(self):
+        docs = [
+            {"id": 1, "geotag": "2.173403 41.385064"},
+            {"id": 2},  # No geotag
+            {"id": 3, "geotag": "not valid"},
+            {"id": 4, "geotag": "-200.5 95.25"},  # Out of range, clipped
+            {"id": 5, "geotag": "151.20929 -33.86882"},
+        ]
+        generated_bytearray, num_geotags = generate_geotag_bytearray_dict(docs)
+        self.assertEqual(num_geotags, 3)
+        self.assertEqual(
+            generated_bytearray,
+            struct.pack(
+                "iiiiiiiii",
+                *(1, int(41.385064 * 1000000), int(2.173403 * 1000000)),
+                *(4, 90000000, -180000000),
+                *(5, int(-33.86882 * 1000000), int(151.20929 * 1000000)),
+            ),
+        )
+        self.assertEqual(generate_geotag_bytearray_dict([]), (b"", 0))
+
+    def test_generate_geotag_bytearray_queryset_fast(self):
+        sounds = list(Sound.objects.all().order_by("id")[:2])
+        GeoTag.objects.create(sound=sounds[0], lat=41.385064, lon=2.173403, zoom=9)
+        GeoTag.objects.create(sound=sounds[1], lat=float("nan"), lon=2.173403, zoom=9)
+        generated_bytearray, num_geotags = generate_geotag_bytearray_queryset_fast(
+            Sound.objects.exclude(geotag=None).order_by("id")
+        )
+        self.assertEqual(num_geotags, 1)
+        self.assertEqual(
+            generated_bytearray, struct.pack("iii", sounds[0].id, int(41.385064 * 1000000), int(2.173403 * 1000000))
+        )
+
     def test_browse_geotags_for_query(self):
         resp = self.client.get(reverse("geotags-query") + "?q=barcelona")
         check_values = {"query_description": '"barcelona"'}
@@ -117,3 +159,96 @@ class GeoTagsTests(TestCase):
         resp = self.client.get(reverse("geotags-for-query-barray") + "?f=samplerate%3Aabc")
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(len(resp.content), 0)
+
+
+class GeoTagsTilesTests(TestCase):
+    fixtures = ["licenses", "sounds"]
+
+    def setUp(self):
+        caches["persistent"].clear()
+
+    def points(self, *points):
+        ids, lats, lons = (np.array(column, dtype=np.int32) for column in zip(*points))
+        return TilePoints(ids, lats, lons)
+
+    def test_encode_decode_points(self):
+        ids = np.array([30, 10, 20], dtype=np.int32)
+        lats = np.array([-90000000, 41385064, 90000000], dtype=np.int32)
+        lons = np.array([180000000, 2173403, -180000000], dtype=np.int32)
+        decoded_ids, decoded_lats, decoded_lons = decode_points(encode_points(ids, lats, lons))
+        # Points are sorted by id
+        self.assertListEqual(decoded_ids.tolist(), [10, 20, 30])
+        self.assertListEqual(decoded_lats.tolist(), [41385064, 90000000, -90000000])
+        self.assertListEqual(decoded_lons.tolist(), [2173403, -180000000, 180000000])
+
+    @override_settings(GEOTAGS_TILES_CLUSTER_MAX_ZOOM=2, GEOTAGS_TILES_CLUSTER_GRID_SIZE=2)
+    def test_build_tile(self):
+        # Two sounds in Barcelona, one in Sydney
+        points = self.points((1, 41385064, 2173403), (2, 41390000, 2170000), (3, -33868820, 151209290))
+
+        # At zoom 0 the whole world is one tile, Barcelona sounds are clustered
+        tile = np.frombuffer(build_tile(points, 0, 0, 0), dtype=np.int32).reshape(-1, 3)
+        self.assertListEqual(sorted(tile[:, 0].tolist()), [-2, 3])
+        barcelona_cluster = tile[tile[:, 0] == -2][0]
+        self.assertEqual(barcelona_cluster[1], round((41385064 + 41390000) / 2))
+        self.assertEqual(barcelona_cluster[2], round((2173403 + 2170000) / 2))
+
+        # At zoom 1, Barcelona is in the north-east tile and Sydney in the south-east tile
+        self.assertEqual(len(build_tile(points, 1, 0, 0)), 0)
+        self.assertEqual(len(build_tile(points, 1, 0, 1)), 0)
+        self.assertEqual(np.frombuffer(build_tile(points, 1, 1, 0), dtype=np.int32)[0], -2)
+        self.assertListEqual(
+            np.frombuffer(build_tile(points, 1, 1, 1), dtype=np.int32).tolist(), [3, -33868820, 151209290]
+        )
+
+        # Above the cluster max zoom, tiles contain individual sounds
+        tile = np.frombuffer(build_tile(points, 3, 4, 2), dtype=np.int32).reshape(-1, 3)
+        self.assertListEqual(tile.tolist(), [[1, 41385064, 2173403], [2, 41390000, 2170000]])
+
+    def test_tile_slice(self):
+        rng = np.random.default_rng(0)
+        points = self.points(
+            *zip(range(1000), rng.integers(-90000000, 90000000, 1000), rng.integers(-180000000, 180000000, 1000))
+        )
+        for z in [0, 1, 3, settings.GEOTAGS_TILES_MAX_ZOOM]:
+            num_tiles = 2**z
+            tile_x = np.floor(points.x * num_tiles)
+            tile_y = np.floor(points.y * num_tiles)
+            for x, y in [(0, 0), (num_tiles - 1, num_tiles - 1)] + list(zip(tile_x[:20], tile_y[:20])):
+                # The points found with the binary search are the points in the tile
+                in_tile = (tile_x == x) & (tile_y == y)
+                self.assertCountEqual(points.ids[points.tile_slice(z, int(x), int(y))], points.ids[in_tile])
+
+    def test_geotags_tile_view(self):
+        sounds = list(Sound.objects.all()[:2])
+        GeoTag.objects.create(sound=sounds[0], lat=41.385064, lon=2.173403, zoom=9)
+        GeoTag.objects.create(sound=sounds[1], lat=-33.86882, lon=151.20929, zoom=9)
+
+        # Before the points array is generated, tiles are empty
+        resp = self.client.get(reverse("geotags-tile", args=[0, 0, 0]))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.content), 0)
+
+        call_command("generate_geotags_bytearray")
+        resp = self.client.get(reverse("geotags-tile", args=[settings.GEOTAGS_TILES_MAX_ZOOM, 0, 0]))
+        self.assertEqual(len(resp.content), 0)
+        resp = self.client.get(reverse("geotags-tile", args=[0, 0, 0]))
+        self.assertCountEqual(np.frombuffer(resp.content, dtype=np.int32)[::3].tolist(), [s.id for s in sounds])
+
+        # Tiles are cached until the points array is generated again, and the points array is not loaded for cached
+        # tiles
+        GeoTag.objects.filter(sound=sounds[1]).delete()
+        cache_persistent = caches["persistent"]
+        with mock.patch.object(cache_persistent, "get", wraps=cache_persistent.get) as cache_get:
+            resp = self.client.get(reverse("geotags-tile", args=[0, 0, 0]))
+            self.assertNotIn(settings.ALL_GEOTAGS_POINTS_CACHE_KEY, [call.args[0] for call in cache_get.call_args_list])
+        self.assertEqual(len(resp.content), 24)
+        call_command("generate_geotags_bytearray")
+        resp = self.client.get(reverse("geotags-tile", args=[0, 0, 0]))
+        self.assertListEqual(np.frombuffer(resp.content, dtype=np.int32)[::3].tolist(), [sounds[0].id])
+
+        # Tiles out of range
+        resp = self.client.get(reverse("geotags-tile", args=[1, 2, 0]))
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get(reverse("geotags-tile", args=[settings.GEOTAGS_TILES_MAX_ZOOM + 1, 0, 0]))
+        self.assertEqual(resp.status_code, 404)
@@ -0,0 +1,143 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+# Map tiles for the "all geotags" map. Instead of sending the geotags of all sounds at once, the map requests the
+# geotags in the tiles of the visible area using the standard web mercator z/x/y tiling scheme. Tiles use the same
+# format as the geotags bytearrays (3 int32 per sound: id, lat and lon in millionths of degree) but, in tiles with
+# zoom <= settings.GEOTAGS_TILES_CLUSTER_MAX_ZOOM, nearby sounds are aggregated in clusters. These are encoded as
+# (-number of sounds, mean lat, mean lon) so they can be told apart from sounds by the sign of the first value.
+# Tiles are built from an array with the geotags of all sounds which is stored (delta-compressed) in the persistent
+# cache by the generate_geotags_bytearray management command, together with a small entry with its generation which is
+# part of the cache keys of the tiles.
+
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+MAX_MERCATOR_LAT = 85.0511287798
+
+
+def encode_points(ids, lats, lons):
+    """Encodes the given points (as returned by geotags.views.geotag_points_from_queryset) sorted by sound id and
+    with each column stored as the differences between consecutive values, then compressed with zlib. As sounds
+    uploaded one after the other tend to be close to each other, the differences are mostly small numbers which
+    compress well."""
+    order = np.argsort(ids, kind="stable")
+    columns = np.stack([ids[order], lats[order], lons[order]]).astype(np.int32)
+    deltas = np.diff(columns, axis=1, prepend=0).astype(np.int32)
+    return zlib.compress(deltas.tobytes())
+
+
+def decode_points(encoded_points):
+    """Inverse of encode_points, returns the ids, latitudes and longitudes as int32 NumPy arrays."""
+    deltas = np.frombuffer(zlib.decompress(encoded_points), dtype=np.int32).reshape(3, -1)
+    ids, lats, lons = np.cumsum(deltas, axis=1, dtype=np.int64).astype(np.int32)
+    return ids, lats, lons
+
+
+def tile_quadkeys(tile_x, tile_y, zoom):
+    """Returns the quadkeys of the given tiles (at the given zoom) as integers, interleaving the bits of the tile x and
+    y coordinates. The quadkey of a tile at zoom z is the common prefix of the quadkeys of all the tiles it contains at
+    higher zooms, so when points are sorted by the quadkey of their tile at the maximum zoom, the points of any tile
+    are in a contiguous range."""
+    quadkeys = np.zeros(len(tile_x), dtype=np.int64)
+    for bit in range(zoom):
+        quadkeys |= ((tile_x >> bit) & 1) << (2 * bit)
+        quadkeys |= ((tile_y >> bit) & 1) << (2 * bit + 1)
+    return quadkeys
+
+
+class TilePoints:
+    """Geotags of all sounds ready to be split in tiles: besides the ids, latitudes and longitudes, it holds the
+    position of each point in the web mercator projection normalised to the [0, 1) range (x from west to east and y
+    from north to south) so that the tile a point belongs to at zoom z is (floor(x * 2^z), floor(y * 2^z)). Points are
+    sorted by the quadkey of their tile at settings.GEOTAGS_TILES_MAX_ZOOM, so that the points of a tile can be found
+    with a binary search (see TilePoints.tile_slice)."""
+
+    def __init__(self, ids, lats, lons):
+        lat_radians = np.radians(np.clip(lats / 1000000, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+        x = np.clip((lons / 1000000 + 180) / 360, 0, np.nextafter(1, 0))
+        y = np.clip((1 - np.arcsinh(np.tan(lat_radians)) / np.pi) / 2, 0, np.nextafter(1, 0))
+        self.max_zoom = settings.GEOTAGS_TILES_MAX_ZOOM
+        num_tiles = 2**self.max_zoom
+        quadkeys = tile_quadkeys(
+            np.floor(x * num_tiles).astype(np.int64), np.floor(y * num_tiles).astype(np.int64), self.max_zoom
+        )
+        order = np.argsort(quadkeys, kind="stable")
+        self.quadkeys = quadkeys[order]
+        self.ids = ids[order]
+        self.lats = lats[order]
+        self.lons = lons[order]
+        self.x = x[order]
+        self.y = y[order]
+
+    def tile_slice(self, z, x, y):
+        """Returns the slice with the positions of the points in tile z/x/y (z must be <= self.max_zoom)."""
+        shift = 2 * (self.max_zoom - z)
+        first_quadkey = int(tile_quadkeys(np.array([x]), np.array([y]), z)[0]) << shift
+        start, end = np.searchsorted(self.quadkeys, [first_quadkey, first_quadkey + (1 << shift)])
+        return slice(start, end)
+
+
+_decoded_points = {}
+
+
+def get_tile_points(generation, load_encoded_points):
+    """Returns the TilePoints of the given generation of the points array. The decoded points of the last generation
+    are kept in memory so that they are not loaded and decoded again for every tile. load_encoded_points is called to
+    get the encoded points when these are not in memory, and can return None if the points of the given generation
+    are not available (in that case, None is returned)."""
+    if generation not in _decoded_points:
+        encoded_points = load_encoded_points()
+        if encoded_points is None:
+            return None
+        _decoded_points.clear()
+        _decoded_points[generation] = TilePoints(*decode_points(encoded_points))
+    return _decoded_points[generation]
+
+
+def build_tile(points, z, x, y):
+    """Returns the bytes of the tile z/x/y with the geotags in points (a TilePoints object). For tiles with zoom
+    <= settings.GEOTAGS_TILES_CLUSTER_MAX_ZOOM, the points in each cell of a grid of
+    settings.GEOTAGS_TILES_CLUSTER_GRID_SIZE x settings.GEOTAGS_TILES_CLUSTER_GRID_SIZE cells are aggregated in a
+    cluster (cells with a single point are returned as the point itself)."""
+    num_tiles = 2**z
+    tile = points.tile_slice(z, x, y)
+    # Positions of the points in the tile, sorted by sound id as in the points array
+    in_tile = tile.start + np.argsort(points.ids[tile], kind="stable")
+    ids, lats, lons = points.ids[in_tile], points.lats[in_tile], points.lons[in_tile]
+    if z > settings.GEOTAGS_TILES_CLUSTER_MAX_ZOOM or len(ids) == 0:
+        return np.stack([ids, lats, lons], axis=1).astype(np.int32).tobytes()
+
+    grid_size = settings.GEOTAGS_TILES_CLUSTER_GRID_SIZE
+    cell_x = np.floor(points.x[in_tile] * num_tiles * grid_size).astype(np.int64) - x * grid_size
+    cell_y = np.floor(points.y[in_tile] * num_tiles * grid_size).astype(np.int64) - y * grid_size
+    cells, cell_index, counts = np.unique(
+        np.clip(cell_y, 0, grid_size - 1) * grid_size + np.clip(cell_x, 0, grid_size - 1),
+        return_inverse=True,
+        return_counts=True,
+    )
+    cluster_lats = np.bincount(cell_index, weights=lats, minlength=len(cells)) / counts
+    cluster_lons = np.bincount(cell_index, weights=lons, minlength=len(cells)) / counts
+    first_point_in_cell = np.zeros(len(cells), dtype=np.int64)
+    first_point_in_cell[cell_index[::-1]] = np.arange(len(ids))[::-1]
+    cluster_ids = np.where(counts == 1, ids[first_point_in_cell], -counts)
+    return np.stack([cluster_ids, np.round(cluster_lats), np.round(cluster_lons)], axis=1).astype(np.int32).tobytes()
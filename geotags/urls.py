@@ -32,6 +32,7 @@ urlpatterns = [
     path("sounds_barray/pack/<int:pack_id>/", geotags.geotags_for_pack_barray, name="geotags-for-pack-barray"),
     path("sounds_barray/sound/<int:sound_id>/", geotags.geotag_for_sound_barray, name="geotags-for-sound-barray"),
     path("sounds_barray/query/", geotags.geotags_for_query_barray, name="geotags-for-query-barray"),
+    path("sounds_barray/tiles/<int:z>/<int:x>/<int:y>/", geotags.geotags_tile, name="geotags-tile"),
     re_path(r"^sounds_barray/(?P<tag>[\w-]+)?/?$", geotags.geotags_barray, name="geotags-barray"),
     path("infowindow/<int:sound_id>/", geotags.infowindow, name="geotags-infowindow"),
 ]
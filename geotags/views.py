@@ -18,14 +18,12 @@
 #     See AUTHORS file.
 #
 
-import io
 import json
 import logging
-import math
-import struct
 import urllib.parse
 from urllib.parse import quote
 
+import numpy as np
 from django.conf import settings
 from django.core.cache import cache, caches
 from django.http import Http404, HttpResponse
@@ -35,6 +33,7 @@ from django.views.decorators.cache import cache_page
 from django.views.decorators.clickjacking import xframe_options_exempt
 
 from accounts.models import Profile
+from geotags.tiles import build_tile, get_tile_points
 from sounds.models import Pack, Sound
 from utils.logging_filters import get_client_ip
 from utils.search.search_query_processor import SearchQueryProcessor
@@ -50,42 +49,82 @@ def log_map_load(map_type, num_geotags, request):
     )
 
 
-def generate_geotag_bytearray_sounds(sound_queryset):
-    # sounds as bytearray
-    packed_sounds = io.BytesIO()
-    num_sounds_in_bytearray = 0
-    for s in sound_queryset:
-        if not math.isnan(s.geotag.lat) and not math.isnan(s.geotag.lon):
-            packed_sounds.write(struct.pack("i", s.id))
-            packed_sounds.write(struct.pack("i", int(s.geotag.lat * 1000000)))
-            packed_sounds.write(struct.pack("i", int(s.geotag.lon * 1000000)))
-            num_sounds_in_bytearray += 1
+def geotag_points_from_arrays(ids, lats, lons):
+    """Takes arrays with the ids and geotag latitudes and longitudes (in degrees) of some sounds and returns the ids,
+    latitudes and longitudes (in millionths of degree) as int32 NumPy arrays. Geotags with NaN coordinates are
+    discarded and the rest are clipped to valid ranges."""
+    ids = np.asarray(ids, dtype=np.int64)
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    valid = ~(np.isnan(lats) | np.isnan(lons))
+    return (
+        ids[valid].astype(np.int32),
+        (np.clip(lats[valid], -90, 90) * 1000000).astype(np.int32),
+        (np.clip(lons[valid], -180, 180) * 1000000).astype(np.int32),
+    )
 
-    return packed_sounds.getvalue(), num_sounds_in_bytearray
+
+def geotag_points_from_queryset(sound_queryset):
+    """Returns the geotag points (see geotag_points_from_arrays) of the sounds in sound_queryset. The ids and
+    coordinates are fetched in chunks with a server-side cursor and put directly in a NumPy array, without creating
+    Sound/Geotag objects."""
+    rows = np.fromiter(
+        sound_queryset.values_list("id", "geotag__lat", "geotag__lon").iterator(
+            chunk_size=settings.GEOTAGS_FETCH_CHUNK_SIZE
+        ),
+        dtype=[("id", np.int64), ("lat", np.float64), ("lon", np.float64)],
+    )
+    return geotag_points_from_arrays(rows["id"], rows["lat"], rows["lon"])
+
+
+def _parse_coordinates(values):
+    try:
+        return np.array(values, dtype=np.float64)
+    except ValueError:
+        # Some coordinates are not valid numbers, parse them one by one and set invalid ones to NaN
+        parsed = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                parsed[i] = float(value)
+            except ValueError:
+                pass
+        return parsed
+
+
+def geotag_points_from_search_results(results_docs):
+    """Returns the geotag points (see geotag_points_from_arrays) of the sounds in a list of search results docs,
+    which have the geotag as a "lon lat" string. Docs without geotag or with invalid values are discarded."""
+    ids, lons, lats = [], [], []
+    for doc in results_docs:
+        lon_lat = doc.get("geotag", "").split(" ")
+        if len(lon_lat) == 2:
+            ids.append(doc["id"])
+            lons.append(lon_lat[0])
+            lats.append(lon_lat[1])
+    return geotag_points_from_arrays(ids, _parse_coordinates(lats), _parse_coordinates(lons))
+
+
+def generate_geotag_bytearray_points(ids, lats, lons):
+    """Returns the bytearray with the given geotag points and the number of points in it. The bytearray has 3 int32
+    per sound: id, latitude and longitude (in millionths of degree)."""
+    return np.stack([ids, lats, lons], axis=1).astype(np.int32).tobytes(), len(ids)
+
+
+def generate_geotag_bytearray_sounds(sound_queryset):
+    sounds = [s for s in sound_queryset]
+    return generate_geotag_bytearray_points(
+        *geotag_points_from_arrays(
+            [s.id for s in sounds], [s.geotag.lat for s in sounds], [s.geotag.lon for s in sounds]
+        )
+    )
 
 
 def generate_geotag_bytearray_queryset_fast(sound_queryset):
-    # Take a queryset of sounds and get only the lat and long with .values_list,
-    # this is much faster than using Sound/Geotag objects, or even using .only
-    sounds = sound_queryset.values_list("id", "geotag__lon", "geotag__lat")
-    sounds = [{"id": id, "geotag": f"{lon} {lat}"} for id, lon, lat in sounds]
-    return generate_geotag_bytearray_dict(sounds)
+    return generate_geotag_bytearray_points(*geotag_points_from_queryset(sound_queryset))
 
 
 def generate_geotag_bytearray_dict(sound_list):
-    packed_sounds = io.BytesIO()
-    num_sounds_in_bytearray = 0
-    for s in sound_list:
-        try:
-            lon, lat = s.get("geotag", "").split(" ")
-            lat = max(min(float(lat), 90), -90)
-            lon = max(min(float(lon), 180), -180)
-            packed_sounds.write(struct.pack("iii", s["id"], int(lat * 1000000), int(lon * 1000000)))
-            num_sounds_in_bytearray += 1
-        except ValueError:
-            pass
-
-    return packed_sounds.getvalue(), num_sounds_in_bytearray
+    return generate_geotag_bytearray_points(*geotag_points_from_search_results(sound_list))
 
 
 def geotags_barray(request, tag=None):
@@ -108,6 +147,36 @@ def geotags_barray(request, tag=None):
             return HttpResponse(generated_bytearray, content_type="application/octet-stream")
 
 
+def geotags_tile(request, z, x, y):
+    if z > settings.GEOTAGS_TILES_MAX_ZOOM or x >= 2**z or y >= 2**z:
+        raise Http404
+    cache_persistent = caches["persistent"]
+    # Only the small generation entry is read for every tile, the (large) points array is only loaded on tile cache
+    # misses if it has not already been decoded in this process
+    points_generation = cache_persistent.get(settings.ALL_GEOTAGS_POINTS_GENERATION_CACHE_KEY)
+    if not isinstance(points_generation, (list, tuple)) or len(points_generation) != 2:
+        return HttpResponse(b"", content_type="application/octet-stream")
+
+    _, generation = points_generation
+    tile_cache_key = f"{settings.GEOTAGS_TILES_CACHE_KEY_PREFIX}:{generation}:{z}:{x}:{y}"
+    tile = cache_persistent.get(tile_cache_key)
+    if tile is None:
+
+        def load_encoded_points():
+            all_points = cache_persistent.get(settings.ALL_GEOTAGS_POINTS_CACHE_KEY)
+            if not isinstance(all_points, (list, tuple)) or len(all_points) != 3 or all_points[2] != generation:
+                # The points array is being regenerated
+                return None
+            return all_points[0]
+
+        points = get_tile_points(generation, load_encoded_points)
+        if points is None:
+            return HttpResponse(b"", content_type="application/octet-stream")
+        tile = build_tile(points, z, x, y)
+        cache_persistent.set(tile_cache_key, tile, settings.GEOTAGS_TILES_CACHE_TIME)
+    return HttpResponse(tile, content_type="application/octet-stream")
+
+
 @redirect_if_old_username
 @raise_404_if_user_is_deleted
 @cache_page(60 * 15)
@@ -206,7 +275,9 @@ def geotags(request, tag=None):
     tvars = _get_geotags_query_params(request)
     if tag is None:
         query_search_page_url = ""
-        url = reverse("geotags-barray")
+        # The "all geotags" map loads the tiles of the visible area instead of all geotags at once
+        url = reverse("geotags-tile", args=[0, 0, 0]).replace("/0/0/0/", "/{z}/{x}/{y}/")
+        tvars["tiles_max_zoom"] = settings.GEOTAGS_TILES_MAX_ZOOM
         # If "all geotags map" and no lat/lon/zoom is indicated, center map so whole world is visible
         if tvars["center_lat"] is None:
             tvars["center_lat"] = 24
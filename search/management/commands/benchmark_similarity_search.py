@@ -0,0 +1,146 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sounds.models import SoundSimilarityVector
+from utils.search import get_search_engine, get_similarity_backend
+
+console_logger = logging.getLogger("console")
+
+
+def time_similarity_queries(search_engine, sound_ids, **search_kwargs):
+    """Runs a similarity search for each of the sounds and returns the latencies (in ms) and the IDs of the results"""
+    latencies = []
+    results = []
+    for sound_id in sound_ids:
+        starttime = time.monotonic()
+        search_results = search_engine.search_sounds(similar_to=sound_id, **search_kwargs)
+        latencies.append((time.monotonic() - starttime) * 1000)
+        results.append([doc["id"] for doc in search_results.docs])
+    return np.array(latencies), results
+
+
+class Command(BaseCommand):
+    help = """Compares the latency and recall of similarity searches done with the vector search of the search engine
+    and with the similarity backend set in settings.SEARCH_ENGINE_SIMILARITY_BACKEND_CLASS, using random sounds as
+    targets. As the similarity backend might be approximate as well, recall is computed for both with respect to the
+    exact nearest neighbors (computed with NumPy from the vectors in the DB)."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--similarity-space",
+            action="store",
+            dest="similarity_space",
+            default=settings.SIMILARITY_SPACE_DEFAULT,
+            help="Similarity space to use (default: settings.SIMILARITY_SPACE_DEFAULT).",
+        )
+        parser.add_argument(
+            "--num-queries", action="store", dest="num_queries", type=int, default=100, help="Number of queries."
+        )
+        parser.add_argument(
+            "--num-results",
+            action="store",
+            dest="num_results",
+            type=int,
+            default=settings.SOUNDS_PER_PAGE,
+            help="Number of results per query (default: settings.SOUNDS_PER_PAGE).",
+        )
+        parser.add_argument(
+            "--filter",
+            action="store",
+            dest="query_filter",
+            default="",
+            help="Filter applied to all queries. Recall is not computed when using a filter.",
+        )
+
+    def handle(self, *args, **options):
+        similarity_space_name = options["similarity_space"]
+        num_results = options["num_results"]
+        similarity_backend = get_similarity_backend()
+        if similarity_backend is None:
+            raise CommandError("No similarity backend is set in settings.SEARCH_ENGINE_SIMILARITY_BACKEND_CLASS")
+
+        vectors_qs = SoundSimilarityVector.objects.filter(
+            similarity_space_name=similarity_space_name, sound__processing_state="OK", sound__moderation_state="OK"
+        )
+        sound_ids = list(vectors_qs.order_by("?").values_list("sound_id", flat=True)[: options["num_queries"]])
+        search_kwargs = dict(
+            similar_to_similarity_space=similarity_space_name,
+            num_sounds=num_results,
+            query_filter=options["query_filter"],
+        )
+
+        search_engine = get_search_engine()
+        search_engine.similarity_backend = None
+        search_engine_latencies, search_engine_results = time_similarity_queries(
+            search_engine, sound_ids, **search_kwargs
+        )
+        search_engine.similarity_backend = similarity_backend
+        similarity_backend_latencies, similarity_backend_results = time_similarity_queries(
+            search_engine, sound_ids, **search_kwargs
+        )
+
+        recalls = {}
+        if not options["query_filter"]:
+            # Exact nearest neighbors computed with all vectors in memory
+            all_sound_ids, all_vectors_data = zip(*vectors_qs.values_list("sound_id", "vector_data"))
+            all_sound_ids = np.array(all_sound_ids)
+            all_vectors = np.stack([SoundSimilarityVector.decode_vector(data) for data in all_vectors_data])
+            position_per_sound_id = {sound_id: position for position, sound_id in enumerate(all_sound_ids.tolist())}
+            l2_norm = settings.SIMILARITY_SPACES[similarity_space_name].get("l2_norm", False)
+            exact_results = []
+            for sound_id in sound_ids:
+                vector = all_vectors[position_per_sound_id[sound_id]]
+                if l2_norm:
+                    distances = -(all_vectors @ vector)
+                else:
+                    distances = np.sum((all_vectors - vector) ** 2, axis=1)
+                distances[position_per_sound_id[sound_id]] = np.inf
+                exact_results.append(all_sound_ids[np.argsort(distances)[:num_results]].tolist())
+            for name, results in [
+                ("search_engine", search_engine_results),
+                ("similarity_backend", similarity_backend_results),
+            ]:
+                # Recall is computed on the results above the min similarity threshold, so only the first results of
+                # the exact nearest neighbors are considered when a query returns less than num_results sounds
+                recalls[name] = np.mean(
+                    [
+                        len(set(result) & set(exact_result[: len(result)])) / len(result)
+                        for result, exact_result in zip(results, exact_results)
+                        if result
+                    ]
+                    or [0.0]
+                )
+
+        for name, latencies in [
+            ("search_engine", search_engine_latencies),
+            ("similarity_backend", similarity_backend_latencies),
+        ]:
+            recall = f", recall@{num_results}: {recalls[name]:.3f}" if name in recalls else ""
+            console_logger.info(
+                f"{name}: mean {latencies.mean():.1f}ms, p50 {np.percentile(latencies, 50):.1f}ms, "
+                f"p95 {np.percentile(latencies, 95):.1f}ms{recall}"
+            )
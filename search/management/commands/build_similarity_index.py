@@ -0,0 +1,67 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+from utils.management_commands import LoggingBaseCommand
+from utils.search import get_similarity_backend
+
+console_logger = logging.getLogger("console")
+
+
+class Command(LoggingBaseCommand):
+    help = """Indexes the similarity vectors of all sounds in the similarity backend set in
+    settings.SEARCH_ENGINE_SIMILARITY_BACKEND_CLASS, replacing the previously indexed vectors. After the index is built,
+    it is kept up to date when sounds are indexed in the search engine. These updates are compacted by rebuilding the
+    index, which post_dirty_sounds_to_search_engine does when there are too many of them (see
+    settings.SIMILARITY_INDEX_MAX_UPDATES_RATIO)."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--similarity-spaces",
+            action="store",
+            dest="similarity_spaces",
+            default=None,
+            help="Comma-separated list of similarity spaces to index (default: all spaces in SIMILARITY_SPACES).",
+        )
+
+    def handle(self, *args, **options):
+        self.log_start()
+        similarity_backend = get_similarity_backend()
+        if similarity_backend is None:
+            raise CommandError("No similarity backend is set in settings.SEARCH_ENGINE_SIMILARITY_BACKEND_CLASS")
+        if options["similarity_spaces"] is not None:
+            similarity_space_names = options["similarity_spaces"].split(",")
+        else:
+            similarity_space_names = settings.SIMILARITY_SPACES_NAMES
+
+        data_to_log = {}
+        for similarity_space_name in similarity_space_names:
+            starttime = time.monotonic()
+            num_vectors = similarity_backend.rebuild_index(similarity_space_name)
+            console_logger.info(
+                f"Indexed {num_vectors} vectors of {similarity_space_name} in {time.monotonic() - starttime:.2f}s"
+            )
+            data_to_log[similarity_space_name] = num_vectors
+        self.log_end(data_to_log)
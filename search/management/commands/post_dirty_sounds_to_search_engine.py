@@ -21,16 +21,22 @@
 import datetime
 import logging
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
-from django.core.cache import cache
 
 from sounds.models import Sound
 from utils.management_commands import LoggingBaseCommand
+from utils.process_pool import map_in_process_pool
+from utils.search import SearchEngineException, get_search_engine, get_similarity_backend
 from utils.search.search_sounds import (
+    add_sound_documents_to_search_engine,
     add_sounds_to_search_engine,
+    bump_search_index_generation,
     delete_sounds_from_search_engine,
     send_update_similarity_vectors_in_search_engine,
+    update_sounds_in_similarity_backend,
 )
 
 console_logger = logging.getLogger("console")
@@ -48,24 +54,28 @@ def time_stats(done, total, starttime):
 
 
 def send_sounds_to_search_engine(
-    sounds_to_index_ids,
-    slice_size=4000,
+    sound_slices,
+    total_sounds,
     delete_if_existing=False,
     include_similarity_vectors=False,
     solr_collection_url=None,
     update=False,
+    invalidate_cached_results=True,
 ):
-    total_sounds = len(sounds_to_index_ids)
+    """Sends sounds to the search engine slice by slice. `sound_slices` is an iterable of lists of Sound objects
+    as returned by bulk_query_solr (see Sound.objects.iter_bulk_query_solr) and `total_sounds` the total number of
+    sounds in them (used to report progress). Cached search results are invalidated after each slice unless
+    `invalidate_cached_results` is False, which should be the case when indexing to a collection which is not (yet)
+    used for searching."""
     console_logger.info(
         f"Starting to post dirty sounds to solr. {total_sounds} sounds to be added/updated to the search engine"
     )
     n_sounds_indexed_correctly = 0
     starttime = time.monotonic()
-    for i in range(0, total_sounds, slice_size):
-        sound_ids_slice = sounds_to_index_ids[i : i + slice_size]
+    for sound_objects in sound_slices:
+        sound_ids_slice = [sound.id for sound in sound_objects]
         if delete_if_existing:
             delete_sounds_from_search_engine(sound_ids_slice, solr_collection_url=solr_collection_url)
-        sound_objects = Sound.objects.bulk_query_solr(sound_ids_slice)
         n_sounds_indexed = add_sounds_to_search_engine(
             sound_objects,
             update=update,
@@ -80,21 +90,107 @@ def send_sounds_to_search_engine(
             f"Added {n_sounds_indexed_correctly}/{total_sounds} sounds. Elapsed: {elapsed}, Remaining: {remaining}"
         )
 
-        # Clear empty query caches as we have modified the sounds index
-        cache.delete(settings.SEARCH_EMPTY_QUERY_CACHE_KEY, None)
-        cache.delete(settings.SEARCH_EMPTY_QUERY_CACHE_KEY + "_beta", None)
+        # We have modified the sounds index, so search results cached for the previous index generation are not used
+        if invalidate_cached_results:
+            bump_search_index_generation()
 
     return n_sounds_indexed_correctly
 
 
-def update_similarity_vectors_in_search_engine(sounds_to_index_ids, slice_size=4000, solr_collection_url=None):
-    total_sounds = len(sounds_to_index_ids)
+def build_search_engine_documents(sound_objects, update, include_similarity_vectors, solr_collection_url):
+    """Builds the search engine documents of the given sounds. This runs in the document building processes of
+    send_sounds_to_search_engine_pipelined and therefore needs to be a module level function."""
+    try:
+        return get_search_engine(sounds_index_url=solr_collection_url).build_sound_documents(
+            sound_objects, update=update, include_similarity_vectors=include_similarity_vectors
+        )
+    except SearchEngineException as e:
+        console_logger.error(f"Failed to build search engine documents: {str(e)}")
+        return []
+
+
+def send_sounds_to_search_engine_pipelined(
+    sound_slices,
+    total_sounds,
+    include_similarity_vectors=False,
+    solr_collection_url=None,
+    update=False,
+    workers=4,
+    max_inflight=2,
+    invalidate_cached_results=True,
+):
+    """Same as send_sounds_to_search_engine but with the work for each slice split in three stages which run
+    concurrently: sounds are fetched from the DB (by iterating sound_slices in the calling thread), search engine
+    documents are built in a pool of `workers` processes (see utils.process_pool.map_in_process_pool) and built
+    documents are sent to the search engine by up to `max_inflight` concurrent requests. The number of slices waiting
+    in each stage is bounded so memory usage does not depend on the total number of sounds. If `workers` is 0,
+    documents are built in the calling thread.
+    """
+    console_logger.info(
+        f"Starting to post sounds to solr using {workers} document building processes and {max_inflight} "
+        f"concurrent requests. {total_sounds} sounds to be added/updated to the search engine"
+    )
+    n_sounds_indexed_correctly = 0
+    starttime = time.monotonic()
+
+    # Slices whose documents are being sent to the search engine: (sound ids, number of indexed sounds future)
+    pending_posts = deque()
+
+    def finish_oldest_post():
+        nonlocal n_sounds_indexed_correctly
+        sound_ids_slice, n_sounds_indexed_future = pending_posts.popleft()
+        n_sounds_indexed = n_sounds_indexed_future.result()
+        if n_sounds_indexed > 0:
+            Sound.objects.filter(pk__in=sound_ids_slice).update(is_index_dirty=False)
+            if include_similarity_vectors:
+                update_sounds_in_similarity_backend(sound_ids_slice)
+        n_sounds_indexed_correctly += n_sounds_indexed
+        elapsed, remaining = time_stats(n_sounds_indexed_correctly, total_sounds, starttime)
+        console_logger.info(
+            f"Added {n_sounds_indexed_correctly}/{total_sounds} sounds. Elapsed: {elapsed}, Remaining: {remaining}"
+        )
+
+        # We have modified the sounds index, so search results cached for the previous index generation are not used
+        if invalidate_cached_results:
+            bump_search_index_generation()
+
+    # Documents are built from the data pre-fetched by bulk_query_solr, so the document building processes don't
+    # need the DB
+    slices_to_build = (
+        (
+            [sound.id for sound in sound_objects],
+            (sound_objects, update, include_similarity_vectors, solr_collection_url),
+        )
+        for sound_objects in sound_slices
+    )
+    poster = ThreadPoolExecutor(max_workers=max_inflight)
+    try:
+        for sound_ids_slice, documents in map_in_process_pool(build_search_engine_documents, slices_to_build, workers):
+            while len(pending_posts) >= max_inflight:
+                finish_oldest_post()
+            pending_posts.append(
+                (
+                    sound_ids_slice,
+                    poster.submit(
+                        add_sound_documents_to_search_engine, documents, solr_collection_url=solr_collection_url
+                    ),
+                )
+            )
+        while pending_posts:
+            finish_oldest_post()
+    finally:
+        poster.shutdown(wait=True, cancel_futures=True)
+
+    return n_sounds_indexed_correctly
+
+
+def update_similarity_vectors_in_search_engine(sound_slices, total_sounds, solr_collection_url=None):
+    """Updates similarity vectors of sounds already in the search engine. See send_sounds_to_search_engine for the
+    sound_slices and total_sounds parameters."""
     console_logger.info(f"Starting to update similarity vectors in solr. {total_sounds} sounds to be updated")
     n_sounds_indexed_correctly = 0
     starttime = time.monotonic()
-    for i in range(0, total_sounds, slice_size):
-        sound_ids_slice = sounds_to_index_ids[i : i + slice_size]
-        sound_objects = Sound.objects.bulk_query_solr(sound_ids_slice)
+    for sound_objects in sound_slices:
         n_sounds_indexed = send_update_similarity_vectors_in_search_engine(
             sound_objects, solr_collection_url=solr_collection_url
         )
@@ -127,19 +223,25 @@ class Command(LoggingBaseCommand):
         self.log_start()
 
         # Index all those which are processed and moderated ok that has is_index_dirty
-        sounds_to_index_ids = list(
-            Sound.objects.filter(processing_state="OK", moderation_state="OK", is_index_dirty=True).values_list(
-                "id", flat=True
-            )
-        )
+        sounds_to_index_filter = dict(processing_state="OK", moderation_state="OK", is_index_dirty=True)
         n_sounds_indexed_correctly = send_sounds_to_search_engine(
-            sounds_to_index_ids,
-            slice_size=options["slice_size"],
+            Sound.objects.iter_bulk_query_solr(batch_size=options["slice_size"], **sounds_to_index_filter),
+            Sound.objects.filter(**sounds_to_index_filter).count(),
             delete_if_existing=options["delete_if_existing"],
             include_similarity_vectors=True,
             update=True,
         )
 
+        # Updates of the similarity backend are compacted from time to time by rebuilding its indexes
+        similarity_backend = get_similarity_backend()
+        if similarity_backend is not None:
+            for similarity_space_name in settings.SIMILARITY_SPACES_NAMES:
+                if similarity_backend.needs_rebuild(similarity_space_name):
+                    num_vectors = similarity_backend.rebuild_index(similarity_space_name)
+                    console_logger.info(
+                        f"Rebuilt similarity index of {similarity_space_name} with {num_vectors} vectors"
+                    )
+
         # Find all the index dirty sounds which are not processed/moderated ok and therefore should not be in the
         # search index, and trigger the deletion of these sounds in the index so that they disappear if they were
         # present. This bit of code should ideally be redundant as sounds should be deleted from the index when they
@@ -23,15 +23,18 @@ import json
 import logging
 import os
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
 
 from search import solrapi
 from search.management.commands.post_dirty_sounds_to_search_engine import (
     send_sounds_to_search_engine,
+    send_sounds_to_search_engine_pipelined,
     update_similarity_vectors_in_search_engine,
 )
 from sounds.models import Sound
-from utils.search import get_search_engine
+from utils.search import get_search_engine, get_similarity_backend
+from utils.search.search_sounds import bump_search_index_generation
 
 console_logger = logging.getLogger("console")
 
@@ -53,6 +56,22 @@ class Command(BaseCommand):
             default=False,
             help="Immediately create the alias for the new index before indexing",
         )
+        parser.add_argument(
+            "--workers",
+            dest="workers",
+            default=0,
+            type=int,
+            help="Number of processes used to build search engine documents. If greater than 0, sounds are fetched "
+            "from the DB, converted to documents and sent to the search engine concurrently (pipelined mode). Not "
+            "used with --only-similarity-vectors.",
+        )
+        parser.add_argument(
+            "--max-inflight",
+            dest="max_inflight",
+            default=2,
+            type=int,
+            help="Max number of concurrent requests sending documents to the search engine in pipelined mode",
+        )
 
         group = parser.add_mutually_exclusive_group(required=False)
         group.add_argument(
@@ -95,29 +114,47 @@ class Command(BaseCommand):
         if options["immediately_create_alias"]:
             console_logger.info("Creating the freesound alias to point to the new index")
             solr_api.create_collection_alias("freesound")
+            bump_search_index_generation()
 
         # Get all sounds moderated and processed ok and add them to the search engine
         # Don't delete existing sounds in each loop because we clean up in the final step
-        sounds_to_index_ids = list(
-            Sound.objects.filter(processing_state="OK", moderation_state="OK").values_list("id", flat=True)
-        )
+        sounds_to_index_filter = dict(processing_state="OK", moderation_state="OK")
+        total_sounds = Sound.objects.filter(**sounds_to_index_filter).count()
+        sound_slices = Sound.objects.iter_bulk_query_solr(batch_size=options["size_size"], **sounds_to_index_filter)
 
         if only_similarity_vectors:
-            console_logger.info(
-                "Updating similarity vectors for %d sounds in the search engine", len(sounds_to_index_ids)
-            )
-            update_similarity_vectors_in_search_engine(
-                sounds_to_index_ids, slice_size=options["size_size"], solr_collection_url=collection_url
-            )
+            console_logger.info("Updating similarity vectors for %d sounds in the search engine", total_sounds)
+            update_similarity_vectors_in_search_engine(sound_slices, total_sounds, solr_collection_url=collection_url)
         else:
-            console_logger.info("Indexing %d sounds to the search engine", len(sounds_to_index_ids))
-            send_sounds_to_search_engine(
-                sounds_to_index_ids,
-                slice_size=options["size_size"],
-                solr_collection_url=collection_url,
-                include_similarity_vectors=include_similarity_vectors,
-            )
+            console_logger.info("Indexing %d sounds to the search engine", total_sounds)
+            if options["workers"] > 0:
+                send_sounds_to_search_engine_pipelined(
+                    sound_slices,
+                    total_sounds,
+                    solr_collection_url=collection_url,
+                    include_similarity_vectors=include_similarity_vectors,
+                    workers=options["workers"],
+                    max_inflight=max(options["max_inflight"], 1),
+                    invalidate_cached_results=options["immediately_create_alias"],
+                )
+            else:
+                send_sounds_to_search_engine(
+                    sound_slices,
+                    total_sounds,
+                    solr_collection_url=collection_url,
+                    include_similarity_vectors=include_similarity_vectors,
+                    invalidate_cached_results=options["immediately_create_alias"],
+                )
 
         if not only_similarity_vectors:
             console_logger.info("Updating the freesound alias to point to the new index")
             solr_api.create_collection_alias("freesound")
+        # Searches now use the new index (or the updated similarity vectors)
+        bump_search_index_generation()
+
+        similarity_backend = get_similarity_backend()
+        if similarity_backend is not None and (include_similarity_vectors or only_similarity_vectors):
+            # All vectors have been added to the similarity backend as updates, rebuild its index to compact them
+            for similarity_space_name in settings.SIMILARITY_SPACES_NAMES:
+                num_vectors = similarity_backend.rebuild_index(similarity_space_name)
+                console_logger.info(f"Rebuilt similarity index of {similarity_space_name} with {num_vectors} vectors")
@@ -74,7 +74,7 @@ class Command(LoggingBaseCommand):
         # These sounds should be indexed, add them to a list to be marked as index dirty
         sound_ids_to_mark_as_dirty += in_db_not_in_solr
 
-        in_solr_not_in_db = list(set(solr_sound_ids).difference(db_sound_ids))
+        in_solr_not_in_db = list(solr_sound_ids.difference(db_sound_ids))
         console_logger.info(f"Sounds in solr but not in db:\t{len(in_solr_not_in_db)}")
         # These sounds should not be in solr, so we delete them from solr
         solr_sound_ids_to_delete += in_solr_not_in_db
@@ -96,7 +96,7 @@ class Command(LoggingBaseCommand):
 
         for similarity_space_name in settings.SIMILARITY_SPACES.keys():
             console_logger.info(f"- Processing similarity space: {similarity_space_name}")
-            solr_ids = solr_sim_vector_ids.get(similarity_space_name, [])
+            solr_ids = solr_sim_vector_ids.get(similarity_space_name, set())
             db_ids = db_sim_vector_ids[similarity_space_name]
             db_ids = list(
                 set(db_ids).intersection(solr_sound_ids)
@@ -0,0 +1,113 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+import pickle
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase
+
+from search.management.commands.post_dirty_sounds_to_search_engine import (
+    send_sounds_to_search_engine,
+    send_sounds_to_search_engine_pipelined,
+)
+from sounds.models import Sound, SoundSimilarityVector
+from utils.search import SearchEngineException, get_search_engine
+from utils.test_helpers import create_user_and_sounds
+
+
+class PostSoundsToSearchEngineTest(TestCase):
+    fixtures = ["licenses"]
+
+    def setUp(self):
+        _, _, sounds = create_user_and_sounds(num_sounds=7, processing_state="OK", moderation_state="OK")
+        self.sound_ids = sorted(s.id for s in sounds)
+        Sound.objects.filter(id__in=self.sound_ids).update(is_index_dirty=True)
+
+    def test_sound_objects_can_be_sent_to_document_building_processes(self):
+        SoundSimilarityVector.objects.create(
+            sound_id=self.sound_ids[0], similarity_space_name=settings.SIMILARITY_SPACE_DEFAULT, vector=[0.5] * 512
+        )
+        sound_objects = list(Sound.objects.bulk_query_solr(self.sound_ids))
+        search_engine = get_search_engine()
+        documents = search_engine.build_sound_documents(sound_objects, include_similarity_vectors=True)
+        documents_with_vectors = [document for document in documents if "similarity_vectors" in document]
+        self.assertEqual([document["id"] for document in documents_with_vectors], [self.sound_ids[0]])
+        # Building documents from pickled sounds (as in document building processes) and using pre-fetched similarity
+        # vectors gives the same documents as querying the vectors from the DB
+        self.assertListEqual(
+            search_engine.build_sound_documents(
+                pickle.loads(pickle.dumps(sound_objects)),  # noqa: S301
+                include_similarity_vectors=True,
+            ),
+            documents,
+        )
+        self.assertListEqual(
+            search_engine.build_sound_documents(
+                sound_objects, include_similarity_vectors=True, use_prefetched_vectors=False
+            ),
+            documents,
+        )
+
+    @mock.patch("utils.search.backends.solr9pysolr.Solr9PySolrSearchEngine.add_sound_documents_to_index")
+    def test_pipelined_sends_same_documents(self, add_sound_documents_to_index):
+        n_sounds_indexed = send_sounds_to_search_engine(
+            Sound.objects.iter_bulk_query_solr(batch_size=3, id__in=self.sound_ids), len(self.sound_ids)
+        )
+        self.assertEqual(n_sounds_indexed, len(self.sound_ids))
+        sequential_documents = [call.args[0] for call in add_sound_documents_to_index.call_args_list]
+
+        Sound.objects.filter(id__in=self.sound_ids).update(is_index_dirty=True)
+        add_sound_documents_to_index.reset_mock()
+        n_sounds_indexed = send_sounds_to_search_engine_pipelined(
+            Sound.objects.iter_bulk_query_solr(batch_size=3, id__in=self.sound_ids),
+            len(self.sound_ids),
+            workers=0,
+            max_inflight=2,
+        )
+        self.assertEqual(n_sounds_indexed, len(self.sound_ids))
+        pipelined_documents = [call.args[0] for call in add_sound_documents_to_index.call_args_list]
+
+        # Documents are sent in slices of 3 sounds, possibly in a different order because of concurrent requests
+        self.assertEqual(len(pipelined_documents), 3)
+        self.assertCountEqual(
+            [document["id"] for documents in pipelined_documents for document in documents], self.sound_ids
+        )
+        key = lambda document: document["id"]  # noqa: E731
+        self.assertListEqual(
+            sorted([document for documents in pipelined_documents for document in documents], key=key),
+            sorted([document for documents in sequential_documents for document in documents], key=key),
+        )
+        self.assertFalse(Sound.objects.filter(id__in=self.sound_ids, is_index_dirty=True).exists())
+
+    @mock.patch(
+        "utils.search.backends.solr9pysolr.Solr9PySolrSearchEngine.add_sound_documents_to_index",
+        side_effect=SearchEngineException("Solr is down"),
+    )
+    def test_pipelined_failed_slices_stay_dirty(self, add_sound_documents_to_index):
+        n_sounds_indexed = send_sounds_to_search_engine_pipelined(
+            Sound.objects.iter_bulk_query_solr(batch_size=3, id__in=self.sound_ids),
+            len(self.sound_ids),
+            workers=0,
+            max_inflight=2,
+        )
+        self.assertEqual(n_sounds_indexed, 0)
+        self.assertEqual(add_sound_documents_to_index.call_count, 3)
+        self.assertEqual(Sound.objects.filter(id__in=self.sound_ids, is_index_dirty=True).count(), 7)
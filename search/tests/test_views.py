@@ -24,13 +24,18 @@ import pytest
 from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.management import call_command
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from sounds.models import Sound
 from utils.pagination import PreSlicedCountProvidedPaginator
 from utils.ratelimit import request_limit_events_total
 from utils.search import SearchResults
+from utils.search.search_sounds import (
+    bump_search_index_generation,
+    delete_sounds_from_search_engine,
+    search_results_cache_requests_total,
+)
 from utils.test_helpers import counter_samples, create_user_and_sounds
 
 
@@ -151,6 +156,62 @@ class SearchPageTests(TestCase):
             self.client.get(reverse("sounds-search") + "?dp=1&cm=1")
 
 
+@override_settings(SEARCH_RESULTS_CACHE_ENABLED=True)
+class SearchResultsCacheTests(TestCase):
+    fixtures = ["licenses", "users", "sounds_with_tags"]
+
+    def setUp(self):
+        cache.clear()
+        self.perform_search_engine_query_response = create_fake_perform_search_engine_query_response(15)
+
+    def _samples(self):
+        return counter_samples(search_results_cache_requests_total, "result")
+
+    @mock.patch("search.views.perform_search_engine_query")
+    def test_results_cached_until_index_generation_changes(self, perform_search_engine_query):
+        perform_search_engine_query.return_value = self.perform_search_engine_query_response
+        before = self._samples()
+
+        # The same query is only sent once to the search engine, regardless of the order of the request parameters
+        resp = self.client.get(reverse("sounds-search") + '?q=wind&f=tag:"field-recording"')
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.get(reverse("sounds-search") + '?f=tag:"field-recording"&q=wind')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context["docs"]), 15)
+        self.assertEqual(perform_search_engine_query.call_count, 1)
+
+        # Different queries are not served from the same cache entry
+        self.client.get(reverse("sounds-search") + "?q=rain")
+        self.assertEqual(perform_search_engine_query.call_count, 2)
+
+        # Once the index is updated, results are retrieved from the search engine again
+        bump_search_index_generation()
+        self.client.get(reverse("sounds-search") + '?q=wind&f=tag:"field-recording"')
+        self.assertEqual(perform_search_engine_query.call_count, 3)
+
+        after = self._samples()
+        self.assertEqual(after[("hit",)] - before.get(("hit",), 0), 1)
+        self.assertEqual(after[("miss",)] - before.get(("miss",), 0), 3)
+
+    @mock.patch("utils.search.search_sounds.get_search_engine")
+    @mock.patch("search.views.perform_search_engine_query")
+    def test_deleting_sounds_invalidates_cached_results(self, perform_search_engine_query, get_search_engine):
+        perform_search_engine_query.return_value = self.perform_search_engine_query_response
+        self.client.get(reverse("sounds-search") + "?q=wind")
+        delete_sounds_from_search_engine([self.perform_search_engine_query_response[0].docs[0]["id"]])
+        get_search_engine.return_value.remove_sounds_from_index.assert_called_once()
+        self.client.get(reverse("sounds-search") + "?q=wind")
+        self.assertEqual(perform_search_engine_query.call_count, 2)
+
+    @override_settings(SEARCH_RESULTS_CACHE_MAX_DOCS=10)
+    @mock.patch("search.views.perform_search_engine_query")
+    def test_large_results_not_cached(self, perform_search_engine_query):
+        perform_search_engine_query.return_value = self.perform_search_engine_query_response
+        self.client.get(reverse("sounds-search") + "?q=wind")
+        self.client.get(reverse("sounds-search") + "?q=wind")
+        self.assertEqual(perform_search_engine_query.call_count, 2)
+
+
 class SearchPageLowerClampTests(TestCase):
     """If ?page= value is < 1 then clamp it to 1 before sending to solr in order to prevent failures"""
 
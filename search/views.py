@@ -52,20 +52,14 @@ from utils.search import (
 )
 from utils.search.search_sounds import (
     allow_beta_search_features,
-    get_empty_query_cache_key,
+    get_search_results_cache_key,
     perform_search_engine_query,
+    search_results_cache_requests_total,
 )
 
 search_logger = logging.getLogger("search")
 
 
-def is_empty_query(request):
-    # Check if the request correpsonds to an empty query with all the default parameters. It happens when the user
-    # hits "enter" in the search box without entering any text. This can be used to return cached results for this common
-    # case which typically produces long queries
-    return len(request.GET) == 0 or (len(request.GET) == 1 and "q" in request.GET and request.GET["q"] == "")
-
-
 def search_view_helper(request):
     # Process request data with the SearchQueryProcessor
     sqp = search_query_processor.SearchQueryProcessor(request)
@@ -135,23 +129,21 @@ def search_view_helper(request):
         query_params = {}  # Initialize to avoid reference before assignment if exception occurs at sqp.as_query_params()
         query_params = sqp.as_query_params()
 
-        empty_query_cache_key = get_empty_query_cache_key(request, use_beta_features=use_beta_features)
-        if is_empty_query(request) and empty_query_cache_key:
-            # This common case produces long queries but the results will change very slowly (only when we index new sounds),
-            # so we can cache them.
-            results_paginator = cache.get(empty_query_cache_key, None)
-            if results_paginator is not None:
-                # If results are cached, we use them directly
-                results, paginator = results_paginator
-                results.q_time = None  # Set query time to None as we are not actually querying the search engine
-            else:
-                # Perform the query and cache the results
-                results, paginator = perform_search_engine_query(query_params)
-                cache.set(empty_query_cache_key, (results, paginator), settings.SEARCH_EMPTY_QUERY_CACHE_TIME)
-
+        # Results only change when the search index is updated, so popular queries (empty query, common tags, front
+        # page links...) are served from the cache. Cache keys include the search index generation number which is
+        # bumped by the indexer, so there is no need to delete cached results when the index changes.
+        results_cache_key = get_search_results_cache_key(query_params, use_beta_features=use_beta_features)
+        results_paginator = cache.get(results_cache_key) if results_cache_key is not None else None
+        if results_paginator is not None:
+            search_results_cache_requests_total.labels(result="hit").inc()
+            results, paginator = results_paginator
+            results.q_time = None  # Set query time to None as we are not actually querying the search engine
         else:
-            # Perform the query normally
             results, paginator = perform_search_engine_query(query_params)
+            if results_cache_key is not None:
+                search_results_cache_requests_total.labels(result="miss").inc()
+                if len(results.docs) <= settings.SEARCH_RESULTS_CACHE_MAX_DOCS:
+                    cache.set(results_cache_key, (results, paginator), settings.SEARCH_RESULTS_CACHE_TIME)
 
         if sqp.map_mode_active():
             # In map we configure the search query to already return geotags data. Here we collect all this data
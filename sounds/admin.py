@@ -178,8 +178,7 @@ class SoundAdmin(DjangoObjectActions, admin.ModelAdmin):
             queryset_or_object.invalidate_template_caches()
             messages.add_message(request, messages.INFO, f"Sound {queryset_or_object.id} caches were cleared.")
         else:
-            for sound in queryset_or_object:
-                sound.invalidate_template_caches()
+            Sound.invalidate_template_caches_bulk(list(queryset_or_object.values_list("id", flat=True)))
             messages.add_message(request, messages.INFO, f"{queryset_or_object.count()} sounds caches were cleared.")
 
     @admin.action(description="Reindex sound")
@@ -0,0 +1,292 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+"""Write-behind counters of sound and pack downloads.
+
+When a Download or PackDownload is created, the download counts of the sound/pack and of the profiles of the
+downloader and the uploader need to be incremented. Doing that in the transaction of the download makes these rows
+lock hot spots for popular sounds and uploaders, so if settings.DOWNLOAD_COUNTERS_WRITE_BEHIND is set, downloads are
+only counted in hashes of the download_counters cache (once the transaction is committed). The
+flush_download_counters management command, which should run periodically, then applies the counts to the DB with a
+single UPDATE per table.
+
+The uploader of the sound/pack is counted when the download is created or deleted, so that counts are applied to the
+right profile even if the sound/pack no longer exists when they are flushed.
+
+To flush the counts, the hashes are renamed to processing keys, which are only deleted once the counts have been
+applied to the DB. If the flush fails, the counts of the processing keys are applied by the next flush, and the ones
+counted meanwhile are kept as pending. Flushing is at-least-once: if the process is killed after the counts have been
+committed to the DB but before the processing keys are deleted, the next flush applies these counts again.
+
+Sounds are only marked as dirty in the search index when their number of downloads changes enough to be relevant for
+sorting search results (see settings.NUM_DOWNLOADS_REINDEX_RATIO).
+"""
+
+import collections
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import connection, transaction
+
+from utils.cache import invalidate_template_cache_generations
+
+sounds_logger = logging.getLogger("sounds")
+
+SOUND_DOWNLOADS_KEY = "download_counters_sounds"
+SOUND_DOWNLOADERS_KEY = "download_counters_sound_downloaders"
+SOUND_UPLOADERS_KEY = "download_counters_sound_uploaders"
+PACK_DOWNLOADS_KEY = "download_counters_packs"
+PACK_DOWNLOADERS_KEY = "download_counters_pack_downloaders"
+PACK_UPLOADERS_KEY = "download_counters_pack_uploaders"
+ALL_KEYS = [
+    SOUND_DOWNLOADS_KEY,
+    SOUND_DOWNLOADERS_KEY,
+    SOUND_UPLOADERS_KEY,
+    PACK_DOWNLOADS_KEY,
+    PACK_DOWNLOADERS_KEY,
+    PACK_UPLOADERS_KEY,
+]
+
+
+def get_processing_key(key):
+    return f"{key}_processing"
+
+
+def count_sound_download(sound_id, user_id, uploader_id, count=1):
+    """Adds count (which can be negative) to the number of downloads of the sound, and to the number of downloaded
+    sounds and the number of downloads of the uploader in the profiles of the downloader and the uploader.
+    """
+    count_downloads(
+        {
+            SOUND_DOWNLOADS_KEY: {sound_id: count},
+            SOUND_DOWNLOADERS_KEY: {user_id: count},
+            SOUND_UPLOADERS_KEY: {uploader_id: count},
+        }
+    )
+
+
+def count_pack_download(pack_id, user_id, uploader_id, count=1):
+    """Same as count_sound_download for packs"""
+    count_downloads(
+        {
+            PACK_DOWNLOADS_KEY: {pack_id: count},
+            PACK_DOWNLOADERS_KEY: {user_id: count},
+            PACK_UPLOADERS_KEY: {uploader_id: count},
+        }
+    )
+
+
+def count_downloads(counts):
+    if settings.DOWNLOAD_COUNTERS_WRITE_BEHIND:
+
+        def increment_pending_counts_on_commit():
+            # The download has already been committed at this point, so an error counting it is logged (with the
+            # counts, to be able to fix them) instead of being raised to the view
+            try:
+                increment_pending_counts(counts)
+            except Exception as e:
+                sounds_logger.error(f"Could not count downloads {counts}: {e}")
+
+        transaction.on_commit(increment_pending_counts_on_commit)
+    else:
+        apply_download_counts(counts)
+
+
+def increment_pending_counts(counts):
+    """Adds the given counts to the ones pending to be applied to the DB.
+
+    Args:
+        counts (dict): counts per object ID for each of the counter keys
+    """
+    cache_download_counters = caches["download_counters"]
+    if isinstance(cache_download_counters, RedisCache):
+        client = cache_download_counters._cache.get_client(write=True)
+        with client.pipeline(transaction=False) as pipeline:
+            for key, key_counts in counts.items():
+                for object_id, count in key_counts.items():
+                    pipeline.hincrby(cache_download_counters.make_and_validate_key(key), object_id, count)
+            pipeline.execute()
+    else:
+        # Other cache backends (used in development and tests) store the hash as a dictionary, which is not atomic
+        for key, key_counts in counts.items():
+            pending_counts = collections.Counter(cache_download_counters.get(key, {}))
+            pending_counts.update(key_counts)
+            cache_download_counters.set(key, dict(pending_counts), None)
+
+
+def start_processing_pending_counts():
+    """Moves the pending counts to the processing keys and returns the counts of these keys. If a processing key
+    already exists (because a previous flush failed), it is kept as it is and the pending counts are not moved.
+    """
+    cache_download_counters = caches["download_counters"]
+    if isinstance(cache_download_counters, RedisCache):
+        client = cache_download_counters._cache.get_client(write=True)
+        with client.pipeline(transaction=True) as pipeline:
+            for key in ALL_KEYS:
+                pipeline.renamenx(
+                    cache_download_counters.make_and_validate_key(key),
+                    cache_download_counters.make_and_validate_key(get_processing_key(key)),
+                )
+            for key in ALL_KEYS:
+                pipeline.hgetall(cache_download_counters.make_and_validate_key(get_processing_key(key)))
+            results = pipeline.execute(raise_on_error=False)
+        for result in results[: len(ALL_KEYS)]:
+            # RENAMENX fails if there are no pending counts for the key
+            if isinstance(result, Exception) and "no such key" not in str(result):
+                raise result
+        return {
+            key: {int(object_id): int(count) for object_id, count in key_counts.items()}
+            for key, key_counts in zip(ALL_KEYS, results[len(ALL_KEYS) :])
+        }
+    for key in ALL_KEYS:
+        if get_processing_key(key) not in cache_download_counters and key in cache_download_counters:
+            cache_download_counters.set(get_processing_key(key), cache_download_counters.get(key), None)
+            cache_download_counters.delete(key)
+    counts = cache_download_counters.get_many([get_processing_key(key) for key in ALL_KEYS])
+    return {key: counts.get(get_processing_key(key), {}) for key in ALL_KEYS}
+
+
+def finish_processing_pending_counts():
+    """Removes the processing keys once their counts have been applied to the DB"""
+    caches["download_counters"].delete_many([get_processing_key(key) for key in ALL_KEYS])
+
+
+def flush_download_counters():
+    """Applies the pending counts to the DB. If that fails, counts are kept in the processing keys so that they are
+    applied the next time (see the module docstring for the case in which they are applied twice). Returns the number
+    of sounds and packs updated.
+    """
+    counts = start_processing_pending_counts()
+    with transaction.atomic():
+        result = apply_download_counts(counts)
+    finish_processing_pending_counts()
+    return result
+
+
+def apply_download_counts(counts):
+    """Adds the given counts to the download counts stored in sounds, packs and profiles. Each table is updated with
+    a single UPDATE statement. The template caches of the updated sounds and packs are invalidated once the transaction
+    is committed.
+
+    Args:
+        counts (dict): counts per object ID for each of the counter keys
+
+    Returns:
+        tuple(int, int): number of sounds and packs updated
+    """
+
+    def as_arrays(key):
+        key_counts = [(object_id, count) for object_id, count in counts.get(key, {}).items() if count]
+        return [object_id for object_id, _ in key_counts], [count for _, count in key_counts]
+
+    sound_ids, sound_counts = as_arrays(SOUND_DOWNLOADS_KEY)
+    sound_downloader_ids, sound_downloader_counts = as_arrays(SOUND_DOWNLOADERS_KEY)
+    sound_uploader_ids, sound_uploader_counts = as_arrays(SOUND_UPLOADERS_KEY)
+    pack_ids, pack_counts = as_arrays(PACK_DOWNLOADS_KEY)
+    pack_downloader_ids, pack_downloader_counts = as_arrays(PACK_DOWNLOADERS_KEY)
+    pack_uploader_ids, pack_uploader_counts = as_arrays(PACK_UPLOADERS_KEY)
+
+    updated_sound_ids = []
+    updated_pack_ids = []
+    with connection.cursor() as cursor:
+        if sound_ids:
+            # Sounds are marked as dirty in the search index only if the logarithm of their number of downloads (with
+            # base NUM_DOWNLOADS_REINDEX_RATIO) changes its integer part
+            cursor.execute(
+                """
+                UPDATE sounds_sound AS s SET
+                    num_downloads = GREATEST(s.num_downloads + c.count, 0),
+                    is_index_dirty = s.is_index_dirty OR
+                        FLOOR(LN(s.num_downloads + 1) / LN(%s)) <>
+                        FLOOR(LN(GREATEST(s.num_downloads + c.count, 0) + 1) / LN(%s))
+                FROM unnest(%s::integer[], %s::integer[]) AS c(id, count)
+                WHERE s.id = c.id
+                RETURNING s.id
+                """,
+                [settings.NUM_DOWNLOADS_REINDEX_RATIO, settings.NUM_DOWNLOADS_REINDEX_RATIO, sound_ids, sound_counts],
+            )
+            updated_sound_ids = [row[0] for row in cursor.fetchall()]
+        if pack_ids:
+            cursor.execute(
+                """
+                UPDATE sounds_pack AS p SET num_downloads = GREATEST(p.num_downloads + c.count, 0)
+                FROM unnest(%s::integer[], %s::integer[]) AS c(id, count)
+                WHERE p.id = c.id
+                RETURNING p.id
+                """,
+                [pack_ids, pack_counts],
+            )
+            updated_pack_ids = [row[0] for row in cursor.fetchall()]
+        if sound_downloader_ids or sound_uploader_ids or pack_downloader_ids or pack_uploader_ids:
+            cursor.execute(
+                """
+                UPDATE accounts_profile AS p SET
+                    num_sound_downloads = GREATEST(p.num_sound_downloads + c.sound_downloads, 0),
+                    num_user_sounds_downloads = GREATEST(p.num_user_sounds_downloads + c.user_sounds_downloads, 0),
+                    num_pack_downloads = GREATEST(p.num_pack_downloads + c.pack_downloads, 0),
+                    num_user_packs_downloads = GREATEST(p.num_user_packs_downloads + c.user_packs_downloads, 0)
+                FROM (
+                    SELECT user_id,
+                        SUM(sound_downloads) AS sound_downloads,
+                        SUM(user_sounds_downloads) AS user_sounds_downloads,
+                        SUM(pack_downloads) AS pack_downloads,
+                        SUM(user_packs_downloads) AS user_packs_downloads
+                    FROM (
+                        SELECT d.user_id, d.count, 0, 0, 0
+                        FROM unnest(%s::integer[], %s::integer[]) AS d(user_id, count)
+                        UNION ALL
+                        SELECT u.user_id, 0, u.count, 0, 0
+                        FROM unnest(%s::integer[], %s::integer[]) AS u(user_id, count)
+                        UNION ALL
+                        SELECT d.user_id, 0, 0, d.count, 0
+                        FROM unnest(%s::integer[], %s::integer[]) AS d(user_id, count)
+                        UNION ALL
+                        SELECT u.user_id, 0, 0, 0, u.count
+                        FROM unnest(%s::integer[], %s::integer[]) AS u(user_id, count)
+                    ) AS profile_counts(user_id, sound_downloads, user_sounds_downloads, pack_downloads,
+                                        user_packs_downloads)
+                    GROUP BY user_id
+                ) AS c
+                WHERE p.user_id = c.user_id
+                """,
+                [
+                    sound_downloader_ids,
+                    sound_downloader_counts,
+                    sound_uploader_ids,
+                    sound_uploader_counts,
+                    pack_downloader_ids,
+                    pack_downloader_counts,
+                    pack_uploader_ids,
+                    pack_uploader_counts,
+                ],
+            )
+
+    # Displayed download counts need to be updated. Caches are invalidated after the commit, as otherwise a page
+    # rendered meanwhile could store the old counts with the new generation.
+    def invalidate_template_caches():
+        if updated_sound_ids:
+            invalidate_template_cache_generations("sound", updated_sound_ids)
+        if updated_pack_ids:
+            invalidate_template_cache_generations("pack", updated_pack_ids)
+
+    transaction.on_commit(invalidate_template_caches)
+    return len(updated_sound_ids), len(updated_pack_ids)
@@ -0,0 +1,67 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+import logging
+
+from sounds.models import Sound, SoundSimilarityVector
+from utils.management_commands import LoggingBaseCommand
+
+console_logger = logging.getLogger("console")
+
+
+class Command(LoggingBaseCommand):
+    help = """Fills the vector_data field of SoundSimilarityVector objects which only have their vector stored in the
+    legacy vector column (e.g. because they were written by a release which did not know about vector_data). Vectors
+    without vector_data are ignored when indexing sounds, so the sounds of the updated vectors are marked as index
+    dirty. Only objects without vector_data are updated, so the command can be interrupted and run again."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            action="store",
+            dest="chunk_size",
+            type=int,
+            default=5000,
+            help="Number of vectors to update at once (default: 5000).",
+        )
+
+    def handle(self, *args, **options):
+        self.log_start()
+        chunk_size = options["chunk_size"]
+
+        n_updated = 0
+        qs = SoundSimilarityVector.objects.filter(vector_data__isnull=True, legacy_vector__isnull=False).order_by("id")
+        last_id = 0
+        while True:
+            # Iterate over IDs with keyset pagination so that queries remain fast for large tables. Each chunk is
+            # committed on its own so rows are only locked while their chunk is updated.
+            chunk = list(qs.filter(id__gt=last_id).only("id", "sound_id", "legacy_vector")[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+
+            for sim_vector in chunk:
+                sim_vector.vector_data = SoundSimilarityVector.encode_vector(sim_vector.legacy_vector)
+            SoundSimilarityVector.objects.bulk_update(chunk, ["vector_data"])
+            Sound.objects.filter(id__in=[sim_vector.sound_id for sim_vector in chunk]).update(is_index_dirty=True)
+            n_updated += len(chunk)
+            console_logger.info(f"{n_updated} similarity vectors updated")
+
+        self.log_end({"n_updated": n_updated})
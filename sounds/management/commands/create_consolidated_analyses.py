@@ -26,10 +26,37 @@ from django.utils import timezone
 
 from sounds.models import Sound, SoundAnalysis
 from utils.management_commands import LoggingBaseCommand
+from utils.process_pool import map_in_process_pool
 
 console_logger = logging.getLogger("console")
 
 
+def compute_consolidated_analysis_data(
+    sounds_to_update, sounds_to_create, existing_analyzer_object_names_for_sid, update_descriptors=None
+):
+    """Computes the consolidated analysis data of the given Sound objects (as returned by Sound.objects.dict_ids with
+    include_audio_descriptors=True) and returns two dictionaries with the data of the sounds to update and of the
+    sounds to create, keyed by sound ID. Only the descriptors in update_descriptors are computed for the sounds to
+    update (if update_descriptors is not None). This function does no DB operations, so it can be run in the worker
+    processes used with the --workers option."""
+    updated_data = {}
+    for sound in sounds_to_update:
+        updated_data[sound.id], _ = sound.consolidate_analysis(
+            verbose=False,
+            existing_analyzer_object_names=existing_analyzer_object_names_for_sid[sound.id],
+            no_db_operations=True,
+            update_descriptors=update_descriptors,
+        )
+    created_data = {}
+    for sound in sounds_to_create:
+        created_data[sound.id], _ = sound.consolidate_analysis(
+            verbose=False,
+            existing_analyzer_object_names=existing_analyzer_object_names_for_sid[sound.id],
+            no_db_operations=True,
+        )
+    return updated_data, created_data
+
+
 class Command(LoggingBaseCommand):
     help = """This command will create or update "consolidated" SoundAnalysis objects for all sounds. It will also mark all affected 
     sounds as dirty so they are re-indexed, and invalidate template caches in case anything shown in the sound pages depends on analysis 
@@ -93,6 +120,15 @@ class Command(LoggingBaseCommand):
             help="If set, update the specified descriptors in the already existing consolidated analysis data for all sounds (default: None).",
         )
 
+        parser.add_argument(
+            "--workers",
+            action="store",
+            dest="workers",
+            type=int,
+            default=0,
+            help="Number of processes used to compute the consolidated analysis data of the chunks. If 0, data is computed in the main process (default: 0).",
+        )
+
     def handle(self, *args, **options):
         self.log_start()
         skip_create = options["skip_create"]
@@ -100,6 +136,7 @@ class Command(LoggingBaseCommand):
         update_descriptors = (
             options["update_descriptors"].split(",") if options["update_descriptors"] is not None else None
         )
+        workers = options["workers"]
 
         sound_ids_option = options["sound_ids"]
         if sound_ids_option:
@@ -122,36 +159,50 @@ class Command(LoggingBaseCommand):
 
         starttime = time.monotonic()
         total_done = 0
-        for i in range(0, total_sounds, chunk_size):
-            # Get sound objects for chunk, include audio descriptors to avoid extra db queries
-            chunk_sound_ids = sound_ids[i : i + chunk_size]
-            sounds_dict = Sound.objects.dict_ids(chunk_sound_ids, include_audio_descriptors=True)
-            affected_sound_ids = []
+        num_chunks = (total_sounds + chunk_size - 1) // chunk_size
 
-            # We get a list of the existing analyzer objects to avoid having to try file loads for each sound/analyzer pair
-            existing_analyzer_objects_ok = (
-                SoundAnalysis.objects.filter(sound_id__in=chunk_sound_ids, analysis_status="OK")
-                .exclude(analyzer="consolidated")
-                .values_list("sound_id", "analyzer")
-            )
-            existing_analyzer_object_names_for_sid = defaultdict(list)
-            for sid, analyzer in existing_analyzer_objects_ok:
-                existing_analyzer_object_names_for_sid[sid].append(analyzer)
+        def iter_chunks_to_compute():
+            for i in range(0, total_sounds, chunk_size):
+                # Get sound objects for chunk, include audio descriptors to avoid extra db queries
+                chunk_sound_ids = sound_ids[i : i + chunk_size]
+                sounds_dict = Sound.objects.dict_ids(chunk_sound_ids, include_audio_descriptors=True)
+
+                # We get a list of the existing analyzer objects to avoid having to try file loads for each sound/analyzer pair
+                existing_analyzer_objects_ok = (
+                    SoundAnalysis.objects.filter(sound_id__in=chunk_sound_ids, analysis_status="OK")
+                    .exclude(analyzer="consolidated")
+                    .values_list("sound_id", "analyzer")
+                )
+                existing_analyzer_object_names_for_sid = defaultdict(list)
+                for sid, analyzer in existing_analyzer_objects_ok:
+                    existing_analyzer_object_names_for_sid[sid].append(analyzer)
+
+                # Note that even if we are skipping updates, we still need to get the list of sounds ids that would have been updated to
+                # avoid creating duplicated consolidated SoundAnalysis objects for those sounds
+                ssaa_to_update = list(
+                    SoundAnalysis.objects.filter(sound_id__in=chunk_sound_ids, analyzer="consolidated")
+                )
+                sound_ids_updated = {sa.sound_id for sa in ssaa_to_update}
+                sounds_to_update = [] if skip_update else [sounds_dict[sa.sound_id] for sa in ssaa_to_update]
+                sounds_to_create = (
+                    [] if skip_create else [sounds_dict[sid] for sid in chunk_sound_ids if sid not in sound_ids_updated]
+                )
+
+                # The objects needed to save the results are kept in this process, only the data needed to compute
+                # the consolidated analysis data is sent to the worker processes (if any)
+                yield (
+                    (chunk_sound_ids, ssaa_to_update),
+                    (sounds_to_update, sounds_to_create, existing_analyzer_object_names_for_sid, update_descriptors),
+                )
+
+        computed_chunks = map_in_process_pool(compute_consolidated_analysis_data, iter_chunks_to_compute(), workers)
+        for (chunk_sound_ids, ssaa_to_update), (updated_data, created_data) in computed_chunks:
+            affected_sound_ids = []
 
             # UPDATE already existing consolidated SoundAnalysis objects
-            # Note that even if we are skipping updates, we still need to get the list of sounds ids that would have been updated to
-            # avoid creating duplicated consolidated SoundAnalysis objects for those sounds in the next step
-            sound_ids_updated = []
-            ssaa_to_update = SoundAnalysis.objects.filter(sound_id__in=chunk_sound_ids, analyzer="consolidated")
-            sound_ids_updated = [sa.sound_id for sa in ssaa_to_update]
             if not skip_update:
                 for sa in ssaa_to_update:
-                    data, _ = sounds_dict[sa.sound_id].consolidate_analysis(
-                        verbose=False,
-                        existing_analyzer_object_names=existing_analyzer_object_names_for_sid[sa.sound_id],
-                        no_db_operations=True,  # We don't do db operation for every sound, only update them in bulks
-                        update_descriptors=update_descriptors,  # If set, we only update the specified descriptors
-                    )
+                    data = updated_data[sa.sound_id]
                     if update_descriptors is None:
                         sa.analysis_data = data
                     else:
@@ -166,43 +217,36 @@ class Command(LoggingBaseCommand):
                 SoundAnalysis.objects.bulk_update(
                     ssaa_to_update, ["last_analyzer_finished", "last_sent_to_queue", "analysis_data"]
                 )
-                n_updated += len(sound_ids_updated)
-                affected_sound_ids += sound_ids_updated
+                n_updated += len(ssaa_to_update)
+                affected_sound_ids += [sa.sound_id for sa in ssaa_to_update]
 
             # CREATE consolidated SoundAnalysis objects for sounds that did not have one
             if not skip_create:
-                missing_sound_ids = set(chunk_sound_ids) - set(sound_ids_updated)
-                ssaa_to_create = []
-                for sid in missing_sound_ids:
-                    data, _ = sounds_dict[sid].consolidate_analysis(
-                        verbose=False,
-                        existing_analyzer_object_names=existing_analyzer_object_names_for_sid[sid],
-                        no_db_operations=True,  # We don't do db operation for every sound, only create them in bulks
-                    )
-                    ssaa_to_create.append(
-                        SoundAnalysis(
-                            sound_id=sid,
-                            analyzer="consolidated",
-                            analysis_status="OK",
-                            last_sent_to_queue=timezone.now(),
-                            last_analyzer_finished=timezone.now(),
-                            analysis_data=data,
-                        )
+                ssaa_to_create = [
+                    SoundAnalysis(
+                        sound_id=sid,
+                        analyzer="consolidated",
+                        analysis_status="OK",
+                        last_sent_to_queue=timezone.now(),
+                        last_analyzer_finished=timezone.now(),
+                        analysis_data=data,
                     )
+                    for sid, data in created_data.items()
+                ]
                 SoundAnalysis.objects.bulk_create(ssaa_to_create)
                 n_created += len(ssaa_to_create)
-                affected_sound_ids += missing_sound_ids
+                affected_sound_ids += list(created_data.keys())
+
             # Mark all affected sounds as dirty so re-indexing happens
             if not options["skip_mark_dirty"]:
                 Sound.objects.filter(id__in=affected_sound_ids).update(is_index_dirty=True)
 
             # Invalidate template caches in case anything shown in the sound pages depends on analysis data (like automatic category)
             if not options["skip_invalidate_template_caches"]:
-                for sid in affected_sound_ids:
-                    Sound.invalidate_template_caches_static(sid)
+                Sound.invalidate_template_caches_bulk(affected_sound_ids)
 
             # Print progress information
-            total_done += chunk_size
+            total_done += len(chunk_sound_ids)
             elapsed = time.monotonic() - starttime
             seconds_remaining = ((total_sounds - total_done) / total_done) * elapsed if total_done > 0 else 0
             if seconds_remaining < 0:
@@ -213,7 +257,7 @@ class Command(LoggingBaseCommand):
                 else f"{seconds_remaining / 60:.2f} minutes"
             )
             console_logger.info(
-                f"Processing chunk {i // chunk_size + 1}/{(total_sounds + chunk_size - 1) // chunk_size} ({n_created} created, {n_updated} updated, {total_done / elapsed:.2f} sounds/second, {time_remaining_label} remaining)"
+                f"Processing chunk {(total_done + chunk_size - 1) // chunk_size}/{num_chunks} ({n_created} created, {n_updated} updated, {total_done / elapsed:.2f} sounds/second, {time_remaining_label} remaining)"
             )
 
         self.log_end(
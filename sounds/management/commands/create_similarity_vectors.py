@@ -156,11 +156,14 @@ class Command(LoggingBaseCommand):
                         sim_vector = sounds_dict[ssv.sound_id].load_similarity_vector(
                             similarity_space_name=similarity_space_name, no_db_operations=True
                         )
-                        if sim_vector:
+                        if sim_vector is not False:
                             ssv.vector = sim_vector
                             n_will_be_updated += 1
                             affected_sound_ids.append(ssv.sound_id)
-                    SoundSimilarityVector.objects.bulk_update(sim_vector_objects_to_update, ["vector"])
+                    fields_to_update = ["vector_data"]
+                    if settings.SIMILARITY_VECTORS_WRITE_LEGACY_COLUMN:
+                        fields_to_update.append("legacy_vector")
+                    SoundSimilarityVector.objects.bulk_update(sim_vector_objects_to_update, fields_to_update)
                     n_updated += n_will_be_updated
 
                 # CREATE sim vector objects
@@ -170,7 +173,7 @@ class Command(LoggingBaseCommand):
                         sim_vector = sounds_dict[sid].load_similarity_vector(
                             similarity_space_name=similarity_space_name, no_db_operations=True
                         )
-                        if sim_vector:
+                        if sim_vector is not False:
                             sim_vector_objects_to_create.append(
                                 SoundSimilarityVector(
                                     sound_id=sid,
@@ -0,0 +1,36 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+
+from sounds import download_counters
+from utils.management_commands import LoggingBaseCommand
+
+
+class Command(LoggingBaseCommand):
+    help = (
+        "Apply the download counts stored in the download_counters cache to the number of downloads of sounds, packs "
+        "and profiles in the database. This command should run periodically when DOWNLOAD_COUNTERS_WRITE_BEHIND is "
+        "enabled."
+    )
+
+    def handle(self, *args, **options):
+        self.log_start()
+        n_sounds, n_packs = download_counters.flush_download_counters()
+        self.log_end({"n_sounds_updated": n_sounds, "n_packs_updated": n_packs})
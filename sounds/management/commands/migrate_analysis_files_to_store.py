@@ -0,0 +1,123 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+import logging
+import time
+
+from django.conf import settings
+
+from sounds.models import SoundAnalysis
+from utils import analysis_store
+from utils.management_commands import LoggingBaseCommand
+
+console_logger = logging.getLogger("console")
+
+
+class Command(LoggingBaseCommand):
+    help = """Copies the analysis results stored in one JSON/YAML file per sound and analyzer to the analysis store
+    (see utils.analysis_store). Only sounds with a SoundAnalysis object with OK status are considered. Once an analyzer
+    has a store, new analysis results are also added to the store when processed. Analysis files are not deleted, and
+    these are still used for sounds that are not in the store."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--analyzers",
+            action="store",
+            dest="analyzers",
+            default=None,
+            help="Comma-separated list of analyzers to migrate (default: all analyzers in ANALYZERS_CONFIGURATION).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            action="store",
+            dest="chunk_size",
+            type=int,
+            default=1000,
+            help="Number of sounds to add to the store at once (default: 1000).",
+        )
+        parser.add_argument(
+            "--skip-existing",
+            action="store_true",
+            dest="skip_existing",
+            default=False,
+            help="If set, skip sounds that already have analysis data in the store (default: False).",
+        )
+
+    def handle(self, *args, **options):
+        self.log_start()
+        if options["analyzers"] is not None:
+            analyzers = options["analyzers"].split(",")
+        else:
+            analyzers = list(settings.ANALYZERS_CONFIGURATION.keys())
+        chunk_size = options["chunk_size"]
+
+        data_to_log = {}
+        for analyzer in analyzers:
+            starttime = time.monotonic()
+            n_added = 0
+            n_missing = 0
+            n_skipped = 0
+            qs = SoundAnalysis.objects.filter(analyzer=analyzer, analysis_status="OK").order_by("sound_id")
+            last_sound_id = -1
+            while True:
+                # Iterate over sound IDs with keyset pagination so that queries remain fast for large tables
+                chunk_sound_ids = list(
+                    qs.filter(sound_id__gt=last_sound_id).values_list("sound_id", flat=True)[:chunk_size]
+                )
+                if not chunk_sound_ids:
+                    break
+                last_sound_id = chunk_sound_ids[-1]
+
+                items = []
+                for sound_id in chunk_sound_ids:
+                    if (
+                        options["skip_existing"]
+                        and analysis_store.get_analysis_data(sound_id, analyzer, descriptors=[]) is not None
+                    ):
+                        n_skipped += 1
+                        continue
+                    analysis_data = SoundAnalysis.get_analysis_data_from_output_file(sound_id, analyzer)
+                    if analysis_data:
+                        items.append((sound_id, analysis_data))
+                    else:
+                        n_missing += 1
+                try:
+                    analysis_store.add_analysis_data(analyzer, items)
+                    n_added += len(items)
+                except TypeError:
+                    # Nothing is added if the data of any sound in the chunk can't be stored, so add the sounds one
+                    # by one to find and skip those with invalid data
+                    for sound_id, analysis_data in items:
+                        try:
+                            analysis_store.add_analysis_data(analyzer, [(sound_id, analysis_data)])
+                            n_added += 1
+                        except TypeError as e:
+                            console_logger.error(f"{analyzer}: could not add analysis data of sound {sound_id} ({e})")
+                            n_missing += 1
+
+                elapsed = time.monotonic() - starttime
+                console_logger.info(
+                    f"{analyzer}: {n_added} sounds added to the store, {n_skipped} skipped, {n_missing} without "
+                    f"valid analysis file ({(n_added + n_skipped + n_missing) / elapsed:.2f} sounds/second)"
+                )
+
+            data_to_log[analyzer] = {"n_added": n_added, "n_skipped": n_skipped, "n_missing": n_missing}
+
+        self.log_end(data_to_log)
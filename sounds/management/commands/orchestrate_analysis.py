@@ -22,6 +22,7 @@ import json
 import logging
 
 from django.conf import settings
+from django.db.models import Count
 from django.utils import timezone
 
 from freesound.celery import get_queues_task_counts
@@ -65,21 +66,26 @@ class Command(LoggingBaseCommand):
         self.log_start()
         data_to_log = {}
 
-        # First print some information about overall status
-        all_sound_ids = Sound.objects.all().values_list("id", flat=True).order_by("id")
-        n_sounds = len(all_sound_ids)
+        # First print some information about overall status. Counts for all analyzers and statuses are computed with a
+        # single GROUP BY query
+        n_sounds = Sound.objects.count()
+        status_counts = {analyzer_name: {} for analyzer_name in settings.ANALYZERS_CONFIGURATION.keys()}
+        for item in (
+            SoundAnalysis.objects.filter(analyzer__in=status_counts.keys())
+            .order_by()
+            .values("analyzer", "analysis_status")
+            .annotate(count=Count("id"))
+        ):
+            status_counts[item["analyzer"]][item["analysis_status"]] = item["count"]
         console_logger.info(
             "{: >44} {: >11} {: >11} {: >11} {: >11} {: >11}".format(
                 *["", "# ok |", "# failed |", "# skipped |", "# queued |", "# missing"]
             )
         )
-        for analyzer_name in settings.ANALYZERS_CONFIGURATION.keys():
-            ok = SoundAnalysis.objects.filter(analyzer=analyzer_name, analysis_status="OK").count()
-            sk = SoundAnalysis.objects.filter(analyzer=analyzer_name, analysis_status="SK").count()
-            fa = SoundAnalysis.objects.filter(analyzer=analyzer_name, analysis_status="FA").count()
-            qu = SoundAnalysis.objects.filter(analyzer=analyzer_name, analysis_status="QU").count()
+        for analyzer_name, counts in status_counts.items():
+            ok, sk, fa, qu = (counts.get(status, 0) for status in ("OK", "SK", "FA", "QU"))
             missing = n_sounds - (ok + sk + fa + qu)
-            percentage_done = (ok + sk + fa) * 100.0 / n_sounds
+            percentage_done = (ok + sk + fa) * 100.0 / n_sounds if n_sounds else 100.0
             # print one row per analyzer
             console_logger.info(
                 "{: >44} {: >11} {: >11} {: >11} {: >11} {: >11}".format(
@@ -141,48 +147,45 @@ class Command(LoggingBaseCommand):
                     )
                 else:
                     # First add sounds from the pool of sounds that have never been analyzed with the selected
-                    # analyzer.
-                    # NOTE: the code below is not very efficient as the queries involved can become very large with
-                    # large lists of IDs to filer. This could probably be optimized with some raw SQL.
+                    # analyzer. These are found with an anti-join query in the DB which only returns the IDs of the
+                    # next num_jobs_to_add sounds.
                     if options["only_failed"]:
                         # When using the only-failed option, we never look at non-analyzed "missing" sounds
-                        missing_sounds = Sound.objects.none()
+                        missing_sound_ids = []
                     else:
-                        sound_ids_with_sa_object = list(
-                            SoundAnalysis.objects.filter(analyzer=analyzer_name).values_list("sound_id", flat=True)
+                        missing_sound_ids = list(
+                            Sound.objects.missing_analysis(analyzer_name, limit=num_jobs_to_add).values_list(
+                                "id", flat=True
+                            )
                         )
-                        missing_sound_ids = list(sorted(set(all_sound_ids).difference(sound_ids_with_sa_object)))[
-                            :num_jobs_to_add
-                        ]
-                        missing_sounds = Sound.objects.filter(id__in=missing_sound_ids).order_by("id")
-                    num_missing_sounds_to_add = missing_sounds.count()
+                    num_missing_sounds_to_add = len(missing_sound_ids)
                     data_to_log[analyzer_name]["just_sent"] = num_missing_sounds_to_add
                     console_logger.info(
                         "- Will add {} new jobs from sounds that have not been analyzed (first 5 sounds {})".format(
-                            num_missing_sounds_to_add, str([s.id for s in missing_sounds[0:5]])
+                            num_missing_sounds_to_add, str(missing_sound_ids[0:5])
                         )
                     )
                     if not options["dry_run"]:
-                        for sound in missing_sounds:
-                            sound.analyze(analyzer_name, verbose=False)
+                        Sound.objects.bulk_analyze(missing_sound_ids, analyzer_name, verbose=False)
 
                     # After adding sounds from the first pool, check if there are still jobs that can be added and
                     # see if there are any sounds with failed analyses that should be re-scheduled
                     num_jobs_to_add = num_jobs_to_add - num_missing_sounds_to_add
                     if num_jobs_to_add:
-                        ssaa = SoundAnalysis.objects.filter(
-                            analyzer=analyzer_name,
-                            analysis_status="FA",
-                            num_analysis_attempts__lt=options["max_num_analysis_attempts"],
-                        )[:num_jobs_to_add]
-                        data_to_log[analyzer_name]["just_sent_fa"] = ssaa.count()
+                        failed_sound_ids = list(
+                            SoundAnalysis.objects.filter(
+                                analyzer=analyzer_name,
+                                analysis_status="FA",
+                                num_analysis_attempts__lt=options["max_num_analysis_attempts"],
+                            ).values_list("sound_id", flat=True)[:num_jobs_to_add]
+                        )
+                        data_to_log[analyzer_name]["just_sent_fa"] = len(failed_sound_ids)
                         console_logger.info(
                             "- Will add {} new jobs from sounds that previously failed analysis "
-                            "(first 5 sounds: {})".format(ssaa.count(), str([sa.sound_id for sa in ssaa[0:5]]))
+                            "(first 5 sounds: {})".format(len(failed_sound_ids), str(failed_sound_ids[0:5]))
                         )
                         if not options["dry_run"]:
-                            for sa in ssaa:
-                                sa.re_run_analysis(verbose=False)
+                            Sound.objects.bulk_analyze(failed_sound_ids, analyzer_name, force=True, verbose=False)
 
             if analyzer_name in data_to_log:
                 # Log ata to graylog in a way that we can make plots and show stats
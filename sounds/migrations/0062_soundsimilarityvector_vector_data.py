@@ -0,0 +1,49 @@
+# Generated by Django 4.2.27 on 2026-10-18 10:12
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+# Adds the vector_data column next to the existing vector column. The vector field is renamed to legacy_vector in the
+# model state only (its column keeps the same name) and becomes nullable. Both operations only change the table
+# metadata, so the table is not rewritten. vector_data is filled in 0063. The vector column will be removed (and
+# vector_data made NOT NULL) in a later release.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sounds', '0061_sound_sound_is_index_dirty_partial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.AlterField(
+                    model_name='soundsimilarityvector',
+                    name='vector',
+                    field=django.contrib.postgres.fields.ArrayField(
+                        base_field=models.FloatField(), null=True, size=None
+                    ),
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='soundsimilarityvector',
+                    name='vector',
+                ),
+                migrations.AddField(
+                    model_name='soundsimilarityvector',
+                    name='legacy_vector',
+                    field=django.contrib.postgres.fields.ArrayField(
+                        base_field=models.FloatField(), db_column='vector', null=True, size=None
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='soundsimilarityvector',
+            name='vector_data',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.27 on 2026-10-18 10:15
+
+import numpy as np
+from django.db import migrations
+
+BATCH_SIZE = 5000
+
+
+def vectors_to_float32_data(apps, schema_editor):
+    # The migration is not atomic, so each batch is committed on its own and rows are only locked while their batch is
+    # updated. Only rows without vector_data are converted, so the migration can be interrupted and run again.
+    # Rows written after the migration by the previous release are converted with the backfill_similarity_vectors_data
+    # management command.
+    with schema_editor.connection.cursor() as cursor:
+        last_id = 0
+        while True:
+            cursor.execute(
+                """
+                SELECT id, vector FROM sounds_soundsimilarityvector
+                WHERE id > %s AND vector_data IS NULL AND vector IS NOT NULL ORDER BY id LIMIT %s
+                """,
+                [last_id, BATCH_SIZE],
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.execute(
+                """
+                UPDATE sounds_soundsimilarityvector AS v SET vector_data = d.vector_data
+                FROM unnest(%s::integer[], %s::bytea[]) AS d(id, vector_data) WHERE v.id = d.id
+                """,
+                [[row[0] for row in rows], [np.asarray(row[1], dtype="<f4").tobytes() for row in rows]],
+            )
+            last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('sounds', '0062_soundsimilarityvector_vector_data'),
+    ]
+
+    operations = [
+        # The vector column is left untouched, so there is nothing to undo
+        migrations.RunPython(vectors_to_float32_data, migrations.RunPython.noop),
+    ]
@@ -32,6 +32,7 @@ import zlib
 from collections import Counter
 from urllib.parse import quote
 
+import numpy as np
 import yaml
 from django.apps import apps
 from django.conf import settings
@@ -40,9 +41,9 @@ from django.contrib.postgres.expressions import ArraySubquery
 from django.contrib.postgres.fields import ArrayField
 from django.contrib.sites.models import Site
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import connection, models
 from django.db.models import Avg, Exists, F, OuterRef, Prefetch, Q, Sum
-from django.db.models.functions import Greatest, JSONObject
+from django.db.models.functions import JSONObject
 from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.template.loader import render_to_string
@@ -53,7 +54,6 @@ from django.utils.functional import cached_property
 from django.utils.http import urlencode
 from django.utils.text import Truncator, slugify
 
-import accounts.models
 from apiv2.models import ApiV2Client
 from comments.models import Comment
 from freesound.celery import app as celery_app
@@ -61,6 +61,7 @@ from general import tasks
 from general.templatetags.absurl import url2absurl
 from general.templatetags.util import formatnumber
 from geotags.models import GeoTag
+from sounds import download_counters
 from sounds.templatetags.bst_category import (
     bst_taxonomy_category_key_to_category_names,
     bst_taxonomy_category_names_to_category_key,
@@ -68,7 +69,8 @@ from sounds.templatetags.bst_category import (
 from tags.models import SoundTag, Tag
 from tickets import TICKET_STATUS_CLOSED, TICKET_STATUS_NEW
 from tickets.models import Ticket, TicketComment
-from utils.cache import invalidate_template_cache, invalidate_user_template_caches
+from utils import analysis_store
+from utils.cache import invalidate_template_cache_generations, invalidate_user_template_caches
 from utils.cdn import delete_cdn_symlink
 from utils.locations import locations_decorator
 from utils.mail import send_mail_template
@@ -415,7 +417,27 @@ class SoundManager(models.Manager):
         qs = self.bulk_query_id(
             sound_ids, include_audio_descriptors=True, include_similarity_vectors=True, include_remix_subqueries=True
         )
-
+        return self.annotate_for_solr(qs)
+
+    def iter_bulk_query_solr(self, batch_size=4000, **filters):
+        """Walks all sounds matching the given filters (e.g. processing_state="OK") and yields them in lists of at
+        most batch_size Sound objects with the same data as returned by bulk_query_solr. Sounds are walked in ID order
+        using keyset pagination (each batch query selects sounds with ID greater than the last one of the previous
+        batch), so there is no need to load the list of all sound IDs beforehand and the DB does not have to sort each
+        batch by creation date. Rows of each batch are read with a server-side cursor."""
+        qs = self.bulk_query(
+            include_audio_descriptors=True, include_similarity_vectors=True, include_remix_subqueries=True
+        ).filter(**filters)
+        qs = self.annotate_for_solr(qs).order_by("id")
+        last_id = 0
+        while True:
+            batch = list(qs.filter(id__gt=last_id)[:batch_size].iterator(chunk_size=min(batch_size, 2000)))
+            if not batch:
+                break
+            yield batch
+            last_id = batch[-1].id
+
+    def annotate_for_solr(self, qs):
         # When indexing in solr, we also want to include comments as a subquery
         comments_subquery = Comment.objects.filter(sound=OuterRef("id")).values("comment")
         qs = qs.annotate(comments_array=ArraySubquery(comments_subquery))
@@ -479,11 +501,18 @@ class SoundManager(models.Manager):
             else:
                 similarity_spaces = settings.SIMILARITY_SPACES_NAMES
 
-            json_object_args = {"similarity_space_name": "similarity_space_name", "vector": "vector"}
+            # Vectors are pre-fetched as arrays of raw float32 data (and the corresponding similarity space names) so
+            # they can be decoded without copies, see Sound.get_similarity_vector. Vectors without float32 data yet are
+            # not included (see SoundSimilarityVector).
             similarity_vectors_subquery = SoundSimilarityVector.objects.filter(
-                sound=OuterRef("id"), similarity_space_name__in=similarity_spaces
-            ).values(data=JSONObject(**json_object_args))
-            qs = qs.annotate(similarity_vectors=ArraySubquery(similarity_vectors_subquery))
+                sound=OuterRef("id"), similarity_space_name__in=similarity_spaces, vector_data__isnull=False
+            ).order_by("similarity_space_name")
+            qs = qs.annotate(
+                similarity_vectors_space_names=ArraySubquery(
+                    similarity_vectors_subquery.values("similarity_space_name")
+                ),
+                similarity_vectors_data=ArraySubquery(similarity_vectors_subquery.values("vector_data")),
+            )
 
         if include_remix_subqueries:
             is_remix_subquery = Sound.objects.filter(remixes=OuterRef("id")).values("id")
@@ -632,6 +661,67 @@ class SoundManager(models.Manager):
         )
         return [sounds[sound_id] for sound_id in sound_ids if sound_id in sounds]
 
+    def missing_analysis(self, analyzer, limit=None):
+        """Returns the sounds that have no SoundAnalysis object for the given analyzer, sorted by ID. The NOT EXISTS
+        filter is run by the database as an anti-join, so there is no need to load the IDs of all sounds/analyses.
+        """
+        qs = self.filter(~Exists(SoundAnalysis.objects.filter(sound=OuterRef("id"), analyzer=analyzer))).order_by("id")
+        if limit is not None:
+            qs = qs[:limit]
+        return qs
+
+    def bulk_analyze(self, sound_ids, analyzer, force=False, verbose=True):
+        """Sends the sounds with the given IDs to the given analyzer. This does the same as calling Sound.analyze for
+        each sound, but SoundAnalysis objects are created/updated with a single INSERT ... ON CONFLICT statement and
+        all the jobs are published to the queue using the same broker connection. Sounds which are already queued for
+        the analyzer are not sent again unless force=True. Returns the IDs of the sounds sent to the analyzer.
+        """
+        if analyzer not in settings.ANALYZERS_CONFIGURATION.keys():
+            if verbose:
+                sounds_logger.info(f"Not sending sounds to unknown analyzer {analyzer}")
+            return []
+        sound_ids = sorted(set(sound_ids))
+        if not sound_ids:
+            return []
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO sounds_soundanalysis
+                    (sound_id, analyzer, analysis_status, num_analysis_attempts, analysis_time, last_sent_to_queue)
+                SELECT ids.sound_id, %s, 'QU', 1, 0, %s
+                FROM unnest(%s::integer[]) AS ids(sound_id)
+                WHERE EXISTS (SELECT 1 FROM sounds_sound WHERE id = ids.sound_id)
+                ON CONFLICT (sound_id, analyzer) DO UPDATE SET
+                    analysis_status = 'QU',
+                    analysis_time = 0,
+                    last_sent_to_queue = EXCLUDED.last_sent_to_queue,
+                    num_analysis_attempts = sounds_soundanalysis.num_analysis_attempts + 1
+                WHERE %s OR sounds_soundanalysis.analysis_status <> 'QU'
+                RETURNING sound_id
+                """,
+                [analyzer, timezone.now(), sound_ids, force],
+            )
+            queued_sound_ids = [row[0] for row in cursor.fetchall()]
+        if not queued_sound_ids:
+            return []
+
+        tags_subquery = Tag.objects.filter(soundtag__sound=OuterRef("id")).order_by("name").values("name")
+        sounds = (
+            self.filter(id__in=queued_sound_ids)
+            .select_related("geotag")
+            .annotate(tag_array=ArraySubquery(tags_subquery))
+            .order_by("id")
+        )
+        with celery_app.producer_or_acquire() as producer:
+            for sound in sounds:
+                celery_app.send_task(
+                    analyzer, kwargs=sound.get_analysis_job_kwargs(), queue=analyzer, producer=producer
+                )
+        if verbose:
+            sounds_logger.info(f"Sending {len(queued_sound_ids)} sounds to analyzer {analyzer}")
+        return queued_sound_ids
+
 
 class PublicSoundManager(models.Manager):
     """a class which only returns public sounds"""
@@ -1047,7 +1137,6 @@ class Sound(models.Model):
         # process sources in old but not in new
         sources_to_remove = list(Sound.objects.filter(id__in=old_sources - new_sources))
         for source in sources_to_remove:
-            source.invalidate_template_caches()
             dirtied_source_ids.add(source.id)
         if sources_to_remove:
             self.sources.remove(*sources_to_remove)
@@ -1055,7 +1144,6 @@ class Sound(models.Model):
         # process sources in new but not in old
         sources_to_add = list(Sound.objects.filter(id__in=new_sources - old_sources))
         for source in sources_to_add:
-            source.invalidate_template_caches()
             dirtied_source_ids.add(source.id)
             send_mail_template(
                 settings.EMAIL_SUBJECT_SOUND_ADDED_AS_REMIX,
@@ -1070,6 +1158,7 @@ class Sound(models.Model):
         # Counterparties' was_remixed/is_remix may have flipped: bulk-mark them for Solr re-indexing.
         if dirtied_source_ids:
             Sound.objects.filter(id__in=dirtied_source_ids).update(is_index_dirty=True)
+            Sound.invalidate_template_caches_bulk(list(dirtied_source_ids))
 
         if old_sources != new_sources:
             self.invalidate_template_caches()
@@ -1387,26 +1476,7 @@ class Sound(models.Model):
             sa.analysis_time = 0
             sa.last_sent_to_queue = timezone.now()
             sa.save(update_fields=["num_analysis_attempts", "analysis_status", "last_sent_to_queue", "analysis_time"])
-            sound_path = self.locations("path")
-            if settings.USE_PREVIEWS_WHEN_ORIGINAL_FILES_MISSING and not os.path.exists(sound_path):
-                sound_path = self.locations("preview.LQ.mp3.path")
-            celery_app.send_task(
-                analyzer,
-                kwargs={
-                    "sound_id": self.id,
-                    "sound_path": sound_path,
-                    "analysis_folder": os.path.join(settings.ANALYSIS_PATH, str(self.id // 1000)),
-                    "metadata": json.dumps(
-                        {
-                            "duration": self.duration,
-                            "name": self.original_filename,
-                            "tags": self.get_sound_tags(),
-                            "geotag": [self.geotag.lat, self.geotag.lon] if hasattr(self, "geotag") else None,
-                        }
-                    ),
-                },
-                queue=analyzer,
-            )
+            celery_app.send_task(analyzer, kwargs=self.get_analysis_job_kwargs(), queue=analyzer)
             if verbose:
                 sounds_logger.info(f"Sending sound {self.id} to analyzer {analyzer}")
         else:
@@ -1414,6 +1484,27 @@ class Sound(models.Model):
                 sounds_logger.info(f"Not sending sound {self.id} to analyzer {analyzer} as is already queued")
         return sa
 
+    def get_analysis_job_kwargs(self):
+        """Returns the arguments of the jobs sent to the analysis workers for this sound. If the sound has been
+        annotated with tag_array (see SoundManager.bulk_analyze), tags are taken from there instead of from the DB.
+        """
+        sound_path = self.locations("path")
+        if settings.USE_PREVIEWS_WHEN_ORIGINAL_FILES_MISSING and not os.path.exists(sound_path):
+            sound_path = self.locations("preview.LQ.mp3.path")
+        return {
+            "sound_id": self.id,
+            "sound_path": sound_path,
+            "analysis_folder": os.path.join(settings.ANALYSIS_PATH, str(self.id // 1000)),
+            "metadata": json.dumps(
+                {
+                    "duration": self.duration,
+                    "name": self.original_filename,
+                    "tags": sorted(self.tag_array) if hasattr(self, "tag_array") else self.get_sound_tags(),
+                    "geotag": [self.geotag.lat, self.geotag.lon] if hasattr(self, "geotag") else None,
+                }
+            ),
+        }
+
     def consolidate_analysis(
         self,
         no_db_operations: bool = False,
@@ -1637,12 +1728,14 @@ class Sound(models.Model):
             similarity_space_name (str): The name of the similarity space to load the vector for.
             force (bool, optional): If True, the similarity vector will be reloaded even if it already exists. Defaults to False. Does not have effect if no_db_operations is True.
             no_db_operations (bool, optional): If True, the method will not perform any database operations (i.e., it will not save the vector in the db)
-                and will only return the similarity vector (or return False if vector data from corresponding analyzer does not exist for that sound). Defaults to False.
+                and will only return the similarity vector as a NumPy array (or return False if vector data from corresponding analyzer does not exist for that sound). Defaults to False.
         """
 
         similarity_space = settings.SIMILARITY_SPACES[similarity_space_name]
         if no_db_operations:
-            analyzer_data = SoundAnalysis.get_analysis_data_from_file_without_db(self.id, similarity_space["analyzer"])
+            analyzer_data = SoundAnalysis.get_analysis_data_from_file_without_db(
+                self.id, similarity_space["analyzer"], descriptors=[similarity_space["vector_property_name"]]
+            )
             if not analyzer_data:
                 return False
         else:
@@ -1657,12 +1750,11 @@ class Sound(models.Model):
 
             try:
                 sa = self.analyses.get(analyzer=similarity_space["analyzer"], analysis_status="OK")
-                analyzer_data = sa.get_analysis_data_from_file()
+                analyzer_data = sa.get_analysis_data_from_file(descriptors=[similarity_space["vector_property_name"]])
             except (SoundAnalysis.DoesNotExist, KeyError, ValueError):
                 return False
 
-        sim_vector = analyzer_data[similarity_space["vector_property_name"]]
-        sim_vector = [float(x) for x in sim_vector]
+        sim_vector = np.asarray(analyzer_data[similarity_space["vector_property_name"]], dtype=np.float64)
 
         if len(sim_vector) != similarity_space["vector_size"]:
             return False
@@ -1673,51 +1765,57 @@ class Sound(models.Model):
         if no_db_operations:
             return sim_vector
 
+        defaults = {"vector_data": SoundSimilarityVector.encode_vector(sim_vector)}
+        if settings.SIMILARITY_VECTORS_WRITE_LEGACY_COLUMN:
+            defaults["legacy_vector"] = sim_vector.tolist()
         SoundSimilarityVector.objects.update_or_create(
-            sound=self,
-            similarity_space_name=similarity_space_name,
-            defaults={"vector": sim_vector},
+            sound=self, similarity_space_name=similarity_space_name, defaults=defaults
         )
 
         return True
 
-    def get_similarity_vector(self, similarity_space_name=settings.SIMILARITY_SPACE_DEFAULT):
-        if hasattr(self, "similarity_vectors"):
+    def get_similarity_vectors(self):
+        """Returns a dictionary with the similarity vectors pre-fetched by SoundManager.bulk_query (as read-only
+        float32 NumPy arrays) keyed by similarity space name, or None if vectors were not pre-fetched."""
+        if not hasattr(self, "similarity_vectors_data"):
+            return None
+        return {
+            similarity_space_name: SoundSimilarityVector.decode_vector(vector_data)
+            for similarity_space_name, vector_data in zip(
+                self.similarity_vectors_space_names, self.similarity_vectors_data
+            )
+        }
+
+    def get_similarity_vector(self, similarity_space_name=settings.SIMILARITY_SPACE_DEFAULT, as_array=False):
+        """Returns the similarity vector of the sound for the given similarity space as a list of floats, or as a
+        read-only float32 NumPy array if as_array=True. Returns None if the sound has no vector for that space."""
+        similarity_vectors = self.get_similarity_vectors()
+        if similarity_vectors is not None:
             # The sound object was retrieved using bulk_query and similarity vectors were pre-fetched
-            try:
-                vectors_dict = {sv["similarity_space_name"]: sv["vector"] for sv in self.similarity_vectors}
-                return vectors_dict[similarity_space_name]
-            except KeyError:
-                return None
+            vector = similarity_vectors.get(similarity_space_name)
         else:
             try:
-                return SoundSimilarityVector.objects.get(sound=self, similarity_space_name=similarity_space_name).vector
+                vector = SoundSimilarityVector.objects.get(
+                    sound=self, similarity_space_name=similarity_space_name
+                ).vector_array
             except SoundSimilarityVector.DoesNotExist:
-                return None
+                vector = None
+        if vector is None or as_array:
+            return vector
+        return vector.tolist()
 
     def delete_from_indexes(self):
         delete_sounds_from_search_engine([self.id])
 
     @staticmethod
-    def invalidate_template_caches_static(sound_id):
-        for is_explicit in [True, False]:
-            invalidate_template_cache("sound_header", sound_id, is_explicit)
-
-        for display_random_link in [True, False]:
-            invalidate_template_cache("sound_footer_top", sound_id, display_random_link)
-
-        invalidate_template_cache("sound_footer_bottom", sound_id)
+    def invalidate_template_caches_bulk(sound_ids):
+        # All template fragments of a sound (bw_display_sound, bw_sound_page, bw_sound_page_sidebar) include the
+        # generation of its template caches in their keys, so incrementing it invalidates all of them
+        invalidate_template_cache_generations("sound", sound_ids)
 
-        for is_authenticated in [True, False]:
-            for is_explicit in [True, False]:
-                invalidate_template_cache("display_sound", sound_id, is_authenticated, is_explicit)
-
-        for player_size in ["small", "middle", "big_no_info", "small_no_info", "minimal", "moderation"]:
-            for is_authenticated in [True, False]:
-                invalidate_template_cache("bw_display_sound", sound_id, player_size, is_authenticated)
-
-        invalidate_template_cache("bw_sound_page", sound_id)
-        invalidate_template_cache("bw_sound_page_sidebar", sound_id)
+    @staticmethod
+    def invalidate_template_caches_static(sound_id):
+        Sound.invalidate_template_caches_bulk([sound_id])
 
     def invalidate_template_caches(self):
         self.invalidate_template_caches_static(self.id)
@@ -1803,7 +1901,8 @@ class Sound(models.Model):
         # Find sequences like 120bpm, bpm120, 120 bpm or bpm 120 in all fields
         description = self.description.lower()
         name = self.original_filename.lower()
-        tags = [t.lower() for t in self.get_sound_tags()]
+        # Use tags pre-fetched by SoundManager.bulk_query if available to avoid an extra DB query
+        tags = [t.lower() for t in (self.tag_array if hasattr(self, "tag_array") else self.get_sound_tags())]
         for candidate in re.findall(r"\d+[\s]?bpm", description + " " + name + " " + " ".join(tags)) + re.findall(
             r"bpm[\s]?\d+", description + " " + name + " " + " ".join(tags)
         ):
@@ -2268,8 +2367,7 @@ class Pack(LicenseSummaryMixin, models.Model):
             for sound in self.sounds.all():
                 sound.delete()  # Create DeletedSound objects and delete original objects
         else:
-            for sound in self.sounds.all():
-                sound.invalidate_template_caches()
+            Sound.invalidate_template_caches_bulk(list(self.sounds.values_list("id", flat=True)))
             self.sounds.update(pack=None, is_index_dirty=True)
         self.is_deleted = True
         self.save()
@@ -2277,9 +2375,7 @@ class Pack(LicenseSummaryMixin, models.Model):
     def invalidate_template_caches(self):
         # NOTE: we're currently using no cache on pack_display as it does not seem to speed up responses
         # This might need further investigation
-        for player_size in ["small", "big"]:
-            invalidate_template_cache("bw_display_pack", self.id, player_size)
-        invalidate_template_cache("bw_pack_stats", self.id)
+        invalidate_template_cache_generations("pack", [self.id])
 
     def get_attribution(self, sound_qs=None):
         # If no queryset of sounds is provided, take it from the pack
@@ -2401,19 +2497,36 @@ class Download(models.Model):
         ]
 
 
+def store_uploader_of_deleted_object(model, instance, origin):
+    """Remembers the uploader of a sound or pack which is being deleted, so that the deletion of its downloads (which
+    are deleted in cascade before it) can be counted without fetching the sound or pack of each one. Uploaders are
+    stored in the object on which delete() was called (the origin of the deletion), so they are only kept as long as
+    that object and are not shared with other deletions."""
+    if origin is None:
+        return
+    if not hasattr(origin, "_deleted_uploader_ids"):
+        origin._deleted_uploader_ids = {}
+    origin._deleted_uploader_ids[model, instance.id] = instance.user_id
+
+
+def get_uploader_of_deleted_object(model, object_id, origin):
+    """Returns the uploader stored by store_uploader_of_deleted_object, or None if it was not stored"""
+    return getattr(origin, "_deleted_uploader_ids", {}).get((model, object_id))
+
+
+@receiver(pre_delete, sender=Sound)
+def store_uploader_of_deleted_sound(sender, instance, origin=None, **kwargs):
+    store_uploader_of_deleted_object(sender, instance, origin)
+
+
 @receiver(post_delete, sender=Download)
 def update_num_downloads_on_delete(**kwargs):
     download = kwargs["instance"]
     if download.sound_id:
-        Sound.objects.filter(id=download.sound_id).update(
-            is_index_dirty=True, num_downloads=Greatest(F("num_downloads") - 1, 0)
-        )
-        accounts.models.Profile.objects.filter(user_id=download.user_id).update(
-            num_sound_downloads=Greatest(F("num_sound_downloads") - 1, 0)
-        )
-        accounts.models.Profile.objects.filter(user_id=download.sound.user_id).update(
-            num_user_sounds_downloads=Greatest(F("num_user_sounds_downloads") - 1, 0)
-        )
+        uploader_id = get_uploader_of_deleted_object(Sound, download.sound_id, kwargs.get("origin"))
+        if uploader_id is None:
+            uploader_id = download.sound.user_id
+        download_counters.count_sound_download(download.sound_id, download.user_id, uploader_id, -1)
 
 
 @receiver(post_save, sender=Download)
@@ -2421,15 +2534,7 @@ def update_num_downloads_on_insert(**kwargs):
     download = kwargs["instance"]
     if kwargs["created"]:
         if download.sound_id:
-            Sound.objects.filter(id=download.sound_id).update(
-                is_index_dirty=True, num_downloads=Greatest(F("num_downloads") + 1, 0)
-            )
-            accounts.models.Profile.objects.filter(user_id=download.user_id).update(
-                num_sound_downloads=Greatest(F("num_sound_downloads") + 1, 0)
-            )
-            accounts.models.Profile.objects.filter(user_id=download.sound.user_id).update(
-                num_user_sounds_downloads=Greatest(F("num_user_sounds_downloads") + 1, 0)
-            )
+            download_counters.count_sound_download(download.sound_id, download.user_id, download.sound.user_id)
 
 
 class PackDownload(models.Model):
@@ -2447,29 +2552,25 @@ class PackDownloadSound(models.Model):
     license = models.ForeignKey(License, on_delete=models.CASCADE)
 
 
+@receiver(pre_delete, sender=Pack)
+def store_uploader_of_deleted_pack(sender, instance, origin=None, **kwargs):
+    store_uploader_of_deleted_object(sender, instance, origin)
+
+
 @receiver(post_delete, sender=PackDownload)
 def update_num_downloads_on_delete_pack(**kwargs):
     download = kwargs["instance"]
-    Pack.objects.filter(id=download.pack_id).update(num_downloads=Greatest(F("num_downloads") - 1, 0))
-    accounts.models.Profile.objects.filter(user_id=download.user_id).update(
-        num_pack_downloads=Greatest(F("num_pack_downloads") - 1, 0)
-    )
-    accounts.models.Profile.objects.filter(user_id=download.pack.user_id).update(
-        num_user_packs_downloads=Greatest(F("num_user_packs_downloads") - 1, 0)
-    )
+    uploader_id = get_uploader_of_deleted_object(Pack, download.pack_id, kwargs.get("origin"))
+    if uploader_id is None:
+        uploader_id = download.pack.user_id
+    download_counters.count_pack_download(download.pack_id, download.user_id, uploader_id, -1)
 
 
 @receiver(post_save, sender=PackDownload)
 def update_num_downloads_on_insert_pack(**kwargs):
     download = kwargs["instance"]
     if kwargs["created"]:
-        Pack.objects.filter(id=download.pack_id).update(num_downloads=Greatest(F("num_downloads") + 1, 0))
-        accounts.models.Profile.objects.filter(user_id=download.user_id).update(
-            num_pack_downloads=Greatest(F("num_pack_downloads") + 1, 0)
-        )
-        accounts.models.Profile.objects.filter(user_id=download.pack.user_id).update(
-            num_user_packs_downloads=Greatest(F("num_user_packs_downloads") + 1, 0)
-        )
+        download_counters.count_pack_download(download.pack_id, download.user_id, download.pack.user_id)
 
 
 class RemixGroup(models.Model):
@@ -2563,27 +2664,28 @@ class SoundAnalysis(models.Model):
                 self.analysis_data = None
         self.save(update_fields=["analysis_data"])
 
-    def get_analysis_data_from_file(self):
-        """Returns the analysis data as stored in file or returns empty dict if no file exists. It tries
-        extensions .json and .yaml as these are the supported formats for analysis results"""
-        try:
-            with open(self.analysis_filepath_base + ".json") as f:
-                return json.load(f)
-        except Exception:
-            pass
-        try:
-            with open(self.analysis_filepath_base + ".yaml") as f:
-                return yaml.load(f, Loader=yaml.CSafeLoader)
-        except Exception:
-            pass
-        return {}
+    def get_analysis_data_from_file(self, descriptors=None):
+        """Returns the analysis data as stored in the analysis store or in file, or returns empty dict if no data
+        exists. See SoundAnalysis.get_analysis_data_from_file_without_db"""
+        return SoundAnalysis.get_analysis_data_from_file_without_db(
+            self.sound_id, self.analyzer, descriptors=descriptors
+        )
+
+    @classmethod
+    def get_analysis_data_from_file_without_db(cls, sound_id, analyzer, descriptors=None):
+        """Class method to get analysis data for a given sound ID and analyzer name, without needing to make a query
+        to get SoundAnalysis object. Data is first looked up in the analysis store (see utils.analysis_store) and, if
+        not there, it is loaded from the analysis output file. Returns the analysis data or returns empty dict if no
+        data exists. If descriptors is given, data loaded from the store only includes these descriptors."""
+        analysis_data = analysis_store.get_analysis_data(sound_id, analyzer, descriptors=descriptors)
+        if analysis_data is not None:
+            return analysis_data
+        return cls.get_analysis_data_from_output_file(sound_id, analyzer)
 
     @classmethod
-    def get_analysis_data_from_file_without_db(cls, sound_id, analyzer):
-        """Class method to get analysis data from file for a given sound ID and analyzer name, without needing
-        to make a query to get SoundAnalysis object. Returns the analysis data as stored in file or returns empty
-        dict if no file exists. It tries extensions .json and .yaml as these are the supported formats for
-        analysis results."""
+    def get_analysis_data_from_output_file(cls, sound_id, analyzer):
+        """Returns the analysis data as stored in the file written by the analyzer or returns empty dict if no file
+        exists. It tries extensions .json and .yaml as these are the supported formats for analysis results."""
         id_folder = str(sound_id // 1000)
         analysis_filepath_base = os.path.join(settings.ANALYSIS_PATH, id_folder, f"{sound_id}-{analyzer}")
         try:
@@ -2628,7 +2730,9 @@ class SoundAnalysis(models.Model):
 
 
 def on_delete_sound_analysis(sender, instance, **kwargs):
-    # Right before deleting a SoundAnalysis object, delete also the associated log and analysis files (if any)
+    # Right before deleting a SoundAnalysis object, delete also the associated log and analysis files (if any) and
+    # the analysis data in the analysis store
+    analysis_store.delete_analysis_data(instance.sound_id, instance.analyzer)
     for filepath in glob.glob(instance.analysis_filepath_base + "*"):
         try:
             os.remove(filepath)
@@ -2640,20 +2744,62 @@ pre_delete.connect(on_delete_sound_analysis, sender=SoundAnalysis)
 
 
 class SoundSimilarityVector(models.Model):
-    """Model to store similarity vectors for sound. We use DB array field to optimize
-    disk space. The alternative would be to save similarity vectors in the JSON data fields
-    of SoundAnalysis obects, but that would be less optimial.
+    """Model to store similarity vectors for sound. Vectors are stored as raw little-endian float32 data in a binary
+    field, which takes half the space of a DB array of doubles (the precision of the vectors indexed in the search
+    engine is also float32) and can be decoded without copies using numpy.frombuffer. The alternative would be to
+    save similarity vectors in the JSON data fields of SoundAnalysis obects, but that would be less optimial.
+
+    Vectors used to be stored in an array of doubles (the "vector" column). While
+    settings.SIMILARITY_VECTORS_WRITE_LEGACY_COLUMN is True, vectors are written to both columns (see the vector
+    setter) so that the previous release can still be deployed. Vectors written by the previous release only have the "vector"
+    column: queries that read vector_data in bulk skip them, and vector_array falls back to the legacy column. The
+    backfill_similarity_vectors_data command fills their vector_data. Once all vectors have vector_data, the setting
+    can be disabled so the legacy column is no longer written, and the column can then be removed.
     """
 
+    VECTOR_DTYPE = np.dtype("<f4")
+
     sound = models.ForeignKey(Sound, related_name="sim_vectors", on_delete=models.CASCADE)
     similarity_space_name = models.CharField(max_length=100)
-    vector = ArrayField(models.FloatField())
+    vector_data = models.BinaryField(null=True)
+    legacy_vector = ArrayField(models.FloatField(), null=True, db_column="vector")
+
+    @classmethod
+    def encode_vector(cls, vector):
+        return np.asarray(vector, dtype=cls.VECTOR_DTYPE).tobytes()
+
+    @classmethod
+    def decode_vector(cls, vector_data):
+        """Returns a read-only NumPy array which uses the given vector data as its buffer (no copies are made)"""
+        return np.frombuffer(vector_data, dtype=cls.VECTOR_DTYPE)
+
+    @property
+    def vector_array(self):
+        if self.vector_data is None:
+            if self.legacy_vector is None:
+                return None
+            return np.asarray(self.legacy_vector, dtype=self.VECTOR_DTYPE)
+        return self.decode_vector(self.vector_data)
+
+    @property
+    def vector(self):
+        vector_array = self.vector_array
+        if vector_array is None:
+            return None
+        return vector_array.tolist()
+
+    @vector.setter
+    def vector(self, vector):
+        self.vector_data = self.encode_vector(vector)
+        if settings.SIMILARITY_VECTORS_WRITE_LEGACY_COLUMN:
+            self.legacy_vector = np.asarray(vector, dtype=np.float64).tolist()
 
     @classmethod
     def l2_normalize_vector(cls, vector):
-        norm = math.sqrt(sum([v * v for v in vector]))
+        vector = np.asarray(vector, dtype=np.float64)
+        norm = np.linalg.norm(vector)
         if norm > 0:
-            return [v / norm for v in vector]
+            return vector / norm
         else:
             return vector
 
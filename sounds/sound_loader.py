@@ -0,0 +1,116 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+"""Request-scoped loader of the sounds rendered with the display_sound templatetags.
+
+Sounds which will be rendered in a page (e.g. the sounds of a carousel) are added to the loader of the request, and the
+first time one of them is displayed all of them are retrieved with a single Sound.objects.bulk_query_id query. The
+loader also memoizes other per-sound and per-user data needed by display_sound. Template cache generations are
+memoized in the same dictionary used by the template_cache_generation templatetag.
+"""
+
+from accounts.models import Profile
+from sounds.models import Sound
+from utils.cache import get_request_template_cache_generations, get_template_cache_generations
+
+
+def sound_object_retrieved_using_bulk_query_id(sound):
+    """Checks whether the given Sound object has the extra properties that are loaded if the object was
+    retrieved using the Sound.objects.bulk_query_id method. Sound objects retrieved with bulk_query_id have
+    the following extra properties required in the display_sound templatetag: 'tag_array', 'username',
+    'license_name'. To optimize the code, we only check for the presence of 'tag_array' and assume the other
+    properties will go together.
+    """
+    return hasattr(sound, "tag_array")
+
+
+class SoundLoader:
+    def __init__(self, template_cache_generations=None):
+        """
+        Args:
+            template_cache_generations (dict, optional): dictionary in which template cache generations are memoized,
+              keyed by object type and ID (see utils.cache.get_request_template_cache_generations)
+        """
+        self.pending_sound_ids = set()
+        self.sounds = {}
+        self.pending_template_cache_generation_ids = set()
+        self.template_cache_generations = template_cache_generations if template_cache_generations is not None else {}
+        self.profile_locations = {}
+
+    def add(self, sounds):
+        """Adds sounds that will be rendered later in the request so that they are retrieved all at once.
+
+        Args:
+            sounds (list): sound IDs or Sound objects. Sound objects retrieved with bulk_query_id are stored as they
+              are, and other objects are retrieved again with bulk_query_id.
+        """
+        for sound in sounds:
+            if isinstance(sound, Sound):
+                sound_id = sound.id
+                if sound_object_retrieved_using_bulk_query_id(sound):
+                    self.sounds.setdefault(sound_id, sound)
+            else:
+                try:
+                    sound_id = int(sound)
+                except (TypeError, ValueError):
+                    continue
+            if sound_id not in self.sounds:
+                self.pending_sound_ids.add(sound_id)
+            if ("sound", sound_id) not in self.template_cache_generations:
+                self.pending_template_cache_generation_ids.add(sound_id)
+
+    def get(self, sound_id):
+        """Returns the sound with the given ID retrieved with bulk_query_id (or None if it does not exist). If the
+        sound has not been retrieved yet, all pending sounds are retrieved with it in the same query.
+        """
+        if sound_id not in self.sounds:
+            sound_ids = self.pending_sound_ids | {sound_id}
+            self.pending_sound_ids = set()
+            sounds = {sound.id: sound for sound in Sound.objects.bulk_query_id(list(sound_ids))}
+            for loaded_sound_id in sound_ids:
+                self.sounds[loaded_sound_id] = sounds.get(loaded_sound_id, None)
+        return self.sounds[sound_id]
+
+    def get_template_cache_generation(self, sound_id):
+        """Returns the generation of the template caches of the sound, getting the generations of all pending
+        sounds from the cache at once.
+        """
+        if ("sound", sound_id) not in self.template_cache_generations:
+            sound_ids = {
+                pending_sound_id
+                for pending_sound_id in self.pending_template_cache_generation_ids
+                if ("sound", pending_sound_id) not in self.template_cache_generations
+            } | {sound_id}
+            self.pending_template_cache_generation_ids = set()
+            for loaded_sound_id, generation in get_template_cache_generations("sound", sound_ids).items():
+                self.template_cache_generations["sound", loaded_sound_id] = generation
+        return self.template_cache_generations["sound", sound_id]
+
+    def get_profile_locations(self, user_id, has_avatar):
+        if (user_id, has_avatar) not in self.profile_locations:
+            self.profile_locations[user_id, has_avatar] = Profile.locations_static(user_id, has_avatar)
+        return self.profile_locations[user_id, has_avatar]
+
+
+def get_sound_loader(request):
+    """Returns the SoundLoader of the request, creating it if needed"""
+    if not hasattr(request, "sound_loader"):
+        request.sound_loader = SoundLoader(get_request_template_cache_generations(request))
+    return request.sound_loader
@@ -24,8 +24,8 @@ from random import randint
 from django import template
 from django.conf import settings
 
-from accounts.models import Profile
 from sounds.models import Sound
+from sounds.sound_loader import get_sound_loader, sound_object_retrieved_using_bulk_query_id
 
 register = template.Library()
 
@@ -69,69 +69,42 @@ def display_sound(
 
     """
 
-    def get_sound_using_bulk_query_id(sound_id):
-        """Get a sound from the DB using the Sound.objects.bulk_query_id method which returns a Sound object with
-        some extra properties loaded.
-
-        Args:
-            sound_id (int): ID of the sound to retrieve.
-
-        Returns:
-            Sound: sound object with extra loaded properties or None if the sound does not exist or the ID is not valid.
-
-        """
-        try:
-            return Sound.objects.bulk_query_id([int(sound_id)])[0]
-        except ValueError:
-            # 'sound' is not an integer
-            return None
-        except IndexError:
-            # No sound with given ID exists (Sound.objects.bulk_query_id returns empty qs)
-            return None
-
-    def sound_object_retrieved_using_bulk_query_id(sound):
-        """Checks whether the given Sound object has the extra properties that are loaded if the object was
-        retrieved using the Sound.objects.bulk_query_id method. Sound objects retrieved with bulk_query_id have
-        the following extra properties required in the display_sound templatetag: 'tag_array', 'username',
-        'license_name'. To optimize the code, we only check for the presence of 'tag_array' and assume the other
-        properties will go together.
-
-        Args:
-            sound (Sound): Sound object
-
-        Returns:
-            bool: True if the object was retrieved using bulk query ID.
-
-        """
-        return hasattr(sound, "tag_array")
-
+    request = context["request"]
+    sound_loader = get_sound_loader(request)
     if isinstance(sound, Sound):
         if sound_object_retrieved_using_bulk_query_id(sound):
             sound_obj = sound
         else:
             # If 'sound' is a Sound instance but has not been retrieved using bulk_query_id, we would need to make
             # some extra DB queries to get the metadata that must be rendered. Instead, we retrieve again
-            # the sound using the bulk_query_id method which will get all needed metadata in only one query.
+            # the sound using the bulk_query_id method which will get all needed metadata in only one query
+            # (shared with other sounds added to the request's sound loader, see sounds.sound_loader).
             # Note that we don't re-retrieve when player size contains "no_info" as in these cases there is
             # no extra metadata needed to be shown.
             if "no_info" not in player_size:
-                sound_obj = get_sound_using_bulk_query_id(sound.id)
+                sound_obj = sound_loader.get(sound.id)
             else:
                 sound_obj = sound
     else:
         # If 'sound' argument is not a Sound instance then we assume it is a sound ID and we retrieve the
-        # corresponding object from the DB.
-        sound_obj = get_sound_using_bulk_query_id(sound)
+        # corresponding object from the DB (or from the request's sound loader if it was already retrieved).
+        try:
+            sound_obj = sound_loader.get(int(sound))
+        except (TypeError, ValueError):
+            # 'sound' is not an integer
+            sound_obj = None
 
     if sound_obj is None:
         return {
             "sound": None,
         }
     else:
-        request = context["request"]
         return {
             "sound": sound_obj,
-            "user_profile_locations": Profile.locations_static(sound_obj.user_id, sound_obj.user.profile.has_avatar),
+            "user_profile_locations": sound_loader.get_profile_locations(
+                sound_obj.user_id, sound_obj.user.profile.has_avatar
+            ),
+            "template_cache_generation": sound_loader.get_template_cache_generation(sound_obj.id),
             "request": request,
             "is_explicit": sound_obj.is_explicit
             and (not request.user.is_authenticated or not request.user.profile.is_adult),
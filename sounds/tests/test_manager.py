@@ -19,10 +19,11 @@
 #
 
 from django.conf import settings
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 
 from geotags.models import GeoTag
-from sounds.models import Pack, Sound
+from sounds.models import Pack, Sound, SoundSimilarityVector
 from tickets.models import Ticket
 from utils.test_helpers import (
     create_consolidated_audio_descriptors_and_similarity_vectors_for_sound,
@@ -60,7 +61,8 @@ class SoundManagerQueryMethods(TestCase):
     fields_to_check_related = ["user", "pack", "license", "ticket"]
     fields_to_check_subqueries = [
         "consolidated_audio_descriptors",
-        "similarity_vectors",
+        "similarity_vectors_space_names",
+        "similarity_vectors_data",
         "ready_for_similarity_precomputed",
     ]
 
@@ -116,6 +118,61 @@ class SoundManagerQueryMethods(TestCase):
             self.assertEqual(Sound.objects.get(id=sound.id).license_id, sound.license_id)
             self.assertCountEqual(Sound.objects.get(id=sound.id).get_sound_tags(), sound.tag_array)
 
+    def test_similarity_vectors(self):
+        # Pre-fetched similarity vectors are decoded from the float32 binary data without additional queries, and
+        # are the same as the ones retrieved from the DB when the vectors are not pre-fetched
+        with self.assertNumQueries(1):
+            sounds = list(Sound.objects.bulk_query_id(sound_ids=self.sound_ids, include_similarity_vectors=True))
+            for sound in sounds:
+                similarity_vectors = sound.get_similarity_vectors()
+                self.assertCountEqual(similarity_vectors.keys(), settings.SIMILARITY_SPACES_NAMES)
+                for similarity_space_name, vector in similarity_vectors.items():
+                    self.assertEqual(vector.dtype, SoundSimilarityVector.VECTOR_DTYPE)
+                    self.assertEqual(len(vector), settings.SIMILARITY_SPACES[similarity_space_name]["vector_size"])
+                    self.assertListEqual(
+                        sound.get_similarity_vector(similarity_space_name=similarity_space_name),
+                        [float(sound.id)] * len(vector),
+                    )
+        for sound in Sound.objects.filter(id__in=self.sound_ids):
+            self.assertIsNone(sound.get_similarity_vectors())
+            for similarity_space_name in settings.SIMILARITY_SPACES_NAMES:
+                self.assertListEqual(
+                    sound.get_similarity_vector(similarity_space_name=similarity_space_name),
+                    [float(sound.id)] * settings.SIMILARITY_SPACES[similarity_space_name]["vector_size"],
+                )
+            self.assertIsNone(sound.get_similarity_vector(similarity_space_name="non_existing_space"))
+
+        # Vectors are stored as float32 and normalised when requested
+        ssv = SoundSimilarityVector(vector=[3.0, 4.0])
+        self.assertEqual(len(ssv.vector_data), 2 * SoundSimilarityVector.VECTOR_DTYPE.itemsize)
+        self.assertListEqual(ssv.vector, [3.0, 4.0])
+        # Vectors are also written to the legacy column while it exists
+        self.assertListEqual(ssv.legacy_vector, [3.0, 4.0])
+        self.assertListEqual(SoundSimilarityVector.l2_normalize_vector(ssv.vector_array).tolist(), [0.6, 0.8])
+        with override_settings(SIMILARITY_VECTORS_WRITE_LEGACY_COLUMN=False):
+            self.assertIsNone(SoundSimilarityVector(vector=[3.0, 4.0]).legacy_vector)
+        # Vectors without data in any of the columns are None
+        self.assertIsNone(SoundSimilarityVector().vector)
+
+    def test_legacy_similarity_vectors(self):
+        # Vectors written by the previous release only have the legacy column
+        sound_id = self.sound_ids[0]
+        SoundSimilarityVector.objects.filter(sound_id=sound_id).update(vector_data=None)
+        Sound.objects.filter(id=sound_id).update(is_index_dirty=False)
+        vector_size = settings.SIMILARITY_SPACES[settings.SIMILARITY_SPACE_DEFAULT]["vector_size"]
+
+        # They are skipped when pre-fetched and read from the legacy column otherwise
+        sound = Sound.objects.bulk_query_id(sound_ids=[sound_id], include_similarity_vectors=True)[0]
+        self.assertDictEqual(sound.get_similarity_vectors(), {})
+        self.assertListEqual(Sound.objects.get(id=sound_id).get_similarity_vector(), [float(sound_id)] * vector_size)
+
+        # Their float32 data is filled by the backfill command, which marks their sounds as index dirty
+        call_command("backfill_similarity_vectors_data", "--chunk-size", "1")
+        self.assertFalse(SoundSimilarityVector.objects.filter(vector_data__isnull=True).exists())
+        self.assertTrue(Sound.objects.get(id=sound_id).is_index_dirty)
+        sound = Sound.objects.bulk_query_id(sound_ids=[sound_id], include_similarity_vectors=True)[0]
+        self.assertListEqual(sound.get_similarity_vector(), [float(sound_id)] * vector_size)
+
     def test_ordered_ids(self):
         # This method is similar to SoundManager.bulk_query_id but returns the sounds in the same order as the
         # the IDs in sound_ids. Here we only check that the sorting is correct. (the other things like returned
@@ -124,6 +181,22 @@ class SoundManagerQueryMethods(TestCase):
             for i, sound in enumerate(Sound.objects.ordered_ids(sound_ids=self.sound_ids)):
                 self.assertEqual(self.sound_ids[i], sound.id)
 
+    def test_iter_bulk_query_solr(self):
+        # Sounds are returned in batches of at most batch_size sounds sorted by ID, and with the same annotations as
+        # when using SoundManager.bulk_query_solr
+        batches = list(Sound.objects.iter_bulk_query_solr(batch_size=2, id__in=self.sound_ids))
+        self.assertListEqual([len(batch) for batch in batches], [2, 1])
+        sounds = [sound for batch in batches for sound in batch]
+        self.assertListEqual([sound.id for sound in sounds], sorted(self.sound_ids))
+        bulk_query_solr_sounds = {sound.id: sound for sound in Sound.objects.bulk_query_solr(self.sound_ids)}
+        for sound in sounds:
+            for field_name in self.fields_to_check_bulk_query_id + self.fields_to_check_subqueries + ["comments"]:
+                self.assertEqual(getattr(sound, field_name), getattr(bulk_query_solr_sounds[sound.id], field_name))
+
+        # Extra filters are applied
+        batches = list(Sound.objects.iter_bulk_query_solr(batch_size=2, id__in=self.sound_ids[:1]))
+        self.assertListEqual([[sound.id for sound in batch] for batch in batches], [self.sound_ids[:1]])
+
     def test_bulk_sounds_for_user(self):
         # This method uses SoundManager.bulk_query internally (also used by SoundManager.bulk_query_id) to retrieve
         # sounds by a user. We only check that filtering by user works here (the other things like returned sound fields
@@ -21,26 +21,32 @@
 
 import json
 import os
+import pickle
 from unittest import mock
 
 from bs4 import BeautifulSoup
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core import mail
-from django.core.cache import cache
+from django.core.cache import cache, caches
 from django.core.cache.backends import locmem
 from django.core.management import call_command
+from django.db import DatabaseError
 from django.http import HttpResponse
 from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
 
 import accounts
 from comments.models import Comment
+from general.tasks import process_analysis_results
 from general.templatetags.filter_img import replace_img
 from geotags.models import GeoTag
+from sounds import download_counters
 from sounds.forms import PackForm
+from sounds.management.commands.create_consolidated_analyses import compute_consolidated_analysis_data
 from sounds.models import DeletedSound, Download, License, Pack, PackDownload, PackDownloadSound, Sound, SoundAnalysis
-from utils.cache import get_template_cache_key
+from utils import analysis_store
+from utils.cache import get_versioned_template_cache_key
 from utils.test_helpers import create_user_and_sounds, override_analysis_path_with_temp_directory
 
 
@@ -533,6 +539,124 @@ class SoundPackDownloadTestCase(TestCase):
             # Check n download objects is 1
             self.assertEqual(PackDownload.objects.filter(user=self.user, pack=self.pack).count(), 1)
 
+    @override_settings(DOWNLOAD_COUNTERS_WRITE_BEHIND=True)
+    def test_download_counters_write_behind(self):
+        caches["download_counters"].clear()
+        downloader = User.objects.create_user("downloader", email="downloader@example.com")
+        Sound.objects.filter(id=self.sound.id).update(is_index_dirty=False)
+
+        # Counts are not updated until the transaction is committed and the pending counts are flushed
+        with self.captureOnCommitCallbacks(execute=True):
+            Download.objects.create(user=downloader, sound=self.sound, license_id=self.sound.license_id)
+            PackDownload.objects.create(user=downloader, pack=self.pack)
+        self.sound.refresh_from_db()
+        self.assertEqual(self.sound.num_downloads, 0)
+        call_command("flush_download_counters")
+
+        self.sound.refresh_from_db()
+        self.pack.refresh_from_db()
+        self.assertEqual(self.sound.num_downloads, 1)
+        self.assertEqual(self.pack.num_downloads, 1)
+        downloader.profile.refresh_from_db()
+        self.assertEqual(downloader.profile.num_sound_downloads, 1)
+        self.assertEqual(downloader.profile.num_pack_downloads, 1)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.num_user_sounds_downloads, 1)
+        self.assertEqual(self.user.profile.num_user_packs_downloads, 1)
+        self.assertEqual(self.user.profile.num_sound_downloads, 0)
+        # Going from 0 to 1 downloads changes the position of the sound when sorting by downloads
+        self.assertTrue(self.sound.is_index_dirty)
+
+        # Small relative changes in the number of downloads do not mark the sound as dirty
+        Sound.objects.filter(id=self.sound.id).update(num_downloads=100, is_index_dirty=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            Download.objects.filter(user=downloader, sound=self.sound).delete()
+            Download.objects.create(user=self.user, sound=self.sound, license_id=self.sound.license_id)
+            Download.objects.create(user=downloader, sound=self.sound, license_id=self.sound.license_id)
+        call_command("flush_download_counters")
+        self.sound.refresh_from_db()
+        self.assertEqual(self.sound.num_downloads, 101)
+        self.assertFalse(self.sound.is_index_dirty)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.num_sound_downloads, 1)
+        self.assertEqual(self.user.profile.num_user_sounds_downloads, 2)
+
+        # Nothing is pending after flushing
+        call_command("flush_download_counters")
+        self.sound.refresh_from_db()
+        self.assertEqual(self.sound.num_downloads, 101)
+
+    @override_settings(DOWNLOAD_COUNTERS_WRITE_BEHIND=True)
+    def test_download_counters_write_behind_deleted_sound(self):
+        caches["download_counters"].clear()
+        downloader = User.objects.create_user("downloader", email="downloader@example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            Download.objects.create(user=downloader, sound=self.sound, license_id=self.sound.license_id)
+        call_command("flush_download_counters")
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.num_user_sounds_downloads, 1)
+
+        # The uploader is counted when the download is deleted, so the count is decremented even if the sound no
+        # longer exists when the counts are flushed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sound.delete()
+        call_command("flush_download_counters")
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.num_user_sounds_downloads, 0)
+        downloader.profile.refresh_from_db()
+        self.assertEqual(downloader.profile.num_sound_downloads, 0)
+
+        # Same for packs, also when deleted with a queryset
+        with self.captureOnCommitCallbacks(execute=True):
+            PackDownload.objects.create(user=downloader, pack=self.pack)
+        call_command("flush_download_counters")
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.num_user_packs_downloads, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Pack.objects.filter(id=self.pack.id).delete()
+        call_command("flush_download_counters")
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.num_user_packs_downloads, 0)
+        downloader.profile.refresh_from_db()
+        self.assertEqual(downloader.profile.num_pack_downloads, 0)
+
+    @override_settings(DOWNLOAD_COUNTERS_WRITE_BEHIND=True)
+    def test_download_counters_write_behind_failed_flush(self):
+        caches["download_counters"].clear()
+        downloader = User.objects.create_user("downloader", email="downloader@example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            Download.objects.create(user=downloader, sound=self.sound, license_id=self.sound.license_id)
+        with mock.patch("sounds.download_counters.apply_download_counts", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                call_command("flush_download_counters")
+
+        # Counts of a failed flush are kept in the processing keys, and downloads counted meanwhile are kept pending
+        with self.captureOnCommitCallbacks(execute=True):
+            Download.objects.create(user=self.user, sound=self.sound, license_id=self.sound.license_id)
+        self.assertEqual(
+            caches["download_counters"].get(
+                download_counters.get_processing_key(download_counters.SOUND_DOWNLOADS_KEY)
+            ),
+            {self.sound.id: 1},
+        )
+        call_command("flush_download_counters")
+        self.sound.refresh_from_db()
+        self.assertEqual(self.sound.num_downloads, 1)
+        call_command("flush_download_counters")
+        self.sound.refresh_from_db()
+        self.assertEqual(self.sound.num_downloads, 2)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.num_user_sounds_downloads, 2)
+
+    @override_settings(DOWNLOAD_COUNTERS_WRITE_BEHIND=True)
+    def test_download_counters_write_behind_cache_error(self):
+        # Errors counting downloads once the transaction is committed are logged instead of raised
+        with mock.patch("sounds.download_counters.increment_pending_counts", side_effect=ConnectionError):
+            with self.assertLogs("sounds", level="ERROR"):
+                with self.captureOnCommitCallbacks(execute=True):
+                    Download.objects.create(user=self.user, sound=self.sound, license_id=self.sound.license_id)
+        self.assertEqual(Download.objects.filter(user=self.user, sound=self.sound).count(), 1)
+
 
 class SoundSignatureTestCase(TestCase):
     fixtures = ["licenses", "user_groups"]
@@ -613,25 +737,27 @@ class SoundTemplateCacheTests(TestCase):
         self.sound.change_moderation_state("OK")
         self.user = user
 
+    # Cache keys are given as fragment name and variables (other than the sound ID), and the actual keys are computed
+    # when checking the cache as they depend on the current generation of the sound template caches
     def _get_sound_view_cache_keys(self):
-        return [
-            get_template_cache_key("bw_sound_page", self.sound.id),
-            get_template_cache_key("bw_sound_page_sidebar", self.sound.id),
-        ]
+        return [("bw_sound_page",), ("bw_sound_page_sidebar",)]
 
     def _get_sound_view_footer_top_cache_keys(self):
-        return [get_template_cache_key("bw_sound_page", self.sound.id)]
+        return [("bw_sound_page",)]
 
     def _get_sound_display_cache_keys(self, is_authenticated=True, is_explicit=False, player_size="small"):
-        return [get_template_cache_key("bw_display_sound", self.sound.id, player_size, is_authenticated)]
+        return [("bw_display_sound", player_size, is_authenticated)]
+
+    def _get_versioned_cache_key(self, cache_key):
+        return get_versioned_template_cache_key(cache_key[0], "sound", self.sound.id, *cache_key[1:])
 
     def _assertCacheAbsent(self, cache_keys):
         for cache_key in cache_keys:
-            self.assertIsNone(cache.get(cache_key))
+            self.assertIsNone(cache.get(self._get_versioned_cache_key(cache_key)))
 
     def _assertCachePresent(self, cache_keys):
         for cache_key in cache_keys:
-            self.assertIsNotNone(cache.get(cache_key))
+            self.assertIsNotNone(cache.get(self._get_versioned_cache_key(cache_key)))
 
     def _get_sound_url(self, viewname, username=None, sound_id=None):
         return reverse(viewname, args=[username or self.sound.user.username, sound_id or self.sound.id])
@@ -1093,6 +1219,204 @@ class SoundAnalysisModel(TestCase):
         self.assertEqual(sound.analyses.all().count(), 3)
         self.assertEqual(sa3.get_analysis_data(), {})
 
+    @override_analysis_path_with_temp_directory
+    def test_migrate_analysis_files_to_store(self):
+        _, _, sounds = create_user_and_sounds(num_sounds=4)
+        sounds, new_sound = sounds[:3], sounds[3]
+        analyzer = settings.FREESOUND_ESSENTIA_EXTRACTOR_NAME
+
+        def write_analysis_file(sound, analysis_data):
+            os.makedirs(os.path.join(settings.ANALYSIS_PATH, str(sound.id // 1000)), exist_ok=True)
+            with open(
+                os.path.join(settings.ANALYSIS_PATH, str(sound.id // 1000), f"{sound.id}-{analyzer}.json"), "w"
+            ) as f:
+                json.dump(analysis_data, f)
+
+        for sound in sounds:
+            SoundAnalysis.objects.create(sound=sound, analyzer=analyzer, analysis_status="OK")
+            write_analysis_file(sound, {"sound_id": sound.id, "vector": [0.5, 1.5]})
+        call_command("migrate_analysis_files_to_store", "--analyzers", analyzer, "--chunk-size", "2")
+
+        # Once in the store, data no longer needs to be read from the analysis files
+        for sound in sounds:
+            os.remove(os.path.join(settings.ANALYSIS_PATH, str(sound.id // 1000), f"{sound.id}-{analyzer}.json"))
+            self.assertDictEqual(
+                SoundAnalysis.get_analysis_data_from_file_without_db(sound.id, analyzer),
+                {"sound_id": sound.id, "vector": [0.5, 1.5]},
+            )
+            self.assertDictEqual(
+                SoundAnalysis.objects.get(sound=sound, analyzer=analyzer).get_analysis_data_from_file(["vector"]),
+                {"vector": [0.5, 1.5]},
+            )
+
+        # Sounds which are not in the store are read from the analysis files
+        write_analysis_file(new_sound, {"sound_id": new_sound.id})
+        self.assertDictEqual(
+            SoundAnalysis.get_analysis_data_from_file_without_db(new_sound.id, analyzer), {"sound_id": new_sound.id}
+        )
+
+        # New analysis results replace the data in the store
+        write_analysis_file(sounds[0], {"sound_id": sounds[0].id, "new": True})
+        process_analysis_results(sounds[0].id, analyzer, "OK", 1.0)
+        os.remove(os.path.join(settings.ANALYSIS_PATH, str(sounds[0].id // 1000), f"{sounds[0].id}-{analyzer}.json"))
+        self.assertDictEqual(
+            SoundAnalysis.get_analysis_data_from_file_without_db(sounds[0].id, analyzer),
+            {"sound_id": sounds[0].id, "new": True},
+        )
+
+        # If new analysis results can't be added to the store, the data in the store is deleted and the results are
+        # read from the analysis files
+        write_analysis_file(sounds[2], {"sound_id": sounds[2].id, "new": True})
+        add_analysis_data = analysis_store.add_analysis_data
+
+        def add_analysis_data_failing_to_encode(analyzer, items):
+            items = list(items)
+            if any(data is not None for _, data in items):
+                raise TypeError("Object of type date is not JSON serializable")
+            add_analysis_data(analyzer, items)
+
+        with mock.patch("utils.analysis_store.add_analysis_data", side_effect=add_analysis_data_failing_to_encode):
+            with mock.patch("sounds.models.SoundAnalysis.load_analysis_data_from_file_to_db") as load_to_db:
+                process_analysis_results(sounds[2].id, analyzer, "OK", 1.0)
+                load_to_db.assert_called_once()
+        self.assertDictEqual(
+            SoundAnalysis.get_analysis_data_from_file_without_db(sounds[2].id, analyzer),
+            {"sound_id": sounds[2].id, "new": True},
+        )
+
+        # Deleted analyses are deleted from the store
+        SoundAnalysis.objects.filter(sound=sounds[1], analyzer=analyzer).delete()
+        self.assertDictEqual(SoundAnalysis.get_analysis_data_from_file_without_db(sounds[1].id, analyzer), {})
+
+    @override_analysis_path_with_temp_directory
+    def test_migrate_analysis_files_to_store_invalid_data(self):
+        _, _, sounds = create_user_and_sounds(num_sounds=3)
+        analyzer = settings.FREESOUND_ESSENTIA_EXTRACTOR_NAME
+        for sound in sounds:
+            SoundAnalysis.objects.create(sound=sound, analyzer=analyzer, analysis_status="OK")
+
+        def get_analysis_data_from_output_file(sound_id, analyzer):
+            # Data of the second sound can't be stored (e.g. a date loaded from a YAML file)
+            return {"sound_id": sound_id, "value": object() if sound_id == sounds[1].id else 1}
+
+        # Sounds with data which can't be stored are skipped, the rest of sounds in the chunk are still added
+        with mock.patch(
+            "sounds.models.SoundAnalysis.get_analysis_data_from_output_file",
+            side_effect=get_analysis_data_from_output_file,
+        ):
+            call_command("migrate_analysis_files_to_store", "--analyzers", analyzer, "--chunk-size", "3")
+        for sound in [sounds[0], sounds[2]]:
+            self.assertDictEqual(
+                analysis_store.get_analysis_data(sound.id, analyzer), {"sound_id": sound.id, "value": 1}
+            )
+        self.assertIsNone(analysis_store.get_analysis_data(sounds[1].id, analyzer))
+
+    @override_analysis_path_with_temp_directory
+    def test_create_consolidated_analyses(self):
+        _, _, sounds = create_user_and_sounds(num_sounds=3, tags="tag1 120bpm")
+        analyzer = settings.AUDIOCOMMONS_ANALYZER_NAME
+        for sound in sounds:
+            SoundAnalysis.objects.create(sound=sound, analyzer=analyzer, analysis_status="OK")
+            os.makedirs(os.path.join(settings.ANALYSIS_PATH, str(sound.id // 1000)), exist_ok=True)
+            with open(
+                os.path.join(settings.ANALYSIS_PATH, str(sound.id // 1000), f"{sound.id}-{analyzer}.json"), "w"
+            ) as f:
+                json.dump({"boominess": 12.34567, "tempo": 90.0}, f)
+        SoundAnalysis.objects.create(
+            sound=sounds[0], analyzer="consolidated", analysis_status="OK", analysis_data={"boominess": 1.0, "other": 5}
+        )
+        Sound.objects.filter(id__in=[sound.id for sound in sounds]).update(is_index_dirty=False)
+
+        sound_ids = ",".join(str(sound.id) for sound in sounds)
+        call_command("create_consolidated_analyses", "--sound-ids", sound_ids, "--chunk-size", "2")
+        for sound in sounds:
+            sa = SoundAnalysis.objects.get(sound=sound, analyzer="consolidated")
+            self.assertEqual(sa.analysis_data, {"boominess": 12.346, "bpm": 120, "bpm_confidence": 1.0})
+            self.assertTrue(Sound.objects.get(id=sound.id).is_index_dirty)
+
+        # Only the selected descriptors are updated
+        SoundAnalysis.objects.filter(sound=sounds[1], analyzer="consolidated").update(
+            analysis_data={"boominess": 1.0, "other": 5}
+        )
+        call_command("create_consolidated_analyses", "--sound-ids", sound_ids, "--update-descriptors", "boominess")
+        self.assertEqual(
+            SoundAnalysis.objects.get(sound=sounds[1], analyzer="consolidated").analysis_data,
+            {"boominess": 12.346, "other": 5},
+        )
+
+        # Sound objects can be sent to worker processes, and computing consolidated analysis data needs no queries
+        sounds_dict = Sound.objects.dict_ids([sound.id for sound in sounds], include_audio_descriptors=True)
+        with self.assertNumQueries(0):
+            updated_data, created_data = compute_consolidated_analysis_data(
+                pickle.loads(pickle.dumps([sounds_dict[sounds[0].id]])),  # noqa: S301
+                pickle.loads(pickle.dumps([sounds_dict[sounds[1].id]])),  # noqa: S301
+                {sound.id: [analyzer] for sound in sounds},
+            )
+        self.assertDictEqual(updated_data, {sounds[0].id: {"boominess": 12.346, "bpm": 120, "bpm_confidence": 1.0}})
+        self.assertDictEqual(created_data, {sounds[1].id: {"boominess": 12.346, "bpm": 120, "bpm_confidence": 1.0}})
+
+    @mock.patch("sounds.models.celery_app.send_task")
+    def test_bulk_analyze(self, send_task):
+        _, _, sounds = create_user_and_sounds(num_sounds=3, tags="tag3 tag1 tag2")
+        analyzer = settings.FREESOUND_ESSENTIA_EXTRACTOR_NAME
+        SoundAnalysis.objects.create(sound=sounds[0], analyzer=analyzer, analysis_status="FA", num_analysis_attempts=1)
+        SoundAnalysis.objects.create(sound=sounds[1], analyzer=analyzer, analysis_status="QU", num_analysis_attempts=1)
+
+        # Sounds already queued are not sent again, non-existing sounds are ignored
+        sound_ids = [sound.id for sound in sounds]
+        self.assertListEqual(
+            Sound.objects.bulk_analyze(sound_ids + [sound_ids[0], 0], analyzer), [sound_ids[0], sound_ids[2]]
+        )
+        self.assertEqual(send_task.call_count, 2)
+        for call, sound in zip(send_task.call_args_list, [sounds[0], sounds[2]]):
+            self.assertEqual(call.args[0], analyzer)
+            self.assertEqual(call.kwargs["queue"], analyzer)
+            self.assertDictEqual(call.kwargs["kwargs"], Sound.objects.get(id=sound.id).get_analysis_job_kwargs())
+        self.assertListEqual(
+            json.loads(send_task.call_args.kwargs["kwargs"]["metadata"])["tags"], ["tag1", "tag2", "tag3"]
+        )
+        for sound, num_analysis_attempts in zip(sounds, [2, 1, 1]):
+            sa = SoundAnalysis.objects.get(sound=sound, analyzer=analyzer)
+            self.assertEqual(sa.analysis_status, "QU")
+            self.assertEqual(sa.num_analysis_attempts, num_analysis_attempts)
+
+        # With force=True, queued sounds are also sent
+        send_task.reset_mock()
+        self.assertListEqual(Sound.objects.bulk_analyze(sound_ids[1:2], analyzer, force=True), sound_ids[1:2])
+        self.assertEqual(send_task.call_count, 1)
+        self.assertEqual(SoundAnalysis.objects.get(sound=sounds[1], analyzer=analyzer).num_analysis_attempts, 2)
+
+        # Unknown analyzers are ignored
+        self.assertListEqual(Sound.objects.bulk_analyze(sound_ids, "UnknownAnalyzer"), [])
+        self.assertEqual(SoundAnalysis.objects.filter(analyzer="UnknownAnalyzer").count(), 0)
+
+    @mock.patch("sounds.models.celery_app.send_task")
+    def test_orchestrate_analysis(self, send_task):
+        _, _, sounds = create_user_and_sounds(num_sounds=5)
+        analyzer = settings.FREESOUND_ESSENTIA_EXTRACTOR_NAME
+        SoundAnalysis.objects.create(sound=sounds[0], analyzer=analyzer, analysis_status="OK")
+        SoundAnalysis.objects.create(sound=sounds[1], analyzer=analyzer, analysis_status="FA", num_analysis_attempts=1)
+        self.assertListEqual(
+            list(Sound.objects.missing_analysis(analyzer, limit=2).values_list("id", flat=True)),
+            [sound.id for sound in sounds[2:4]],
+        )
+
+        # Missing sounds are sent first and then failed sounds, up to the maximum number of jobs in the queue
+        queues_status = [(analyzer, 0, 0, 1, 0)]
+        with (
+            mock.patch(
+                "sounds.management.commands.orchestrate_analysis.get_queues_task_counts", return_value=queues_status
+            ),
+            override_settings(ANALYZERS_CONFIGURATION={analyzer: {"max_jobs_in_queue": 4}}),
+        ):
+            call_command("orchestrate_analysis")
+        self.assertCountEqual(
+            [call.kwargs["kwargs"]["sound_id"] for call in send_task.call_args_list], [sound.id for sound in sounds[1:]]
+        )
+        self.assertEqual(Sound.objects.missing_analysis(analyzer).count(), 0)
+        self.assertEqual(SoundAnalysis.objects.filter(analyzer=analyzer, analysis_status="QU").count(), 4)
+        self.assertEqual(SoundAnalysis.objects.get(sound=sounds[1], analyzer=analyzer).num_analysis_attempts, 2)
+
 
 class SoundEditDeletePermissionTestCase(TestCase):
     """Test that when editing and deleting sounds and packs only the user who owns
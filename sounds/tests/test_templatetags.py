@@ -18,14 +18,18 @@
 #     See AUTHORS file.
 #
 
+from unittest import mock
+
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
 from django.http import HttpRequest
 from django.template import Context, Template
 from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from sounds.models import Sound
+from utils.cache import get_template_cache_generation
 
 
 class DisplaySoundTemplatetagTestCase(TestCase):
@@ -127,6 +131,45 @@ class DisplaySoundTemplatetagTestCase(TestCase):
             )
             #  If the template could not be rendered, the test will have failed by that time, no need to assert anything
 
+    @override_settings(TEMPLATES=[settings.TEMPLATES[0]])
+    def test_display_sounds_from_sound_carousel(self):
+        """Test that when displaying several sounds in a carousel (either from IDs or from standard Sound objects), all
+        of them are retrieved with a single DB query using the request's sound loader.
+        """
+        sound_ids = list(Sound.objects.order_by("id").values_list("id", flat=True)[:5])
+        self.assertEqual(len(sound_ids), 5)
+        sounds = sound_ids[:3] + list(Sound.objects.filter(id__in=sound_ids[3:]))
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        with self.assertNumQueries(1):
+            html = Template("{% load bw_templatetags %}{% sound_carousel sounds %}").render(
+                Context({"sounds": sounds, "request": request})
+            )
+        for sound_id in sound_ids:
+            self.assertIn(f'data-sound-id="{sound_id}"', html)
+
+        # Sounds already retrieved by the loader are not retrieved again in the same request
+        with self.assertNumQueries(0):
+            Template("{% load display_sound %}{% display_sound sound %}").render(
+                Context({"sound": sound_ids[0], "request": request})
+            )
+
+    @override_settings(TEMPLATES=[settings.TEMPLATES[0]])
+    def test_template_cache_generations_shared_with_sound_loader(self):
+        """Test that the template cache generation of a sound used both by the template_cache_generation templatetag
+        and by display_sound in the same request is only got from the cache once.
+        """
+        sound = Sound.objects.bulk_query_id([23])[0]
+        get_template_cache_generation("sound", sound.id)  # Make sure the generation is initialised
+        request = HttpRequest()
+        request.user = AnonymousUser()
+        with mock.patch("utils.cache.cache", wraps=cache) as wrapped_cache:
+            Template(
+                "{% load util display_sound %}"
+                '{% template_cache_generation "sound" sound.id as generation %}{% display_sound sound %}'
+            ).render(Context({"sound": sound, "request": request}))
+        wrapped_cache.get_many.assert_called_once()
+
     def test_display_sound_wrapper_view(self):
         response = self.client.get(reverse("sound-display", args=[self.sound.user.username, 921]))  # Non existent ID
         self.assertEqual(response.status_code, 404)
@@ -68,7 +68,7 @@ from sounds.sound_grid_editor import (
 )
 from tickets import TICKET_STATUS_CLOSED
 from tickets.models import Ticket, TicketComment
-from utils.cache import invalidate_user_template_caches
+from utils.cache import invalidate_all_moderators_header_cache, invalidate_user_template_caches
 from utils.cdn import generate_cdn_download_url
 from utils.download_limit import (
     DownloadType,
@@ -374,7 +374,6 @@ def sound_download(request, username, sound_id):
         # (e.g. a multi-part Range request, or a repeated click within the window),
         # so we record only one Download row per download.
         Download.objects.create(user=request.user, sound=sound, license_id=sound.license_id)
-        sound.invalidate_template_caches()
 
     if settings.USE_CDN_FOR_DOWNLOADS:
         cdn_url = generate_cdn_download_url(sound)
@@ -512,8 +511,7 @@ def edit_and_describe_sounds_helper(request, describing=False, session_key_prefi
                         ),
                     )
                     invalidate_user_template_caches(request.user.id)
-                    for moderator in Group.objects.get(name="moderators").user_set.all():
-                        invalidate_user_template_caches(moderator.id)
+                    invalidate_all_moderators_header_cache()
                 clean_processing_before_describe_files(file_full_path)
 
             except NoAudioException:
@@ -23,6 +23,7 @@ from builtins import object
 from numpy import load
 
 from .community_detector import CommunityDetector
+from .neighbours_table import NeighboursTable
 from .tag_recommender import TagRecommender
 
 class CommunityBasedTagRecommender(object):
@@ -70,9 +71,16 @@ class CommunityBasedTagRecommender(object):
             self.recommenders[class_name] = TagRecommender()
             self.recommenders[class_name].set_heuristic(self.recommendation_heuristic)
 
+            path = self.base_data_dir + self.dataset + '_%s_SIMILARITY_MATRIX_' % class_name + self.metric + '_SUBSET'
+            if not NeighboursTable.exists(path):
+                # Data computed before neighbours tables were saved when training, build the table from the dense
+                # similarity matrix (this is slow and the table is not shared with other processes)
+                print("Building neighbours table from similarity matrix for class %s..." % class_name)
+                neighbours_table = NeighboursTable.from_similarity_matrix(load(path + '_TAG_NAMES.npy'), load(path + '.npy'))
+            else:
+                neighbours_table = NeighboursTable.load(path)
             data = {
-                'TAG_NAMES': load(self.base_data_dir + self.dataset + '_%s_SIMILARITY_MATRIX_' % class_name + self.metric + '_SUBSET_TAG_NAMES.npy'),
-                'SIMILARITY_MATRIX': load(self.base_data_dir + self.dataset + '_%s_SIMILARITY_MATRIX_' % class_name + self.metric + '_SUBSET.npy'),
+                'NEIGHBOURS': neighbours_table,
             }
 
             self.recommenders[class_name].load_data(
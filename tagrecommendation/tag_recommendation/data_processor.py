@@ -27,15 +27,15 @@ standard_library.install_aliases()
 from builtins import str
 from builtins import range
 from builtins import object
-from past.utils import old_div
 import sys, os
+from itertools import chain, islice
+import numpy as np
 from numpy import save, load, where, in1d
-from math import sqrt
-from pysparse import spmatrix
+from scipy import sparse
 from .community_tag_recommender import CommunityDetector
+from .neighbours_table import NeighboursTable
 import datetime
 import json
-from numpy import zeros
 
  # NOTE: This code not been tested in the new hetnzer infrastructure (and actually has not been run for many years...). 
  # We should re-think how to handle re-training of the tag recommendaiton models
@@ -57,28 +57,77 @@ def saveToJson(path="", data="", verbose=True):
             print("Saving data to '" + path + "'")
         json.dump(data,f,indent=4)
 
-def mtx2npy(M, verbose = True):
-    n = M.shape[0]
-    m = M.shape[1]
-    npy = zeros((n, m) , 'float32')
-    #non_zero_index = M.keys()
-    items = list(M.items())
-    nItems = len(M.items())
-    done = 0
-    #for index in non_zero_index :
-    for index, value in items:
-        npy[ index[0] ][ index[1] ] = value #M[ index[0] , index[1] ]
-
-        done += 1
-        if verbose:
-            sys.stdout.write("\rConverting to npy... " + '%.2f'%((float(done)*100)/float(nItems)) + "% ")
-            sys.stdout.flush()
-
+def save_csr_matrix(path, M, verbose=True):
+    # CSR matrices are stored as one .npy file per component so that they can be loaded with mmap_mode='r'
     if verbose:
-        sys.stdout.write("\n")
-        sys.stdout.flush()
-    return npy
-
+        print("Saving sparse matrix to '" + path + "_*.npy'")
+    save(path + '_DATA.npy', M.data)
+    save(path + '_INDICES.npy', M.indices)
+    save(path + '_INDPTR.npy', M.indptr)
+    save(path + '_SHAPE.npy', np.array(M.shape))
+
+
+def load_csr_matrix(path, mmap_mode=None):
+    return sparse.csr_matrix((load(path + '_DATA.npy', mmap_mode=mmap_mode),
+                              load(path + '_INDICES.npy', mmap_mode=mmap_mode),
+                              load(path + '_INDPTR.npy', mmap_mode=mmap_mode)),
+                             shape=tuple(load(path + '_SHAPE.npy')))
+
+
+def build_association_matrix(index, tag_threshold=0, line_limit=1000000000):
+    """
+    Builds the binary resource x tag association matrix (in CSR format) from the tags of each resource of the index.
+    Tags are encoded with np.unique and the matrix is built in a single pass from the (resource, tag) pairs, so that
+    the whole Freesound index can be processed in a few seconds.
+    Returns the matrix, the resource ids of its rows, the tag names of its columns and the ids of these tags in the
+    list of all unique tag names (before filtering).
+    Only tags with at least tag_threshold occurrences are kept, and resources without any of these tags are removed.
+    """
+    items = list(islice(index.items(), line_limit + 1))
+    resource_ids = np.array([sid for sid, _ in items])
+    n_tags_per_resource = np.fromiter((len(tags) for _, tags in items), dtype=np.int64, count=len(items))
+    all_tags = np.array(list(chain.from_iterable(tags for _, tags in items)), dtype=object)
+
+    # Encode tags and compute tag occurrences
+    unique_tags, tag_codes = np.unique(all_tags, return_inverse=True)
+    tag_occurrences = np.bincount(tag_codes, minlength=len(unique_tags))
+    resource_codes = np.repeat(np.arange(len(items)), n_tags_per_resource)
+
+    # Filter tags and resources without tags
+    tags_ids = np.where(tag_occurrences >= tag_threshold)[0]
+    kept_associations = tag_occurrences[tag_codes] >= tag_threshold
+    tag_codes = np.searchsorted(tags_ids, tag_codes[kept_associations])
+    resource_codes = resource_codes[kept_associations]
+    kept_resources = np.bincount(resource_codes, minlength=len(items)) > 0
+    resource_codes = np.cumsum(kept_resources)[resource_codes] - 1
+
+    M = sparse.coo_matrix((np.ones(len(tag_codes), dtype=np.float32), (resource_codes, tag_codes)),
+                          shape=(int(kept_resources.sum()), len(tags_ids))).tocsr()
+    M.sum_duplicates()
+    M.data[:] = 1  # A resource might have the same tag more than once
+    return M, resource_ids[kept_resources], unique_tags[tags_ids].astype(str), tags_ids
+
+
+def similarity_matrix_from_association_matrix(M, metric="cosine"):
+    """
+    Computes the tag x tag similarity matrix (in CSR format) from a resource x tag association matrix using sparse
+    matrix products. Only pairs of tags that co-occur in some resource have a non zero similarity.
+    """
+    C = (M.T @ M).tocoo()
+    C.eliminate_zeros()
+    occurrences = M.T @ np.ones(M.shape[0], dtype=M.dtype)  # Diagonal of C
+    rows, cols, values = C.row, C.col, C.data.astype(np.float64)
+    if metric == 'cosine':
+        values = values / np.sqrt(occurrences[rows] * occurrences[cols])
+    elif metric == 'coocurrence':
+        pass
+    elif metric == 'binary':
+        values = np.ones_like(values)
+    elif metric == 'jaccard':
+        values = values / (occurrences[rows] + occurrences[cols] - values)
+    else:
+        raise Exception("Wrong similarity metric specified")
+    return sparse.csr_matrix((values.astype(np.float32), (rows, cols)), shape=C.shape)
 
 
 class RecommendationDataProcessor(object):
@@ -104,8 +153,9 @@ class RecommendationDataProcessor(object):
 
     The files that are generated by the system are:
     (for every sound class: Soundscape, Music, Fx, Samples, Speech)
-    [[DATABASE]]_[[CLASSNAME]]_SIMILARITY_MATRIX_cosine_SUBSET.npy
     [[DATABASE]]_[[CLASSNAME]]_SIMILARITY_MATRIX_cosine_SUBSET_TAG_NAMES.npy
+    [[DATABASE]]_[[CLASSNAME]]_SIMILARITY_MATRIX_cosine_SUBSET_NEIGHBOURS_{INDPTR,INDICES,SCORES}.npy
+    [[DATABASE]]_[[CLASSNAME]]_SIMILARITY_MATRIX_cosine_SUBSET_SORTED_TAG_{NAMES,POSITIONS}.npy
     '''
 
     verbose = None
@@ -119,109 +169,26 @@ class RecommendationDataProcessor(object):
     def tas_to_association_matrix(self, tag_threshold=0, line_limit=1000000000):
 
         index = loadFromJson(RECOMMENDATION_DATA_DIR + "Index.json")
-        # Get tags from file
-        ts = []
-        idx = 0
-        n_original_associations = 0
-        sound_ids = []
         if self.verbose:
-            print("Reading index file (%i entries)..." % len(index.items()), end=' ')
-        for sid, tags in index.items():
-            ts += tags
-            n_original_associations += len(tags)
-            sound_ids.append(sid)
-
-            idx += 1
-            if idx > line_limit:
-                break
-
+            print("Building association matrix from index file (%i entries)..." % len(index), end=' ')
+            sys.stdout.flush()
+        M, resources, tags, tags_ids = build_association_matrix(index, tag_threshold=tag_threshold, line_limit=line_limit)
+        n_sounds = min(len(index), line_limit + 1)
         stats = {
-            'n_sounds_in_matrix': len(sound_ids),
-            #'biggest_id': max([int(sid) for sid in sound_ids])
+            'n_sounds_in_matrix': n_sounds,
         }
         saveToJson(RECOMMENDATION_TMP_DATA_DIR + 'Current_index_stats.json', stats)
         if self.verbose:
             print("done!")
-
-        # Compute tag occurrences after loading the file
-        tag_occurrences = dict()
-        unique_ts = list(set(ts))
-        for id, t in enumerate(unique_ts):
-            tag_occurrences[t] = ts.count(t)
-
-            if self.verbose:
-                sys.stdout.write("\rComputing tag occurrences %.2f%%"%(float(100*(id+1))/len(unique_ts)))
-                sys.stdout.flush()
-        print("")
-        tags = []
-        tags_ids = []
-        for id, t in enumerate(unique_ts):
-
-            if tag_occurrences[t] >= tag_threshold:
-                tags.append(t)
-                tags_ids.append(id)
-
-            if self.verbose:
-                sys.stdout.write("\rFiltering tags %.2f%%"%(float(100*(id+1))/len(unique_ts)))
-                sys.stdout.flush()
-
-        nTags = len(tags)
-        if self.verbose:
-            print("")
-            print("\tOriginal number of tags: " + str(len(unique_ts)))
-            print("\tTags after filtering: " + str(nTags))
+            print("\tOriginal number of associations: " + str(sum(len(tags) for tags in islice(index.values(), n_sounds))))
+            print("\tAssociations after filtering: " + str(M.nnz))
+            print("\tTags after filtering: " + str(len(tags)))
+            print("\tResources after filtering: " + str(len(resources)))
 
         # Generate resource-tags dictionary only with filtered tags
-        if self.verbose:
-            print("Reading file for resources...", end=' ')
-        sys.stdout.flush()
         res_tags = {}
-        res_user = {}
-        res_tags_no_filt = {}
-        idx = 0
-        n_filtered_associations = 0
-        for sid, stags in index.items():
-            resource = sid
-            user = None
-            assigned_tags = stags
-            assigned_tags_filt = list(set(assigned_tags).intersection(set(tags)))
-            res_tags_no_filt[resource] = assigned_tags
-            res_user[resource] = user
-            if len(assigned_tags_filt) > 0:
-                res_tags[resource] = assigned_tags_filt
-                n_filtered_associations += len(assigned_tags_filt)
-
-            idx += 1
-            if idx > line_limit:
-                break
-
-        resources = list(res_tags.keys())
-        nResources = len(resources)
-        resources_ids = list(range(0,nResources))
-        if self.verbose:
-            print("done!")
-
-        # Generate association matrix
-        if self.verbose:
-            print("\tOriginal number of associations: " + str(n_original_associations))
-            print("\tAssociations after filtering: " + str(n_filtered_associations))
-
-        if self.verbose:
-            print('Creating empty array of ' + str(nResources) + ' x ' + str(nTags) + '...', end=' ')
-        M = spmatrix.ll_mat(nResources, nTags)
-        if self.verbose:
-            print('done!')
-
-        done = 0
-        for r_id in resources:
-            for t in res_tags[r_id]:
-                M[resources.index(r_id),tags.index(t)] = 1
-                done += 1
-                if self.verbose:
-                    sys.stdout.write("\rGenerating association matrix %.2f%%" % (float(100*done)/n_filtered_associations))
-                    sys.stdout.flush()
-        if self.verbose:
-            print("")
+        for position, resource in enumerate(resources.tolist()):
+            res_tags[resource] = tags[M.indices[M.indptr[position]:M.indptr[position + 1]]].tolist()
 
         # Save data
         if self.verbose:
@@ -229,13 +196,11 @@ class RecommendationDataProcessor(object):
 
         now = datetime.datetime.now(datetime.timezone.utc)
         filename = "FS%.4i%.2i%.2i" % (now.year, now.month, now.day)
-        M.export_mtx(RECOMMENDATION_TMP_DATA_DIR + filename + '_ASSOCIATION_MATRIX.mtx')
+        save_csr_matrix(RECOMMENDATION_TMP_DATA_DIR + filename + '_ASSOCIATION_MATRIX', M, verbose=self.verbose)
         save(RECOMMENDATION_TMP_DATA_DIR + filename + '_RESOURCE_IDS.npy',resources)
         save(RECOMMENDATION_TMP_DATA_DIR + filename + '_TAG_IDS.npy',tags_ids)
         save(RECOMMENDATION_TMP_DATA_DIR + filename + '_TAG_NAMES.npy',tags)
         saveToJson(RECOMMENDATION_TMP_DATA_DIR + filename + '_RESOURCES_TAGS.json',res_tags, verbose = self.verbose)
-        #saveToJson(RECOMMENDATION_TMP_DATA_DIR + filename + '_RESOURCES_TAGS_NO_FILTER.json',res_tags_no_filt, verbose = self.verbose)
-        #saveToJson(RECOMMENDATION_TMP_DATA_DIR + filename + '_RESOURCES_USER.json',res_user, verbose = self.verbose)
 
         return filename
 
@@ -251,7 +216,7 @@ class RecommendationDataProcessor(object):
         if self.verbose:
             print("Loading association matrix and tag names, ids files...")
         try:
-            M = spmatrix.ll_mat_from_mtx(RECOMMENDATION_TMP_DATA_DIR + dataset + "_ASSOCIATION_MATRIX.mtx")
+            M = load_csr_matrix(RECOMMENDATION_TMP_DATA_DIR + dataset + "_ASSOCIATION_MATRIX", mmap_mode='r')
             resource_ids = load(RECOMMENDATION_TMP_DATA_DIR + dataset + "_RESOURCE_IDS.npy")
             tag_names = load(RECOMMENDATION_TMP_DATA_DIR + dataset + "_TAG_NAMES.npy")
         except Exception:
@@ -265,51 +230,26 @@ class RecommendationDataProcessor(object):
         # Get index of resources to train (usable index for M)
         resource_id_positions = where(in1d(resource_ids, training_set, assume_unique=True))[0]
 
-        # Matrix multiplication (only taking in account resources in training set and ALL tags)
-        MM = spmatrix.dot(M[resource_id_positions, :], M[resource_id_positions, :])
-
-        # Get similarity matrix
-        sim_matrix = spmatrix.ll_mat(MM.shape[0],MM.shape[0])
-        non_zero_index = list(MM.keys())
-        for index in non_zero_index:
-            if metric == 'cosine':
-                sim_matrix[index[0], index[1]] = MM[index[0], index[1]] * (old_div(1, (sqrt(MM[index[0], index[0]]) * sqrt(MM[index[1], index[1]]))))
-            elif metric == 'coocurrence':
-                sim_matrix[index[0], index[1]] = MM[index[0], index[1]]
-            elif metric == 'binary':
-                sim_matrix[index[0], index[1]] = old_div(MM[index[0], index[1]],MM[index[0], index[1]])
-            elif metric == 'jaccard':
-                sim_matrix[index[0], index[1]] = MM[index[0], index[1]] * (old_div(1, (MM[index[0], index[0]] + MM[index[1], index[1]] - MM[index[0], index[1]])))
+        # Similarity of all pairs of tags (only taking in account resources in training set and ALL tags)
+        sim_matrix = similarity_matrix_from_association_matrix(M[resource_id_positions, :], metric=metric)
 
         # Clean out similarity matrix (clean tags that are not used)
-        tag_positions = []
-        for i in range(0, sim_matrix.shape[0]):
-            if sim_matrix[i, i] != 0.0:
-                tag_positions.append(i)
+        tag_positions = where(sim_matrix.diagonal() != 0.0)[0]
 
-        # Transform sparse similarity matrix to npy format
-        sim_matrix_npy = mtx2npy(sim_matrix[tag_positions,tag_positions])
+        sim_matrix = sim_matrix[tag_positions, :][:, tag_positions]
         tag_names_sim_matrix = tag_names[tag_positions]
 
         if save_sim:
             if not is_general_recommender:
-                # Save sim
-                path = RECOMMENDATION_TMP_DATA_DIR + dataset + "_%s_SIMILARITY_MATRIX_" % out_name_prefix + metric + "_SUBSET.npy"
-                if self.verbose:
-                    print("Saving to " + path + "...")
-                save(path, sim_matrix_npy)
-
-                # Save tag names
-                path = RECOMMENDATION_TMP_DATA_DIR + dataset + "_%s_SIMILARITY_MATRIX_" % out_name_prefix + metric + "_SUBSET_TAG_NAMES.npy"
+                # Save table of most similar tags and tag names (loaded by the recommendation server)
+                path = RECOMMENDATION_TMP_DATA_DIR + dataset + "_%s_SIMILARITY_MATRIX_" % out_name_prefix + metric + "_SUBSET"
                 if self.verbose:
-                    print("Saving to " + path + "...")
-                save(path, tag_names_sim_matrix)
+                    print("Saving to " + path + "_NEIGHBOURS_*.npy, " + path + "_SORTED_TAG_*.npy and " + path + "_TAG_NAMES.npy...")
+                NeighboursTable.from_similarity_matrix(tag_names_sim_matrix, sim_matrix).save(path)
             else:
                 # Save sim
-                path = RECOMMENDATION_TMP_DATA_DIR + dataset + "_SIMILARITY_MATRIX_" + metric + ".npy"
-                if self.verbose:
-                    print("Saving to " + path + "...")
-                save(path, sim_matrix_npy)
+                path = RECOMMENDATION_TMP_DATA_DIR + dataset + "_SIMILARITY_MATRIX_" + metric
+                save_csr_matrix(path, sim_matrix, verbose=self.verbose)
 
                 # Save tag names
                 path = RECOMMENDATION_TMP_DATA_DIR + dataset + "_SIMILARITY_MATRIX_" + metric + "_TAG_NAMES.npy"
@@ -317,7 +257,7 @@ class RecommendationDataProcessor(object):
                     print("Saving to " + path + "...")
                 save(path, tag_names_sim_matrix)
 
-        return {'SIMILARITY_MATRIX': sim_matrix_npy, 'TAG_NAMES': tag_names_sim_matrix}
+        return {'SIMILARITY_MATRIX': sim_matrix, 'TAG_NAMES': tag_names_sim_matrix}
 
     def process_tag_recommendation_data(self,
                                         resources_limit=None,
@@ -0,0 +1,124 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+import os
+
+import numpy as np
+from scipy import sparse
+
+# Number of most similar tags stored for each tag (must be at least the cNMostSimilar_N option of the heuristics)
+DEFAULT_NUMBER_OF_NEIGHBOURS = 100
+
+
+class NeighboursTable(object):
+    """
+    Most similar tags of each tag, stored in CSR format: the neighbours of the tag at position i are
+    indices[indptr[i]:indptr[i + 1]] (sorted by decreasing similarity), and their similarities are the scores at the
+    same positions (stored as float32, as co-occurrence similarities are not bounded).
+    Tags are looked up with a binary search in the sorted tag names (sorted_tag_positions are the positions of the
+    sorted tag names in tag_names).
+    When loaded from disk, the arrays are memory-mapped so that all processes of the server share the same copy.
+    """
+
+    def __init__(self, tag_names, indptr, indices, scores, sorted_tag_names=None, sorted_tag_positions=None):
+        self.tag_names = tag_names
+        self.indptr = indptr
+        self.indices = indices
+        self.scores = scores
+        if sorted_tag_positions is None:
+            sorted_tag_positions = np.argsort(tag_names, kind='stable')
+            sorted_tag_names = tag_names[sorted_tag_positions]
+        self.sorted_tag_names = sorted_tag_names
+        self.sorted_tag_positions = sorted_tag_positions
+
+    def tag_position(self, tag):
+        """Returns the position of the given tag in tag_names (or None if the tag does not exist in the table)"""
+        sorted_position = np.searchsorted(self.sorted_tag_names, tag)
+        if sorted_position == len(self.sorted_tag_names) or self.sorted_tag_names[sorted_position] != tag:
+            return None
+        return int(self.sorted_tag_positions[sorted_position])
+
+    def __len__(self):
+        return len(self.tag_names)
+
+    def most_similar(self, tag, n):
+        """Returns the names and similarities of the n most similar tags to the given tag (or None if the tag does not
+        exist in the table)"""
+        position = self.tag_position(tag)
+        if position is None:
+            return None
+        start = self.indptr[position]
+        end = min(self.indptr[position + 1], start + n)
+        return self.tag_names[self.indices[start:end]], self.scores[start:end]
+
+    def save(self, path):
+        np.save(path + '_TAG_NAMES.npy', self.tag_names)
+        np.save(path + '_NEIGHBOURS_INDPTR.npy', self.indptr)
+        np.save(path + '_NEIGHBOURS_INDICES.npy', self.indices)
+        np.save(path + '_NEIGHBOURS_SCORES.npy', self.scores)
+        np.save(path + '_SORTED_TAG_NAMES.npy', self.sorted_tag_names)
+        np.save(path + '_SORTED_TAG_POSITIONS.npy', self.sorted_tag_positions)
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(path + '_NEIGHBOURS_INDPTR.npy')
+
+    @classmethod
+    def load(cls, path):
+        sorted_tag_names, sorted_tag_positions = None, None
+        if os.path.exists(path + '_SORTED_TAG_POSITIONS.npy'):
+            sorted_tag_names = np.load(path + '_SORTED_TAG_NAMES.npy', mmap_mode='r')
+            sorted_tag_positions = np.load(path + '_SORTED_TAG_POSITIONS.npy', mmap_mode='r')
+        return cls(np.load(path + '_TAG_NAMES.npy', mmap_mode='r'),
+                   np.load(path + '_NEIGHBOURS_INDPTR.npy', mmap_mode='r'),
+                   np.load(path + '_NEIGHBOURS_INDICES.npy', mmap_mode='r'),
+                   np.load(path + '_NEIGHBOURS_SCORES.npy', mmap_mode='r'),
+                   sorted_tag_names,
+                   sorted_tag_positions)
+
+    @classmethod
+    def from_similarity_matrix(cls, tag_names, similarity_matrix, n=DEFAULT_NUMBER_OF_NEIGHBOURS):
+        """
+        Builds the table from a (dense or sparse) tag similarity matrix. Tags themselves and tags with 0 similarity
+        are not included in the neighbours of each tag.
+        """
+        similarity_matrix = sparse.coo_matrix(similarity_matrix)
+        kept = (similarity_matrix.row != similarity_matrix.col) & (similarity_matrix.data != 0)
+        similarity_matrix = sparse.csr_matrix(
+            (similarity_matrix.data[kept], (similarity_matrix.row[kept], similarity_matrix.col[kept])),
+            shape=similarity_matrix.shape)
+        indptr = np.zeros(similarity_matrix.shape[0] + 1, dtype=np.int64)
+        indices = []
+        scores = []
+        for position in range(similarity_matrix.shape[0]):
+            start, end = similarity_matrix.indptr[position], similarity_matrix.indptr[position + 1]
+            row_indices = similarity_matrix.indices[start:end]
+            row_scores = similarity_matrix.data[start:end]
+            if len(row_scores) > n:
+                top = np.argpartition(-row_scores, n)[:n]
+                row_indices, row_scores = row_indices[top], row_scores[top]
+            order = np.argsort(-row_scores, kind='stable')
+            indices.append(row_indices[order])
+            scores.append(row_scores[order])
+            indptr[position + 1] = indptr[position] + len(order)
+        return cls(np.asarray(tag_names).astype(str),
+                   indptr,
+                   np.concatenate(indices).astype(np.int32) if indices else np.zeros(0, dtype=np.int32),
+                   np.concatenate(scores).astype(np.float32) if scores else np.zeros(0, dtype=np.float32))
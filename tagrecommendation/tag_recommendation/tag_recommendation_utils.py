@@ -23,24 +23,15 @@ import operator
 from numpy import *
 
 
-def cNMostSimilar(input_tags, tag_names, similarity_matrix, options):
+def cNMostSimilar(input_tags, neighbours_table, options):
 
     N = options['cNMostSimilar_N']
-    unicode_tag_names = list(tag_names)  # No need for further conversion in python 3
     candidate_tags = []
     for tag in input_tags:
-        # Check that tag exists in the tag matrix, if it does not exist we cannot recommend similar tags
-        if tag in unicode_tag_names:
-            # Find N most similar tags in the row
-            idx = unicode_tag_names.index(tag)
-            #where(tag_names == tag)[0][0]
-            row_idx = nonzero(similarity_matrix[idx,:])
-            row_idx = row_idx[0]
-            row = similarity_matrix[idx,row_idx]
-            MAX = N
-            most_similar_idx = row.argsort()[-MAX-1:-1][::-1] # We pick the first N most similar tags (practically the same as no threshold but more efficient)
-            most_similar_dist = row[most_similar_idx]
-            most_similar_tags = tag_names[row_idx[most_similar_idx]]
+        # Find N most similar tags (precomputed in the neighbours table)
+        most_similar = neighbours_table.most_similar(tag, N)
+        if most_similar is not None:
+            most_similar_tags, most_similar_dist = most_similar
 
             rank = N
             for count,item in enumerate(most_similar_tags):
@@ -36,7 +36,7 @@ class TagRecommender(object):
 
     def __repr__(self):
         if self.data:
-            size = self.data['SIMILARITY_MATRIX'].shape[0]
+            size = len(self.data['NEIGHBOURS'])
         else:
             size = -1
 
@@ -71,7 +71,7 @@ class TagRecommender(object):
         selectAlgorithm = self.heuristic['s']
 
         # CHOOSE candidate tags
-        candidate_tags = chooseAlgorithm(input_tags, self.data['TAG_NAMES'], self.data['SIMILARITY_MATRIX'], self.heuristic['options'])
+        candidate_tags = chooseAlgorithm(input_tags, self.data['NEIGHBOURS'], self.heuristic['options'])
 
         # AGGREGATE candidate tags
         aggregated_candidate_tags, aggregated_candiate_tags_list = aggregateAlgorithm(candidate_tags, input_tags, self.heuristic['options'])
@@ -0,0 +1,100 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Encodes texts requested concurrently by different threads (e.g. the threads serving HTTP requests) in batches.
+
+    A single worker thread runs the model: when a text is requested, it waits up to max_wait seconds for other texts to
+    be requested and encodes all of them (up to max_batch_size texts) with a single call to encode_batch.
+    """
+
+    def __init__(self, encode_batch, max_batch_size=64, max_wait=0.005):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def encode(self, text):
+        return self.encode_many([text])[0]
+
+    def encode_many(self, texts):
+        futures = []
+        for text in texts:
+            future = Future()
+            self.queue.put((text, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def get_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.get_batch()
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                embeddings = dict(zip(texts, self.encode_batch(texts)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for text, future in batch:
+                future.set_result(embeddings[text])
+
+
+class StandInTextEncoder:
+    """Deterministic replacement of the text encoding model, used to test and benchmark the service without loading
+    the real model. Embeddings are random unit vectors seeded with the text, and each call takes overhead +
+    per_text * len(texts) seconds. As in the real model (which uses all CPU cores), calls are not run in parallel.
+    """
+
+    def __init__(self, dimensions=512, overhead=0.02, per_text=0.0005):
+        self.dimensions = dimensions
+        self.overhead = overhead
+        self.per_text = per_text
+        self.lock = threading.Lock()
+
+    def get_text_embedding(self, texts):
+        with self.lock:
+            time.sleep(self.overhead + self.per_text * len(texts))
+        embeddings = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            embedding = np.random.default_rng(seed).standard_normal(self.dimensions)
+            embeddings[i] = embedding / np.linalg.norm(embedding)
+        return embeddings
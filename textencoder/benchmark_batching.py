@@ -0,0 +1,100 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+"""Compares the throughput of the text encoder when encoding each request separately, when merging concurrent
+requests with the micro-batcher, and when requesting all texts at once (as with the /encode_texts/ endpoint). It uses
+the deterministic stand-in encoder, so it can be run without the model checkpoint:
+
+    python benchmark_batching.py --concurrency 32 --requests-per-client 10
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from batching import MicroBatcher, StandInTextEncoder
+
+
+def run_clients(encode, texts_per_client):
+    """Encodes the texts of each client in a separate thread, one text at a time. Returns the total time and the
+    latencies of all requests (in ms)"""
+
+    def run_client(texts):
+        latencies = []
+        for text in texts:
+            starttime = time.monotonic()
+            encode(text)
+            latencies.append((time.monotonic() - starttime) * 1000)
+        return latencies
+
+    starttime = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(texts_per_client)) as executor:
+        latencies = sum(executor.map(run_client, texts_per_client), [])
+    return time.monotonic() - starttime, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32, help="Number of concurrent clients.")
+    parser.add_argument("--requests-per-client", type=int, default=10, help="Number of texts encoded by each client.")
+    parser.add_argument("--max-batch-size", type=int, default=64, help="Max number of texts per batch.")
+    parser.add_argument("--window-ms", type=float, default=5, help="Max time waiting for other requests.")
+    parser.add_argument("--overhead-ms", type=float, default=20, help="Time per call of the stand-in encoder.")
+    parser.add_argument("--per-text-ms", type=float, default=0.5, help="Time per text of the stand-in encoder.")
+    args = parser.parse_args()
+
+    encoder = StandInTextEncoder(overhead=args.overhead_ms / 1000, per_text=args.per_text_ms / 1000)
+    texts_per_client = [
+        [f"text {client} {i}" for i in range(args.requests_per_client)] for client in range(args.concurrency)
+    ]
+    num_texts = args.concurrency * args.requests_per_client
+
+    # One call to the encoder per request (as done before micro-batching)
+    single_time, single_latencies = run_clients(lambda text: encoder.get_text_embedding([text])[0], texts_per_client)
+
+    # Concurrent requests merged by the micro-batcher
+    batcher = MicroBatcher(
+        encoder.get_text_embedding, max_batch_size=args.max_batch_size, max_wait=args.window_ms / 1000
+    )
+    batched_time, batched_latencies = run_clients(batcher.encode, texts_per_client)
+
+    # All texts requested at once
+    all_texts = sum(texts_per_client, [])
+    starttime = time.monotonic()
+    embeddings = batcher.encode_many(all_texts)
+    batch_time = time.monotonic() - starttime
+
+    # Embeddings do not depend on how texts are batched
+    assert np.array_equal(embeddings[0], encoder.get_text_embedding([all_texts[0]])[0])
+
+    for name, total_time, latencies in [
+        ("one call per request", single_time, single_latencies),
+        ("micro-batching", batched_time, batched_latencies),
+        ("single batch request", batch_time, None),
+    ]:
+        latency = ""
+        if latencies is not None:
+            latency = f", p50 {np.percentile(latencies, 50):.1f}ms, p95 {np.percentile(latencies, 95):.1f}ms"
+        print(f"{name}: {num_texts / total_time:.0f} texts/s{latency}")
+
+
+if __name__ == "__main__":
+    main()
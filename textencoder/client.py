@@ -18,20 +18,28 @@
 #     See AUTHORS file.
 #
 
-import json
-import urllib.request
-
+import requests
 from django.conf import settings
 from django.core.cache import cache
 
 _BASE_URL = "http://%s:%i/" % (settings.TEXTENCODER_ADDRESS, settings.TEXTENCODER_PORT)
 _URL_ENCODE_TEXT = "encode_text/"
+_URL_ENCODE_TEXTS = "encode_texts/"
+
+# Connections to the text encoder are kept alive and reused by all requests of the process
+_session = requests.Session()
+
 
+def _get_url_as_json(url, params):
+    response = _session.get(url, params=params, timeout=settings.TEXTENCODER_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
 
-def _get_url_as_json(url):
-    f = urllib.request.urlopen(url.replace(" ", "%20"), timeout=settings.TEXTENCODER_TIMEOUT)  # noqa: S310
-    resp = f.read()
-    return json.loads(resp)
+
+def _post_url_as_json(url, data):
+    response = _session.post(url, json=data, timeout=settings.TEXTENCODER_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
 
 
 def _result_or_exception(result):
@@ -41,16 +49,51 @@ def _result_or_exception(result):
         raise Exception(result["result"])
 
 
+def _get_cache_key(input_text, model):
+    return f"text-encoding-{model}-{input_text}"
+
+
 class TextEncoder(object):
     @classmethod
     def encode_text(cls, input_text, model=None):
-        cache_key = f"text-encoding-{model}-{input_text}"
+        cache_key = _get_cache_key(input_text, model)
         result = cache.get(cache_key, None)
         if result is None:
-            url = _BASE_URL + _URL_ENCODE_TEXT + "?" + "input=" + urllib.parse.quote(input_text)
+            params = {"input": input_text}
             if model is not None:
-                url += "&model=" + urllib.parse.quote(model)
-            result = _result_or_exception(_get_url_as_json(url))
+                params["model"] = model
+            result = _result_or_exception(_get_url_as_json(_BASE_URL + _URL_ENCODE_TEXT, params))
             cache.set(cache_key, result, settings.TEXTENCODER_CACHE_TIME)
 
         return result
+
+    @classmethod
+    def encode_texts(cls, input_texts, model=None):
+        """Same as encode_text for a list of texts, returning a list of results. Cached results are retrieved with a
+        single cache query and all other texts are encoded with a single request to the text encoder.
+        """
+        cache_keys = {input_text: _get_cache_key(input_text, model) for input_text in input_texts}
+        cached_results = cache.get_many(list(cache_keys.values()))
+        results = {
+            input_text: cached_results[cache_key]
+            for input_text, cache_key in cache_keys.items()
+            if cache_key in cached_results
+        }
+        texts_to_encode = [input_text for input_text in cache_keys if input_text not in results]
+        if texts_to_encode:
+            data = {"inputs": texts_to_encode}
+            if model is not None:
+                data["model"] = model
+            result = _result_or_exception(_post_url_as_json(_BASE_URL + _URL_ENCODE_TEXTS, data))
+            new_results = {}
+            for i, input_text in enumerate(texts_to_encode):
+                new_results[input_text] = {
+                    "embeddings": {model_name: embeddings[i] for model_name, embeddings in result["embeddings"].items()}
+                }
+            cache.set_many(
+                {cache_keys[input_text]: result for input_text, result in new_results.items()},
+                settings.TEXTENCODER_CACHE_TIME,
+            )
+            results.update(new_results)
+
+        return [results[input_text] for input_text in input_texts]
@@ -18,23 +18,43 @@
 #     See AUTHORS file.
 #
 
+import os
 
-import laion_clap
+from batching import MicroBatcher, StandInTextEncoder
 from flask import Flask, jsonify, request
 
 app = Flask(__name__)
 
 models = ["laion_clap"]
 
-clap_model_path = "/630k-audioset-fusion-best.pt"
-model = laion_clap.CLAP_Module(enable_fusion=True)
-model.load_ckpt(clap_model_path)
+# Texts requested concurrently are encoded together, waiting at most BATCH_WINDOW_MS for other requests
+MAX_BATCH_SIZE = int(os.environ.get("TEXTENCODER_MAX_BATCH_SIZE", 64))
+BATCH_WINDOW_MS = float(os.environ.get("TEXTENCODER_BATCH_WINDOW_MS", 5))
+USE_STAND_IN_ENCODER = os.environ.get("TEXTENCODER_USE_STAND_IN_ENCODER", "False").lower() in ("true", "1", "t")
 
+if USE_STAND_IN_ENCODER:
+    model = StandInTextEncoder()
+else:
+    import laion_clap
 
-def get_clap_embeddings_from_text(text):
-    text_embed = model.get_text_embedding([text])
-    text_embed = text_embed[0, :]
-    return text_embed
+    clap_model_path = "/630k-audioset-fusion-best.pt"
+    model = laion_clap.CLAP_Module(enable_fusion=True)
+    model.load_ckpt(clap_model_path)
+
+
+def get_clap_embeddings_from_texts(texts):
+    return model.get_text_embedding(texts)
+
+
+batchers = {
+    "laion_clap": MicroBatcher(
+        get_clap_embeddings_from_texts, max_batch_size=MAX_BATCH_SIZE, max_wait=BATCH_WINDOW_MS / 1000
+    ),
+}
+
+
+def get_requested_models(requested_model):
+    return [m for m in models if m == requested_model or requested_model is None]
 
 
 @app.route("/encode_text/", methods=["GET"])
@@ -44,9 +64,31 @@ def encode_text():
 
     embeddings = {}
 
-    for model in [m for m in models if m == requested_model or requested_model is None]:
-        if model == "laion_clap":
-            embeddings[model] = get_clap_embeddings_from_text(input).tolist()
+    for model_name in get_requested_models(requested_model):
+        embeddings[model_name] = batchers[model_name].encode(input).tolist()
+
+    return jsonify(
+        {
+            "error": False,
+            "result": {
+                "embeddings": embeddings,
+            },
+        }
+    )
+
+
+@app.route("/encode_texts/", methods=["POST"])
+def encode_texts():
+    data = request.get_json(silent=True) or {}
+    inputs = data.get("inputs", None)
+    requested_model = data.get("model", None)
+    if not isinstance(inputs, list) or not all(isinstance(input, str) for input in inputs):
+        return jsonify({"error": True, "result": "inputs must be a list of strings"}), 400
+
+    embeddings = {}
+
+    for model_name in get_requested_models(requested_model):
+        embeddings[model_name] = [embedding.tolist() for embedding in batchers[model_name].encode_many(inputs)]
 
     return jsonify(
         {
@@ -59,4 +101,4 @@ def encode_text():
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5001, debug=False)  # noqa: S104
+    app.run(host="0.0.0.0", port=5001, debug=False, threaded=True)  # noqa: S104
@@ -0,0 +1,219 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+# Packed store for the outputs of the analyzers. Instead of one JSON/YAML file per sound and analyzer, the analysis
+# data of each analyzer is stored in shards of settings.ANALYSIS_STORE_SHARD_SIZE consecutive sound IDs, each shard
+# being a folder in ANALYSIS_PATH/store/<analyzer>/ with these files:
+#   - records.bin: the analysis data of each sound encoded as compact JSON, except for float arrays
+#   - vectors.bin: the float arrays of the analysis data of all sounds (float64, so values are not altered)
+#   - index.bin: fixed size entries (sound_id, offset, length) pointing to the record of each sound in records.bin
+# All files are only appended to, so storing new analysis data for a sound which already has data in the store simply
+# adds a new entry to the index which replaces the previous one (entries with negative length mark deleted data).
+# Readers memory-map records.bin and vectors.bin so that getting the data of a sound does not need to open any file,
+# and float arrays are only read if they are requested.
+
+import fcntl
+import json
+import os
+
+import numpy as np
+from django.conf import settings
+
+STORE_FOLDER_NAME = "store"
+INDEX_FILENAME = "index.bin"
+RECORDS_FILENAME = "records.bin"
+VECTORS_FILENAME = "vectors.bin"
+LOCK_FILENAME = "lock"
+
+INDEX_DTYPE = np.dtype([("sound_id", "<i8"), ("offset", "<i8"), ("length", "<i8")])
+VECTOR_DTYPE = np.dtype("<f8")
+
+
+def get_store_path(analyzer):
+    return os.path.join(settings.ANALYSIS_PATH, STORE_FOLDER_NAME, analyzer)
+
+
+def get_shard_path(analyzer, sound_id):
+    return os.path.join(get_store_path(analyzer), str(sound_id // settings.ANALYSIS_STORE_SHARD_SIZE))
+
+
+def analyzer_has_store(analyzer):
+    return os.path.isdir(get_store_path(analyzer))
+
+
+def is_vector(value):
+    """Float arrays are stored in the vectors file. Only lists in which all values are floats are considered so that
+    lists of integers or mixed types are not converted to floats when reading them back."""
+    return isinstance(value, list) and len(value) > 0 and all(type(item) is float for item in value)
+
+
+def encode_json_value(value):
+    """Converts NumPy values (which analyzers might output) to the equivalent Python types when encoding records as
+    JSON. Other values which can't be represented in JSON raise TypeError, as they would not be read back with the same
+    type."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} can't be stored in the analysis store")
+
+
+def _memmap(path, dtype):
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class ShardReader:
+    """Reads the analysis data stored in a shard. The entries of the index are loaded when the reader is created and
+    only the last entry for each sound is kept. Data added after that is not visible to the reader (see
+    get_shard_reader)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index_size = os.path.getsize(os.path.join(path, INDEX_FILENAME))
+        index = np.fromfile(
+            os.path.join(path, INDEX_FILENAME), dtype=INDEX_DTYPE, count=self.index_size // INDEX_DTYPE.itemsize
+        )
+        # np.unique returns the position of the first occurrence of each sound ID, so we reverse the index to get the
+        # position of the last entry added for each sound
+        _, last_positions = np.unique(index["sound_id"][::-1], return_index=True)
+        index = index[::-1][last_positions]
+        self.sound_ids = index["sound_id"]
+        self.offsets = index["offset"]
+        self.lengths = index["length"]
+        # Index entries are written after the data they point to, so the data files are never shorter than what the
+        # index references
+        self.records = _memmap(os.path.join(path, RECORDS_FILENAME), np.uint8)
+        self.vectors = _memmap(os.path.join(path, VECTORS_FILENAME), VECTOR_DTYPE)
+
+    def get_record(self, sound_id):
+        position = np.searchsorted(self.sound_ids, sound_id)
+        if position == len(self.sound_ids) or self.sound_ids[position] != sound_id or self.lengths[position] < 0:
+            return None
+        offset = self.offsets[position]
+        return json.loads(self.records[offset : offset + self.lengths[position]].tobytes())
+
+    def get(self, sound_id, descriptors=None, vectors_as_arrays=False):
+        """Returns the analysis data of the sound or None if the shard has no data for it. If descriptors is given,
+        only these descriptors are returned. Float arrays are returned as lists, or as read-only NumPy arrays backed by
+        the memory-mapped vectors file if vectors_as_arrays=True."""
+        record = self.get_record(sound_id)
+        if record is None:
+            return None
+        data = {}
+        for name, value in record["descriptors"].items():
+            if descriptors is None or name in descriptors:
+                data[name] = value
+        for name, (offset, length) in record["vectors"].items():
+            if descriptors is None or name in descriptors:
+                vector = self.vectors[offset : offset + length]
+                data[name] = vector if vectors_as_arrays else vector.tolist()
+        return data
+
+
+_shard_readers = {}
+
+
+def get_shard_reader(shard_path):
+    """Returns a ShardReader for the shard, or None if the shard does not exist. Readers are kept in memory and
+    re-created when the index of the shard changes size because new data was added."""
+    try:
+        index_size = os.path.getsize(os.path.join(shard_path, INDEX_FILENAME))
+    except OSError:
+        _shard_readers.pop(shard_path, None)
+        return None
+    reader = _shard_readers.get(shard_path)
+    if reader is None or reader.index_size != index_size:
+        reader = ShardReader(shard_path)
+        _shard_readers[shard_path] = reader
+    return reader
+
+
+def get_analysis_data(sound_id, analyzer, descriptors=None, vectors_as_arrays=False):
+    """Returns the analysis data of the sound for the given analyzer as stored in the analysis store, or None if the
+    store has no data for it. See ShardReader.get for the meaning of the other parameters."""
+    reader = get_shard_reader(get_shard_path(analyzer, sound_id))
+    if reader is None:
+        return None
+    return reader.get(sound_id, descriptors=descriptors, vectors_as_arrays=vectors_as_arrays)
+
+
+def add_analysis_data(analyzer, items):
+    """Appends analysis data to the store of the given analyzer. items is an iterable of (sound_id, data) tuples,
+    where data is the dictionary with the analysis output of the sound (as it would be loaded from the JSON/YAML
+    files), or None to delete the data of the sound from the store. A lock is held on each shard while writing so
+    several processes can add data at the same time. If the data of any sound can't be encoded, TypeError is raised
+    before anything is written to the store."""
+    items_per_shard = {}
+    for sound_id, data in items:
+        if data is not None:
+            # The descriptors of all items are encoded before writing so that data which can't be stored does not
+            # leave the store with part of the items written
+            descriptors = {}
+            vectors = {}
+            for name, value in data.items():
+                if isinstance(value, np.ndarray):
+                    value = value.tolist()
+                if is_vector(value):
+                    vectors[name] = np.asarray(value, dtype=VECTOR_DTYPE)
+                else:
+                    descriptors[name] = value
+            data = (json.dumps(descriptors, separators=(",", ":"), default=encode_json_value), vectors)
+        items_per_shard.setdefault(get_shard_path(analyzer, sound_id), []).append((sound_id, data))
+
+    for shard_path, shard_items in items_per_shard.items():
+        os.makedirs(shard_path, exist_ok=True)
+        with open(os.path.join(shard_path, LOCK_FILENAME), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with (
+                open(os.path.join(shard_path, RECORDS_FILENAME), "ab") as records_file,
+                open(os.path.join(shard_path, VECTORS_FILENAME), "ab") as vectors_file,
+            ):
+                records_offset = records_file.tell()
+                vectors_offset = vectors_file.tell() // VECTOR_DTYPE.itemsize
+                index_entries = []
+                for sound_id, data in shard_items:
+                    if data is None:
+                        index_entries.append((sound_id, 0, -1))
+                        continue
+                    encoded_descriptors, vectors = data
+                    vector_positions = {}
+                    for name, vector in vectors.items():
+                        vectors_file.write(vector.tobytes())
+                        vector_positions[name] = [vectors_offset, len(vector)]
+                        vectors_offset += len(vector)
+                    # Same as json.dumps({"descriptors": descriptors, "vectors": vector_positions}) in compact form
+                    encoded_record = (
+                        f'{{"descriptors":{encoded_descriptors},'
+                        f'"vectors":{json.dumps(vector_positions, separators=(",", ":"))}}}'
+                    ).encode()
+                    records_file.write(encoded_record)
+                    index_entries.append((sound_id, records_offset, len(encoded_record)))
+                    records_offset += len(encoded_record)
+            # Data files are closed (and therefore flushed) before writing the index entries pointing to them
+            with open(os.path.join(shard_path, INDEX_FILENAME), "ab") as index_file:
+                index_file.write(np.array(index_entries, dtype=INDEX_DTYPE).tobytes())
+
+
+def delete_analysis_data(sound_id, analyzer):
+    """Marks the analysis data of the sound as deleted if the analyzer has a store"""
+    if analyzer_has_store(analyzer):
+        add_analysis_data(analyzer, [(sound_id, None)])
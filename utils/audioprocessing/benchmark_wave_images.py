@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+# Compares the time it takes to generate display images with create_wave_images (single pass) and
+# create_wave_images_per_column (original renderer) for synthetic files of different durations. The single pass
+# renderer is also timed sharing one analysis between all display sizes, as done in FreesoundAudioProcessor.process.
+# Run from the root of the repository with:
+#   python -m utils.audioprocessing.benchmark_wave_images --durations 60 3600
+
+import argparse
+import os
+import time
+from tempfile import TemporaryDirectory
+
+import numpy
+import pysndfile
+
+from utils.audioprocessing.color_schemes import BEASTWHOOSH_COLOR_SCHEME
+from utils.audioprocessing.processing import (
+    AudioProcessor,
+    SpectrogramImage,
+    WaveformImage,
+    WaveImagesAnalysis,
+    create_wave_images,
+)
+
+# Display sizes generated by FreesoundAudioProcessor.process
+DISPLAY_SIZES = [(195, 101), (780, 301)]
+
+
+def create_wave_images_per_column(
+    input_filename,
+    output_filename_w,
+    output_filename_s,
+    image_width,
+    image_height,
+    fft_size,
+    progress_callback=None,
+    color_scheme=None,
+    use_transparent_background=False,
+):
+    """
+    Original implementation of create_wave_images which seeks and reads the audio file for every pixel column using
+    AudioProcessor. Much slower for long files, used as a reference to compare the output and speed of
+    create_wave_images.
+    :param input_filename: input audio filename (must be PCM)
+    :param output_filename_w: output filename for waveform image (must end in .png)
+    :param output_filename_s: output filename for spectrogram image (must end in .jpg)
+    :param image_width: width of both spectrogram and waveform images
+    :param image_height: height of both spectrogram and waveform images
+    :param fft_size: size of the FFT computed for the spectrogram image
+    :param progress_callback: function to iteratively call while images are being created. Will be called every 1%,
+                                with parameters (current_position, width)
+    :param color_scheme: color scheme to use for the generated images (defaults to Freesound2 color scheme)
+    """
+    processor = AudioProcessor(input_filename, fft_size, numpy.hanning)
+    samples_per_pixel = processor.nframes / float(image_width)
+
+    waveform = WaveformImage(image_width, image_height, color_scheme)
+    spectrogram = SpectrogramImage(image_width, image_height, fft_size, color_scheme)
+
+    for x in range(image_width):
+        if progress_callback and x % (image_width // 100) == 0:
+            progress_callback(x, image_width)
+
+        seek_point = int(x * samples_per_pixel)
+        next_seek_point = int((x + 1) * samples_per_pixel)
+
+        (spectral_centroid, db_spectrum) = processor.spectral_centroid(seek_point)
+        peaks = processor.peaks(seek_point, next_seek_point)
+
+        waveform.draw_peaks(x, peaks, spectral_centroid)
+        spectrogram.draw_spectrum(x, db_spectrum)
+
+    if progress_callback:
+        progress_callback(image_width, image_width)
+
+    waveform.save(output_filename_w)
+    spectrogram.save(output_filename_s)
+
+
+def write_test_file(path, duration, samplerate=44100, chunk_size=2**20):
+    """write a stereo 16 bit wav file (the format produced by stereofy) with noise modulated by a few sines"""
+    audio_file = pysndfile.PySndfile(path, "w", pysndfile.construct_format("wav", "pcm16"), 2, samplerate)
+    rng = numpy.random.default_rng(0)
+    n_frames = int(duration * samplerate)
+    for start in range(0, n_frames, chunk_size):
+        t = numpy.arange(start, min(start + chunk_size, n_frames)) / samplerate
+        envelope = 0.5 + 0.5 * numpy.sin(2 * numpy.pi * 0.1 * t)
+        signal = envelope * (0.5 * numpy.sin(2 * numpy.pi * 440 * t) + 0.3 * rng.uniform(-1, 1, len(t)))
+        audio_file.write_frames(numpy.stack((signal, signal), axis=1))
+    audio_file.close()
+
+
+def time_renderer(renderer, input_filename, output_folder, fft_size, shared_analysis=False):
+    start = time.monotonic()
+    kwargs = {}
+    if shared_analysis:
+        kwargs["analysis"] = WaveImagesAnalysis(input_filename, max(width for width, _ in DISPLAY_SIZES), fft_size)
+    for width, height in DISPLAY_SIZES:
+        renderer(
+            input_filename,
+            os.path.join(output_folder, f"wave_{width}.png"),
+            os.path.join(output_folder, f"spectral_{width}.jpg"),
+            width,
+            height,
+            fft_size,
+            color_scheme=BEASTWHOOSH_COLOR_SCHEME,
+            **kwargs,
+        )
+    return time.monotonic() - start
+
+
+def main(args):
+    with TemporaryDirectory() as tmp_directory:
+        for duration in args.durations:
+            input_filename = os.path.join(tmp_directory, f"test_{duration}.wav")
+            write_test_file(input_filename, duration)
+            print(f"{duration} seconds file ({os.path.getsize(input_filename) / 1e6:.1f} MB)")
+
+            single_pass_time = time_renderer(create_wave_images, input_filename, tmp_directory, args.fft_size)
+            print(f"\tsingle pass renderer: {single_pass_time:.2f}s")
+            shared_analysis_time = time_renderer(
+                create_wave_images, input_filename, tmp_directory, args.fft_size, shared_analysis=True
+            )
+            print(f"\tsingle pass renderer, one analysis for all sizes: {shared_analysis_time:.2f}s")
+            if args.skip_per_column_above is not None and duration > args.skip_per_column_above:
+                print("\tper column renderer: skipped")
+            else:
+                per_column_time = time_renderer(
+                    create_wave_images_per_column, input_filename, tmp_directory, args.fft_size
+                )
+                print(f"\tper column renderer: {per_column_time:.2f}s")
+                print(f"\tspeedup: {per_column_time / single_pass_time:.1f}x")
+                print(f"\tspeedup (one analysis for all sizes): {per_column_time / shared_analysis_time:.1f}x")
+            os.remove(input_filename)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-d", "--durations", type=float, nargs="+", default=[60, 3600], help="durations of the test files in seconds"
+    )
+    parser.add_argument(
+        "-f", "--fft", type=int, default=2048, dest="fft_size", help="fft size, power of 2 for increased performance"
+    )
+    parser.add_argument(
+        "--skip-per-column-above",
+        type=float,
+        default=None,
+        help="don't run the per column renderer for files longer than this number of seconds",
+    )
+
+    args = parser.parse_args()
+    main(args)
@@ -25,6 +25,8 @@ import logging
 import os
 import signal
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from tempfile import TemporaryDirectory
 
 from django.apps import apps
@@ -40,6 +42,15 @@ from . import color_schemes
 console_logger = logging.getLogger("console")
 
 
+def encode_preview(encoder, input_filename, output_filename, quality):
+    """
+    Runs one of the preview encoding functions (convert_to_mp3/convert_to_ogg) and returns the wall time it took.
+    """
+    start = time.monotonic()
+    encoder(input_filename, output_filename, quality)
+    return time.monotonic() - start
+
+
 class WorkerException(Exception):
     """
     Exception raised by the worker if:
@@ -188,6 +199,48 @@ class FreesoundAudioProcessor(FreesoundAudioProcessorBase):
         self.sound.set_processing_ongoing_state("FI")
         self.sound.change_processing_state("FA", processing_log=self.work_log)
 
+    def start_previews_encoding(self, executor, input_filename):
+        """
+        Submits the encoding of all MP3 and OGG previews of the sound to the given executor so that encoders run
+        concurrently (and while display images are generated). Returns a list of (format, path, future) tuples to be
+        passed to finish_previews_encoding.
+        """
+        previews = [
+            ("mp3", audioprocessing.convert_to_mp3, "preview.LQ.mp3.path", settings.MP3_LQ_PREVIEW_QUALITY),
+            ("mp3", audioprocessing.convert_to_mp3, "preview.HQ.mp3.path", settings.MP3_HQ_PREVIEW_QUALITY),
+            ("ogg", audioprocessing.convert_to_ogg, "preview.LQ.ogg.path", settings.OGG_LQ_PREVIEW_QUALITY),
+            ("ogg", audioprocessing.convert_to_ogg, "preview.HQ.ogg.path", settings.OGG_HQ_PREVIEW_QUALITY),
+        ]
+        jobs = []
+        for preview_format, encoder, location, quality in previews:
+            path = self.sound.locations(location)
+            jobs.append((preview_format, path, executor.submit(encode_preview, encoder, input_filename, path, quality)))
+        return jobs
+
+    def finish_previews_encoding(self, jobs):
+        """
+        Waits for the preview encoding jobs started with start_previews_encoding and logs the wall time of each
+        encoder. Returns False (after setting the processing failure) if any of the encoders failed.
+        """
+        encoder_executables = {"mp3": "lame", "ogg": "oggenc"}
+        for preview_format, path, future in jobs:
+            try:
+                encoding_time = future.result()
+            except OSError as e:
+                self.set_failure(
+                    f"conversion to {preview_format} (preview) has failed, make sure that "
+                    f"{encoder_executables[preview_format]} executable exists: {e}"
+                )
+                return False
+            except AudioProcessingException as e:
+                self.set_failure(f"conversion to {preview_format} (preview) has failed", e)
+                return False
+            except Exception as e:
+                self.set_failure(f"unhandled exception generating {preview_format.upper()} previews", e)
+                return False
+            self.log_info(f"created {preview_format}: {path} (encoding took {encoding_time:.2f}s)")
+        return True
+
     def process(self, skip_previews=False, skip_displays=False, update_sound_processing_state_in_db=True):
         with TemporaryDirectory(
             prefix=f"processing_{self.sound.id}_", dir=settings.PROCESSING_TEMP_DIR
@@ -270,96 +323,42 @@ class FreesoundAudioProcessor(FreesoundAudioProcessorBase):
                 self.set_failure("failed writing audio info fields to db", e)
                 return False
 
-            # Generate MP3 and OGG previews
-            if not skip_previews:
-                # Create directory to store previews (if it does not exist)
-                # Same directory is used for all MP3 and OGG previews of a given sound so we only need to run this once
-                try:
-                    os.makedirs(os.path.dirname(self.sound.locations("preview.LQ.mp3.path")), exist_ok=True)
-                except OSError:
-                    self.set_failure("could not create directory for previews")
-                    return False
-
-                # Generate MP3 previews
-                for mp3_path, quality in [
-                    (self.sound.locations("preview.LQ.mp3.path"), settings.MP3_LQ_PREVIEW_QUALITY),
-                    (self.sound.locations("preview.HQ.mp3.path"), settings.MP3_HQ_PREVIEW_QUALITY),
-                ]:
+            # Start generating MP3 and OGG previews. Encoders run concurrently in a bounded pool of threads (each one
+            # just waits for a lame/oggenc subprocess) while display images are generated below
+            preview_jobs = []
+            previews_executor = ThreadPoolExecutor(max_workers=settings.PROCESSING_PREVIEW_ENCODING_WORKERS)
+            try:
+                if not skip_previews:
+                    # Create directory to store previews (if it does not exist)
+                    # Same directory is used for all MP3 and OGG previews of a given sound so we only need to run
+                    # this once
                     try:
-                        audioprocessing.convert_to_mp3(tmp_wavefile2, mp3_path, quality)
-                    except OSError as e:
-                        self.set_failure(
-                            "conversion to mp3 (preview) has failed, make sure that lame executable exists: %s" % e
-                        )
+                        os.makedirs(os.path.dirname(self.sound.locations("preview.LQ.mp3.path")), exist_ok=True)
+                    except OSError:
+                        self.set_failure("could not create directory for previews")
                         return False
 
-                    except AudioProcessingException as e:
-                        self.set_failure("conversion to mp3 (preview) has failed", e)
-                        return False
-                    except Exception as e:
-                        self.set_failure("unhandled exception generating MP3 previews", e)
-                        return False
-                    self.log_info("created mp3: " + mp3_path)
+                    preview_jobs = self.start_previews_encoding(previews_executor, tmp_wavefile2)
 
-                # Generate OGG previews
-                for ogg_path, quality in [
-                    (self.sound.locations("preview.LQ.ogg.path"), settings.OGG_LQ_PREVIEW_QUALITY),
-                    (self.sound.locations("preview.HQ.ogg.path"), settings.OGG_HQ_PREVIEW_QUALITY),
-                ]:
+                # Generate display images for different sizes and colour scheme front-ends
+                if not skip_displays:
+                    # Create directory to store display images (if it does not exist)
+                    # Same directory is used for all displays of a given sound so we only need to run this once
                     try:
-                        audioprocessing.convert_to_ogg(tmp_wavefile2, ogg_path, quality)
-                    except OSError as e:
-                        self.set_failure(
-                            "conversion to ogg (preview) has failed, make sure that oggenc executable exists: %s" % e
-                        )
-                        return False
-                    except AudioProcessingException as e:
-                        self.set_failure("conversion to ogg (preview) has failed", e)
-                        return False
-                    except Exception as e:
-                        self.set_failure("unhandled exception generating OGG previews", e)
+                        os.makedirs(os.path.dirname(self.sound.locations("display.wave.M.path")), exist_ok=True)
+                    except OSError:
+                        self.set_failure("could not create directory for displays")
                         return False
-                    self.log_info("created ogg: " + ogg_path)
-
-            # Generate display images for different sizes and colour scheme front-ends
-            if not skip_displays:
-                # Create directory to store display images (if it does not exist)
-                # Same directory is used for all displays of a given sound so we only need to run this once
-                try:
-                    os.makedirs(os.path.dirname(self.sound.locations("display.wave.M.path")), exist_ok=True)
-                except OSError:
-                    self.set_failure("could not create directory for displays")
-                    return False
 
-                # Generate display images, M and L sizes for NG and BW front-ends
-                for width, height, color_scheme, waveform_path, spectral_path in [
-                    (
-                        195,
-                        101,
-                        color_schemes.BEASTWHOOSH_COLOR_SCHEME,
-                        self.sound.locations("display.wave.M.path"),
-                        self.sound.locations("display.spectral.M.path"),
-                    ),
-                    (
-                        780,
-                        301,
-                        color_schemes.BEASTWHOOSH_COLOR_SCHEME,
-                        self.sound.locations("display.wave.L.path"),
-                        self.sound.locations("display.spectral.L.path"),
-                    ),
-                ]:
+                    # Generate display images for all configured sizes. The audio file is analyzed only once (for the
+                    # largest width) and the images of each size are drawn from that analysis
+                    fft_size = settings.PROCESSING_DISPLAY_FFT_SIZE
                     try:
-                        fft_size = 2048
-                        audioprocessing.create_wave_images(
+                        analysis = audioprocessing.WaveImagesAnalysis(
                             tmp_wavefile2,
-                            waveform_path,
-                            spectral_path,
-                            width,
-                            height,
+                            max(width for width, _ in settings.PROCESSING_DISPLAY_SIZES.values()),
                             fft_size,
-                            color_scheme=color_scheme,
                         )
-                        self.log_info(f"created wave and spectrogram images: {waveform_path}, {spectral_path}")
                     except AudioProcessingException as e:
                         self.set_failure("creation of display images has failed", e)
                         return False
@@ -367,6 +366,35 @@ class FreesoundAudioProcessor(FreesoundAudioProcessorBase):
                         self.set_failure("unhandled exception while generating displays", e)
                         return False
 
+                    for size_name, (width, height) in settings.PROCESSING_DISPLAY_SIZES.items():
+                        waveform_path = self.sound.locations(f"display.wave.{size_name}.path")
+                        spectral_path = self.sound.locations(f"display.spectral.{size_name}.path")
+                        try:
+                            audioprocessing.create_wave_images(
+                                tmp_wavefile2,
+                                waveform_path,
+                                spectral_path,
+                                width,
+                                height,
+                                fft_size,
+                                color_scheme=color_schemes.BEASTWHOOSH_COLOR_SCHEME,
+                                analysis=analysis,
+                            )
+                            self.log_info(f"created wave and spectrogram images: {waveform_path}, {spectral_path}")
+                        except AudioProcessingException as e:
+                            self.set_failure("creation of display images has failed", e)
+                            return False
+                        except Exception as e:
+                            self.set_failure("unhandled exception while generating displays", e)
+                            return False
+
+                # Wait for the previews to be encoded
+                if not skip_previews and not self.finish_previews_encoding(preview_jobs):
+                    return False
+            finally:
+                # If processing failed before all previews were encoded, pending encoders are not started
+                previews_executor.shutdown(wait=True, cancel_futures=True)
+
         # Change processing state and processing ongoing state in Sound model
         if update_sound_processing_state_in_db:
             self.sound.set_processing_ongoing_state("FI")
@@ -20,6 +20,7 @@
 #     See AUTHORS file.
 #
 
+import copy
 import math
 import os
 import re
@@ -222,6 +223,227 @@ class AudioProcessor:
         return (min_value, max_value) if min_index < max_index else (max_value, min_value)
 
 
+# Number of frames read from disk at once by WaveImagesAnalysis. Larger chunks are faster but take more memory (each
+# chunk is converted to a float64 mono array).
+WAVE_IMAGES_READ_CHUNK_SIZE = 2**18
+
+
+class WaveImagesAnalysis:
+    """
+    Single pass alternative to AudioProcessor. Reads the PCM file once, in large chunks, and computes all the data
+    needed to draw waveform and spectrogram images of a given width: the min/max peaks of the samples of each pixel
+    column (and the position where they were found) and the magnitude spectrum of an FFT window centered at the start
+    of each column. Spectra for all columns of a chunk are computed at once with a 2-D rfft over a matrix of frames.
+
+    The maximum level of the file is tracked while reading so that no separate pass is needed to normalize spectra.
+    Results are equivalent to those computed with AudioProcessor.spectral_centroid and AudioProcessor.peaks for each
+    column, with the exception of the order of the peaks of columns longer than AudioProcessor.peaks block size, which
+    AudioProcessor does not compute correctly.
+    """
+
+    def __init__(
+        self,
+        input_filename,
+        image_width,
+        fft_size,
+        window_function=numpy.hanning,
+        chunk_size=WAVE_IMAGES_READ_CHUNK_SIZE,
+        progress_callback=None,
+    ):
+        self.image_width = image_width
+        self.fft_size = fft_size
+        self.window = window_function(fft_size)
+        self.lower = 100
+        self.higher = 22050
+        self.max_level = 0.0
+
+        self.min_values = numpy.ones(image_width)
+        self.max_values = -numpy.ones(image_width)
+        self.min_positions = numpy.full(image_width, -1, dtype=numpy.int64)
+        self.max_positions = numpy.full(image_width, -1, dtype=numpy.int64)
+        self.magnitude_spectra = numpy.zeros((image_width, fft_size // 2 + 1))
+
+        audio_file = pysndfile.PySndfile(input_filename, "r")
+        try:
+            self.nframes = audio_file.frames()
+            self.samplerate = audio_file.samplerate()
+            self._analyze(audio_file, max(chunk_size, fft_size), progress_callback)
+        finally:
+            audio_file.close()
+
+    def _column_bounds(self, image_width):
+        samples_per_pixel = self.nframes / float(image_width)
+        column_bounds = (numpy.arange(image_width + 1) * samples_per_pixel).astype(numpy.int64)
+        column_bounds[-1] = max(column_bounds[-1], self.nframes)
+        return column_bounds
+
+    def _analyze(self, audio_file, chunk_size, progress_callback):
+        # Each column x covers the samples in [column_bounds[x], column_bounds[x + 1]) and its FFT window is centered
+        # at column_bounds[x]
+        column_bounds = self._column_bounds(self.image_width)
+
+        # FFT windows are taken from a virtual signal padded with fft_size // 2 zeros at the start and fft_size zeros at
+        # the end. In padded coordinates, the window of column x starts at column_bounds[x].
+        half = self.fft_size // 2
+        buffer = numpy.zeros(half)
+        buffer_start = 0  # Position of buffer[0] in padded coordinates
+        next_spectrum_column = 0
+        read_broken = False
+        # 16 bit files (such as the ones generated by stereofy) are much faster to read as integers, dividing by 32768
+        # gives the same values that libsndfile returns when reading them as normalized floats
+        read_as_int16 = audio_file.encoding_str() == "pcm16"
+
+        position = 0
+        while position < self.nframes:
+            to_read = min(chunk_size, self.nframes - position)
+            samples = None
+            if not read_broken:
+                try:
+                    samples = audio_file.read_frames(to_read, dtype=numpy.int16 if read_as_int16 else numpy.float64)
+                except RuntimeError:
+                    # this can happen with a broken header, consider the rest of the file silent
+                    read_broken = True
+            if samples is None:
+                samples = numpy.zeros(to_read)
+            else:
+                if audio_file.channels() > 1:
+                    # convert to mono by selecting left channel only
+                    samples = samples[:, 0]
+                if read_as_int16:
+                    samples = samples / 32768.0
+
+            if len(samples):
+                self.max_level = max(self.max_level, float(numpy.abs(samples).max()))
+            self._update_peaks(samples, position, column_bounds)
+
+            position += to_read
+            buffer = numpy.concatenate((buffer, samples))
+            if position >= self.nframes:
+                buffer = numpy.concatenate((buffer, numpy.zeros(self.fft_size)))
+            next_spectrum_column = self._update_spectra(buffer, buffer_start, next_spectrum_column, column_bounds)
+
+            # Only keep the part of the buffer which is still needed for the windows of the remaining columns
+            if next_spectrum_column < self.image_width:
+                keep_from = min(column_bounds[next_spectrum_column] - buffer_start, len(buffer))
+                buffer = buffer[keep_from:]
+                buffer_start += keep_from
+
+            if progress_callback:
+                progress_callback(next_spectrum_column, self.image_width)
+
+        if next_spectrum_column < self.image_width:
+            # Empty file, all windows are silent
+            buffer = numpy.concatenate((buffer, numpy.zeros(self.fft_size)))
+            self._update_spectra(buffer, buffer_start, next_spectrum_column, column_bounds)
+
+    def _update_peaks(self, samples, position, column_bounds):
+        """update per-column min/max peaks with the samples of a chunk starting at the given position"""
+        chunk_end = position + len(samples)
+        if chunk_end == position:
+            return
+
+        starts = column_bounds[:-1]
+        ends = column_bounds[1:]
+        # Columns with no samples (when there are less frames than pixels) take the value of the sample at their start,
+        # so they belong to the chunk which contains that sample
+        columns = numpy.flatnonzero(
+            (starts < chunk_end) & ((ends > position) | ((starts == ends) & (starts >= position)))
+        )
+        for column in columns:
+            start = max(starts[column], position) - position
+            end = max(min(ends[column], chunk_end) - position, start + 1)
+            min_index = start + numpy.argmin(samples[start:end])
+            max_index = start + numpy.argmax(samples[start:end])
+            if samples[min_index] < self.min_values[column]:
+                self.min_values[column] = samples[min_index]
+                self.min_positions[column] = position + min_index
+            if samples[max_index] > self.max_values[column]:
+                self.max_values[column] = samples[max_index]
+                self.max_positions[column] = position + max_index
+
+    def _update_spectra(self, buffer, buffer_start, first_column, column_bounds):
+        """compute the spectra of all pending columns whose FFT window is fully contained in the buffer"""
+        buffer_end = buffer_start + len(buffer)
+        last_column = int(numpy.searchsorted(column_bounds[: self.image_width], buffer_end - self.fft_size, "right"))
+        if last_column <= first_column:
+            return first_column
+
+        frames = numpy.lib.stride_tricks.sliding_window_view(buffer, self.fft_size)
+        frames = frames[column_bounds[first_column:last_column] - buffer_start] * self.window
+        self.magnitude_spectra[first_column:last_column] = numpy.abs(numpy.fft.rfft(frames, axis=1))
+        return last_column
+
+    def downsampled(self, image_width):
+        """
+        Returns a new WaveImagesAnalysis for a smaller image width computed from the data of this one, without reading
+        the audio file again. Each column of the new analysis aggregates the peaks of the columns of this analysis
+        that it covers and takes the spectrum of the first of them. Results are the same as analyzing the file with the
+        new width if it divides the width of this analysis (e.g. 195 and 780), otherwise the nearest columns are used.
+        """
+        if image_width > self.image_width:
+            raise AudioProcessingException(
+                f"can't downsample wave images analysis of width {self.image_width} to width {image_width}"
+            )
+        if image_width == self.image_width:
+            return self
+
+        # For each new column, first column of this analysis which starts at (or after) the new column start
+        first_columns = numpy.searchsorted(self._column_bounds(self.image_width)[:-1], self._column_bounds(image_width))
+        first_columns[:-1] = numpy.minimum(first_columns[:-1], self.image_width - 1)
+        first_columns[-1] = self.image_width
+
+        analysis = copy.copy(self)
+        analysis.image_width = image_width
+        analysis.min_values = numpy.empty(image_width)
+        analysis.max_values = numpy.empty(image_width)
+        analysis.min_positions = numpy.empty(image_width, dtype=numpy.int64)
+        analysis.max_positions = numpy.empty(image_width, dtype=numpy.int64)
+        for x in range(image_width):
+            start = first_columns[x]
+            end = max(first_columns[x + 1], start + 1)
+            min_column = start + numpy.argmin(self.min_values[start:end])
+            max_column = start + numpy.argmax(self.max_values[start:end])
+            analysis.min_values[x] = self.min_values[min_column]
+            analysis.min_positions[x] = self.min_positions[min_column]
+            analysis.max_values[x] = self.max_values[max_column]
+            analysis.max_positions[x] = self.max_positions[max_column]
+        analysis.magnitude_spectra = self.magnitude_spectra[first_columns[:-1]]
+        return analysis
+
+    def peaks(self):
+        """returns an array of shape (image_width, 2) with the min and max peaks of each column, in the order they
+        were found (same convention as AudioProcessor.peaks)"""
+        min_first = self.min_positions < self.max_positions
+        return numpy.where(
+            min_first[:, None],
+            numpy.stack((self.min_values, self.max_values), axis=1),
+            numpy.stack((self.max_values, self.min_values), axis=1),
+        )
+
+    def spectral_centroids_and_db_spectra(self, spec_range=110.0):
+        """returns the normalized spectral centroid of each column and the db spectra scaled to [0..1] (same
+        computation as AudioProcessor.spectral_centroid)"""
+        max_fft = numpy.abs(numpy.fft.rfft(numpy.ones(self.fft_size) * self.window)).max()
+        scale = (1.0 / self.max_level) / max_fft if self.max_level > 0 else 1
+        spectra = scale * self.magnitude_spectra
+        length = numpy.float64(spectra.shape[1])
+
+        db_spectra = (20 * (numpy.log10(spectra + 1e-60))).clip(-spec_range, 0.0) + spec_range
+        db_spectra = db_spectra / spec_range
+
+        energy = spectra.sum(axis=1)
+        has_energy = energy > 1e-60
+        spectral_centroids = numpy.zeros(self.image_width)
+        centroids_hz = (
+            (spectra[has_energy] @ numpy.arange(length)) / (energy[has_energy] * (length - 1)) * self.samplerate * 0.5
+        )
+        spectral_centroids[has_energy] = (
+            numpy.log10(centroids_hz.clip(self.lower, self.higher)) - math.log10(self.lower)
+        ) / (math.log10(self.higher) - math.log10(self.lower))
+
+        return spectral_centroids, db_spectra
+
+
 def interpolate_colors(colors, flat=False, num_colors=256):
     """given a list of colors, create a larger list of colors interpolating
     the first one. If flatten is True, a list of numbers will be returned. If
@@ -303,6 +525,12 @@ class WaveformImage:
 
         self.draw_anti_aliased_pixels(x, y1, y2, line_color)
 
+    def draw_waveform(self, peaks, spectral_centroids):
+        """draw the peaks of all columns at once, peaks is an array of shape (image_width, 2) and spectral_centroids
+        an array of shape (image_width, )"""
+        for x in range(self.image_width):
+            self.draw_peaks(x, peaks[x], spectral_centroids[x])
+
     def draw_anti_aliased_pixels(self, x, y1, y2, color):
         """vertical anti-aliasing at y1 and y2"""
 
@@ -383,6 +611,8 @@ class SpectrogramImage:
         # a lot slower than using image.putadata and then rotating the image
         # so we store all the pixels in an array and then create the image when saving
         self.pixels = []
+        # when drawing all spectra at once pixels are stored in an (image_width, image_height, 3) array instead
+        self.pixel_array = None
 
     def draw_spectrum(self, x, spectrum):
         # for all frequencies, draw the pixels
@@ -393,8 +623,22 @@ class SpectrogramImage:
         for y in range(len(self.y_to_bin), self.image_height):
             self.pixels.append(self.palette[0])
 
+    def draw_spectra(self, db_spectra):
+        """draw the spectra of all columns at once, db_spectra is an array of shape (image_width, fft_size // 2 + 1)
+        with values in [0..1]. Produces the same pixels as calling draw_spectrum for each column."""
+        indexes = numpy.array([index for index, _ in self.y_to_bin], dtype=numpy.int64)
+        alphas = numpy.array([alpha for _, alpha in self.y_to_bin])
+        color_indexes = numpy.zeros((len(db_spectra), self.image_height), dtype=numpy.int64)
+        color_indexes[:, : len(indexes)] = (
+            (255.0 - alphas) * db_spectra[:, indexes] + alphas * db_spectra[:, indexes + 1]
+        ).astype(numpy.int64)
+        self.pixel_array = numpy.array(self.palette, dtype=numpy.uint8)[color_indexes]
+
     def save(self, filename, quality=80):
-        self.image.putdata(self.pixels)
+        if self.pixel_array is not None:
+            self.image = Image.fromarray(self.pixel_array, "RGB")
+        else:
+            self.image.putdata(self.pixels)
         self.image.transpose(Image.ROTATE_90).save(filename, quality=quality)
 
 
@@ -408,37 +652,41 @@ def create_wave_images(
     progress_callback=None,
     color_scheme=None,
     use_transparent_background=False,
+    analysis=None,
 ):
     """
-    Utility function for creating both wavefile and spectrum images from an audio input file.
+    Utility function for creating both wavefile and spectrum images from an audio input file. The audio file is read
+    only once (see WaveImagesAnalysis) and images are drawn from the computed peaks and spectra. To create images of
+    several sizes for the same file, an analysis computed for the largest width can be passed so that the audio file
+    is not read (and FFTs not computed) again for every size.
     :param input_filename: input audio filename (must be PCM)
     :param output_filename_w: output filename for waveform image (must end in .png)
     :param output_filename_s: output filename for spectrogram image (must end in .jpg)
     :param image_width: width of both spectrogram and waveform images
     :param image_height: height of both spectrogram and waveform images
     :param fft_size: size of the FFT computed for the spectrogram image
-    :param progress_callback: function to iteratively call while images are being created. Will be called every 1%,
-                                with parameters (current_position, width)
+    :param progress_callback: function to iteratively call while images are being created. Will be called after
+                                each chunk of audio is analyzed, with parameters (current_position, width)
     :param color_scheme: color scheme to use for the generated images (defaults to Freesound2 color scheme)
+    :param analysis: WaveImagesAnalysis of input_filename with the same fft_size and a width equal or larger than
+                                image_width. If not provided, the file will be analyzed.
     """
-    processor = AudioProcessor(input_filename, fft_size, numpy.hanning)
-    samples_per_pixel = processor.nframes / float(image_width)
+    if analysis is None:
+        analysis = WaveImagesAnalysis(
+            input_filename, image_width, fft_size, numpy.hanning, progress_callback=progress_callback
+        )
+    elif analysis.fft_size != fft_size:
+        raise AudioProcessingException(
+            f"wave images analysis was computed with fft size {analysis.fft_size} but {fft_size} was requested"
+        )
+    else:
+        analysis = analysis.downsampled(image_width)
+    spectral_centroids, db_spectra = analysis.spectral_centroids_and_db_spectra()
 
     waveform = WaveformImage(image_width, image_height, color_scheme)
+    waveform.draw_waveform(analysis.peaks(), spectral_centroids)
     spectrogram = SpectrogramImage(image_width, image_height, fft_size, color_scheme)
-
-    for x in range(image_width):
-        if progress_callback and x % (image_width // 100) == 0:
-            progress_callback(x, image_width)
-
-        seek_point = int(x * samples_per_pixel)
-        next_seek_point = int((x + 1) * samples_per_pixel)
-
-        (spectral_centroid, db_spectrum) = processor.spectral_centroid(seek_point)
-        peaks = processor.peaks(seek_point, next_seek_point)
-
-        waveform.draw_peaks(x, peaks, spectral_centroid)
-        spectrogram.draw_spectrum(x, db_spectrum)
+    spectrogram.draw_spectra(db_spectra)
 
     if progress_callback:
         progress_callback(image_width, image_width)
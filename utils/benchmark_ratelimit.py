@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+# Compares the time it takes to check whether an IP is blocked with BlockedIPsMatcher and with a linear scan of
+# ipaddress.ip_network objects (as ip_is_blocked used to do) for a list of random blocked IPv4 and IPv6 ranges.
+# Run from the root of the repository with:
+#   python -m utils.benchmark_ratelimit --num-blocked-ranges 10000
+
+import argparse
+import ipaddress
+import random
+import time
+
+from utils.ratelimit import BlockedIPsMatcher
+
+
+def random_ranges(num_ranges, rng):
+    ranges = []
+    for _ in range(num_ranges):
+        if rng.random() < 0.8:
+            prefix_length = rng.choice([16, 24, 28, 32])
+            ip = ipaddress.IPv4Address(rng.getrandbits(32))
+        else:
+            prefix_length = rng.choice([32, 48, 64, 128])
+            ip = ipaddress.IPv6Address(rng.getrandbits(128))
+        ranges.append(str(ipaddress.ip_network(f"{ip}/{prefix_length}", strict=False)))
+    return ranges
+
+
+def random_ips(num_ips, rng):
+    return [
+        str(
+            ipaddress.IPv4Address(rng.getrandbits(32))
+            if rng.random() < 0.8
+            else ipaddress.IPv6Address(rng.getrandbits(128))
+        )
+        for _ in range(num_ips)
+    ]
+
+
+def linear_scan_is_blocked(ips_to_block, ip):
+    for ip_to_block in ips_to_block:
+        if ipaddress.ip_network(str(ip_to_block)).overlaps(ipaddress.ip_network(str(ip))):
+            return True
+    return False
+
+
+def main(args):
+    rng = random.Random(0)  # noqa: S311
+    ips_to_block = random_ranges(args.num_blocked_ranges, rng)
+    # Include some blocked IPs so that both outcomes are timed
+    ips = random_ips(args.num_lookups, rng) + ips_to_block[: args.num_lookups // 10]
+    print(f"{args.num_blocked_ranges} blocked ranges, {len(ips)} lookups")
+
+    start = time.monotonic()
+    matcher = BlockedIPsMatcher(ips_to_block)
+    print(f"\tcompile matcher: {(time.monotonic() - start) * 1000:.1f}ms ({len(matcher)} merged ranges)")
+    start = time.monotonic()
+    matcher_results = [matcher.is_blocked(ip) for ip in ips]
+    matcher_time = (time.monotonic() - start) / len(ips)
+    print(f"\tmatcher: {matcher_time * 1e6:.2f}us per lookup")
+
+    linear_scan_ips = ips[: args.num_linear_scan_lookups]
+    start = time.monotonic()
+    linear_scan_results = [linear_scan_is_blocked(ips_to_block, ip) for ip in linear_scan_ips]
+    linear_scan_time = (time.monotonic() - start) / len(linear_scan_ips)
+    print(f"\tlinear scan: {linear_scan_time * 1e6:.2f}us per lookup ({len(linear_scan_ips)} lookups)")
+    print(f"\tspeedup: {linear_scan_time / matcher_time:.0f}x")
+    assert linear_scan_results == matcher_results[: len(linear_scan_ips)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--num-blocked-ranges", type=int, default=10000, help="number of blocked IP ranges")
+    parser.add_argument("-l", "--num-lookups", type=int, default=100000, help="number of lookups with the matcher")
+    parser.add_argument(
+        "--num-linear-scan-lookups",
+        type=int,
+        default=100,
+        help="number of lookups with the linear scan (which is much slower)",
+    )
+    main(parser.parse_args())
@@ -18,11 +18,24 @@
 #     See AUTHORS file.
 #
 
+import time
+
 from django.conf import settings
 from django.contrib.auth.models import Group
-from django.core.cache import cache
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.redis import RedisCache
 from django.core.cache.utils import make_template_fragment_key
 
+# Template fragments of sounds, users and packs are cached with keys which include a generation number of the object
+# they belong to, e.g.:
+#   {% template_cache_generation "sound" sound.id as template_cache_generation %}
+#   {% cache 3600 bw_sound_page sound.id template_cache_generation %}
+# To invalidate all the fragments of an object, its generation is incremented so that new keys are used. Old fragments
+# are not deleted but expire with their timeout. Missing generations (never set or evicted from the cache) are
+# initialised with the current timestamp so that a generation number is never reused for different contents of an
+# object.
+TEMPLATE_CACHE_OBJECT_TYPES = ["sound", "user", "pack"]
+
 
 def get_template_cache_key(fragment_name, *variables):
     return make_template_fragment_key(fragment_name, variables)
@@ -33,22 +46,111 @@ def invalidate_template_cache(fragment_name, *variables):
     cache.delete(cache_key)
 
 
+def get_template_cache_generation_key(object_type, object_id):
+    return settings.TEMPLATE_CACHE_GENERATION_KEY.format(object_type, object_id)
+
+
+def _get_redis_default_cache():
+    default_cache = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(default_cache, RedisCache):
+        return default_cache
+    return None
+
+
+def _initialise_template_cache_generations(keys):
+    """Sets the current timestamp as the generation of the given keys which are not set yet, and returns the
+    generations of all of them"""
+    generation = time.time_ns()
+    redis_cache = _get_redis_default_cache()
+    if redis_cache is not None:
+        client = redis_cache._cache.get_client(write=True)
+        with client.pipeline(transaction=False) as pipeline:
+            for key in keys:
+                pipeline.set(redis_cache.make_and_validate_key(key), generation, nx=True)
+            pipeline.execute()
+    else:
+        for key in keys:
+            cache.add(key, generation, timeout=None)
+    generations = cache.get_many(keys)
+    # Caches which don't store values (e.g. DummyCache) are used with the timestamp
+    return {key: generations.get(key, generation) for key in keys}
+
+
+def get_template_cache_generation(object_type, object_id):
+    return get_template_cache_generations(object_type, [object_id])[object_id]
+
+
+def get_template_cache_generations(object_type, object_ids):
+    """Returns a dictionary with the template cache generation of each object ID, getting all of them at once"""
+    keys = {get_template_cache_generation_key(object_type, object_id): object_id for object_id in object_ids}
+    generations = cache.get_many(keys.keys())
+    missing_keys = [key for key in keys if key not in generations]
+    if missing_keys:
+        generations.update(_initialise_template_cache_generations(missing_keys))
+    return {object_id: generations[key] for key, object_id in keys.items()}
+
+
+def get_request_template_cache_generations(request):
+    """Returns the dictionary in which the template cache generations got during a request are memoized, keyed by
+    object type and ID. It is shared by the template_cache_generation templatetag and the sound loader of the request
+    so that generations are only got from the cache once per request."""
+    if not hasattr(request, "template_cache_generations"):
+        request.template_cache_generations = {}
+    return request.template_cache_generations
+
+
+def get_versioned_template_cache_key(fragment_name, object_type, object_id, *variables):
+    """Returns the current key of a template fragment cached with the object ID and its generation as first variables"""
+    generation = get_template_cache_generation(object_type, object_id)
+    return get_template_cache_key(fragment_name, object_id, generation, *variables)
+
+
+def invalidate_template_cache_generations(object_type, object_ids):
+    """
+    Invalidates all the template fragments of the given objects by incrementing their generations. With a Redis cache,
+    all generations are incremented with a single pipelined call. Missing generations are initialised with the current
+    timestamp before being incremented.
+
+    Args:
+        object_type (str): type of the objects (one of TEMPLATE_CACHE_OBJECT_TYPES)
+        object_ids (list[int]): IDs of the objects
+    """
+    keys = [get_template_cache_generation_key(object_type, object_id) for object_id in object_ids]
+    if not keys:
+        return
+    generation = time.time_ns()
+    redis_cache = _get_redis_default_cache()
+    if redis_cache is not None:
+        # Writes always go to the first server, so all keys can be incremented with the same client
+        client = redis_cache._cache.get_client(write=True)
+        with client.pipeline(transaction=False) as pipeline:
+            for key in keys:
+                redis_key = redis_cache.make_and_validate_key(key)
+                pipeline.set(redis_key, generation, nx=True)
+                pipeline.incr(redis_key)
+            pipeline.execute()
+    else:
+        for key in keys:
+            cache.add(key, generation, timeout=None)
+            try:
+                cache.incr(key)
+            except ValueError:
+                # The key expired between add and incr
+                cache.set(key, generation + 1, timeout=None)
+
+
+def invalidate_users_template_caches(user_ids):
+    invalidate_template_cache_generations("user", user_ids)
+    cache.delete_many([settings.USER_STATS_CACHE_KEY.format(user_id) for user_id in user_ids])
+
+
 def invalidate_user_template_caches(user_id):
-    invalidate_template_cache("user_header", user_id)
-    invalidate_template_cache("bw_user_header", user_id)
-    invalidate_template_cache("bw_user_profile_tags", user_id)
-    invalidate_template_cache("bw_user_profile_followers_count", user_id)
-    invalidate_template_cache("bw_user_profile_following_count", user_id)
-    invalidate_template_cache("bw_user_profile_following_tags_count", user_id)
-    invalidate_template_cache("bw_user_profile_latest_packs_section", user_id, True)
-    invalidate_template_cache("bw_user_profile_latest_packs_section", user_id, False)
-    cache.delete(settings.USER_STATS_CACHE_KEY.format(user_id))
+    invalidate_users_template_caches([user_id])
 
 
 def invalidate_all_moderators_header_cache():
-    mods = Group.objects.get(name="moderators").user_set.all()
-    for mod in mods:
-        invalidate_user_template_caches(mod.id)
+    mod_ids = Group.objects.get(name="moderators").user_set.values_list("id", flat=True)
+    invalidate_users_template_caches(list(mod_ids))
 
 
 def get_all_keys_matching_pattern(pattern, cache_store):
@@ -0,0 +1,58 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+
+def map_in_process_pool(func, items, workers):
+    """Calls func(*args) for each (context, args) pair in `items` using a pool of `workers` processes and yields
+    (context, result) pairs in the same order as `items`. `context` is not sent to the worker processes, so it can be
+    used to keep objects needed to handle the results (e.g. model instances). `func` must be a module level function
+    which does not use the DB (see below).
+
+    At most one item per worker process is queued, so `items` (which is iterated lazily, in the calling process) does
+    not run too far ahead of the workers and memory usage does not depend on the total number of items. If `workers`
+    is 0, func is called in the calling process.
+    """
+    if workers <= 0:
+        for context, args in items:
+            yield context, func(*args)
+        return
+
+    # Worker processes are spawned (not forked) so they don't share this process' DB connections
+    pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup
+    )
+    pending = deque()
+    try:
+        for context, args in items:
+            pending.append((context, pool.submit(func, *args)))
+            while len(pending) > workers:
+                context, future = pending.popleft()
+                yield context, future.result()
+        while pending:
+            context, future = pending.popleft()
+            yield context, future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
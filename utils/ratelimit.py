@@ -20,6 +20,7 @@
 
 from __future__ import annotations
 
+import bisect
 import enum
 import ipaddress
 import logging
@@ -37,23 +38,94 @@ console_logger = logging.getLogger("console")
 last_cached_blocked_ips = []
 last_cached_blocked_ips_timestamp: float = 0
 
+blocked_ips_matcher: BlockedIPsMatcher | None = None
+blocked_ips_matcher_sources: tuple[list[str], list[str] | None] | None = None
 
-def get_ips_to_block() -> list[str]:
+
+class BlockedIPsMatcher:
     """
-    Get a list of IPs to block. Returned IPs include a combination of the IPs listed in settings.BLOCKED_IPS and
-    a list of IPs cached with the key settings.CACHED_BLOCKED_IPS_KEY. To avoid many queries to the cache, this
+    Precompiled list of blocked IPs and IP ranges which can be checked in O(log n). Each IP or range is converted to an
+    interval of integers (one list of intervals for IPv4 and another one for IPv6). Overlapping and adjacent intervals
+    are merged so that intervals are disjoint and, once sorted by start, also sorted by end. An IP (or range) then
+    overlaps a blocked range only if it overlaps the last interval starting before the end of the IP (or range).
+    """
+
+    def __init__(self, ips_to_block: list[str]):
+        intervals = {4: [], 6: []}
+        for ip_to_block in ips_to_block:
+            try:
+                network = ipaddress.ip_network(str(ip_to_block))
+            except ValueError as e:
+                console_logger.info(f"Ignoring blocked IP {ip_to_block} as it is not valid: {e}")
+                continue
+            intervals[network.version].append((int(network.network_address), int(network.broadcast_address)))
+
+        self.starts = {}
+        self.ends = {}
+        for version, version_intervals in intervals.items():
+            starts, ends = [], []
+            for start, end in sorted(version_intervals):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self.starts[version] = starts
+            self.ends[version] = ends
+
+    def __len__(self):
+        return sum(len(starts) for starts in self.starts.values())
+
+    def is_blocked(self, ip: str) -> bool:
+        """
+        Args:
+            ip: IP to check. Can also specify a range as described in ipaddress.IPv4Network docs.
+
+        Returns:
+            True if the IP overlaps any of the blocked IPs, False otherwise (also if the IP is not valid).
+        """
+        ip = str(ip)
+        try:
+            if "/" in ip:
+                network = ipaddress.ip_network(ip)
+                version, first, last = network.version, int(network.network_address), int(network.broadcast_address)
+            else:
+                # Parsing an address is much faster than parsing a network
+                address = ipaddress.ip_address(ip)
+                version, first, last = address.version, int(address), int(address)
+        except ValueError:
+            return False
+        position = bisect.bisect_right(self.starts[version], last) - 1
+        return position >= 0 and self.ends[version][position] >= first
+
+
+def get_cached_blocked_ips() -> list[str] | None:
+    """
+    Get the list of IPs cached with the key settings.CACHED_BLOCKED_IPS_KEY. To avoid many queries to the cache, this
     function stores the cached IPs in a global variable and only refreshes them after settings.CACHED_BLOCKED_IPS_TIME
     seconds have passed since the last time the cache was queried for settings.CACHED_BLOCKED_IPS_KEY. This effectively
     adds a 2nd layer of cache.
 
     Returns:
-        List of IPs to block
+        List of cached IPs to block, or None if there are no cached IPs
     """
     global last_cached_blocked_ips, last_cached_blocked_ips_timestamp
     now = time.time()
     if now - last_cached_blocked_ips_timestamp > settings.CACHED_BLOCKED_IPS_TIME:
         last_cached_blocked_ips = cache.get(settings.CACHED_BLOCKED_IPS_KEY, None)
         last_cached_blocked_ips_timestamp = now
+    return last_cached_blocked_ips
+
+
+def get_ips_to_block() -> list[str]:
+    """
+    Get a list of IPs to block. Returned IPs include a combination of the IPs listed in settings.BLOCKED_IPS and
+    a list of IPs cached with the key settings.CACHED_BLOCKED_IPS_KEY (see get_cached_blocked_ips).
+
+    Returns:
+        List of IPs to block
+    """
+    last_cached_blocked_ips = get_cached_blocked_ips()
     if last_cached_blocked_ips is not None:
         return list(set(settings.BLOCKED_IPS + last_cached_blocked_ips))
     else:
@@ -90,10 +162,30 @@ def add_new_ip_to_block(ip: str) -> None:
     cache.set(settings.CACHED_BLOCKED_IPS_KEY, cached_ips_to_block)
 
 
+def get_blocked_ips_matcher() -> BlockedIPsMatcher:
+    """
+    Get a BlockedIPsMatcher for the IPs returned by get_ips_to_block. The matcher is stored in a global variable and
+    only compiled again when settings.BLOCKED_IPS or the cached list of IPs to block change.
+
+    Returns:
+        BlockedIPsMatcher for the current IPs to block
+    """
+    global blocked_ips_matcher, blocked_ips_matcher_sources
+    sources = (settings.BLOCKED_IPS, get_cached_blocked_ips())
+    if blocked_ips_matcher_sources is None or any(
+        source is not previous_source for source, previous_source in zip(sources, blocked_ips_matcher_sources)
+    ):
+        # The cached list is a new object every time it is refreshed, so only compile again if its contents changed
+        if blocked_ips_matcher_sources is None or sources != blocked_ips_matcher_sources:
+            blocked_ips_matcher = BlockedIPsMatcher(get_ips_to_block())
+        blocked_ips_matcher_sources = sources
+    return blocked_ips_matcher
+
+
 def ip_is_blocked(ip: str) -> bool:
     """
-    Determines whether an IP should be blocked. To do that, it uses ipaddress.ip_network objects which support
-    IP comparison using ranges.
+    Determines whether an IP should be blocked. IPs to block can include ranges, which are checked using a
+    precompiled BlockedIPsMatcher (see get_blocked_ips_matcher).
 
     Args:
         ip: IP to check. Can also specify a range as described in ipaddress.IPv4Network docs.
@@ -102,10 +194,7 @@ def ip_is_blocked(ip: str) -> bool:
         True if the IP should be blocked, False otherwise.
 
     """
-    for ip_to_block in get_ips_to_block():
-        if ipaddress.ip_network(str(ip_to_block)).overlaps(ipaddress.ip_network(str(ip))):
-            return True
-    return False
+    return get_blocked_ips_matcher().is_blocked(ip)
 
 
 def get_ip_or_random_ip(request):
@@ -20,11 +20,15 @@
 from __future__ import annotations
 
 import importlib
+from collections.abc import Iterator
+from functools import cached_property
 from typing import TYPE_CHECKING
 
 from django.conf import settings
 
 if TYPE_CHECKING:
+    import numpy as np
+
     import forum.models
     import sounds.models
 
@@ -47,6 +51,20 @@ def get_search_engine(
     return getattr(module, class_name)(sounds_index_url, forum_index_url)
 
 
+def get_similarity_backend() -> SimilarityBackendBase | None:
+    """Return an instance of the similarity backend class set in settings.SEARCH_ENGINE_SIMILARITY_BACKEND_CLASS
+
+    Returns:
+        similarity backend class instance or None if similarity searches should be carried out by the search engine
+    """
+    backend_class = settings.SEARCH_ENGINE_SIMILARITY_BACKEND_CLASS
+    if backend_class is None:
+        return None
+    module_name, class_name = backend_class.rsplit(".", 1)
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)()
+
+
 class SearchResults:
     def __init__(
         self,
@@ -170,6 +188,12 @@ class SearchEngineTimeoutException(SearchEngineException):
 class SearchEngineBase:
     solr_base_url: str | None = None
 
+    @cached_property
+    def similarity_backend(self) -> SimilarityBackendBase | None:
+        """Similarity backend used by search_sounds for similarity searches (see get_similarity_backend). Can be set to
+        None to use the vector search of the search engine regardless of settings."""
+        return get_similarity_backend()
+
     # Test SearchEngineBase with `pytest -m "search_engine" utils/search/backends/test_search_engine_backend.py`
 
     # Sound search related methods
@@ -188,6 +212,39 @@ class SearchEngineBase:
         """
         raise NotImplementedError
 
+    def build_sound_documents(
+        self,
+        sound_objects: list[sounds.models.Sound],
+        update: bool = False,
+        include_similarity_vectors: bool = False,
+        use_prefetched_vectors: bool = True,
+    ) -> list[dict]:
+        """Builds the search engine documents for the provided sound objects without sending them to the index.
+        Together with add_sound_documents_to_index, this allows building documents and sending them to the index
+        in different processes/threads. By default, this does not query the DB as similarity vectors are taken from
+        the ones pre-fetched by Sound.objects.bulk_query_solr.
+
+        Args:
+            sound_objects: Sound objects of the sounds to index, as returned by Sound.objects.bulk_query_solr
+            update: Whether the documents should update existing documents in the index instead of replacing them
+                (see add_sounds_to_index).
+            include_similarity_vectors: Whether to include similarity vectors in the documents.
+            use_prefetched_vectors: Whether to take similarity vectors from the ones pre-fetched in the sound objects
+                instead of querying them from the DB.
+
+        Returns:
+            list of documents, one per sound
+        """
+        raise NotImplementedError
+
+    def add_sound_documents_to_index(self, documents: list[dict]):
+        """Sends sound documents built with build_sound_documents to the search index
+
+        Args:
+            documents: documents to add to the index
+        """
+        raise NotImplementedError
+
     def update_similarity_vectors_in_index(self, sound_objects):
         """Create an update document to add only similarity vectors to sounds that already exist in the index"""
         raise NotImplementedError
@@ -223,6 +280,19 @@ class SearchEngineBase:
         """
         raise NotImplementedError
 
+    def iter_all_sound_ids_from_index(self, page_size: int = settings.SEARCH_ENGINE_EXPORT_PAGE_SIZE) -> Iterator[int]:
+        """Yield the IDs of all sounds indexed in the search engine, sorted by the search engine's document ID.
+        IDs are retrieved in pages using cursor-based paging so that the cost of each page does not depend on
+        its position in the index. Prefer this over get_all_sound_ids_from_index for processing the whole index.
+
+        Args:
+            page_size: number of sound IDs to retrieve per search engine query
+
+        Returns:
+            iterator over all sound IDs indexed in the search engine
+        """
+        raise NotImplementedError
+
     def search_sounds(
         self,
         textual_query: str = "",
@@ -331,6 +401,21 @@ class SearchEngineBase:
         """
         raise NotImplementedError
 
+    def iter_sim_vector_document_ids(
+        self, similarity_space_name: str, page_size: int = settings.SEARCH_ENGINE_EXPORT_PAGE_SIZE
+    ) -> Iterator[str]:
+        """Yield indexed Solr document IDs of all similarity vector documents of a similarity space, sorted by
+        document ID. Like iter_all_sound_ids_from_index, IDs are retrieved in pages using cursor-based paging.
+
+        Args:
+            similarity_space_name: name of the similarity space whose vector document IDs should be returned
+            page_size: number of document IDs to retrieve per search engine query
+
+        Returns:
+            iterator over Solr document IDs of similarity vector documents (e.g. "1234/similarity_vectors#0")
+        """
+        raise NotImplementedError
+
     # Forum search related methods
 
     def add_forum_posts_to_index(self, forum_post_objects: list[forum.models.Post]):
@@ -421,3 +506,87 @@ class SearchEngineBase:
                 Eg: [('cat', 1), ('echo', 1), ('forest', 1)]
         """
         raise NotImplementedError
+
+
+class SimilarityBackendBase:
+    """Backend that answers similarity searches (SearchEngineBase.search_sounds with similar_to) instead of the
+    vector search of the search engine. The search engine is still used to apply the other search parameters to the
+    sounds found by the similarity backend. Similarity scores must be comparable to the ones of the search engine so
+    that the same similar_to_min_similarity thresholds can be used."""
+
+    def search(
+        self,
+        similarity_space_name: str,
+        vector: list[float] | np.ndarray,
+        min_similarity: float = settings.SIMILARITY_MIN_THRESHOLD,
+        num_results: int = settings.SIMILARITY_BACKEND_MAX_RESULTS,
+        allowed_ids: list[int] | np.ndarray | None = None,
+        exclude_ids: list[int] | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Find the sounds with vectors most similar to the given vector
+
+        Args:
+            similarity_space_name: name of the similarity space of the vector
+            vector: target vector
+            min_similarity: min similarity score to consider a sound as similar
+            num_results: max number of sounds to return
+            allowed_ids: if not None, only sounds with these IDs are returned
+            exclude_ids: IDs of sounds which should not be returned (e.g. the target sound)
+
+        Returns:
+            arrays with the IDs and the similarity scores of the most similar sounds, sorted by decreasing score
+        """
+        raise NotImplementedError
+
+    def get_vector(self, similarity_space_name: str, sound_id: int) -> np.ndarray | None:
+        """Return the vector of a sound as indexed in the similarity backend
+
+        Args:
+            similarity_space_name: name of the similarity space of the vector
+            sound_id: ID of the sound
+
+        Returns:
+            the vector of the sound or None if the sound has no vector indexed in that similarity space
+        """
+        raise NotImplementedError
+
+    def update_sounds(self, sound_ids: list[int]):
+        """Index the current similarity vectors (SoundSimilarityVector objects) of the given sounds in all similarity
+        spaces. Sounds which no longer have a vector in a similarity space are removed from that space.
+
+        Args:
+            sound_ids: IDs of the sounds to update
+        """
+        raise NotImplementedError
+
+    def remove_sounds(self, sound_ids: list[int]):
+        """Remove the vectors of the given sounds from all similarity spaces
+
+        Args:
+            sound_ids: IDs of the sounds to remove
+        """
+        raise NotImplementedError
+
+    def needs_rebuild(self, similarity_space_name: str) -> bool:
+        """Whether the index of the given similarity space should be rebuilt to compact the updates made with
+        update_sounds and remove_sounds since it was last built
+
+        Args:
+            similarity_space_name: name of the similarity space
+
+        Returns:
+            True if rebuild_index should be called
+        """
+        return False
+
+    def rebuild_index(self, similarity_space_name: str) -> int:
+        """Index the vectors of all sounds with a SoundSimilarityVector in the given similarity space, replacing the
+        previously indexed vectors
+
+        Args:
+            similarity_space_name: name of the similarity space to rebuild
+
+        Returns:
+            number of vectors indexed
+        """
+        raise NotImplementedError
@@ -0,0 +1,386 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+# In-process similarity backend. The vectors of each similarity space are stored in snapshot folders in
+# settings.SIMILARITY_INDEX_PATH/<similarity space name>/, and the "current" file of that folder holds the name of the
+# snapshot in use. Each snapshot folder has these files:
+#   - ids.npy: sorted int64 array with the IDs of the indexed sounds
+#   - vectors.bin: the float32 vector of each sound in ids.npy, one after the other (same format as
+#     SoundSimilarityVector.vector_data)
+#   - updates.bin: fixed size records (sound_id, deleted, vector) appended when sounds are indexed or removed after the
+#     snapshot was built. The last record of a sound replaces its vector in vectors.bin.
+# Snapshots are built from SoundSimilarityVector objects by rebuild_index (see the build_similarity_index command) and
+# are never modified except for appending updates, so readers can memory-map them. All processes share the same copy
+# of the vectors, and similarity is computed exactly (brute force) with a matrix-vector product.
+
+import fcntl
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+from sounds.models import SoundSimilarityVector
+from utils.search import SimilarityBackendBase
+
+CURRENT_FILENAME = "current"
+LOCK_FILENAME = "lock"
+IDS_FILENAME = "ids.npy"
+VECTORS_FILENAME = "vectors.bin"
+UPDATES_FILENAME = "updates.bin"
+
+
+def get_index_path(similarity_space_name):
+    return os.path.join(settings.SIMILARITY_INDEX_PATH, similarity_space_name)
+
+
+def get_current_snapshot_path(index_path):
+    try:
+        with open(os.path.join(index_path, CURRENT_FILENAME)) as current_file:
+            return os.path.join(index_path, current_file.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def get_updates_dtype(similarity_space_name):
+    vector_size = settings.SIMILARITY_SPACES[similarity_space_name]["vector_size"]
+    return np.dtype([("sound_id", "<i8"), ("deleted", "<i8"), ("vector", "<f4", (vector_size,))])
+
+
+@contextmanager
+def index_lock(index_path):
+    """Lock held while adding updates to the index or switching snapshots, so several processes can do it"""
+    os.makedirs(index_path, exist_ok=True)
+    with open(os.path.join(index_path, LOCK_FILENAME), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def create_snapshot_folder(index_path):
+    snapshot_path = os.path.join(index_path, f"snapshot-{time.time_ns()}")
+    os.makedirs(snapshot_path)
+    return snapshot_path
+
+
+def get_snapshot_timestamp(snapshot_path):
+    return int(os.path.basename(snapshot_path).split("-")[1])
+
+
+def set_current_snapshot(index_path, snapshot_path):
+    """Makes snapshot_path the snapshot in use and deletes the snapshots older than the previous one (the previous
+    one might still be being opened by readers, and newer ones might be being built). Must be called holding the
+    index lock."""
+    previous_snapshot_path = get_current_snapshot_path(index_path)
+    tmp_current_path = os.path.join(index_path, CURRENT_FILENAME + ".tmp")
+    with open(tmp_current_path, "w") as current_file:
+        current_file.write(os.path.basename(snapshot_path))
+    os.replace(tmp_current_path, os.path.join(index_path, CURRENT_FILENAME))
+    if previous_snapshot_path is not None:
+        previous_snapshot_timestamp = get_snapshot_timestamp(previous_snapshot_path)
+        for name in os.listdir(index_path):
+            if name.startswith("snapshot-") and get_snapshot_timestamp(name) < previous_snapshot_timestamp:
+                shutil.rmtree(os.path.join(index_path, name), ignore_errors=True)
+
+
+def get_or_create_current_snapshot(index_path):
+    """Returns the path of the snapshot in use. If the index was never built, an empty snapshot is created so that
+    sounds can be indexed incrementally. Must be called holding the index lock."""
+    snapshot_path = get_current_snapshot_path(index_path)
+    if snapshot_path is None:
+        snapshot_path = create_snapshot_folder(index_path)
+        np.save(os.path.join(snapshot_path, IDS_FILENAME), np.empty(0, dtype=np.int64))
+        open(os.path.join(snapshot_path, VECTORS_FILENAME), "wb").close()
+        set_current_snapshot(index_path, snapshot_path)
+    return snapshot_path
+
+
+def similarity_scores(vectors, vector, l2_norm, squared_norms=None):
+    """Returns the similarity scores between the rows of vectors and vector, computed like the dense vector search of
+    the search engine: (1 + dot product) / 2 for l2 normalized vectors (dot_product similarity function) and
+    1 / (1 + squared euclidean distance) otherwise (euclidean similarity function)."""
+    dot_products = vectors @ vector
+    if l2_norm:
+        return (1 + dot_products) / 2
+    if squared_norms is None:
+        squared_norms = np.einsum("ij,ij->i", vectors, vectors)
+    return 1 / (1 + np.maximum(squared_norms - 2 * dot_products + vector @ vector, 0))
+
+
+def ids_bitmap(sound_ids):
+    """Returns a boolean array which is True at the positions of the given sound IDs"""
+    sound_ids = np.asarray(sound_ids, dtype=np.int64)
+    bitmap = np.zeros(sound_ids.max() + 1 if len(sound_ids) else 0, dtype=bool)
+    bitmap[sound_ids] = True
+    return bitmap
+
+
+def in_bitmap(sound_ids, bitmap):
+    result = np.zeros(len(sound_ids), dtype=bool)
+    in_range = sound_ids < len(bitmap)
+    result[in_range] = bitmap[sound_ids[in_range]]
+    return result
+
+
+class SimilarityIndex:
+    """Vectors indexed in a similarity space as seen by a reader. The vectors of the snapshot are memory-mapped and
+    the updates are loaded in memory. Updates appended after the reader was created are loaded by load_updates."""
+
+    def __init__(self, similarity_space_name, snapshot_path):
+        similarity_space = settings.SIMILARITY_SPACES[similarity_space_name]
+        self.snapshot_path = snapshot_path
+        self.l2_norm = similarity_space.get("l2_norm", False)
+        self.updates_dtype = get_updates_dtype(similarity_space_name)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, similarity_space["vector_size"]), dtype=np.float32)
+        if snapshot_path is not None:
+            self.ids = np.load(os.path.join(snapshot_path, IDS_FILENAME))
+            if len(self.ids):
+                self.vectors = np.memmap(
+                    os.path.join(snapshot_path, VECTORS_FILENAME),
+                    dtype=SoundSimilarityVector.VECTOR_DTYPE,
+                    mode="r",
+                    shape=(len(self.ids), similarity_space["vector_size"]),
+                )
+        # Squared norms are only needed to compute euclidean distances, compute them once per snapshot
+        self.squared_norms = None if self.l2_norm else np.einsum("ij,ij->i", self.vectors, self.vectors)
+
+        self.num_updates = 0
+        self.updated_ids = np.empty(0, dtype=np.int64)
+        self.updated_deleted = np.empty(0, dtype=bool)
+        self.updated_vectors = np.empty((0, similarity_space["vector_size"]), dtype=np.float32)
+        # Sounds of the snapshot whose vectors have not been replaced by updates
+        self.not_updated = np.ones(len(self.ids), dtype=bool)
+        self.load_updates()
+
+    def load_updates(self):
+        """Loads the updates appended since the last call. Only the new records are read from the updates file and
+        merged with the updates already loaded."""
+        if self.snapshot_path is None:
+            return
+        updates_path = os.path.join(self.snapshot_path, UPDATES_FILENAME)
+        try:
+            num_updates = os.path.getsize(updates_path) // self.updates_dtype.itemsize
+        except FileNotFoundError:
+            num_updates = 0
+        if num_updates <= self.num_updates:
+            return
+        updates = np.fromfile(
+            updates_path,
+            dtype=self.updates_dtype,
+            count=num_updates - self.num_updates,
+            offset=self.num_updates * self.updates_dtype.itemsize,
+        )
+        # np.unique returns the position of the first occurrence of each sound ID, so we reverse the updates to get
+        # the last update of each sound
+        new_ids, last_positions = np.unique(updates["sound_id"][::-1], return_index=True)
+        updates = updates[::-1][last_positions]
+
+        # New updates replace the previous updates of the same sounds, and the rest are inserted keeping IDs sorted
+        kept = ~np.isin(self.updated_ids, new_ids, assume_unique=True)
+        kept_ids = self.updated_ids[kept]
+        insert_positions = np.searchsorted(kept_ids, new_ids)
+        self.updated_ids = np.insert(kept_ids, insert_positions, new_ids)
+        self.updated_deleted = np.insert(self.updated_deleted[kept], insert_positions, updates["deleted"] != 0)
+        self.updated_vectors = np.insert(self.updated_vectors[kept], insert_positions, updates["vector"], axis=0)
+
+        not_updated = self.not_updated.copy()
+        positions = np.searchsorted(self.ids, new_ids)
+        in_snapshot = positions < len(self.ids)
+        in_snapshot[in_snapshot] = self.ids[positions[in_snapshot]] == new_ids[in_snapshot]
+        not_updated[positions[in_snapshot]] = False
+        self.not_updated = not_updated
+        self.num_updates = num_updates
+
+    def get_vector(self, sound_id):
+        position = np.searchsorted(self.updated_ids, sound_id)
+        if position < len(self.updated_ids) and self.updated_ids[position] == sound_id:
+            return None if self.updated_deleted[position] else self.updated_vectors[position]
+        position = np.searchsorted(self.ids, sound_id)
+        if position < len(self.ids) and self.ids[position] == sound_id:
+            return np.asarray(self.vectors[position])
+        return None
+
+    def search(self, vector, min_similarity, num_results, allowed_bitmap=None, exclude_ids=None):
+        vector = np.asarray(vector, dtype=np.float32)
+        all_ids = []
+        all_scores = []
+        for ids, vectors, squared_norms, selected in [
+            (self.ids, self.vectors, self.squared_norms, self.not_updated),
+            (self.updated_ids, self.updated_vectors, None, ~self.updated_deleted),
+        ]:
+            if allowed_bitmap is not None:
+                selected = selected & in_bitmap(ids, allowed_bitmap)
+            if exclude_ids:
+                selected = selected & ~np.isin(ids, exclude_ids)
+            if np.count_nonzero(selected) > len(ids) // 2:
+                # Computing the scores of all vectors is cheaper than copying the selected ones
+                scores = similarity_scores(vectors, vector, self.l2_norm, squared_norms)[selected]
+            else:
+                rows = np.flatnonzero(selected)
+                scores = similarity_scores(
+                    vectors[rows], vector, self.l2_norm, None if squared_norms is None else squared_norms[rows]
+                )
+            all_ids.append(ids[selected])
+            all_scores.append(scores)
+
+        ids = np.concatenate(all_ids)
+        scores = np.concatenate(all_scores)
+        above_min_similarity = scores >= min_similarity
+        ids, scores = ids[above_min_similarity], scores[above_min_similarity]
+        if len(ids) > num_results:
+            top = np.argpartition(-scores, num_results - 1)[:num_results]
+            ids, scores = ids[top], scores[top]
+        order = np.lexsort((ids, -scores))
+        return ids[order], scores[order]
+
+
+_similarity_indexes = {}
+
+
+def get_similarity_index(similarity_space_name):
+    """Returns the SimilarityIndex for the similarity space. Indexes are kept in memory and re-created when a new
+    snapshot is built, and new updates are loaded every time the index is requested."""
+    snapshot_path = get_current_snapshot_path(get_index_path(similarity_space_name))
+    index = _similarity_indexes.get(similarity_space_name)
+    if index is None or index.snapshot_path != snapshot_path:
+        index = SimilarityIndex(similarity_space_name, snapshot_path)
+        _similarity_indexes[similarity_space_name] = index
+    else:
+        index.load_updates()
+    return index
+
+
+def append_updates(similarity_space_name, updates):
+    """Appends updates (an array with get_updates_dtype dtype) to the snapshot in use of the similarity space"""
+    index_path = get_index_path(similarity_space_name)
+    with index_lock(index_path):
+        snapshot_path = get_or_create_current_snapshot(index_path)
+        with open(os.path.join(snapshot_path, UPDATES_FILENAME), "ab") as updates_file:
+            updates_file.write(updates.tobytes())
+
+
+class NumpySimilarityBackend(SimilarityBackendBase):
+    def search(
+        self,
+        similarity_space_name,
+        vector,
+        min_similarity=settings.SIMILARITY_MIN_THRESHOLD,
+        num_results=settings.SIMILARITY_BACKEND_MAX_RESULTS,
+        allowed_ids=None,
+        exclude_ids=None,
+    ):
+        return get_similarity_index(similarity_space_name).search(
+            vector,
+            min_similarity,
+            num_results,
+            allowed_bitmap=ids_bitmap(allowed_ids) if allowed_ids is not None else None,
+            exclude_ids=exclude_ids,
+        )
+
+    def get_vector(self, similarity_space_name, sound_id):
+        return get_similarity_index(similarity_space_name).get_vector(sound_id)
+
+    def update_sounds(self, sound_ids):
+        sound_ids = np.unique(np.asarray(sound_ids, dtype=np.int64))
+        for similarity_space_name in settings.SIMILARITY_SPACES_NAMES:
+            vectors_data = dict(
+                SoundSimilarityVector.objects.filter(
+                    sound_id__in=sound_ids.tolist(),
+                    similarity_space_name=similarity_space_name,
+                    vector_data__isnull=False,
+                ).values_list("sound_id", "vector_data")
+            )
+            updates = np.zeros(len(sound_ids), dtype=get_updates_dtype(similarity_space_name))
+            updates["sound_id"] = sound_ids
+            for i, sound_id in enumerate(sound_ids.tolist()):
+                if sound_id in vectors_data:
+                    updates["vector"][i] = SoundSimilarityVector.decode_vector(vectors_data[sound_id])
+                else:
+                    updates["deleted"][i] = 1
+            append_updates(similarity_space_name, updates)
+
+    def remove_sounds(self, sound_ids):
+        sound_ids = np.unique(np.asarray(sound_ids, dtype=np.int64))
+        for similarity_space_name in settings.SIMILARITY_SPACES_NAMES:
+            updates = np.zeros(len(sound_ids), dtype=get_updates_dtype(similarity_space_name))
+            updates["sound_id"] = sound_ids
+            updates["deleted"] = 1
+            append_updates(similarity_space_name, updates)
+
+    def needs_rebuild(self, similarity_space_name):
+        index_path = get_index_path(similarity_space_name)
+        snapshot_path = get_current_snapshot_path(index_path)
+        if snapshot_path is None:
+            return False
+        try:
+            updates_size = os.path.getsize(os.path.join(snapshot_path, UPDATES_FILENAME))
+        except FileNotFoundError:
+            return False
+        num_updates = updates_size // get_updates_dtype(similarity_space_name).itemsize
+        num_vectors = len(np.load(os.path.join(snapshot_path, IDS_FILENAME), mmap_mode="r"))
+        return num_updates > settings.SIMILARITY_INDEX_MAX_UPDATES_RATIO * num_vectors
+
+    def rebuild_index(self, similarity_space_name, chunk_size=10000):
+        index_path = get_index_path(similarity_space_name)
+        vector_size = settings.SIMILARITY_SPACES[similarity_space_name]["vector_size"]
+        vector_data_size = vector_size * SoundSimilarityVector.VECTOR_DTYPE.itemsize
+        with index_lock(index_path):
+            previous_snapshot_path = get_or_create_current_snapshot(index_path)
+            snapshot_path = create_snapshot_folder(index_path)
+            try:
+                previous_updates_size = os.path.getsize(os.path.join(previous_snapshot_path, UPDATES_FILENAME))
+            except FileNotFoundError:
+                previous_updates_size = 0
+
+        # Vector data is copied as is from the DB, iterating over sound IDs with keyset pagination. Like in the search
+        # engine, only sounds which are processed and moderated are indexed
+        ids = []
+        with open(os.path.join(snapshot_path, VECTORS_FILENAME), "wb") as vectors_file:
+            qs = SoundSimilarityVector.objects.filter(
+                similarity_space_name=similarity_space_name,
+                vector_data__isnull=False,
+                sound__processing_state="OK",
+                sound__moderation_state="OK",
+            ).order_by("sound_id")
+            last_sound_id = -1
+            while True:
+                chunk = list(qs.filter(sound_id__gt=last_sound_id).values_list("sound_id", "vector_data")[:chunk_size])
+                if not chunk:
+                    break
+                for sound_id, vector_data in chunk:
+                    if len(vector_data) == vector_data_size:
+                        vectors_file.write(vector_data)
+                        ids.append(sound_id)
+                last_sound_id = chunk[-1][0]
+        np.save(os.path.join(snapshot_path, IDS_FILENAME), np.array(ids, dtype=np.int64))
+
+        with index_lock(index_path):
+            # Updates added while the snapshot was being built are carried over to the new snapshot
+            with open(os.path.join(snapshot_path, UPDATES_FILENAME), "wb") as updates_file:
+                try:
+                    with open(os.path.join(previous_snapshot_path, UPDATES_FILENAME), "rb") as previous_file:
+                        previous_file.seek(previous_updates_size)
+                        shutil.copyfileobj(previous_file, updates_file)
+                except FileNotFoundError:
+                    pass
+            set_current_snapshot(index_path, snapshot_path)
+        return len(ids)
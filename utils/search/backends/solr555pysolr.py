@@ -22,6 +22,7 @@ import json
 import math
 import random
 import re
+import time
 from collections import defaultdict
 from datetime import date, datetime
 
@@ -30,7 +31,12 @@ from django.conf import settings
 
 from forum.models import Post
 from sounds.models import Sound, SoundSimilarityVector
-from utils.search import SearchEngineBase, SearchEngineException, SearchEngineTimeoutException, SearchResults
+from utils.search import (
+    SearchEngineBase,
+    SearchEngineException,
+    SearchEngineTimeoutException,
+    SearchResults,
+)
 from utils.search.backends.solr_common import SolrQuery, SolrResponseInterpreter
 from utils.text import remove_control_chars
 
@@ -386,7 +392,12 @@ class Solr555PySolrSearchEngine(SearchEngineBase):
 
         return document
 
-    def add_similarity_vectors_to_documents(self, sound_objects, documents):
+    def add_similarity_vectors_to_documents(self, sound_objects, documents, use_prefetched_vectors=False):
+        """
+        Adds the similarity vectors of the sounds to their documents (as child documents). If use_prefetched_vectors
+        is True, vectors are taken from the annotations added by Sound.objects.bulk_query_solr (see
+        Sound.get_similarity_vectors) instead of being queried from the DB.
+        """
         similarity_data = defaultdict(list)
         sound_ids = [s.id for s in sound_objects]
         sound_objects_dict = {s.id: s for s in sound_objects}
@@ -400,17 +411,28 @@ class Solr555PySolrSearchEngine(SearchEngineBase):
                 # If the vector size is not supported, then we can't index the vectors generated by the requested analyzer
                 continue
 
-            for ssv in SoundSimilarityVector.objects.filter(
-                sound_id__in=sound_ids, similarity_space_name=similarity_space_name
-            ):
-                sound = sound_objects_dict[ssv.sound_id]
+            if use_prefetched_vectors:
+                similarity_vectors = [
+                    (sound.id, similarity_space_name, vector)
+                    for sound in sound_objects
+                    if (vector := sound.get_similarity_vector(similarity_space_name, as_array=True)) is not None
+                ]
+            else:
+                similarity_vectors = [
+                    (sound_id, vector_similarity_space_name, SoundSimilarityVector.decode_vector(vector_data))
+                    for sound_id, vector_similarity_space_name, vector_data in SoundSimilarityVector.objects.filter(
+                        sound_id__in=sound_ids, similarity_space_name=similarity_space_name, vector_data__isnull=False
+                    ).values_list("sound_id", "similarity_space_name", "vector_data")
+                ]
+            for sound_id, vector_similarity_space_name, vector in similarity_vectors:
+                sound = sound_objects_dict[sound_id]
                 similairty_vectors_per_space_per_sound = []
                 sim_vector_document_data = {
                     "content_type": SOLR_DOC_CONTENT_TYPES["similarity_vector"],
-                    "similarity_space": ssv.similarity_space_name,
+                    "similarity_space": vector_similarity_space_name,
                     "timestamp_start": 0,  # This will be used in the future if analyzers generate multiple sound vectors
                     "timestamp_end": -1,  # This will be used in the future if analyzers generate multiple sound vectors
-                    vector_field_name: ssv.vector,
+                    vector_field_name: vector.tolist(),
                 }
                 # Because we still want to be able to group by pack when matching sim vector documents (sound child documents),
                 # we add the pack_grouping field here as well. In the future we might be able to optimize this if we can tell solr
@@ -430,7 +452,7 @@ class Solr555PySolrSearchEngine(SearchEngineBase):
                 similairty_vectors_per_space_per_sound.append(sim_vector_document_data)
 
                 if similairty_vectors_per_space_per_sound:
-                    similarity_data[ssv.sound_id] += similairty_vectors_per_space_per_sound
+                    similarity_data[sound_id] += similairty_vectors_per_space_per_sound
 
         # Add collected vectors to the documents created as child documents
         for document in documents:
@@ -583,19 +605,35 @@ class Solr555PySolrSearchEngine(SearchEngineBase):
         return query_dict
 
     # Sound methods
-    def add_sounds_to_index(self, sound_objects, update=False, include_similarity_vectors=False):
+    def build_sound_documents(
+        self, sound_objects, update=False, include_similarity_vectors=False, use_prefetched_vectors=True
+    ):
         # Generate basic documents for Solr
         documents = [self.convert_sound_to_search_engine_document(s) for s in sound_objects]
         # If required, collect similarity vectors from all configured analyzers
         if include_similarity_vectors:
-            self.add_similarity_vectors_to_documents(sound_objects, documents)
+            self.add_similarity_vectors_to_documents(
+                sound_objects, documents, use_prefetched_vectors=use_prefetched_vectors
+            )
         if update:
             documents = [self.transform_document_into_update_document(d) for d in documents]
+        return documents
+
+    def add_sound_documents_to_index(self, documents):
         try:
             self.get_sounds_index(timeout=60).add(documents)
         except pysolr.SolrError as e:
             _raise_search_engine_exception(e)
 
+    def add_sounds_to_index(self, sound_objects, update=False, include_similarity_vectors=False):
+        documents = self.build_sound_documents(
+            sound_objects,
+            update=update,
+            include_similarity_vectors=include_similarity_vectors,
+            use_prefetched_vectors=False,
+        )
+        self.add_sound_documents_to_index(documents)
+
     def update_similarity_vectors_in_index(self, sound_objects):
         """Create an update document to add only similarity vectors to sounds that already exist in the index"""
         documents = [{"id": sound.id, "content_type": SOLR_DOC_CONTENT_TYPES["sound"]} for sound in sound_objects]
@@ -632,23 +670,48 @@ class Solr555PySolrSearchEngine(SearchEngineBase):
         response = self.search_sounds(query_filter=f"id:{sound_id}", offset=0, num_sounds=1)
         return response.num_found > 0
 
+    def count_documents(self, filter_query):
+        """Returns the number of documents in the sounds index matching filter_query"""
+        query = SolrQuery()
+        query.set_query("*:*")
+        query.set_query_options(rows=0, field_list=["id"], filter_query=filter_query)
+        try:
+            response = self.get_sounds_index().search(search_handler="select", **query.as_kwargs())
+        except pysolr.SolrError as e:
+            _raise_search_engine_exception(e)
+        return response.num_found
+
+    def export_document_ids(self, filter_query, page_size=settings.SEARCH_ENGINE_EXPORT_PAGE_SIZE):
+        """
+        Generator that yields the IDs of all documents in the sounds index matching filter_query. Documents are
+        retrieved sorted by ID using Solr's cursorMark, so that unlike start/rows paging, the cost of retrieving
+        every page does not grow with the number of documents already retrieved.
+        """
+        query = SolrQuery(time_allowed=None)
+        query.set_query("*:*")
+        query.set_query_options(rows=page_size, sort=["id asc"], field_list=["id"], filter_query=filter_query)
+        cursor_mark = "*"
+        while True:
+            query.set_cursor_mark(cursor_mark)
+            try:
+                response = self.get_sounds_index(timeout=60).search(search_handler="select", **query.as_kwargs())
+            except pysolr.SolrError as e:
+                _raise_search_engine_exception(e)
+            for document in response.docs:
+                yield document["id"]
+            # Solr returns the same cursor mark once all documents have been retrieved
+            if response.next_cursor_mark is None or response.next_cursor_mark == cursor_mark:
+                break
+            cursor_mark = response.next_cursor_mark
+
+    def iter_all_sound_ids_from_index(self, page_size=settings.SEARCH_ENGINE_EXPORT_PAGE_SIZE):
+        for document_id in self.export_document_ids(
+            f"content_type:{SOLR_DOC_CONTENT_TYPES['sound']}", page_size=page_size
+        ):
+            yield int(document_id)
+
     def get_all_sound_ids_from_index(self):
-        page_size = 2000
-        solr_ids = []
-        solr_count = None
-        current_page = 1
-        while solr_count is None or len(solr_ids) < solr_count:
-            response = self.search_sounds(
-                sort=settings.SEARCH_SOUNDS_SORT_OPTION_DATE_NEW_FIRST,
-                offset=(current_page - 1) * page_size,
-                num_sounds=page_size,
-                timeout=60,
-                enforce_time_allowed=False,
-            )
-            solr_ids += [int(element["id"]) for element in response.docs]
-            solr_count = response.num_found
-            current_page += 1
-        return sorted(solr_ids)
+        return sorted(self.iter_all_sound_ids_from_index())
 
     def search_sounds(
         self,
@@ -673,6 +736,29 @@ class Solr555PySolrSearchEngine(SearchEngineBase):
         timeout=None,
         enforce_time_allowed=True,
     ):
+        if similar_to is not None and self.similarity_backend is not None:
+            results = self.search_similar_sounds_with_similarity_backend(
+                similar_to,
+                similar_to_similarity_space,
+                similar_to_min_similarity,
+                query_filter=query_filter,
+                field_list=field_list,
+                offset=offset,
+                current_page=current_page,
+                num_sounds=num_sounds,
+                sort=sort,
+                sorting_target=sorting_target,
+                group_by_pack=group_by_pack,
+                num_sounds_per_pack_group=num_sounds_per_pack_group,
+                facets=facets,
+                only_sounds_with_pack=only_sounds_with_pack,
+                only_sounds_within_ids=only_sounds_within_ids,
+                group_counts_as_one_in_facets=group_counts_as_one_in_facets,
+                timeout=timeout,
+            )
+            if results is not None:
+                return results
+
         # Tell solr to stop after this time. Give similarity a bit more time
         if not enforce_time_allowed:
             query = SolrQuery(time_allowed=None)
@@ -944,6 +1030,143 @@ class Solr555PySolrSearchEngine(SearchEngineBase):
         except pysolr.SolrError as e:
             _raise_search_engine_exception(e)
 
+    def search_similar_sounds_with_similarity_backend(
+        self,
+        similar_to,
+        similar_to_similarity_space,
+        similar_to_min_similarity,
+        query_filter="",
+        field_list=None,
+        offset=0,
+        current_page=None,
+        num_sounds=settings.SOUNDS_PER_PAGE,
+        sort=settings.SEARCH_SOUNDS_SORT_OPTION_AUTOMATIC,
+        sorting_target=None,
+        group_by_pack=False,
+        num_sounds_per_pack_group=1,
+        facets=None,
+        only_sounds_with_pack=False,
+        only_sounds_within_ids=False,
+        group_counts_as_one_in_facets=False,
+        timeout=None,
+    ):
+        """
+        Similarity search using self.similarity_backend (see settings.SEARCH_ENGINE_SIMILARITY_BACKEND_CLASS)
+        instead of Solr's dense vector search. Filters are applied by getting the IDs of all the sounds matching them
+        from Solr and passing these to the similarity backend, which only returns similar sounds among them. When
+        results are sorted by similarity (the automatic sorting option) results are paginated here, and Solr is only
+        queried again for facets or extra fields. Otherwise, Solr sorts (and groups) the sounds returned by the
+        similarity backend.
+        Returns None if the query can't be answered with the similarity backend (results sorted by similarity and
+        grouped by pack, or filters matching more than settings.SIMILARITY_BACKEND_MAX_FILTERED_SOUNDS sounds), in
+        which case Solr's dense vector search should be used.
+        """
+        sort_by_similarity = sorting_target is None and sort == settings.SEARCH_SOUNDS_SORT_OPTION_AUTOMATIC
+        if sort_by_similarity and group_by_pack:
+            # Solr can't group the sounds returned by the similarity backend while keeping them sorted by similarity
+            return None
+
+        start_time = time.monotonic()
+        if current_page is not None:
+            offset = (current_page - 1) * num_sounds
+        no_results = SearchResults(num_found=0, start=offset, num_rows=0, non_grouped_number_of_results=0)
+        if similar_to_similarity_space not in settings.SIMILARITY_SPACES:
+            return no_results
+
+        exclude_ids = None
+        if isinstance(similar_to, list):
+            vector = similar_to
+            if settings.SIMILARITY_SPACES[similar_to_similarity_space].get("l2_norm", False):
+                vector = SoundSimilarityVector.l2_normalize_vector(vector)
+        else:
+            # similar_to should be a sound ID. The sound itself is not included in the results
+            exclude_ids = [int(similar_to)]
+            vector = self.similarity_backend.get_vector(similar_to_similarity_space, int(similar_to))
+            if vector is None:
+                # Sounds not (yet) in the similarity backend can still be used as target
+                ssv = SoundSimilarityVector.objects.filter(
+                    sound_id=int(similar_to), similarity_space_name=similar_to_similarity_space
+                ).first()
+                vector = ssv.vector_array if ssv is not None else None
+        if vector is None:
+            return no_results
+
+        allowed_ids = None
+        query_filter = self.search_process_filter(query_filter, only_sounds_with_pack=only_sounds_with_pack)
+        if query_filter:
+            filter_query = [f"content_type:{SOLR_DOC_CONTENT_TYPES['sound']}", query_filter]
+            # Getting the IDs of the sounds matching the filters takes one request per SEARCH_ENGINE_EXPORT_PAGE_SIZE
+            # sounds, so broad filters are better handled by Solr's vector search
+            if self.count_documents(filter_query) > settings.SIMILARITY_BACKEND_MAX_FILTERED_SOUNDS:
+                return None
+            allowed_ids = [int(document_id) for document_id in self.export_document_ids(filter_query)]
+        if only_sounds_within_ids:
+            allowed_ids = list(
+                set(only_sounds_within_ids) if allowed_ids is None else set(allowed_ids) & set(only_sounds_within_ids)
+            )
+        sound_ids, scores = self.similarity_backend.search(
+            similar_to_similarity_space,
+            vector,
+            min_similarity=similar_to_min_similarity,
+            num_results=settings.SIMILARITY_BACKEND_MAX_RESULTS,
+            allowed_ids=allowed_ids,
+            exclude_ids=exclude_ids,
+        )
+        if len(sound_ids) == 0:
+            return no_results
+        scores_per_sound_id = dict(zip(sound_ids.tolist(), scores.tolist()))
+
+        if not sort_by_similarity:
+            results = self.search_sounds(
+                field_list=field_list,
+                offset=offset,
+                num_sounds=num_sounds,
+                sort=sort,
+                sorting_target=sorting_target,
+                group_by_pack=group_by_pack,
+                num_sounds_per_pack_group=num_sounds_per_pack_group,
+                facets=facets,
+                only_sounds_within_ids=sound_ids.tolist(),
+                group_counts_as_one_in_facets=group_counts_as_one_in_facets,
+                timeout=timeout,
+            )
+            for doc in results.docs:
+                doc["score"] = scores_per_sound_id.get(doc["id"], doc.get("score"))
+            return results
+
+        page_sound_ids = sound_ids[offset : offset + num_sounds].tolist()
+        docs = [{"id": sound_id, "score": scores_per_sound_id[sound_id]} for sound_id in page_sound_ids]
+        if page_sound_ids and field_list is not None and set(field_list) - {"id", "score"}:
+            # Get the requested fields of the sounds in the page from Solr (in the order of the page)
+            docs_per_sound_id = {
+                doc["id"]: doc
+                for doc in self.search_sounds(
+                    field_list=field_list,
+                    num_sounds=len(page_sound_ids),
+                    only_sounds_within_ids=page_sound_ids,
+                    timeout=timeout,
+                ).docs
+            }
+            docs = [dict(docs_per_sound_id.get(doc["id"], {}), **doc) for doc in docs]
+        results_facets = {}
+        if facets is not None:
+            results_facets = self.search_sounds(
+                num_sounds=0,
+                facets=facets,
+                only_sounds_within_ids=sound_ids.tolist(),
+                group_counts_as_one_in_facets=group_counts_as_one_in_facets,
+                timeout=timeout,
+            ).facets
+        return SearchResults(
+            docs=docs,
+            num_found=len(sound_ids),
+            start=offset,
+            num_rows=len(docs),
+            non_grouped_number_of_results=len(sound_ids),
+            facets=results_facets,
+            q_time=int((time.monotonic() - start_time) * 1000),
+        )
+
     def get_random_sound_id(self):
         query = SolrQuery()
         rand_key = random.randint(1, 10000000)  # noqa: S311
@@ -979,26 +1202,15 @@ class Solr555PySolrSearchEngine(SearchEngineBase):
                 _raise_search_engine_exception(e)
         return results
 
+    def iter_sim_vector_document_ids(self, similarity_space_name, page_size=settings.SEARCH_ENGINE_EXPORT_PAGE_SIZE):
+        filter_query = f'similarity_space:"{similarity_space_name}" content_type:"v"'
+        yield from self.export_document_ids(filter_query, page_size=page_size)
+
     def get_all_sim_vector_document_ids_per_similarity_space(self):
-        page_size = 2000
-        results = {}
-        for similarity_space_name in settings.SIMILARITY_SPACES.keys():
-            solr_ids = []
-            solr_count = None
-            current_page = 1
-            while solr_count is None or len(solr_ids) < solr_count:
-                query = SolrQuery(time_allowed=None)
-                filter_query = f'similarity_space:"{similarity_space_name}" content_type:"v"'
-                query.set_query("*:*")
-                query.set_query_options(
-                    start=(current_page - 1) * page_size, rows=page_size, field_list=["id"], filter_query=filter_query
-                )
-                response = self.get_sounds_index(timeout=60).search(search_handler="select", **query.as_kwargs())
-                solr_ids += [element["id"] for element in response.docs]
-                solr_count = response.num_found
-                current_page += 1
-            results[similarity_space_name] = solr_ids
-        return results
+        return {
+            similarity_space_name: list(self.iter_sim_vector_document_ids(similarity_space_name))
+            for similarity_space_name in settings.SIMILARITY_SPACES.keys()
+        }
 
     # Forum posts methods
     def add_forum_posts_to_index(self, forum_post_objects):
@@ -118,6 +118,12 @@ class SolrQuery:
         self.params["fq"] = filter_query
         self.params["fl"] = ",".join(field_list) if field_list else field_list
 
+    def set_cursor_mark(self, cursor_mark):
+        """Set the cursor mark for deep paging (use "*" for the first page). Sort must include the unique key field
+        and start must not be set.
+        """
+        self.params["cursorMark"] = cursor_mark
+
     def add_facet_fields(self, *args):
         """Adds facet fields"""
         self.params["facet"] = True
@@ -413,6 +419,9 @@ class SolrResponseInterpreter:
 
         self.q_time = response["responseHeader"]["QTime"]
 
+        # Only present when the query used a cursor mark
+        self.next_cursor_mark = response.get("nextCursorMark")
+
         self.facets = {}
         if "facet_counts" in response:
             # "old" Solr faceting format
@@ -605,6 +605,23 @@ def test_sound_random_sound(search_engine_sounds_backend):
     )
 
 
+@pytest.mark.search_engine
+@pytest.mark.sounds
+@pytest.mark.django_db
+def test_sound_export_all_ids(search_engine_sounds_backend, test_sounds):
+    """Test that cursor-based export returns all sound IDs and sim vector document IDs with small pages"""
+    sound_ids = list(search_engine_sounds_backend.iter_all_sound_ids_from_index(page_size=3))
+    assert sorted(sound_ids) == sorted([s.id for s in test_sounds]), "Exported sound IDs do not match indexed sounds"
+    assert len(sound_ids) == len(set(sound_ids)), "Exported sound IDs contain duplicates"
+    assert search_engine_sounds_backend.get_all_sound_ids_from_index() == sorted(sound_ids)
+
+    for similarity_space_name in settings.SIMILARITY_SPACES.keys():
+        document_ids = list(
+            search_engine_sounds_backend.iter_sim_vector_document_ids(similarity_space_name, page_size=3)
+        )
+        assert len(document_ids) == len(set(document_ids)), "Exported sim vector document IDs contain duplicates"
+
+
 @pytest.mark.search_engine
 @pytest.mark.sounds
 @pytest.mark.django_db
@@ -0,0 +1,192 @@
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from sounds.models import SoundSimilarityVector
+from utils.search import SearchResults, get_similarity_backend
+from utils.search.backends import numpy_similarity, solr555pysolr
+from utils.test_helpers import create_user_and_sounds, override_similarity_index_path_with_temp_directory
+
+TEST_SIMILARITY_SPACES = {
+    "test_l2": {"vector_property_name": "v", "vector_size": 2, "l2_norm": True, "analyzer": "a"},
+    "test_euclidean": {"vector_property_name": "v", "vector_size": 2, "l2_norm": False, "analyzer": "a"},
+}
+
+
+@override_settings(
+    SIMILARITY_SPACES=TEST_SIMILARITY_SPACES,
+    SIMILARITY_SPACES_NAMES=list(TEST_SIMILARITY_SPACES.keys()),
+    SEARCH_ENGINE_SIMILARITY_BACKEND_CLASS="utils.search.backends.numpy_similarity.NumpySimilarityBackend",
+)
+class NumpySimilarityBackendTest(TestCase):
+    fixtures = ["licenses"]
+
+    def setUp(self):
+        numpy_similarity._similarity_indexes.clear()
+        _, _, sounds = create_user_and_sounds(num_sounds=5, processing_state="OK", moderation_state="OK")
+        self.sound_ids = [sound.id for sound in sounds]
+        # Unit vectors at increasing angles, so similarity to the first one decreases with the position
+        angles = np.radians([0, 10, 30, 60, 120])
+        self.vectors = np.stack([np.cos(angles), np.sin(angles)], axis=1).astype(np.float32)
+        for sound_id, vector in zip(self.sound_ids, self.vectors):
+            for similarity_space_name in TEST_SIMILARITY_SPACES:
+                SoundSimilarityVector.objects.create(
+                    sound_id=sound_id, similarity_space_name=similarity_space_name, vector=vector
+                )
+        # Sounds which are not moderated are not indexed
+        _, _, sounds = create_user_and_sounds(num_sounds=1, count_offset=5, username="testuser2")
+        SoundSimilarityVector.objects.create(sound=sounds[0], similarity_space_name="test_l2", vector=[1.0, 0.0])
+
+    @override_similarity_index_path_with_temp_directory
+    def test_search(self):
+        backend = get_similarity_backend()
+        self.assertEqual(backend.rebuild_index("test_l2"), 5)
+        self.assertEqual(backend.rebuild_index("test_euclidean"), 5)
+
+        # Scores are computed like in the search engine
+        sound_ids, scores = backend.search("test_l2", self.vectors[0], min_similarity=0)
+        self.assertListEqual(sound_ids.tolist(), self.sound_ids)
+        np.testing.assert_allclose(scores, (1 + self.vectors @ self.vectors[0]) / 2, rtol=1e-6)
+        sound_ids, scores = backend.search("test_euclidean", self.vectors[0], min_similarity=0)
+        self.assertListEqual(sound_ids.tolist(), self.sound_ids)
+        np.testing.assert_allclose(
+            scores, 1 / (1 + np.sum((self.vectors - self.vectors[0]) ** 2, axis=1)), rtol=1e-5, atol=1e-6
+        )
+
+        # Results are limited by min similarity, number of results, allowed IDs and excluded IDs
+        sound_ids, _ = backend.search("test_l2", self.vectors[0], min_similarity=(1 + np.cos(np.radians(45))) / 2)
+        self.assertListEqual(sound_ids.tolist(), self.sound_ids[:3])
+        sound_ids, _ = backend.search("test_l2", self.vectors[0], min_similarity=0, num_results=2)
+        self.assertListEqual(sound_ids.tolist(), self.sound_ids[:2])
+        sound_ids, _ = backend.search(
+            "test_l2",
+            self.vectors[0],
+            min_similarity=0,
+            allowed_ids=[self.sound_ids[1], self.sound_ids[4], 10**6],
+            exclude_ids=[self.sound_ids[1]],
+        )
+        self.assertListEqual(sound_ids.tolist(), [self.sound_ids[4]])
+        sound_ids, _ = backend.search("test_l2", self.vectors[0], min_similarity=0, allowed_ids=[])
+        self.assertListEqual(sound_ids.tolist(), [])
+
+    @override_similarity_index_path_with_temp_directory
+    def test_updates(self):
+        backend = get_similarity_backend()
+        # Sounds can be indexed incrementally without building the index first
+        backend.update_sounds(self.sound_ids[:2])
+        sound_ids, _ = backend.search("test_l2", self.vectors[0], min_similarity=0)
+        self.assertListEqual(sound_ids.tolist(), self.sound_ids[:2])
+
+        backend.rebuild_index("test_l2")
+        np.testing.assert_array_equal(backend.get_vector("test_l2", self.sound_ids[3]), self.vectors[3])
+
+        # Updated vectors replace the ones in the index, and removed sounds are no longer returned
+        SoundSimilarityVector.objects.filter(sound_id=self.sound_ids[4]).update(
+            vector_data=SoundSimilarityVector.encode_vector([1.0, 0.0])
+        )
+        SoundSimilarityVector.objects.filter(sound_id=self.sound_ids[3]).delete()
+        backend.update_sounds([self.sound_ids[4], self.sound_ids[3]])
+        backend.remove_sounds([self.sound_ids[2]])
+        sound_ids, _ = backend.search("test_l2", self.vectors[0], min_similarity=0)
+        self.assertListEqual(sound_ids.tolist(), [self.sound_ids[0], self.sound_ids[4], self.sound_ids[1]])
+        self.assertIsNone(backend.get_vector("test_l2", self.sound_ids[3]))
+        np.testing.assert_array_equal(backend.get_vector("test_l2", self.sound_ids[4]), [1.0, 0.0])
+
+        # Rebuilding the index compacts the updates (sound 2 still has a vector in the DB, so it is indexed again)
+        backend.rebuild_index("test_l2")
+        sound_ids, _ = backend.search("test_l2", self.vectors[0], min_similarity=0)
+        self.assertListEqual(
+            sound_ids.tolist(), [self.sound_ids[0], self.sound_ids[4], self.sound_ids[1], self.sound_ids[2]]
+        )
+
+    @override_similarity_index_path_with_temp_directory
+    def test_updates_are_loaded_incrementally(self):
+        backend = get_similarity_backend()
+        backend.rebuild_index("test_l2")
+        index = numpy_similarity.get_similarity_index("test_l2")
+        self.assertFalse(backend.needs_rebuild("test_l2"))
+
+        backend.remove_sounds([self.sound_ids[2], self.sound_ids[0]])
+        self.assertIs(numpy_similarity.get_similarity_index("test_l2"), index)
+        SoundSimilarityVector.objects.filter(sound_id=self.sound_ids[1]).update(
+            vector_data=SoundSimilarityVector.encode_vector([0.0, 1.0])
+        )
+        backend.update_sounds([self.sound_ids[0], self.sound_ids[1]])
+        index = numpy_similarity.get_similarity_index("test_l2")
+        self.assertEqual(index.num_updates, 4)
+
+        # Updates loaded in several steps give the same index as loading all of them at once
+        reloaded_index = numpy_similarity.SimilarityIndex("test_l2", index.snapshot_path)
+        for attribute in ["updated_ids", "updated_deleted", "updated_vectors", "not_updated"]:
+            np.testing.assert_array_equal(getattr(index, attribute), getattr(reloaded_index, attribute))
+        sound_ids, _ = backend.search("test_l2", self.vectors[0], min_similarity=0)
+        self.assertListEqual(sound_ids.tolist(), [self.sound_ids[i] for i in [0, 3, 1, 4]])
+
+        # The index needs to be rebuilt when there are too many updates
+        with override_settings(SIMILARITY_INDEX_MAX_UPDATES_RATIO=0.5):
+            self.assertTrue(backend.needs_rebuild("test_l2"))
+            backend.rebuild_index("test_l2")
+            self.assertFalse(backend.needs_rebuild("test_l2"))
+
+    @override_similarity_index_path_with_temp_directory
+    def test_search_sounds_with_similarity_backend(self):
+        get_similarity_backend().rebuild_index("test_l2")
+        search_engine = solr555pysolr.Solr555PySolrSearchEngine()
+        sounds_index = mock.Mock()
+        with (
+            mock.patch.object(search_engine, "get_sounds_index", return_value=sounds_index),
+            mock.patch.object(
+                search_engine, "export_document_ids", return_value=iter([str(self.sound_ids[2]), "999999"])
+            ) as export_document_ids,
+            mock.patch.object(search_engine, "count_documents", return_value=2),
+        ):
+            # Results sorted by similarity are paginated without querying the search engine
+            results = search_engine.search_sounds(
+                similar_to=self.sound_ids[0],
+                similar_to_similarity_space="test_l2",
+                similar_to_min_similarity=0,
+                num_sounds=2,
+                current_page=2,
+            )
+            self.assertListEqual([doc["id"] for doc in results.docs], self.sound_ids[3:5])
+            self.assertEqual(results.num_found, 4)
+            sounds_index.search.assert_not_called()
+            export_document_ids.assert_not_called()
+
+            # Filters are applied by getting the IDs of the sounds matching them from the search engine
+            results = search_engine.search_sounds(
+                similar_to=self.vectors[0].tolist(),
+                similar_to_similarity_space="test_l2",
+                similar_to_min_similarity=0,
+                query_filter="samplerate:44100",
+            )
+            self.assertListEqual([doc["id"] for doc in results.docs], [self.sound_ids[2]])
+            self.assertIn("+samplerate:44100", export_document_ids.call_args.args[0])
+
+            # Filters matching too many sounds are left to the search engine's vector search
+            with override_settings(SIMILARITY_BACKEND_MAX_FILTERED_SOUNDS=1):
+                self.assertIsNone(
+                    search_engine.search_similar_sounds_with_similarity_backend(
+                        self.sound_ids[0], "test_l2", 0, query_filter="samplerate:44100"
+                    )
+                )
+            self.assertEqual(export_document_ids.call_count, 1)
+
+            # Results sorted by other criteria are sorted by the search engine, but keep the similarity scores
+            with mock.patch.object(
+                search_engine, "search_sounds", return_value=SearchResults(docs=[{"id": self.sound_ids[2], "score": 1}])
+            ) as search_sounds:
+                results = search_engine.search_similar_sounds_with_similarity_backend(
+                    self.sound_ids[0], "test_l2", 0, sort=settings.SEARCH_SOUNDS_SORT_OPTION_DATE_NEW_FIRST
+                )
+            self.assertListEqual(search_sounds.call_args.kwargs["only_sounds_within_ids"], self.sound_ids[1:])
+            self.assertAlmostEqual(results.docs[0]["score"], (1 + self.vectors[2] @ self.vectors[0]) / 2, places=6)
+
+            # Results sorted by similarity and grouped by pack are left to the search engine's vector search
+            self.assertIsNone(
+                search_engine.search_similar_sounds_with_similarity_backend(
+                    self.sound_ids[0], "test_l2", 0, group_by_pack=True
+                )
+            )
@@ -1,6 +1,9 @@
+from unittest import mock
+
 from django.test import TestCase
 
 from utils.search.backends import solr555pysolr
+from utils.search.backends.solr_common import SolrResponseInterpreter
 
 
 class Solr555PySolrTest(TestCase):
@@ -20,3 +23,35 @@ class Solr555PySolrTest(TestCase):
         filter_query = "username:alastairp -license:(a OR b)"
         updated = solr555pysolr.Solr555PySolrSearchEngine().search_filter_make_intersection(filter_query)
         self.assertEqual(updated, "+username:alastairp -license:(a OR b)")
+
+    def test_export_document_ids_uses_cursor_mark(self):
+        def make_response(ids, next_cursor_mark):
+            return SolrResponseInterpreter(
+                {
+                    "responseHeader": {"QTime": 1, "params": {}},
+                    "response": {"numFound": 5, "start": 0, "docs": [{"id": str(i)} for i in ids]},
+                    "nextCursorMark": next_cursor_mark,
+                }
+            )
+
+        sounds_index = mock.Mock()
+        # Last page returns the same cursor mark that was sent, which means there are no more results
+        sounds_index.search.side_effect = [
+            make_response([1, 10], "AoE1"),
+            make_response([2, 3], "AoE2"),
+            make_response([4], "AoE3"),
+            make_response([], "AoE3"),
+        ]
+        search_engine = solr555pysolr.Solr555PySolrSearchEngine()
+        with mock.patch.object(search_engine, "get_sounds_index", create=True, return_value=sounds_index):
+            sound_ids = search_engine.iter_all_sound_ids_from_index(page_size=2)
+            self.assertEqual(sounds_index.search.call_count, 0)  # Nothing is requested until the ids are consumed
+            self.assertListEqual(list(sound_ids), [1, 10, 2, 3, 4])
+
+        cursor_marks = [call.kwargs["cursorMark"] for call in sounds_index.search.call_args_list]
+        self.assertListEqual(cursor_marks, ["*", "AoE1", "AoE2", "AoE3"])
+        for call in sounds_index.search.call_args_list:
+            self.assertEqual(call.kwargs["sort"], "id asc")
+            self.assertEqual(call.kwargs["rows"], 2)
+            self.assertNotIn("start", call.kwargs)
+            self.assertIn("content_type:s", call.kwargs["fq"])
@@ -20,19 +20,31 @@
 
 from __future__ import annotations
 
+import hashlib
+import json
 import logging
+import time
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db.models.query import RawQuerySet
+from prometheus_client import Counter
 
 import sounds.models
 import utils.search
 from utils.pagination import PreSlicedCountProvidedPaginator
-from utils.search import SearchEngineException, SearchResults, get_search_engine
+from utils.search import SearchEngineException, SearchResults, get_search_engine, get_similarity_backend
 
 search_logger = logging.getLogger("search")
 console_logger = logging.getLogger("console")
 
+search_results_cache_requests_total = Counter(
+    "freesound_search_results_cache_requests_total",
+    "Search page queries looked up in the search results cache. result=hit if results were served from the cache, "
+    "result=miss if the search engine had to be queried.",
+    ["result"],
+)
+
 
 def parse_weights_parameter(weights_param):
     """param weights can be used to specify custom field weights with this format
@@ -98,6 +110,8 @@ def add_sounds_to_search_engine(
         get_search_engine(sounds_index_url=solr_collection_url).add_sounds_to_index(
             sound_objects, update=update, include_similarity_vectors=include_similarity_vectors
         )
+        if include_similarity_vectors:
+            update_sounds_in_similarity_backend([sound.id for sound in sound_objects])
         return num_sounds
     except SearchEngineException as e:
         console_logger.error(f"Failed to add sounds to search engine index: {str(e)}")
@@ -105,6 +119,27 @@ def add_sounds_to_search_engine(
         return 0
 
 
+def add_sound_documents_to_search_engine(documents: list[dict], solr_collection_url=None) -> int:
+    """Add sound documents built with SearchEngineBase.build_sound_documents to the search engine
+
+    Args:
+        documents: list of sound documents to index
+    Returns:
+        number of sounds added to the index
+    """
+    if not documents:
+        return 0
+    try:
+        console_logger.debug(f"Adding {len(documents)} sound documents to the search engine")
+        search_logger.debug(f"Adding {len(documents)} sound documents to the search engine")
+        get_search_engine(sounds_index_url=solr_collection_url).add_sound_documents_to_index(documents)
+        return len(documents)
+    except SearchEngineException as e:
+        console_logger.error(f"Failed to add sounds to search engine index: {str(e)}")
+        search_logger.error(f"Failed to add sounds to search engine index: {str(e)}")
+        return 0
+
+
 def send_update_similarity_vectors_in_search_engine(
     sound_objects: list[sounds.models.Sound], solr_collection_url=None
 ) -> int:
@@ -123,6 +158,7 @@ def send_update_similarity_vectors_in_search_engine(
         console_logger.debug(f"Adding similarity vectors for {num_sounds} sounds to the search engine")
         search_logger.debug(f"Adding similarity vectors for {num_sounds} sounds to the search engine")
         get_search_engine(sounds_index_url=solr_collection_url).update_similarity_vectors_in_index(sound_objects)
+        update_sounds_in_similarity_backend([sound.id for sound in sound_objects])
         return num_sounds
     except SearchEngineException as e:
         console_logger.error(f"Failed to add sounds to search engine index: {str(e)}")
@@ -130,6 +166,19 @@ def send_update_similarity_vectors_in_search_engine(
         return 0
 
 
+def update_sounds_in_similarity_backend(sound_ids: list[int]):
+    """Index the current similarity vectors of the given sounds in the similarity backend (if one is configured in
+    settings.SEARCH_ENGINE_SIMILARITY_BACKEND_CLASS). This is called when sounds are indexed with similarity vectors
+    in the search engine so that both stay in sync.
+
+    Args:
+        sound_ids: IDs of the sounds to update
+    """
+    similarity_backend = get_similarity_backend()
+    if similarity_backend is not None:
+        similarity_backend.update_sounds(sound_ids)
+
+
 def delete_sounds_from_search_engine(sound_ids: list[int], solr_collection_url=None):
     """Delete sounds from the search engine
 
@@ -143,6 +192,11 @@ def delete_sounds_from_search_engine(sound_ids: list[int], solr_collection_url=N
     except SearchEngineException as e:
         console_logger.info(f"Could not delete sounds: {str(e)}")
         search_logger.info(f"Could not delete sounds: {str(e)}")
+    similarity_backend = get_similarity_backend()
+    if similarity_backend is not None:
+        similarity_backend.remove_sounds(sound_ids)
+    # Deleted sounds should not appear in cached search results
+    bump_search_index_generation()
 
 
 def delete_all_sounds_from_search_engine(solr_collection_url=None):
@@ -154,43 +208,53 @@ def delete_all_sounds_from_search_engine(solr_collection_url=None):
     except SearchEngineException as e:
         console_logger.info(f"Could not delete sounds: {str(e)}")
         search_logger.info(f"Could not delete sounds: {str(e)}")
+    bump_search_index_generation()
 
 
-def get_all_sound_ids_from_search_engine(solr_collection_url=None) -> list[int]:
-    """Retrieves the list of all sound IDs currently indexed in the search engine
+def get_all_sound_ids_from_search_engine(
+    solr_collection_url=None, page_size=settings.SEARCH_ENGINE_EXPORT_PAGE_SIZE
+) -> set[int]:
+    """Retrieves the set of all sound IDs currently indexed in the search engine. IDs are streamed from the search
+    engine page by page and added to the set as they arrive.
 
     Args:
+        solr_collection_url: URL of the solr collection to use (defaults to the sounds index in settings)
         page_size: number of sound IDs to retrieve per search engine query
 
     Returns:
-        list of sound IDs indexed in the search engine
+        set of sound IDs indexed in the search engine
     """
     console_logger.info("Getting all sound ids from search engine")
     search_engine = get_search_engine(sounds_index_url=solr_collection_url)
     try:
-        return search_engine.get_all_sound_ids_from_index()
+        return set(search_engine.iter_all_sound_ids_from_index(page_size=page_size))
     except SearchEngineException as e:
         search_logger.info(f"Could not retrieve all sound IDs from search engine: {str(e)}")
-    return []
+    return set()
 
 
-def get_all_sim_vector_sound_ids_from_search_engine(solr_collection_url=None) -> dict[str, list[int]]:
-    """Retrieves the list of all sound IDs with similarity vectors for all similarity spaces currently
-    indexed in the search engine
+def get_all_sim_vector_sound_ids_from_search_engine(
+    solr_collection_url=None, page_size=settings.SEARCH_ENGINE_EXPORT_PAGE_SIZE
+) -> dict[str, set[int]]:
+    """Retrieves the set of all sound IDs with similarity vectors for all similarity spaces currently
+    indexed in the search engine. Similarity vector document IDs are streamed from the search engine page by page.
 
     Args:
-        page_size: number of sound IDs to retrieve per search engine query
+        solr_collection_url: URL of the solr collection to use (defaults to the sounds index in settings)
+        page_size: number of similarity vector document IDs to retrieve per search engine query
 
     Returns:
-        list of sound IDs with per similarity space indexed in the search engine
+        set of sound IDs with similarity vectors per similarity space indexed in the search engine
     """
     console_logger.info("Getting all sound ids with similarity vectors from search engine")
     search_engine = get_search_engine(sounds_index_url=solr_collection_url)
     sim_vector_sound_ids = {}
     try:
-        sim_vector_document_ids = search_engine.get_all_sim_vector_document_ids_per_similarity_space()
-        for key, document_ids in sim_vector_document_ids.items():
-            sim_vector_sound_ids[key] = list(set([int(doc_id.split("/")[0]) for doc_id in document_ids]))
+        for similarity_space_name in settings.SIMILARITY_SPACES.keys():
+            sim_vector_sound_ids[similarity_space_name] = {
+                int(doc_id.split("/")[0])
+                for doc_id in search_engine.iter_sim_vector_document_ids(similarity_space_name, page_size=page_size)
+            }
     except SearchEngineException as e:
         search_logger.info(
             f"Could not retrieve all sound IDs with similarity vectors for similarity space from search engine: {str(e)}"
@@ -300,14 +364,42 @@ def allow_beta_search_features(request):
         return True
 
 
-def get_empty_query_cache_key(request, use_beta_features=None):
-    if not settings.SEARCH_EMPTY_QUERY_CACHE_KEY:
-        return False
-    if use_beta_features is None:
-        # If not specified, we check if the user has beta features enabled
-        use_beta_features = allow_beta_search_features(request)
-    return (
-        settings.SEARCH_EMPTY_QUERY_CACHE_KEY
-        if not use_beta_features
-        else settings.SEARCH_EMPTY_QUERY_CACHE_KEY + "_beta"
+def get_search_index_generation():
+    """Returns the current search index generation number, which is part of the keys of the search results cache so
+    that cached results are invalidated whenever the index is updated (see bump_search_index_generation). If the
+    generation number is not in the cache (first use or evicted), it is initialised with a timestamp so that the
+    numbers of older generations are never reused."""
+    return cache.get_or_set(settings.SEARCH_RESULTS_CACHE_GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def bump_search_index_generation():
+    """Increments the search index generation number. This should be called every time changes are committed to the
+    search index so that results cached for the previous generation are not used anymore (they are not deleted but
+    will expire after settings.SEARCH_RESULTS_CACHE_TIME)."""
+    try:
+        return cache.incr(settings.SEARCH_RESULTS_CACHE_GENERATION_KEY)
+    except ValueError:
+        # Generation number not in the cache, initialise it
+        return get_search_index_generation()
+
+
+def get_search_results_cache_key(query_params, use_beta_features=False):
+    """Returns the key to store the results of a search engine query in the search results cache, or None if caching
+    search results is disabled.
+
+    Args:
+        query_params: query parameters as returned by SearchQueryProcessor.as_query_params.
+        use_beta_features: whether the query is made for a user with beta search features.
+
+    Returns:
+        str or None: cache key including the current search index generation and a hash of the query parameters.
+    """
+    if not settings.SEARCH_RESULTS_CACHE_ENABLED:
+        return None
+    normalised_query_params = json.dumps(query_params, sort_keys=True, default=str)
+    return "{}:{}:{}:{}".format(
+        settings.SEARCH_RESULTS_CACHE_KEY_PREFIX,
+        get_search_index_generation(),
+        "beta" if use_beta_features else "default",
+        hashlib.sha256(normalised_query_params.encode()).hexdigest(),
     )
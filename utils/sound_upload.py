@@ -32,12 +32,12 @@ import openpyxl
 import xlrd
 from django.apps import apps
 from django.conf import settings
-from django.contrib.auth.models import Group, User
+from django.contrib.auth.models import User
 from django.urls import reverse
 
 from geotags.models import GeoTag
 from utils.audioprocessing import get_sound_type
-from utils.cache import invalidate_user_template_caches
+from utils.cache import invalidate_all_moderators_header_cache, invalidate_user_template_caches
 from utils.cdn import create_cdn_symlink
 from utils.filesystem import md5file, remove_directory, remove_directory_if_empty
 from utils.forms import filename_has_valid_extension
@@ -274,9 +274,7 @@ def create_sound(
         # create moderation ticket!
         sound.create_moderation_ticket()
         invalidate_user_template_caches(user.id)
-        moderators = Group.objects.get(name="moderators").user_set.all()
-        for moderator in moderators:
-            invalidate_user_template_caches(moderator.id)
+        invalidate_all_moderators_header_cache()
 
     # 9 process sound and packs
     sound.compute_crc()
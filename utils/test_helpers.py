@@ -193,6 +193,10 @@ override_analysis_path_with_temp_directory = partial(
     override_path_with_temp_directory, settings_path_name="ANALYSIS_PATH"
 )
 
+override_similarity_index_path_with_temp_directory = partial(
+    override_path_with_temp_directory, settings_path_name="SIMILARITY_INDEX_PATH"
+)
+
 override_sounds_path_with_temp_directory = partial(override_path_with_temp_directory, settings_path_name="SOUNDS_PATH")
 
 override_previews_path_with_temp_directory = partial(
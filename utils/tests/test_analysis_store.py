@@ -0,0 +1,136 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+import os
+
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from utils import analysis_store
+from utils.test_helpers import override_analysis_path_with_temp_directory
+
+
+@override_settings(ANALYSIS_STORE_SHARD_SIZE=10)
+class AnalysisStoreTest(SimpleTestCase):
+    analysis_data = {
+        "float": 0.123456789012345,
+        "int": 3,
+        "string": "C major",
+        "nan": float("nan"),
+        "none": None,
+        "list_int": [1, 2, 3],
+        "list_mixed": [1, 0.5],
+        "nested": {"a": [0.1, 0.2]},
+        "vector": [0.1, -2.5, 1e-300],
+        "vector2": [1.0] * 100,
+    }
+
+    def assertAnalysisDataEqual(self, data, expected_data):
+        self.assertEqual(data.keys(), expected_data.keys())
+        for key, value in expected_data.items():
+            if key == "nan":
+                self.assertTrue(np.isnan(data[key]))
+            else:
+                self.assertEqual(data[key], value)
+                self.assertEqual(type(data[key]), type(value))
+
+    @override_analysis_path_with_temp_directory
+    def test_add_and_get_analysis_data(self):
+        self.assertFalse(analysis_store.analyzer_has_store("analyzer"))
+        self.assertIsNone(analysis_store.get_analysis_data(1, "analyzer"))
+
+        # Sounds in different shards are added at once
+        analysis_store.add_analysis_data(
+            "analyzer", [(sound_id, dict(self.analysis_data, id=sound_id)) for sound_id in [25, 3, 11, 1]]
+        )
+        self.assertTrue(analysis_store.analyzer_has_store("analyzer"))
+        for sound_id in [1, 3, 11, 25]:
+            self.assertAnalysisDataEqual(
+                analysis_store.get_analysis_data(sound_id, "analyzer"), dict(self.analysis_data, id=sound_id)
+            )
+        self.assertIsNone(analysis_store.get_analysis_data(2, "analyzer"))
+        self.assertIsNone(analysis_store.get_analysis_data(1, "other_analyzer"))
+
+        # Only the selected descriptors are returned, vectors can be returned as memory-mapped arrays
+        self.assertDictEqual(
+            analysis_store.get_analysis_data(3, "analyzer", descriptors=["int", "vector"]),
+            {"int": 3, "vector": [0.1, -2.5, 1e-300]},
+        )
+        vector = analysis_store.get_analysis_data(3, "analyzer", descriptors=["vector"], vectors_as_arrays=True)[
+            "vector"
+        ]
+        self.assertIsInstance(vector, np.memmap)
+        self.assertListEqual(vector.tolist(), [0.1, -2.5, 1e-300])
+
+    @override_analysis_path_with_temp_directory
+    def test_replace_and_delete_analysis_data(self):
+        analysis_store.add_analysis_data("analyzer", [(1, {"value": 1}), (2, {"value": 2})])
+        self.assertDictEqual(analysis_store.get_analysis_data(1, "analyzer"), {"value": 1})
+
+        # Data added later replaces the existing data (also when added in the same call)
+        analysis_store.add_analysis_data("analyzer", [(1, {"value": 3}), (1, {"value": 4, "vector": [0.5]})])
+        self.assertDictEqual(analysis_store.get_analysis_data(1, "analyzer"), {"value": 4, "vector": [0.5]})
+        self.assertDictEqual(analysis_store.get_analysis_data(2, "analyzer"), {"value": 2})
+
+        analysis_store.delete_analysis_data(1, "analyzer")
+        self.assertIsNone(analysis_store.get_analysis_data(1, "analyzer"))
+        self.assertDictEqual(analysis_store.get_analysis_data(2, "analyzer"), {"value": 2})
+        analysis_store.add_analysis_data("analyzer", [(1, {"value": 5})])
+        self.assertDictEqual(analysis_store.get_analysis_data(1, "analyzer"), {"value": 5})
+
+        # Deleting data of analyzers without store does not create it
+        analysis_store.delete_analysis_data(1, "other_analyzer")
+        self.assertFalse(analysis_store.analyzer_has_store("other_analyzer"))
+
+    @override_analysis_path_with_temp_directory
+    def test_numpy_values_are_converted(self):
+        analysis_store.add_analysis_data(
+            "analyzer",
+            [
+                (
+                    1,
+                    {
+                        "int": np.int64(3),
+                        "float": np.float32(0.5),
+                        "vector": np.array([0.25, 1.0]),
+                        "list": [np.int32(1)],
+                    },
+                )
+            ],
+        )
+        self.assertAnalysisDataEqual(
+            analysis_store.get_analysis_data(1, "analyzer"),
+            {"int": 3, "float": 0.5, "vector": [0.25, 1.0], "list": [1]},
+        )
+
+        # Values which can't be read back with the same type are not stored
+        with self.assertRaises(TypeError):
+            analysis_store.add_analysis_data("analyzer", [(2, {"value": object()})])
+        self.assertIsNone(analysis_store.get_analysis_data(2, "analyzer"))
+
+        # Nothing is written if the data of any of the sounds can't be stored
+        records_path = os.path.join(analysis_store.get_shard_path("analyzer", 3), analysis_store.RECORDS_FILENAME)
+        records_size = os.path.getsize(records_path)
+        with self.assertRaises(TypeError):
+            analysis_store.add_analysis_data(
+                "analyzer", [(3, {"vector": [0.5, 1.5], "value": 1}), (4, {"value": object()})]
+            )
+        self.assertIsNone(analysis_store.get_analysis_data(3, "analyzer"))
+        self.assertEqual(os.path.getsize(records_path), records_size)
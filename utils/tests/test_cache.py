@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase
+
+from utils.cache import (
+    get_template_cache_generation,
+    get_template_cache_generation_key,
+    get_template_cache_generations,
+    get_versioned_template_cache_key,
+    invalidate_template_cache_generations,
+    invalidate_users_template_caches,
+)
+
+
+class TemplateCacheGenerationsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidate_template_cache_generations(self):
+        generation = get_template_cache_generation("sound", 1)
+        self.assertEqual(get_template_cache_generation("sound", 1), generation)
+        key = get_versioned_template_cache_key("bw_display_sound", "sound", 1, "small", True)
+        cache.set(key, "fragment")
+
+        invalidate_template_cache_generations("sound", [1, 2])
+        invalidate_template_cache_generations("sound", [1])
+        invalidate_template_cache_generations("sound", [])
+        generations = get_template_cache_generations("sound", [1, 2, 3])
+        self.assertEqual(generations[1], generation + 2)
+        self.assertEqual(len(set(generations.values())), 3)
+        # The fragment is no longer reachable with the current key
+        new_key = get_versioned_template_cache_key("bw_display_sound", "sound", 1, "small", True)
+        self.assertNotEqual(new_key, key)
+        self.assertIsNone(cache.get(new_key))
+
+    def test_missing_generations_are_not_reused(self):
+        # Generations which are missing (e.g. evicted from the cache) are initialised with a timestamp so that the
+        # fragments cached with a previous generation of the object are not reachable again
+        generation = get_template_cache_generation("sound", 1)
+        self.assertGreater(generation, 0)
+        key = get_versioned_template_cache_key("bw_display_sound", "sound", 1, "small", True)
+        cache.set(key, "fragment")
+        cache.delete(get_template_cache_generation_key("sound", 1))
+        self.assertGreater(get_template_cache_generation("sound", 1), generation)
+        self.assertIsNone(cache.get(get_versioned_template_cache_key("bw_display_sound", "sound", 1, "small", True)))
+
+        invalidate_template_cache_generations("pack", [1])
+        self.assertGreater(get_template_cache_generation("pack", 1), generation)
+
+    def test_invalidate_users_template_caches(self):
+        cache.set(settings.USER_STATS_CACHE_KEY.format(1), {"num_sounds": 1})
+        generations = get_template_cache_generations("user", [1])
+        invalidate_users_template_caches([1, 2])
+        self.assertEqual(get_template_cache_generation("user", 1), generations[1] + 1)
+        self.assertGreater(get_template_cache_generation("user", 2), generations[1])
+        self.assertIsNone(cache.get(settings.USER_STATS_CACHE_KEY.format(1)))
@@ -0,0 +1,39 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+
+import operator
+
+from django.test import SimpleTestCase
+
+from utils.process_pool import map_in_process_pool
+
+
+class MapInProcessPoolTest(SimpleTestCase):
+    def test_map_in_process_pool(self):
+        items = [(f"item{i}", (i, 2)) for i in range(7)]
+        expected_results = [(f"item{i}", i * 2) for i in range(7)]
+        for workers in [0, 1, 3]:
+            # Results are returned with their context and in the same order as the items
+            self.assertEqual(list(map_in_process_pool(operator.mul, iter(items), workers)), expected_results)
+
+    def test_map_in_process_pool_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            list(map_in_process_pool(operator.truediv, [("a", (1, 1)), ("b", (1, 0))], 2))
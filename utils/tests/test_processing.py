@@ -19,17 +19,27 @@
 #
 
 import os
+import threading
+from tempfile import TemporaryDirectory
 from unittest import mock
 
+import numpy
 from django.conf import settings
 from django.test import TestCase, override_settings
+from PIL import Image
 
 from sounds.models import Sound
+from utils.audioprocessing import color_schemes
+from utils.audioprocessing.benchmark_wave_images import create_wave_images_per_column
 from utils.audioprocessing.freesound_audio_processing import (
     FreesoundAudioProcessor,
     FreesoundAudioProcessorBeforeDescription,
 )
-from utils.audioprocessing.processing import AudioProcessingException
+from utils.audioprocessing.processing import (
+    AudioProcessingException,
+    WaveImagesAnalysis,
+    create_wave_images,
+)
 from utils.sound_upload import get_processing_before_describe_sound_folder
 from utils.test_helpers import (
     create_test_files,
@@ -96,6 +106,15 @@ def create_wave_images_mock_fail(
     raise AudioProcessingException("creation of display images has failed")
 
 
+def concurrent_encoder_mock(barrier):
+    # All preview encoders must be running at the same time for the barrier to be passed
+    def encoder_mock(input_filename, output_filename, quality):
+        barrier.wait()
+        create_test_files(paths=[output_filename])
+
+    return encoder_mock
+
+
 class AudioProcessingTestCase(TestCase):
     fixtures = ["licenses"]
 
@@ -185,6 +204,7 @@ class AudioProcessingTestCase(TestCase):
     @override_processing_tmp_path_with_temp_directory
     @override_sounds_path_with_temp_directory
     @override_previews_path_with_temp_directory
+    @override_displays_path_with_temp_directory
     def test_make_mp3_previews_fails(self, *args):
         self.pre_test()
         first_sound = Sound.objects.first()
@@ -203,6 +223,7 @@ class AudioProcessingTestCase(TestCase):
     @override_processing_tmp_path_with_temp_directory
     @override_sounds_path_with_temp_directory
     @override_previews_path_with_temp_directory
+    @override_displays_path_with_temp_directory
     def test_make_ogg_previews_fails(self, *args):
         self.pre_test()
         first_sound = Sound.objects.first()
@@ -287,6 +308,51 @@ class AudioProcessingTestCase(TestCase):
         self.assertEqual(self.sound.processing_ongoing_state, "FI")
         self.assertFalse(len(os.listdir(settings.PROCESSING_TEMP_DIR)), 0)
 
+    @override_settings(USE_PREVIEWS_WHEN_ORIGINAL_FILES_MISSING=False, PROCESSING_PREVIEW_ENCODING_WORKERS=4)
+    @override_processing_tmp_path_with_temp_directory
+    @override_sounds_path_with_temp_directory
+    @override_previews_path_with_temp_directory
+    @override_displays_path_with_temp_directory
+    def test_previews_encoded_concurrently(self, *args):
+        self.pre_test()
+        first_sound = Sound.objects.first()
+        assert first_sound is not None
+        encoder_mock = concurrent_encoder_mock(threading.Barrier(4, timeout=10))
+        with (
+            mock.patch("utils.audioprocessing.processing.convert_to_mp3", side_effect=encoder_mock),
+            mock.patch("utils.audioprocessing.processing.convert_to_ogg", side_effect=encoder_mock),
+        ):
+            result = FreesoundAudioProcessor(sound_id=first_sound.id).process(skip_displays=True)
+        self.assertTrue(result)
+        self.sound.refresh_from_db()
+        self.assertEqual(self.sound.processing_state, "OK")
+        for location in ["preview.LQ.mp3", "preview.HQ.mp3", "preview.LQ.ogg", "preview.HQ.ogg"]:
+            self.assertTrue(os.path.exists(self.sound.locations(f"{location}.path")))
+            # Wall time of each encoder is reported in the processing log
+            self.assertIn(f"{self.sound.locations(location + '.path')} (encoding took", self.sound.processing_log)
+        self.assertFalse(len(os.listdir(settings.PROCESSING_TEMP_DIR)), 0)
+
+    @override_settings(USE_PREVIEWS_WHEN_ORIGINAL_FILES_MISSING=False)
+    @override_processing_tmp_path_with_temp_directory
+    @override_sounds_path_with_temp_directory
+    @override_previews_path_with_temp_directory
+    @override_displays_path_with_temp_directory
+    def test_displays_created_from_single_analysis(self, *args):
+        self.pre_test()
+        first_sound = Sound.objects.first()
+        assert first_sound is not None
+        with mock.patch(
+            "utils.audioprocessing.processing.WaveImagesAnalysis", wraps=WaveImagesAnalysis
+        ) as wave_images_analysis:
+            result = FreesoundAudioProcessor(sound_id=first_sound.id).process(skip_previews=True)
+        self.assertTrue(result)
+        # Audio file is analyzed only once, for the largest display width
+        wave_images_analysis.assert_called_once()
+        self.assertEqual(wave_images_analysis.call_args.args[1], 780)
+        for size_name in settings.PROCESSING_DISPLAY_SIZES:
+            self.assertTrue(os.path.exists(self.sound.locations(f"display.wave.{size_name}.path")))
+            self.assertTrue(os.path.exists(self.sound.locations(f"display.spectral.{size_name}.path")))
+
 
 class AudioProcessingBeforeDescriptionTestCase(TestCase):
     fixtures = ["licenses"]
@@ -309,3 +375,65 @@ class AudioProcessingBeforeDescriptionTestCase(TestCase):
                 sorted(os.listdir(get_processing_before_describe_sound_folder(uploaded_file_path))),
                 sorted(["wave.png", "spectral.png", "preview.ogg", "preview.mp3", "info.json"]),
             )
+
+
+class WaveImagesTestCase(TestCase):
+    def assertImagesEqual(self, path_a, path_b):
+        with Image.open(path_a) as image_a, Image.open(path_b) as image_b:
+            self.assertEqual(image_a.size, image_b.size)
+            self.assertTrue(numpy.array_equal(numpy.asarray(image_a), numpy.asarray(image_b)))
+
+    def test_create_wave_images_same_as_per_column_renderer(self):
+        with TemporaryDirectory() as tmp_directory:
+            for n_frames in [100, 2 * 44100]:
+                input_path = os.path.join(tmp_directory, f"{n_frames}.wav")
+                create_test_files(paths=[input_path], make_valid_wav_files=True, duration=n_frames / 44100)
+                for width, height in [(195, 101), (780, 301)]:
+                    paths = {
+                        renderer: (
+                            os.path.join(tmp_directory, f"{renderer}_{n_frames}_{width}_w.png"),
+                            os.path.join(tmp_directory, f"{renderer}_{n_frames}_{width}_s.jpg"),
+                        )
+                        for renderer in ["single_pass", "per_column"]
+                    }
+                    create_wave_images(
+                        input_path,
+                        *paths["single_pass"],
+                        width,
+                        height,
+                        2048,
+                        color_scheme=color_schemes.BEASTWHOOSH_COLOR_SCHEME,
+                    )
+                    create_wave_images_per_column(
+                        input_path,
+                        *paths["per_column"],
+                        width,
+                        height,
+                        2048,
+                        color_scheme=color_schemes.BEASTWHOOSH_COLOR_SCHEME,
+                    )
+                    self.assertImagesEqual(paths["single_pass"][0], paths["per_column"][0])
+                    self.assertImagesEqual(paths["single_pass"][1], paths["per_column"][1])
+
+    def test_wave_images_analysis_does_not_depend_on_chunk_size(self):
+        with TemporaryDirectory() as tmp_directory:
+            input_path = os.path.join(tmp_directory, "test.wav")
+            create_test_files(paths=[input_path], make_valid_wav_files=True, duration=1)
+            # Include a width with columns longer than the read chunk
+            for width in [5, 195, 780]:
+                reference = WaveImagesAnalysis(input_path, width, 2048)
+                analysis = WaveImagesAnalysis(input_path, width, 2048, chunk_size=3000)
+                self.assertTrue(numpy.array_equal(reference.peaks(), analysis.peaks()))
+                self.assertTrue(numpy.allclose(reference.magnitude_spectra, analysis.magnitude_spectra))
+
+    def test_downsampled_analysis_same_as_direct_analysis(self):
+        with TemporaryDirectory() as tmp_directory:
+            for n_frames in [100, 2 * 44100]:
+                input_path = os.path.join(tmp_directory, f"{n_frames}.wav")
+                create_test_files(paths=[input_path], make_valid_wav_files=True, duration=n_frames / 44100)
+                analysis = WaveImagesAnalysis(input_path, 780, 2048)
+                for width in [195, 390, 780]:
+                    reference = WaveImagesAnalysis(input_path, width, 2048)
+                    downsampled = analysis.downsampled(width)
+                    self.assertTrue(numpy.array_equal(reference.peaks(), downsampled.peaks()))
+                    self.assertTrue(numpy.array_equal(reference.magnitude_spectra, downsampled.magnitude_spectra))
@@ -1,7 +1,15 @@
 from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
 from django.test import RequestFactory
 
-from utils.ratelimit import RequestLimitReason, count_request_limit_event, request_limit_events_total
+from utils import ratelimit
+from utils.ratelimit import (
+    BlockedIPsMatcher,
+    RequestLimitReason,
+    count_request_limit_event,
+    ip_is_blocked,
+    request_limit_events_total,
+)
 from utils.test_helpers import counter_samples
 
 
@@ -23,3 +31,35 @@ def test_count_request_limit_event_labels_authenticated():
     before = _samples().get(("django_ratelimit", "false", "authenticated"), 0)
     count_request_limit_event(req, RequestLimitReason.DJANGO_RATELIMIT, enforced=False)
     assert _samples()[("django_ratelimit", "false", "authenticated")] == before + 1
+
+
+def test_blocked_ips_matcher():
+    matcher = BlockedIPsMatcher(["10.0.0.0/24", "10.0.1.0/24", "10.0.0.128/25", "192.168.1.1", "2001:db8::/32", "bad"])
+    # Overlapping and adjacent ranges are merged, invalid ones are ignored
+    assert len(matcher) == 3
+    for ip in ["10.0.0.0", "10.0.1.255", "192.168.1.1", "2001:db8::1", "10.0.0.64/26", "10.0.0.0/8"]:
+        assert matcher.is_blocked(ip), ip
+    for ip in ["9.255.255.255", "10.0.2.0/23", "192.168.1.2", "2001:db9::", "::ffff:a00:1", "0.6324", "-"]:
+        assert not matcher.is_blocked(ip), ip
+    assert not BlockedIPsMatcher([]).is_blocked("10.0.0.1")
+
+
+def test_ip_is_blocked(settings, monkeypatch):
+    settings.BLOCKED_IPS = ["10.0.0.0/24"]
+    settings.CACHED_BLOCKED_IPS_TIME = 0
+    monkeypatch.setattr(ratelimit, "blocked_ips_matcher_sources", None)
+    cache.delete(settings.CACHED_BLOCKED_IPS_KEY)
+    assert ip_is_blocked("10.0.0.1")
+    assert not ip_is_blocked("10.0.1.1")
+    matcher = ratelimit.blocked_ips_matcher
+
+    # The matcher is only compiled again when the list of IPs to block changes
+    cache.set(settings.CACHED_BLOCKED_IPS_KEY, [])
+    assert not ip_is_blocked("10.0.1.1")
+    ratelimit.add_new_ip_to_block("10.0.1.0/24")
+    assert ip_is_blocked("10.0.1.1")
+    matcher_with_cached_ips = ratelimit.blocked_ips_matcher
+    assert matcher_with_cached_ips is not matcher
+    assert ip_is_blocked("10.0.1.2")
+    assert ratelimit.blocked_ips_matcher is matcher_with_cached_ips
+    cache.delete(settings.CACHED_BLOCKED_IPS_KEY)
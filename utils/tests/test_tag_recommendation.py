@@ -0,0 +1,141 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+import os
+import tempfile
+from collections import Counter
+from itertools import chain
+
+import numpy as np
+from django.test import SimpleTestCase
+from scipy import sparse
+
+from tagrecommendation.tag_recommendation.data_processor import (
+    build_association_matrix,
+    similarity_matrix_from_association_matrix,
+)
+from tagrecommendation.tag_recommendation.neighbours_table import NeighboursTable
+
+
+class SimilarityMatrixTest(SimpleTestCase):
+    index = {
+        "1": ["loop", "drum", "kick", "drum"],
+        "2": ["drum", "kick"],
+        "3": ["loop", "bass"],
+        "4": ["field-recording"],
+        "5": ["bass", "drum", "loop"],
+    }
+
+    def dense_similarity_matrix(self, tag_threshold, metric):
+        # Dense computation of the similarity matrix cell by cell, as it was done before using sparse matrix products
+        tag_occurrences = Counter(chain.from_iterable(self.index.values()))
+        tags = sorted(tag for tag, occurrences in tag_occurrences.items() if occurrences >= tag_threshold)
+        M = np.zeros((len(self.index), len(tags)))
+        for position, resource_tags in enumerate(self.index.values()):
+            for tag in resource_tags:
+                if tag in tags:
+                    M[position, tags.index(tag)] = 1
+        MM = M.T @ M
+        similarity_matrix = np.zeros(MM.shape)
+        for i, j in zip(*np.nonzero(MM)):
+            if metric == "cosine":
+                similarity_matrix[i, j] = MM[i, j] / (np.sqrt(MM[i, i]) * np.sqrt(MM[j, j]))
+            elif metric == "coocurrence":
+                similarity_matrix[i, j] = MM[i, j]
+            elif metric == "binary":
+                similarity_matrix[i, j] = MM[i, j] / MM[i, j]
+            elif metric == "jaccard":
+                similarity_matrix[i, j] = MM[i, j] / (MM[i, i] + MM[j, j] - MM[i, j])
+        return tags, similarity_matrix
+
+    def test_build_association_matrix(self):
+        M, resource_ids, tag_names, _ = build_association_matrix(self.index, tag_threshold=2)
+
+        # Tags with less than 2 occurrences and resources without tags are removed, and repeated tags are counted once
+        self.assertEqual(tag_names.tolist(), ["bass", "drum", "kick", "loop"])
+        self.assertEqual(resource_ids.tolist(), ["1", "2", "3", "5"])
+        np.testing.assert_array_equal(M.toarray(), [[0, 1, 1, 1], [0, 1, 1, 0], [1, 0, 0, 1], [1, 1, 0, 1]])
+
+    def test_similarity_matrix(self):
+        for tag_threshold in [0, 2]:
+            M, _, tag_names, _ = build_association_matrix(self.index, tag_threshold=tag_threshold)
+            for metric in ["cosine", "coocurrence", "binary", "jaccard"]:
+                expected_tag_names, expected_similarity_matrix = self.dense_similarity_matrix(tag_threshold, metric)
+                similarity_matrix = similarity_matrix_from_association_matrix(M, metric=metric)
+                self.assertEqual(tag_names.tolist(), expected_tag_names)
+                np.testing.assert_allclose(similarity_matrix.toarray(), expected_similarity_matrix, rtol=1e-6)
+
+
+class NeighboursTableTest(SimpleTestCase):
+    tag_names = ["bass", "drum", "kick", "loop"]
+    similarity_matrix = np.array(
+        [
+            [1.0, 0.5, 0.2, 0.0],
+            [0.5, 1.0, 0.9, 0.3],
+            [0.2, 0.9, 1.0, 0.0],
+            [0.0, 0.3, 0.0, 1.0],
+        ]
+    )
+
+    def assertMostSimilar(self, neighbours_table, tag, n, expected_tags, expected_scores):
+        tags, scores = neighbours_table.most_similar(tag, n)
+        self.assertEqual(tags.tolist(), expected_tags)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+
+    def test_most_similar(self):
+        for similarity_matrix in [self.similarity_matrix, sparse.csr_matrix(self.similarity_matrix)]:
+            neighbours_table = NeighboursTable.from_similarity_matrix(self.tag_names, similarity_matrix, n=2)
+            self.assertEqual(len(neighbours_table), 4)
+
+            # Tags are sorted by decreasing similarity, and neither the tag itself nor tags with 0 similarity are
+            # included
+            self.assertMostSimilar(neighbours_table, "drum", 2, ["kick", "bass"], [0.9, 0.5])
+            self.assertMostSimilar(neighbours_table, "drum", 1, ["kick"], [0.9])
+            self.assertMostSimilar(neighbours_table, "bass", 5, ["drum", "kick"], [0.5, 0.2])
+            self.assertMostSimilar(neighbours_table, "loop", 2, ["drum"], [0.3])
+            self.assertIsNone(neighbours_table.most_similar("snare", 2))
+
+    def test_large_scores(self):
+        # Co-occurrence similarities are not bounded
+        similarity_matrix = np.array([[0, 70000, 100000], [70000, 0, 1], [100000, 1, 0]])
+        neighbours_table = NeighboursTable.from_similarity_matrix(self.tag_names[:3], similarity_matrix)
+        self.assertMostSimilar(neighbours_table, "bass", 2, ["kick", "drum"], [100000, 70000])
+
+    def test_save_and_load(self):
+        neighbours_table = NeighboursTable.from_similarity_matrix(self.tag_names, self.similarity_matrix)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "FS_SIMILARITY_MATRIX_cosine_SUBSET")
+            self.assertFalse(NeighboursTable.exists(path))
+            neighbours_table.save(path)
+            self.assertTrue(NeighboursTable.exists(path))
+            loaded_neighbours_table = NeighboursTable.load(path)
+            self.assertMostSimilar(loaded_neighbours_table, "drum", 3, ["kick", "bass", "loop"], [0.9, 0.5, 0.3])
+
+            # The arrays used to look up tags are also memory-mapped
+            self.assertIsInstance(loaded_neighbours_table.sorted_tag_names, np.memmap)
+            self.assertIsInstance(loaded_neighbours_table.sorted_tag_positions, np.memmap)
+
+    def test_tag_position(self):
+        tag_names = ["loop", "bass", "snare", "drum", "kick"]
+        neighbours_table = NeighboursTable.from_similarity_matrix(tag_names, np.zeros((5, 5)))
+        for position, tag in enumerate(tag_names):
+            self.assertEqual(neighbours_table.tag_position(tag), position)
+        for tag in ["", "a", "dru", "drums", "zzz", "field-recording"]:
+            self.assertIsNone(neighbours_table.tag_position(tag))
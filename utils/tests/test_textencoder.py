@@ -0,0 +1,119 @@
+#
+# Freesound is (c) MUSIC TECHNOLOGY GROUP, UNIVERSITAT POMPEU FABRA
+#
+# Freesound is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# Freesound is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     See AUTHORS file.
+#
+
+from concurrent.futures import Future
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from textencoder.batching import MicroBatcher
+from textencoder.client import TextEncoder, _get_cache_key
+
+
+class TextEncoderClientTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch("textencoder.client._session")
+    def test_encode_texts(self, session):
+        cache.set(_get_cache_key("cached", None), {"embeddings": {"laion_clap": [1.0, 0.0]}})
+        session.post.return_value.json.return_value = {
+            "error": False,
+            "result": {"embeddings": {"laion_clap": [[0.0, 1.0], [0.5, 0.5]]}},
+        }
+
+        # Cached results are retrieved, and new results stored, with a single cache query
+        with mock.patch("textencoder.client.cache", wraps=cache) as client_cache:
+            results = TextEncoder.encode_texts(["dog", "cached", "cat", "dog"])
+            client_cache.get_many.assert_called_once()
+            client_cache.set_many.assert_called_once()
+            self.assertEqual(
+                set(client_cache.set_many.call_args.args[0]), {_get_cache_key("dog", None), _get_cache_key("cat", None)}
+            )
+
+        # Only texts which are not cached are requested (once each), and results are returned in the order of the input
+        session.post.assert_called_once()
+        self.assertEqual(session.post.call_args.kwargs["json"], {"inputs": ["dog", "cat"]})
+        self.assertEqual(
+            [result["embeddings"]["laion_clap"] for result in results], [[0.0, 1.0], [1.0, 0.0], [0.5, 0.5], [0.0, 1.0]]
+        )
+
+        # Encoded texts are cached
+        self.assertEqual(cache.get(_get_cache_key("cat", None)), {"embeddings": {"laion_clap": [0.5, 0.5]}})
+        session.post.reset_mock()
+        results = TextEncoder.encode_texts(["cat", "dog"])
+        session.post.assert_not_called()
+        self.assertEqual([result["embeddings"]["laion_clap"] for result in results], [[0.5, 0.5], [0.0, 1.0]])
+
+    @mock.patch("textencoder.client._session")
+    def test_encode_texts_with_model(self, session):
+        session.post.return_value.json.return_value = {"error": False, "result": {"embeddings": {"model": [[1.0]]}}}
+        TextEncoder.encode_texts(["dog"], model="model")
+        self.assertEqual(session.post.call_args.kwargs["json"], {"inputs": ["dog"], "model": "model"})
+
+        # Results are cached per model
+        self.assertIsNotNone(cache.get(_get_cache_key("dog", "model")))
+        self.assertIsNone(cache.get(_get_cache_key("dog", None)))
+
+    @mock.patch("textencoder.client._session")
+    def test_encode_texts_error(self, session):
+        session.post.return_value.json.return_value = {"error": True, "result": "Model not available"}
+        with self.assertRaisesMessage(Exception, "Model not available"):
+            TextEncoder.encode_texts(["dog"])
+        self.assertIsNone(cache.get(_get_cache_key("dog", None)))
+
+
+class MicroBatcherTest(SimpleTestCase):
+    def test_batch_size(self):
+        encode_batch = mock.Mock(side_effect=lambda texts: [text.upper() for text in texts])
+        batcher = MicroBatcher(encode_batch, max_batch_size=3, max_wait=0.1)
+        self.assertEqual(batcher.encode_many(list("abcdefg")), list("ABCDEFG"))
+        self.assertEqual([call.args[0] for call in encode_batch.call_args_list], [list("abc"), list("def"), ["g"]])
+
+    def test_max_wait(self):
+        # Batches which are not full are encoded once max_wait has passed
+        encode_batch = mock.Mock(side_effect=lambda texts: [text.upper() for text in texts])
+        batcher = MicroBatcher(encode_batch, max_batch_size=64, max_wait=0.01)
+        self.assertEqual(batcher.encode("a"), "A")
+        self.assertEqual(batcher.encode("b"), "B")
+        self.assertEqual([call.args[0] for call in encode_batch.call_args_list], [["a"], ["b"]])
+
+    def test_deduplication(self):
+        encode_batch = mock.Mock(side_effect=lambda texts: [text.upper() for text in texts])
+        batcher = MicroBatcher(encode_batch, max_batch_size=64, max_wait=0.1)
+        self.assertEqual(batcher.encode_many(["a", "b", "a"]), ["A", "B", "A"])
+        encode_batch.assert_called_once_with(["a", "b"])
+
+    def test_error(self):
+        encode_batch = mock.Mock(side_effect=ValueError("Could not encode"))
+        batcher = MicroBatcher(encode_batch, max_batch_size=64, max_wait=0.1)
+
+        # The exception is set for all the texts of the failed batch
+        futures = [Future(), Future()]
+        for text, future in zip(["a", "b"], futures):
+            batcher.queue.put((text, future))
+        for future in futures:
+            self.assertIsInstance(future.exception(timeout=5), ValueError)
+        encode_batch.assert_called_once_with(["a", "b"])
+
+        # The worker keeps encoding batches after an error
+        encode_batch.side_effect = lambda texts: [text.upper() for text in texts]
+        self.assertEqual(batcher.encode("c"), "C")